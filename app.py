@@ -76,7 +76,6 @@ try:
 except ImportError:
     _HAS_REDIS_JOBSTORE = False
 from werkzeug.security import generate_password_hash, check_password_hash
-import pdfplumber
 import cloudinary
 import cloudinary.uploader
 import smtplib
@@ -310,6 +309,9 @@ def _msg_linha(linha_num, contexto, mensagem, fechar=True):
     return f"Ops! Linha {linha_num}{ctx}: {mensagem}.{fim}"
 
 
+_RE_DATA_BR = re.compile(r'^(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{2,4})$')
+
+
 def _parse_data_flex(s):
     """Converte string/data para date. Aceita dd/mm/yyyy, dd/mm/yy (→ 20XX), ISO, etc. Retorna (date ou None, raw)."""
     if s is None or pd.isna(s):
@@ -317,7 +319,7 @@ def _parse_data_flex(s):
     raw = str(s).strip().strip('"').strip("'").strip()
     if not raw or raw.lower() in ('nan', 'nat', ''):
         return None, raw
-    m = re.match(r'^(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{2,4})$', raw)
+    m = _RE_DATA_BR.match(raw)
     if m:
         d, mo, y = m.groups()
         if len(y) == 2:
@@ -335,156 +337,68 @@ def _parse_data_flex(s):
 # ============================================================================
 # FUNÇÕES DE EXTRAÇÃO DE DADOS DE PDF (BOLETOS E NOTAS FISCAIS)
 # ============================================================================
-
-# CNPJs de beneficiários/emissores — ignorar ao capturar CNPJ do pagador
-CNPJ_PATY = '03.553.665/0002-00'
-CNPJ_DESTAK = '30.820.528/0001-78'
-CNPJ_EMISSOR_SERVICO = '14.187.040/0001-07'  # CNPJ de serviço/emissor comum
-CNPJS_EMISSORES = frozenset({
+# As heurísticas de texto e ``_processar_pdf`` vivem em
+# ``services/extracao_pdf.py`` (sem Flask/banco, para rodar no pool de
+# processos). Reimportadas aqui para os ``from app import ...`` existentes.
+from services.extracao_pdf import (  # noqa: E402
     CNPJ_PATY,
     CNPJ_DESTAK,
     CNPJ_EMISSOR_SERVICO,
-    '14.187.040/0001-07',  # Formato alternativo
-})
-
-
-def _extrair_linha_danfe_nome_cnpj_data(texto):
-    """DANFE: tenta capturar linha com 'NOME/RAZÃO SOCIAL + CNPJ + DATA DA EMISSÃO'."""
-    if not texto:
-        return None, None
-    m = re.search(
-        r'^([A-Z0-9\s\&\.\-\*]+?)\s+(\d{2}\.\d{3}\.\d{3}/\d{4}\-\d{2})\s+\d{2}/\d{2}/\d{4}',
-        texto,
-        re.MULTILINE
-    )
-    if not m:
-        return None, None
-    nome = (m.group(1) or '').strip()
-    cnpj = (m.group(2) or '').strip()
-    return nome or None, cnpj or None
-
-
-def _extrair_cnpj(texto, nome_arquivo=None):
-    """Extrai CNPJ do PAGADOR/DESTINATÁRIO. Padrão \\d{2}\\.\\d{3}\\.\\d{3}/\\d{4}-\\d{2}.
-    Ignora PATY, DESTAK e emissores conhecidos. Prioriza CNPJ próximo a 'Pagador', 'Destinatário', 'Razão Social'."""
-    padrao = r'\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}'
-    todos = re.findall(padrao, texto)
-    emissores_encontrados = [c for c in todos if c in CNPJS_EMISSORES]
-    candidatos = [c for c in todos if c not in CNPJS_EMISSORES]
-    
-    # Debug: mostrar todos os CNPJs encontrados
-    if nome_arquivo:
-        app.logger.debug(f"DEBUG: CNPJs localizados no arquivo {nome_arquivo}: {todos}")
-        if emissores_encontrados:
-            app.logger.debug(f"DEBUG: CNPJs de emissores ignorados: {emissores_encontrados}")
-        if candidatos:
-            app.logger.debug(f"DEBUG: CNPJs candidatos (pagador): {candidatos}")
-        elif todos:
-            app.logger.warning("DEBUG: AVISO - Apenas CNPJs de emissores encontrados. CNPJ do pagador não identificado.")
-    
-    if not candidatos:
-        if todos and nome_arquivo:
-            app.logger.error(f"DEBUG: Erro - Apenas CNPJ(s) do emissor localizado(s) em {nome_arquivo}: {emissores_encontrados}")
-        return None
-
-    # Prioridade 0 (DANFE): linha "NOME / RAZÃO SOCIAL CNPJ / CPF DATA DA EMISSÃO"
-    _, cnpj_danfe = _extrair_linha_danfe_nome_cnpj_data(texto)
-    if cnpj_danfe and cnpj_danfe not in CNPJS_EMISSORES:
-        return cnpj_danfe
-    
-    # Prioridade 1: CNPJ após "CNPJ/CPF:" próximo ao Pagador (Itaú/DESTAK)
-    m = re.search(r'Pagador[:\s]*[\s\S]{0,200}?CNPJ\s*/\s*CPF\s*[:\s]*(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', texto, re.IGNORECASE | re.DOTALL)
-    if m:
-        cnpj = m.group(1)
-        if cnpj not in CNPJS_EMISSORES:
-            return cnpj
-    
-    # Prioridade 2: CNPJ após "Destinatário" (NF-e)
-    m = re.search(r'Destinat[áa]rio[:\s]*[\s\S]{0,300}?CNPJ\s*[:\s]*(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', texto, re.IGNORECASE | re.DOTALL)
-    if m:
-        cnpj = m.group(1)
-        if cnpj not in CNPJS_EMISSORES:
-            return cnpj
-    
-    # Prioridade 3: CNPJ após "Razão Social" seguido de CNPJ (NF-e)
-    m = re.search(r'Raz[ãa]o\s+Social[:\s]*[\s\S]{0,200}?(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', texto, re.IGNORECASE | re.DOTALL)
-    if m:
-        cnpj = m.group(1)
-        if cnpj not in CNPJS_EMISSORES:
-            return cnpj
-    
-    # Prioridade 4: CNPJ após "CPF/CNPJ" (Bradesco)
-    m = re.search(r'CPF/CNPJ\s*([\d\.\-\/]{14,18})', texto, re.IGNORECASE)
-    if m:
-        cnpj = (m.group(1) or '').strip()
-        if cnpj and cnpj not in CNPJS_EMISSORES:
-            return cnpj
-
-    # Prioridade 4.1: CNPJ após "CPF / CNPJ" com separação por barra e espaços
-    m = re.search(r'CPF\s*/\s*CNPJ\s*[\s:]*(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', texto, re.IGNORECASE)
-    if m:
-        cnpj = (m.group(1) or '').strip()
-        if cnpj not in CNPJS_EMISSORES:
-            return cnpj
-    
-    # Prioridade 5: CNPJ após "Nome/Razão Social" (NF-e)
-    m = re.search(r'Nome\s*/\s*Raz[ãa]o\s+Social[:\s]*[\s\S]{0,200}?(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', texto, re.IGNORECASE | re.DOTALL)
-    if m:
-        cnpj = m.group(1)
-        if cnpj not in CNPJS_EMISSORES:
-            return cnpj
-    
-    # Fallback: usar o último CNPJ válido (geralmente o do pagador vem depois do emissor)
-    # Se houver múltiplos, preferir o que não está nos emissores conhecidos
-    for cnpj in reversed(candidatos):
-        if cnpj not in CNPJS_EMISSORES:
-            return cnpj
-    
-    # Último recurso: primeiro candidato válido
-    return candidatos[0] if candidatos else None
-
+    CNPJS_EMISSORES,
+    BLACKLIST_NF,
+    DESCRICAO_FALHA,
+    FALHAS_DEFINITIVAS,
+    TarefaExtracao,
+    extrair_lote,
+    _extrair_linha_danfe_nome_cnpj_data,
+    _extrair_cnpj,
+    _extrair_numero_nf,
+    _extrair_nf_do_nome_arquivo,
+    _extrair_numero_da_nf,
+    _eh_linha_cabecalho_pagador,
+    _limpar_razao_ate_cnpj_ou_data,
+    _extrair_razao_social,
+    _extrair_data_vencimento,
+    _detectar_empresa_destak,
+    _parse_valor_monetario,
+    _extrair_valor_boleto,
+    _extrair_texto_primeira_pagina,
+    _classificar_pdf,
+    _detectar_bonificacao,
+    _processar_pdf,
+)
 
-BLACKLIST_NF = frozenset({
-    '40901685',
-    '08007701685',
-    '08007280728',
-    '08005700011',
-})
+# XML da NF-e (ao lado do PDF ou sozinho): services/nfe_xml.py.
+from services.nfe_xml import xml_irmao  # noqa: E402
 
+# Varredura incremental de documentos_entrada/: services/manifesto_documentos.py.
+from services.manifesto_documentos import (  # noqa: E402
+    ManifestoDocumentos,
+    STATUS_PENDENTE,
+    STATUS_SEM_REGISTRO,
+    STATUS_VINCULADO,
+)
 
-def _normalizar_nf(s):
-    """Normaliza NF para comparação: remove prefixos (NF-, NF , NF), só dígitos, remove zeros à esquerda.
-    Ex.: '000042234' -> '42234', 'NF-00042234' -> '42234'. Retorna '' se vazio."""
-    if not s:
-        return ''
-    t = str(s).strip()
-    for prefix in ('NF-', 'NF ', 'NF:'):
-        if t.upper().startswith(prefix.upper()):
-            t = t[len(prefix):].strip()
-            break
-    if t.upper().startswith('NF'):
-        t = re.sub(r'^NF\s*', '', t, flags=re.IGNORECASE).strip()
-    digs = re.sub(r'\D', '', t)
-    if not digs:
-        return ''
-    return digs.lstrip('0') or '0'
+# Normalização de NF e busca indexada de vendas por NF: services/indice_nf.py.
+from services.indice_nf import (  # noqa: E402
+    _normalizar_nf,
+    vendas_por_nf,
+    vendas_por_nfs,
+)
 
+# Diagnóstico do vínculo pela NF pré-calculado para a fila: services/diagnostico_vinculo.py.
+from services.diagnostico_vinculo import diagnostico_armazenado, diagnosticar_sem_gravar  # noqa: E402
 
-def _nf_match(doc_norm, venda_norm):
-    """True se as NFs normalizadas são iguais ou uma é base + sufixo numérico (ex.: 12263 vs 12263-01 → 1226301).
-    Sufixo permitido: 2–4 dígitos, para evitar falsos positivos (ex.: 1226 vs 12263)."""
-    if doc_norm == venda_norm:
-        return True
-    if not doc_norm or not venda_norm:
-        return False
+# Recepção de documentos em background (status PROCESSANDO): services/fila_documentos.py.
+from services.fila_documentos import fora_do_processamento  # noqa: E402
 
-    def ok_suffix(shorter, longer):
-        if not longer.startswith(shorter) or longer == shorter:
-            return False
-        suf = longer[len(shorter):]
-        return suf.isdigit() and 2 <= len(suf) <= 4
-
-    return ok_suffix(doc_norm, venda_norm) or ok_suffix(venda_norm, doc_norm)
+# Envio ao Cloudinary em background, com spool e retentativa: services/uploads_nuvem.py.
+from services.uploads_nuvem import (  # noqa: E402
+    DESTINO_DOCUMENTO,
+    disparar_uploads,
+    guardar_para_upload,
+    nuvem_configurada,
+)
 
 
 def _normalizar_cnpj(s):
@@ -538,367 +452,7 @@ def _parse_clientes_raw_tsv(text):
     return out
 
 
-def _extrair_numero_nf(texto):
-    """Extrai número da NF apenas se colado a 'Núm. do documento', 'NF' ou 'Numero Documento'.
-    Ignora últimos 25%% da página (feito em _processar_pdf). 4–6 dígitos; blacklist de telefones."""
-    # DANFE: priorizar blocos explícitos de NF-e (aceita zeros à esquerda e número mais longo)
-    padroes_danfe = [
-        r'NFe?\s*N[º°]\s*(\d{3,12})',
-        r'N[º°]\s*0*(\d{3,12})',
-        r'NFe?\s*N[º°]\s*S[ée]rie[\s\S]{0,40}?(\d{3,12})',
-        r'N[ºo]\s*([\d\.]+)',
-    ]
-    for p in padroes_danfe:
-        m = re.search(p, texto, re.IGNORECASE)
-        if not m:
-            continue
-        n = (m.group(1) or '').strip().replace('.', '')
-        if not n:
-            continue
-        if n in BLACKLIST_NF:
-            continue
-        return n
-
-    padroes = [
-        (r'N[úu]m\.?\s*do\s*documento\s*[:\s]*(?:NF[-]?)?\s*(\d+)', False),
-        (r'N[úu]mero\s*do\s*documento\s*[:\s]*(?:NF[-]?)?\s*(\d+)', False),
-        (r'N[úu]mero\s+Documento\s*[:\s]*(?:NF[-]?)?\s*(\d+)', False),
-        (r'(?:Numero Documento|N[úu]mero do Documento)\s*(?:.*?\s+)?(\d+)(?:/\d+)?', False),
-        (r'NF-(\d+)', True),
-        (r'NF\s+(\d+)', True),
-        (r'NF:\s*(\d+)', True),
-        (r'NF(\d+)', True),
-        (r'(\d+)/\d+\s+DM', False),
-    ]
-    for p, exige_nf in padroes:
-        m = re.search(p, texto, re.IGNORECASE)
-        if not m:
-            continue
-        n = m.group(1)
-        if n in BLACKLIST_NF:
-            continue
-        if len(n) == 8 and not exige_nf:
-            continue
-        if len(n) < 3 or len(n) > 12:
-            continue
-        return n
-    return None
-
-
-def _extrair_nf_do_nome_arquivo(nome_arquivo):
-    """Extrai número da NF diretamente do nome do arquivo.
-    Procura sequências de 4-6 dígitos após termos como 'CB', 'BONIF', 'NF' ou após hífens.
-    Exemplos: 'NF - CB - 12244...' → '12244', 'NF-BONIF-12345...' → '12345'
-    
-    Args:
-        nome_arquivo: Nome do arquivo (ex: 'NF - CB - 12244 - CLIENTE.pdf')
-    
-    Returns:
-        String com o número da NF encontrado ou None
-    """
-    if not nome_arquivo:
-        return None
-    
-    # Padrões para extrair NF do nome do arquivo
-    # Procura por: NF - CB - 12244, NF-BONIF-12345, NF - 12244, etc.
-    padroes = [
-        r'(?:NF\s*[-–—]?\s*)?(?:CB|BONIF)\s*[-–—]\s*(\d{4,6})',  # NF - CB - 12244 ou CB - 12244
-        r'NF\s*[-–—]\s*(\d{4,6})',  # NF - 12244
-        r'NF\s*[-–—]\s*\d+\s*[-–—]\s*(\d{4,6})',  # NF - 01 - 12244
-        r'[-–—]\s*(\d{4,6})\s*[-–—]',  # - 12244 - (entre hífens)
-    ]
-    
-    for padrao in padroes:
-        m = re.search(padrao, nome_arquivo, re.IGNORECASE)
-        if m:
-            nf = m.group(1)
-            # Validar que não está na blacklist e tem tamanho adequado
-            if nf not in BLACKLIST_NF and 4 <= len(nf) <= 6:
-                return nf
-    
-    # Fallback: primeira sequência numérica no nome (ex: NF3439.pdf -> 3439)
-    nf_fallback = _extrair_numero_da_nf(nome_arquivo)
-    if nf_fallback and nf_fallback not in BLACKLIST_NF and 4 <= len(nf_fallback) <= 6:
-        return nf_fallback
-    return None
-
-
-def _extrair_numero_da_nf(nome_arquivo):
-    """Extrai apenas a primeira sequência de dígitos do nome do arquivo.
-    Ex: 'NF3439.pdf' -> '3439', 'NF - 12244 - CLIENTE.pdf' -> '12244' (se outros padrões falharem).
-    """
-    if not nome_arquivo:
-        return None
-    try:
-        nome_limpo = str(nome_arquivo).lower().replace('.pdf', '')
-        m = re.search(r'(\d+)', nome_limpo)
-        return m.group(1) if m else None
-    except Exception:
-        return None
-
-
-def _eh_linha_cabecalho_pagador(s):
-    """Retorna True se s for linha de cabeçalho (Numero Documento, Vencimento, etc.)."""
-    if not s or len(s) < 3:
-        return True
-    u = s.upper()
-    if 'NUMERO' in u and 'DOCUMENTO' in u:
-        return True
-    if u.strip() in ('VENCIMENTO', 'CPF', 'CNPJ', 'PAGADOR', 'NOME', 'RAZÃO SOCIAL'):
-        return True
-    return False
-
-
-def _limpar_razao_ate_cnpj_ou_data(linha):
-    """Remove sufixo tipo '12341/1 26/02/2026' ou 'CNPJ 24.333.585/0001-20 27/01/2026'."""
-    # Remove trecho final " NNN/N DD/MM/YYYY" ou " DD/MM/YYYY"
-    linha = re.sub(r'\s+\d{1,5}/\d+\s+\d{1,2}/\d{1,2}/\d{2,4}\s*$', '', linha)
-    linha = re.sub(r'\s+\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\s+\d{1,2}/\d{1,2}/\d{2,4}\s*$', '', linha)
-    linha = re.sub(r'\s+\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\s*$', '', linha)
-    return linha.strip()
-
-
-def _extrair_razao_social(texto):
-    """Extrai razão social do PAGADOR (boletos) ou DESTINATÁRIO (NF-e)."""
-    # DANFE: priorizar bloco do destinatário para evitar capturar "Transportador / Volumes Transportados"
-    bloco_dest = re.search(
-        r'Destinat[áa]rio\s*/\s*Remetente([\s\S]{0,1200}?)(?:Endere[cç]o|CNPJ\s*/\s*CPF)',
-        texto,
-        re.IGNORECASE,
-    )
-    if bloco_dest:
-        trecho = bloco_dest.group(1)
-        linhas = [re.sub(r'\s+', ' ', linha).strip() for linha in re.split(r'[\r\n]+', trecho) if linha and linha.strip()]
-        # Se houver cabeçalho "Nome/Razão Social", capturar a linha imediatamente abaixo
-        for i, linha in enumerate(linhas):
-            if re.search(r'Nome\s*/\s*Raz[ãa]o\s+Social', linha, re.IGNORECASE):
-                if i + 1 < len(linhas):
-                    cand = _limpar_razao_ate_cnpj_ou_data(linhas[i + 1])
-                    if cand and len(cand) > 3 and not _eh_linha_cabecalho_pagador(cand):
-                        return cand[:200]
-        # Fallback no mesmo bloco: primeira linha textual plausível que não seja cabeçalho
-        for linha in linhas:
-            if re.search(r'Nome\s*/\s*Raz[ãa]o\s+Social|CNPJ|CPF|Insc', linha, re.IGNORECASE):
-                continue
-            cand = _limpar_razao_ate_cnpj_ou_data(linha)
-            if cand and len(cand) > 3 and not _eh_linha_cabecalho_pagador(cand):
-                return cand[:200]
-
-    # DANFE (fallback do plano B): Nome + CNPJ + Data na mesma linha
-    nome_danfe, _ = _extrair_linha_danfe_nome_cnpj_data(texto)
-    if nome_danfe:
-        razao = _limpar_razao_ate_cnpj_ou_data(nome_danfe)
-        if razao and len(razao) > 2 and not _eh_linha_cabecalho_pagador(razao):
-            return razao[:200]
-
-    # Itaú/DESTAK: "Pagador: CAPIM FRIOS EIRELI" (mesma linha ou próxima)
-    m = re.search(r'Pagador\s*:\s*([A-ZÁÉÍÓÚÇa-z0-9][A-ZÁÉÍÓÚÇa-z0-9\s&\.\-(),]+?)(?:\s*[\r\n]|CNPJ|CPF|$)', texto, re.IGNORECASE)
-    if m:
-        razao = _limpar_razao_ate_cnpj_ou_data(m.group(1))
-        if razao and len(razao) > 2 and not _eh_linha_cabecalho_pagador(razao):
-            return razao[:200]
-    # Bradesco/PDF com texto colado: "PagadorS N SOARES... CPF/CNPJ ..."
-    m = re.search(r'Pagador\s*([A-Za-z0-9\s\&\.\-\*]+?)\s*CPF/CNPJ', texto, re.IGNORECASE)
-    if m:
-        razao = _limpar_razao_ate_cnpj_ou_data((m.group(1) or '').strip())
-        if razao and len(razao) > 2 and not _eh_linha_cabecalho_pagador(razao):
-            return razao[:200]
-    # NF-e: "NOME / RAZÃO SOCIAL ..." na linha seguinte "JNS COMERCIO ... LTDA 24.333.585/..."
-    m = re.search(r'NOME\s*/\s*RAZ[ÃA]O\s+SOCIAL[\s\S]*?[\r\n]+\s*([A-ZÁÉÍÓÚÇa-z0-9][A-ZÁÉÍÓÚÇa-z0-9\s&\.\-(),]+?)\s+\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}', texto, re.IGNORECASE)
-    if m:
-        razao = _limpar_razao_ate_cnpj_ou_data(m.group(1))
-        if razao and len(razao) > 3:
-            return razao[:200]
-    # Boletos: Pagador + linhas; pular "Numero Documento Vencimento" e pegar a seguinte
-    pos = 0
-    while True:
-        m = re.search(r'Pagador\s*[\r\n]+', texto[pos:], re.IGNORECASE)
-        if not m:
-            break
-        pos += m.end()
-        resto = texto[pos:]
-        linhas = re.split(r'[\r\n]+', resto)
-        for linha in linhas:
-            linha = re.sub(r'\s+', ' ', linha).strip()
-            if not linha or _eh_linha_cabecalho_pagador(linha):
-                continue
-            if len(linha) > 3 and not re.match(r'^\d{2}\.\d{3}\.\d{3}', linha):
-                return _limpar_razao_ate_cnpj_ou_data(linha)[:200]
-        break
-    m = re.search(r'Pagador\s+([A-ZÁÉÍÓÚÇa-z0-9][A-ZÁÉÍÓÚÇa-z0-9\s&\.\-(),]+?)(?:\s{2,}|\d{2}\.\d{3}\.\d{3}|[\r\n]|$)', texto, re.IGNORECASE)
-    if m:
-        razao = _limpar_razao_ate_cnpj_ou_data(m.group(1))
-        if razao and len(razao) > 2 and not _eh_linha_cabecalho_pagador(razao):
-            return razao[:200]
-    for p in [
-        r'Raz[ãa]o\s+Social[:\s]+([A-ZÁÉÍÓÚÇ][A-ZÁÉÍÓÚÇ\s&\.\-]+)',
-        r'Nome\s+Empresarial[:\s]+([A-ZÁÉÍÓÚÇ][A-ZÁÉÍÓÚÇ\s&\.\-]+)',
-        r'Empresa[:\s]+([A-ZÁÉÍÓÚÇ][A-ZÁÉÍÓÚÇ\s&\.\-]+)',
-    ]:
-        m = re.search(p, texto, re.IGNORECASE)
-        if m:
-            razao = m.group(1).strip()
-            return razao[:200] if len(razao) > 200 else razao
-    return None
-
-
-def _extrair_data_vencimento(texto, debug_paty=False):
-    """Extrai data de vencimento: ao lado de 'Vencimento' ou em PARCELAS (001 DD/MM/YYYY).
-    Prioriza padrão dd/mm/aaaa após 'Vencimento' (ex: 05/02/2026, 08/02/2026).
-    
-    Args:
-        texto: Texto extraído do PDF
-        debug_paty: Se True, imprime debug detalhado no console (para boletos PATY/Bradesco)
-    """
-    if debug_paty:
-        app.logger.info("\n" + "="*80)
-        app.logger.debug("DEBUG EXTRAÇÃO DE VENCIMENTO - BOLETO PATY/BRADESCO")
-        app.logger.info("="*80)
-        app.logger.info("TEXTO COMPLETO DO PDF (primeiros 2000 caracteres):")
-        app.logger.info(texto[:2000])
-        app.logger.info("\n" + "-"*80)
-    
-    # Padrões mais flexíveis e abrangentes
-    padroes = [
-        # Padrão flexível: aceita "Vencimento", "Data de Vencimento" com separadores variados
-        r'(?:Vencimento|Data\s+de\s+Vencimento)[\s\n]*[:\-]?[\s\n]*(\d{2}/\d{2}/\d{4})',
-        
-        # Padrões específicos mantidos para compatibilidade
-        r'Vencimento[\s\n]*(\d{2}/\d{2}/\d{4})',  # ex: Vencimento 05/02/2026 ou Vencimento\n05/02/2026
-        r'Vencimento\s*[:\s]+\s*(\d{1,2}/\d{1,2}/\d{2,4})',  # Itaú: Vencimento: 08/02/2026
-        r'Vencimento[:\s]+(\d{1,2}/\d{1,2}/\d{2,4})',
-        r'Vencimento\s*[\r\n]+\s*(\d{1,2}/\d{1,2}/\d{2,4})',
-        r'Venc\.?[:\s]+(\d{1,2}/\d{1,2}/\d{2,4})',
-        r'Data\s+de\s+Vencimento[:\s]+(\d{1,2}/\d{1,2}/\d{2,4})',
-        
-        # Bradesco: data pode aparecer isolada após "Vencimento" em linhas separadas
-        r'Vencimento[\s\S]{0,50}?(\d{2}/\d{2}/\d{4})',  # Busca data até 50 chars após "Vencimento"
-        
-        # PARCELAS (formato de recibo com parcelas)
-        r'PARCELAS\s*[\r\n]+\s*\d+\s+(\d{1,2}/\d{1,2}/\d{2,4})\s',  # 001 26/02/2026 R$
-        
-        # Busca genérica: qualquer data dd/mm/yyyy precedida por "Vencimento" em até 100 caracteres
-        r'Vencimento[\s\S]{0,100}?(\d{2}/\d{2}/\d{4})',
-    ]
-    
-    for idx, p in enumerate(padroes):
-        m = re.search(p, texto, re.IGNORECASE | re.DOTALL)
-        if m:
-            data_str = m.group(1)
-            if debug_paty:
-                app.logger.info(f"\n✓ Match encontrado com padrão {idx}: {p}")
-                app.logger.info(f"  Data capturada: {data_str}")
-                app.logger.info(f"  Contexto: ...{texto[max(0, m.start()-50):m.end()+50]}...")
-            
-            data_parsed, _ = _parse_data_flex(data_str)
-            if data_parsed:
-                if debug_paty:
-                    app.logger.info(f"  ✓ Data parseada com sucesso: {data_parsed.strftime('%d/%m/%Y')}")
-                    app.logger.info("="*80 + "\n")
-                return data_parsed
-            elif debug_paty:
-                app.logger.error(f"  ✗ Falha ao parsear data: {data_str}")
-    
-    if debug_paty:
-        app.logger.error("\n✗ NENHUMA DATA DE VENCIMENTO ENCONTRADA")
-        app.logger.info("="*80 + "\n")
-    
-    return None
-
-
-def _detectar_empresa_destak(texto):
-    """Detecta se o beneficiário é DESTAK. Retorna True se encontrar 'DESTAK EMBALAGEM LTDA' ou CNPJ 30.820.528/0001-78."""
-    if 'DESTAK EMBALAGEM LTDA' in texto.upper() or CNPJ_DESTAK in texto:
-        return True
-    return False
-
-
-def _parse_valor_monetario(s):
-    """Converte string 'R$ 1.234,56' ou '-R$ 120,00' para float. Retorna None se inválido. Preserva sinal negativo."""
-    if not s or not isinstance(s, str):
-        return None
-    s = str(s).strip()
-    negativo = s.lstrip().startswith('-')
-    s = re.sub(r'R\$\s*', '', s, flags=re.IGNORECASE).replace(' ', '')
-    s = s.lstrip('-').strip()
-    if ',' in s:
-        s = s.replace('.', '').replace(',', '.')
-    try:
-        n = float(s)
-        return -n if negativo else n
-    except (ValueError, TypeError):
-        return None
-
-
-def _extrair_valor_boleto(texto):
-    """Extrai valor principal do boleto (ex.: R$ 2.400,00) e, para DANFE, o Valor Total da Nota."""
-    # DANFE: ancorar no rótulo "Valor Total da Nota" para não capturar zeros de impostos
-    bloco_total_nota = re.search(
-        r'Valor\s+Total\s+da\s+Nota([\s\S]{0,220})',
-        texto,
-        re.IGNORECASE
-    )
-    if bloco_total_nota:
-        trecho = bloco_total_nota.group(1)
-        candidatos = re.findall(r'(\d{1,3}(?:\.\d{3})*,\d{2})', trecho)
-        if candidatos:
-            # Usa o último valor não-zero do bloco (normalmente o total final da nota)
-            for raw in reversed(candidatos):
-                v = _parse_valor_monetario(raw)
-                if v is not None and v > 0:
-                    return v
-
-    padroes = [
-        r'Valor\s*(?:do\s*Documento)?\s*[:\s]*R\$\s*([\d\.]+,\d{2})',
-        r'Valor\s*[:\s]*R\$\s*([\d\.]+,\d{2})',
-        r'Total\s*[:\s]*R\$\s*([\d\.]+,\d{2})',
-        r'(?:Valor|Total)\s+([\d\.]+,\d{2})\b',
-    ]
-    for p in padroes:
-        m = re.search(p, texto, re.IGNORECASE)
-        if m:
-            raw = m.group(1)
-            v = _parse_valor_monetario(raw)
-            if v is not None and v > 0:
-                return v
-    for m in re.finditer(r'R\$\s*([\d\.]+,\d{2})', texto):
-        v = _parse_valor_monetario(m.group(1))
-        if v is not None and v > 0:
-            return v
-    return None
-
-
-def _extrair_texto_primeira_pagina(caminho_arquivo):
-    """Extrai o texto apenas da primeira página do PDF. Retorna str (vazia se erro ou sem páginas)."""
-    if not caminho_arquivo or not os.path.isfile(caminho_arquivo):
-        return ""
-    try:
-        with pdfplumber.open(caminho_arquivo) as pdf:
-            if not pdf.pages:
-                return ""
-            t = pdf.pages[0].extract_text()
-            return (t or "").strip()
-    except FileNotFoundError:
-        app.logger.warning(f"PDF não encontrado ao extrair texto: {caminho_arquivo}")
-        return ""
-    except Exception:
-        return ""
-
-
-def _classificar_pdf(texto):
-    """Classifica um PDF pelo texto da primeira página.
-    Retorna 'NOTA_FISCAL', 'BOLETO' ou 'NAO_IDENTIFICADO'."""
-    u = (texto or "").upper()
-    if "DANFE" in u or "NOTA FISCAL" in u:
-        return "NOTA_FISCAL"
-    if "BOLETO" in u or "LINHA DIGITÁVEL" in u or "LINHA DIGITAVEL" in u:
-        return "BOLETO"
-    if "ITAU" in u or "ITAÚ" in u or "BRADESCO" in u:
-        return "BOLETO"
-    return "NAO_IDENTIFICADO"
-
-
-def organizar_arquivos():
+def organizar_arquivos(nomes=None):
     """Organiza PDFs na raiz de documentos_entrada/ movendo para subpastas por tipo.
     
     - NOTA_FISCAL (DANFE / NOTA FISCAL) -> documentos_entrada/notas_fiscais/
@@ -906,13 +460,32 @@ def organizar_arquivos():
     - Resto -> documentos_entrada/nao_identificados/
     
     Usa apenas a primeira página para classificação. shutil.move para mover no Mac.
-    Suporta 50+ arquivos em lote sem travar.
+    A leitura das primeiras páginas roda em lote no pool de processos
+    (``extrair_lote``); as movimentações ficam aqui, em série.
+    PDF com o XML da NF-e ao lado é classificado pelo XML, que vai junto;
+    XML sem PDF é organizado sozinho (NF-e, bonificação ou não identificado).
+    PDF que a extração não conseguiu ler (``falha``: corrompido, grande
+    demais, tempo esgotado) vai para ``nao_identificados/``; com ``nomes``
+    (fila de documentos), o tempo esgotado fica na raiz para a nova tentativa.
+    
+    Args:
+        nomes: Se informado, organiza só esses arquivos da raiz (fila de documentos).
     
     Returns:
-        dict: {'notas_fiscais': int, 'boletos': int, 'nao_identificados': int, 'erros': int}
+        dict: {'notas_fiscais': int, 'boletos': int, 'nao_identificados': int, 'erros': int,
+               'falhas_extracao': {arquivo: 'TIMEOUT' | 'CORROMPIDO' | 'GRANDE_DEMAIS'}}
     """
     base = os.path.join(os.path.dirname(os.path.abspath(__file__)), "documentos_entrada")
-    root_pdf = [f for f in os.listdir(base) if f.lower().endswith(".pdf")]
+    root_pdf = [f for f in os.listdir(base) if f.lower().endswith((".pdf", ".xml"))]
+    if nomes is not None:
+        nomes = set(nomes)
+        root_pdf = [f for f in root_pdf if f in nomes]
+    # O XML de um PDF da lista viaja com ele (``_mover_com_xml``).
+    bases_pdf = {os.path.splitext(f)[0] for f in root_pdf if f.lower().endswith(".pdf")}
+    root_pdf = [
+        f for f in root_pdf
+        if not (f.lower().endswith(".xml") and os.path.splitext(f)[0] in bases_pdf)
+    ]
     
     notas = os.path.join(base, "notas_fiscais")
     boletos = os.path.join(base, "boletos")
@@ -923,19 +496,30 @@ def organizar_arquivos():
     bonificacoes = os.path.join(base, "bonificacoes")
     os.makedirs(bonificacoes, exist_ok=True)
     
-    out = {"notas_fiscais": 0, "boletos": 0, "nao_identificados": 0, "bonificacoes": 0, "erros": 0}
+    out = {"notas_fiscais": 0, "boletos": 0, "nao_identificados": 0, "bonificacoes": 0, "erros": 0,
+           "falhas_extracao": {}}
     
-    for nome in root_pdf:
+    root_pdf = [nome for nome in root_pdf if os.path.isfile(os.path.join(base, nome))]
+    extraidos = extrair_lote(
+        [TarefaExtracao(os.path.join(base, nome), campos=False) for nome in root_pdf]
+    )
+    for nome, extraido in zip(root_pdf, extraidos):
         src = os.path.join(base, nome)
         if not os.path.isfile(src):
             continue
-        texto = _extrair_texto_primeira_pagina(src)
+        
+        falha = extraido.get('falha')
+        if falha:
+            out["falhas_extracao"][nome] = falha
+            app.logger.warning(f"[ORGANIZAR] {nome}: {DESCRICAO_FALHA[falha]} ({extraido.get('erro')})")
+            if nomes is not None and falha not in FALHAS_DEFINITIVAS:
+                out["erros"] += 1
+                continue
         
         # Verificar se é bonificação ANTES de classificar
-        if _detectar_bonificacao(texto):
-            dst = os.path.join(bonificacoes, nome)
+        if extraido['bonificacao']:
             try:
-                shutil.move(src, dst)
+                _mover_com_xml(src, bonificacoes)
                 out["bonificacoes"] += 1
                 app.logger.info(f"[ORGANIZAR] Bonificação movida: {nome}")
                 continue
@@ -944,16 +528,15 @@ def organizar_arquivos():
                 out["erros"] += 1
                 continue
         
-        tipo = _classificar_pdf(texto)
+        tipo = extraido['classificacao']
         if tipo == "NOTA_FISCAL":
             dst_dir = notas
         elif tipo == "BOLETO":
             dst_dir = boletos
         else:
             dst_dir = outros
-        dst = os.path.join(dst_dir, nome)
         try:
-            shutil.move(src, dst)
+            _mover_com_xml(src, dst_dir)
             if tipo == "NOTA_FISCAL":
                 out["notas_fiscais"] += 1
             elif tipo == "BOLETO":
@@ -966,78 +549,12 @@ def organizar_arquivos():
     return out
 
 
-def _detectar_bonificacao(texto):
-    """
-    Detecta se um documento é uma nota de bonificação/brinde.
-    
-    Lê o conteúdo do PDF e verifica a "Natureza da Operação" procurando por frases exatas
-    que indicam bonificação (baseado nas notas da Paty e Destak).
-    
-    Args:
-        texto: Texto extraído do PDF (primeira página ou completo)
-    
-    Returns:
-        bool: True se for bonificação, False caso contrário
-    """
-    if not texto:
-        return False
-    
-    # Normalizar texto: remover acentos e converter para maiúsculas
-    texto_normalizado = texto.upper()
-    
-    # Remover acentos básicos
-    substituicoes = {
-        'Á': 'A', 'À': 'A', 'Â': 'A', 'Ã': 'A',
-        'É': 'E', 'Ê': 'E',
-        'Í': 'I',
-        'Ó': 'O', 'Ô': 'O', 'Õ': 'O',
-        'Ú': 'U', 'Ü': 'U',
-        'Ç': 'C'
-    }
-    for acento, sem_acento in substituicoes.items():
-        texto_normalizado = texto_normalizado.replace(acento, sem_acento)
-    
-    # Frases exatas que indicam bonificação (baseado nas notas da Paty e Destak)
-    frases_bonificacao = [
-        'REMESSA EM BONIFICACAO',
-        'REMESSA DE BONIFICACAO',
-        'DOACAO',
-        'BRINDE'
-    ]
-    
-    # PRIORIDADE 1: Procurar por "Natureza da Operação" seguido de bonificação
-    # Padrão flexível para capturar variações: "Natureza da Operação:", "Natureza da Operação", etc.
-    padrao_natureza = re.compile(
-        r'NATUREZA\s+DA\s+OPERACAO[:\s]*([^\n]{0,300})',
-        re.IGNORECASE | re.MULTILINE
-    )
-    match_natureza = padrao_natureza.search(texto_normalizado)
-    
-    if match_natureza:
-        natureza_texto = match_natureza.group(1).upper()
-        # Remover acentos do texto da natureza
-        for acento, sem_acento in substituicoes.items():
-            natureza_texto = natureza_texto.replace(acento, sem_acento)
-        
-        # Verificar se contém alguma das frases exatas de bonificação
-        for frase in frases_bonificacao:
-            if frase in natureza_texto:
-                return True
-    
-    # PRIORIDADE 2: Verificar no texto completo se alguma frase aparece próxima de "Natureza" ou "Operação"
-    # Isso captura casos onde a estrutura do PDF pode ter quebrado a linha
-    for frase in frases_bonificacao:
-        # Procurar a frase no texto
-        if frase in texto_normalizado:
-            # Verificar se está próxima (até 150 caracteres) de "Natureza" ou "Operação"
-            padrao_proximo = re.compile(
-                r'(NATUREZA|OPERACAO).{0,150}?' + re.escape(frase),
-                re.IGNORECASE | re.DOTALL
-            )
-            if padrao_proximo.search(texto_normalizado):
-                return True
-    
-    return False
+def _mover_com_xml(caminho_arquivo, pasta_destino):
+    """Move o arquivo para ``pasta_destino`` levando o XML da NF-e ao lado, se houver."""
+    caminho_xml = xml_irmao(caminho_arquivo) if caminho_arquivo.lower().endswith('.pdf') else None
+    shutil.move(caminho_arquivo, os.path.join(pasta_destino, os.path.basename(caminho_arquivo)))
+    if caminho_xml:
+        shutil.move(caminho_xml, os.path.join(pasta_destino, os.path.basename(caminho_xml)))
 
 
 def _mover_para_bonificacoes(caminho_arquivo):
@@ -1062,9 +579,8 @@ def _mover_para_bonificacoes(caminho_arquivo):
         shutil.move(caminho_arquivo, caminho_destino)
         
         # Tentar mover XML correspondente se existir
-        nome_base, _ = os.path.splitext(caminho_arquivo)
-        caminho_xml = nome_base + '.xml'
-        if os.path.exists(caminho_xml):
+        caminho_xml = xml_irmao(caminho_arquivo)
+        if caminho_xml:
             nome_xml = os.path.basename(caminho_xml)
             caminho_xml_destino = os.path.join(pasta_bonificacoes, nome_xml)
             shutil.move(caminho_xml, caminho_xml_destino)
@@ -1074,99 +590,25 @@ def _mover_para_bonificacoes(caminho_arquivo):
         return False, None, f"Erro ao mover arquivo para bonificacoes: {str(e)}"
 
 
-def _processar_pdf(caminho_arquivo, tipo_documento):
-    """Processa um arquivo PDF e extrai informações relevantes.
-    
-    Args:
-        caminho_arquivo: Caminho completo do arquivo PDF
-        tipo_documento: 'BOLETO' ou 'NOTA_FISCAL'
-    
-    Returns:
-        dict com campos: cnpj, numero_nf, razao_social, data_vencimento, empresa_destak, apenas_emissor (ou None se erro)
-    """
-    if not caminho_arquivo or not os.path.isfile(caminho_arquivo):
-        app.logger.warning(f"PDF não encontrado para processamento: {caminho_arquivo}")
-        return None
-    try:
-        nome_arquivo = os.path.basename(caminho_arquivo)
-        with pdfplumber.open(caminho_arquivo) as pdf:
-            texto_completo = ""
-            for pagina in pdf.pages:
-                h = float(pagina.height) or 842
-                w = float(pagina.width) or 595
-                crop_bottom = max(0, h * 0.75)
-                if crop_bottom <= 0:
-                    cropped = pagina
-                else:
-                    cropped = pagina.crop((0, 0, w, crop_bottom))
-                texto_pagina = cropped.extract_text()
-                if texto_pagina:
-                    texto_completo += texto_pagina + "\n"
-        
-        # Extrai NF, vencimento, valor do boleto, etc.
-        padrao_cnpj = r'\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}'
-        todos_cnpjs = re.findall(padrao_cnpj, texto_completo)
-        apenas_emissor = len(todos_cnpjs) > 0 and len([c for c in todos_cnpjs if c not in CNPJS_EMISSORES]) == 0
-        
-        # Tentar extrair NF do PDF primeiro
-        numero_nf = _extrair_numero_nf(texto_completo)
-        
-        # Se não encontrou no PDF, tentar extrair do nome do arquivo (fallback para arquivos CB/BONIF)
-        if not numero_nf:
-            numero_nf = _extrair_nf_do_nome_arquivo(nome_arquivo)
-            if numero_nf:
-                app.logger.debug(f"DEBUG: NF extraída do nome do arquivo: {numero_nf} (arquivo: {nome_arquivo})")
-        
-        # Detectar se é boleto PATY/Bradesco para ativar debug
-        eh_paty_bradesco = (
-            'BRADESCO' in texto_completo.upper() or 
-            'PATY' in texto_completo.upper() or
-            'CNPJ_PATY' in texto_completo.upper() or
-            not _detectar_empresa_destak(texto_completo)  # Se não é DESTAK, provavelmente é PATY
-        )
-        
-        debug_vencimento = eh_paty_bradesco and tipo_documento == 'BOLETO'
-        
-        resultado = {
-            'cnpj': _extrair_cnpj(texto_completo, nome_arquivo=nome_arquivo),
-            'numero_nf': numero_nf,
-            'razao_social': _extrair_razao_social(texto_completo),
-            'data_vencimento': _extrair_data_vencimento(texto_completo, debug_paty=debug_vencimento),
-            'empresa_destak': _detectar_empresa_destak(texto_completo),
-            'valor_boleto': _extrair_valor_boleto(texto_completo),
-            'apenas_emissor': apenas_emissor,
-        }
-        return resultado
-    except FileNotFoundError:
-        app.logger.warning(f"PDF removido durante processamento: {caminho_arquivo}")
-        return None
-    except Exception as e:
-        app.logger.error(f"Erro ao processar PDF {caminho_arquivo}: {str(e)}")
-        return None
+def _agendar_upload_documento(documento, caminho_absoluto):
+    """Põe o PDF local no spool de envio ao Cloudinary (``services/uploads_nuvem.py``).
 
-
-def _upload_cloudinary_documento_local(caminho_absoluto):
-    """Envia PDF local ao Cloudinary; tolera arquivo ausente (deploy/restart efêmero)."""
+    Devolve o token para ``disparar_uploads`` (depois do commit), ou ``None``
+    quando a nuvem não está configurada ou o arquivo sumiu (deploy/restart
+    efêmero). ``documento`` precisa ter ``id`` (flush antes).
+    """
     if not caminho_absoluto or not os.path.isfile(caminho_absoluto):
         app.logger.warning(f"Arquivo não encontrado para upload Cloudinary: {caminho_absoluto}")
-        return None, None
-    if not (os.environ.get('CLOUDINARY_URL') or app.config.get('CLOUDINARY_URL')):
-        return None, None
+        return None
     try:
-        resultado_nuvem = cloudinary.uploader.upload(
-            caminho_absoluto, resource_type='raw', timeout=_EXTERNAL_TIMEOUT
+        return guardar_para_upload(
+            caminho_absoluto, DESTINO_DOCUMENTO, documento.id,
+            resource_type='raw', empresa_id=documento.empresa_id,
+            referencia=documento.caminho_arquivo,
         )
-        url = resultado_nuvem.get('secure_url')
-        pid = resultado_nuvem.get('public_id')
-        if url:
-            app.logger.info(f"✅ Sucesso Nuvem: {url}")
-        return url, pid
-    except FileNotFoundError:
-        app.logger.warning(f"Arquivo removido antes do upload Cloudinary: {caminho_absoluto}")
-        return None, None
-    except Exception as ex:
-        app.logger.error(f"Erro Cloudinary ({caminho_absoluto}): {ex}")
-        return None, None
+    except OSError as ex:
+        app.logger.error(f"Erro ao guardar para upload ({caminho_absoluto}): {ex}")
+        return None
 
 
 def _processar_documento(caminho_arquivo, user_id_forcado=None):
@@ -1180,15 +622,138 @@ def _processar_documento(caminho_arquivo, user_id_forcado=None):
     _processar_documentos_pendentes(user_id_forcado=user_id_forcado)
 
 
-def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado=None):
+def _documentos_por_caminho(caminhos_relativos):
+    """``{caminho_arquivo: Documento}`` em consultas ``IN`` de 500 caminhos."""
+    docs = {}
+    valores = list(caminhos_relativos)
+    for i in range(0, len(valores), 500):
+        for doc in Documento.query.filter(Documento.caminho_arquivo.in_(valores[i:i + 500])).all():
+            docs.setdefault(doc.caminho_arquivo, doc)
+    return docs
+
+
+def _caminhos_com_documento(caminhos_relativos):
+    """Os caminhos que já têm ``Documento`` (em ``caminho_arquivo`` ou ``url_arquivo``)."""
+    encontrados = set()
+    valores = list(caminhos_relativos)
+    for i in range(0, len(valores), 500):
+        lote = valores[i:i + 500]
+        for caminho, url in db.session.query(Documento.caminho_arquivo, Documento.url_arquivo).filter(
+            or_(Documento.caminho_arquivo.in_(lote), Documento.url_arquivo.in_(lote))
+        ):
+            encontrados.update((caminho, url))
+    return encontrados
+
+
+def _extrair_pasta_em_lote(subpasta, tipo, arquivos, docs, forcar=False):
+    """Estágio paralelo de ``_processar_documentos_pendentes`` para uma pasta.
+
+    Com os documentos já carregados (``docs``, de ``_documentos_por_caminho``),
+    separa os arquivos que o laço vai mandar para ``_processar_pdf``
+    (mesmos critérios: documento novo, ou sem vínculo e sem NF/valor em
+    cache) e extrai todos de uma vez no pool (``extrair_lote``). Notas
+    fiscais levam também a 1ª página, usada na checagem de bonificação.
+    Devolve ``{arquivo: dict}``; o que não estiver aqui o laço extrai em
+    série, como antes. Documentos com a leitura descartada
+    (``_leitura_descartada``) ficam de fora.
+    """
+    pasta = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'documentos_entrada', subpasta)
+    relativos = {a: os.path.join('documentos_entrada', subpasta, a) for a in arquivos}
+
+    tarefas, nomes = [], []
+    for arquivo, relativo in relativos.items():
+        doc = docs.get(relativo)
+        if _leitura_descartada(doc, forcar):
+            continue
+        if doc is None:
+            campos = True
+        elif doc.venda_id is not None:
+            campos = False
+        else:
+            nf_cached = ((getattr(doc, 'nf_extraida', None) or doc.numero_nf) or '').strip()
+            campos = not nf_cached or getattr(doc, 'valor', None) is None
+        primeira_pagina = tipo == 'NOTA_FISCAL'
+        if campos or primeira_pagina:
+            tarefas.append(TarefaExtracao(os.path.join(pasta, arquivo), tipo, primeira_pagina, campos))
+            nomes.append(arquivo)
+    return dict(zip(nomes, extrair_lote(tarefas)))
+
+
+def _atualizar_manifesto_pasta(manifesto, arquivos):
+    """Grava no manifesto o estado final dos arquivos ``{relativo: absoluto}`` varridos.
+
+    Uma consulta ``IN`` (só colunas) por lote. Arquivo que saiu do disco
+    (enviado à nuvem, movido para bonificações) sai do manifesto.
+    """
+    if not manifesto.caminho or not arquivos:
+        return
+    relativos = list(arquivos)
+    venda_por_caminho = {}
+    for i in range(0, len(relativos), 500):
+        venda_por_caminho.update(
+            db.session.query(Documento.caminho_arquivo, Documento.venda_id)
+            .filter(Documento.caminho_arquivo.in_(relativos[i:i + 500]))
+            .all()
+        )
+    for relativo, absoluto in arquivos.items():
+        if not os.path.isfile(absoluto):
+            manifesto.esquecer(relativo)
+        elif relativo not in venda_por_caminho:
+            manifesto.registrar(relativo, absoluto, STATUS_SEM_REGISTRO)
+        elif venda_por_caminho[relativo] is None:
+            manifesto.registrar(relativo, absoluto, STATUS_PENDENTE)
+        else:
+            manifesto.registrar(relativo, absoluto, STATUS_VINCULADO)
+
+
+def _dados_pdf_do_lote(extraido, caminho_arquivo, tipo):
+    """``_processar_pdf`` que já veio do lote; senão extrai agora."""
+    if 'dados' in extraido:
+        return extraido['dados']
+    return _processar_pdf(caminho_arquivo, tipo)
+
+
+def _leitura_descartada(doc, forcar=False):
+    """Documento sem venda cujo PDF já falhou de vez (corrompido/grande demais).
+
+    A varredura não relê o arquivo a cada passada; "forçar leitura" ou um
+    novo envio do arquivo (``receber_documento`` limpa a falha) sim.
+    """
+    return (
+        not forcar and doc is not None and doc.venda_id is None
+        and getattr(doc, 'falha_extracao', None) in FALHAS_DEFINITIVAS
+    )
+
+
+def _sufixo_falha(extraido):
+    """``': PDF corrompido ou ilegível'`` para a mensagem de erro (vazio sem falha)."""
+    falha = extraido.get('falha')
+    return f": {DESCRICAO_FALHA[falha]}" if falha else ''
+
+
+def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado=None, forcar=False, somente=None):
     """Verifica as pastas de documentos e processa novos arquivos PDF que ainda não foram registrados.
     
+    Notas fiscais com o XML da NF-e ao lado são lidas pelo XML; XML sem
+    PDF em ``notas_fiscais/`` é registrado como documento próprio.
+    
+    A leitura dos PDFs roda em processos isolados (``extrair_lote``). PDF
+    que falhou grava a causa em ``Documento.falha_extracao``; corrompido
+    ou grande demais não é relido pela varredura (só com ``forcar``).
+    
+    A varredura é incremental: arquivos já vinculados e inalterados desde
+    então (``services/manifesto_documentos.py``) nem chegam a consultar o
+    banco; os demais são conferidos numa consulta ``IN`` por pasta.
+    
     Args:
         capturar_logs_memoria: Se True, captura logs em uma lista para retorno (usado pelo endpoint de debug)
         user_id_forcado: Se informado, usa este ID como usuario_id ao criar Documento (ex: da thread background)
+        forcar: Se True, ignora o manifesto e revê todos os arquivos (ação "forçar leitura")
+        somente: Caminhos relativos (``documentos_entrada/<pasta>/<arquivo>``) — processa só
+            esses arquivos, sem manifesto e sem a passagem 2 (fila de documentos)
     
     Returns:
-        dict com: {'processados': int, 'erros': int, 'mensagens': list, 'logs': list (se capturar_logs_memoria=True)}
+        dict com: {'processados': int, 'erros': int, 'inalterados': int, 'mensagens': list, 'logs': list (se capturar_logs_memoria=True)}
     """
     # Lista para capturar logs em memória (usado pelo endpoint de debug)
     logs_memoria = []
@@ -1216,8 +781,11 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
         'NOTA_FISCAL': os.path.join(base_dir, 'notas_fiscais'),
     }
     
-    resultado = {'processados': 0, 'erros': 0, 'vinculos_novos': 0, 'mensagens': []}
-    
+    resultado = {'processados': 0, 'erros': 0, 'vinculos_novos': 0, 'inalterados': 0, 'mensagens': []}
+    manifesto = ManifestoDocumentos.carregar()
+    uploads_agendados = []
+    if somente is not None:
+        somente = {str(c).replace('\\', '/') for c in somente}
     
     for tipo, pasta in pastas.items():
         if not os.path.exists(pasta):
@@ -1225,11 +793,52 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
             continue
         
         # Lista todos os PDFs na pasta
-        arquivos_pdf = [f for f in os.listdir(pasta) if f.lower().endswith('.pdf')]
-        app.logger.debug(f"DEBUG: Processando {len(arquivos_pdf)} arquivo(s) do tipo {tipo}")
+        subpasta = os.path.basename(pasta)
+        prefixo_relativo = os.path.join('documentos_entrada', subpasta, '')
+        todos_pdf = [f for f in os.listdir(pasta) if f.lower().endswith('.pdf')]
+        if tipo == 'NOTA_FISCAL':
+            # XML da NF-e sem PDF vira documento próprio; com PDF, só alimenta a
+            # leitura dele. Conta como PDF também o que já tem Documento e saiu
+            # do disco (enviado à nuvem por services/uploads_nuvem.py).
+            bases_pdf = {os.path.splitext(f)[0] for f in todos_pdf}
+            xmls_sem_pdf = [
+                f for f in os.listdir(pasta)
+                if f.lower().endswith('.xml') and os.path.splitext(f)[0] not in bases_pdf
+            ]
+            pdfs_dos_xmls = {
+                f: [prefixo_relativo + os.path.splitext(f)[0] + ext for ext in ('.pdf', '.PDF')]
+                for f in xmls_sem_pdf
+            }
+            registrados = _caminhos_com_documento(c for cs in pdfs_dos_xmls.values() for c in cs)
+            todos_pdf += [
+                f for f in xmls_sem_pdf
+                if not any(c in registrados for c in pdfs_dos_xmls[f])
+            ]
+        if somente is not None:
+            todos_pdf = [f for f in todos_pdf if prefixo_relativo + f in somente]
+        else:
+            manifesto.podar(prefixo_relativo, [prefixo_relativo + f for f in todos_pdf])
+        # Vinculados e inalterados desde a última conferência ficam de fora.
+        alterados, pulados = manifesto.separar(
+            {prefixo_relativo + f: os.path.join(pasta, f) for f in todos_pdf},
+            forcar=forcar or somente is not None,
+        )
+        arquivos_pdf = [os.path.basename(r) for r in alterados]
+        resultado['inalterados'] += len(pulados)
+        app.logger.debug(
+            f"DEBUG: Processando {len(arquivos_pdf)} arquivo(s) do tipo {tipo} "
+            f"({len(pulados)} inalterado(s) pelo manifesto)"
+        )
+        # Uma consulta IN para todos os arquivos da pasta (antes: uma por arquivo).
+        docs_por_caminho = _documentos_por_caminho(alterados)
+        # Parsing dos PDFs em paralelo, antes do laço; o vínculo com o
+        # banco continua abaixo, arquivo a arquivo, no processo atual.
+        forcar_leitura = forcar or somente is not None
+        extraidos = _extrair_pasta_em_lote(subpasta, tipo, arquivos_pdf, docs_por_caminho, forcar_leitura)
         
         for arquivo in arquivos_pdf:
             caminho_completo = os.path.join(pasta, arquivo)
+            extraido = extraidos.get(arquivo, {})
             caminho_relativo = os.path.join('documentos_entrada', 'boletos' if tipo == 'BOLETO' else 'notas_fiscais', arquivo)
 
             if not os.path.isfile(caminho_completo):
@@ -1243,16 +852,23 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
                 resultado['mensagens'].append(f"⚠️ {arquivo}: arquivo ausente no servidor.")
                 continue
             
+            if _leitura_descartada(docs_por_caminho.get(caminho_relativo), forcar_leitura):
+                app.logger.debug(f"DEBUG: {arquivo} com falha de leitura registrada, pulando")
+                continue
+            
             # Verificar se é bonificação ANTES de processar (apenas para notas fiscais)
             if tipo == 'NOTA_FISCAL':
-                texto_primeira_pagina = _extrair_texto_primeira_pagina(caminho_completo)
-                if _detectar_bonificacao(texto_primeira_pagina):
+                # O lote já leu a 1ª página e checou a bonificação na mesma abertura.
+                eh_bonificacao = extraido.get('bonificacao')
+                if eh_bonificacao is None:
+                    eh_bonificacao = _detectar_bonificacao(_extrair_texto_primeira_pagina(caminho_completo))
+                if eh_bonificacao:
                     # Mover arquivo para pasta bonificacoes
                     sucesso, caminho_destino, mensagem = _mover_para_bonificacoes(caminho_completo)
                     if sucesso:
                         app.logger.info(f"[BONIFICACAO] {mensagem}")
                         # Se havia documento no banco, removê-lo
-                        doc_existente = Documento.query.filter_by(caminho_arquivo=caminho_relativo).first()
+                        doc_existente = docs_por_caminho.get(caminho_relativo)
                         if doc_existente:
                             _deletar_cloudinary_seguro(
                                 public_id=getattr(doc_existente, 'public_id', None),
@@ -1272,7 +888,7 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
             dados_extraidos = None
             
             # Verifica se já foi processado E vinculado (permite re-processar documentos não vinculados)
-            doc_existente = Documento.query.filter_by(caminho_arquivo=caminho_relativo).first()
+            doc_existente = docs_por_caminho.get(caminho_relativo)
             # CORREÇÃO: Só pular se documento existe E está vinculado. Permite re-processar documentos não vinculados.
             if doc_existente and doc_existente.venda_id is not None:
                 app.logger.debug(f"DEBUG: Arquivo {arquivo} já processado e vinculado (Venda ID {doc_existente.venda_id}), pulando")
@@ -1280,12 +896,10 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
             elif doc_existente and doc_existente.venda_id is None:
                 app.logger.debug(f"DEBUG: Documento ID {doc_existente.id} existe mas não está vinculado. Re-processando para tentar vincular.")
                 documento = doc_existente
-                if not documento.url_arquivo and (os.environ.get('CLOUDINARY_URL') or app.config.get('CLOUDINARY_URL')):
-                    url_arquivo, public_id = _upload_cloudinary_documento_local(caminho_completo)
-                    if url_arquivo:
-                        documento.url_arquivo = url_arquivo
-                        documento.public_id = public_id
-                        db.session.flush()
+                if not documento.url_arquivo:
+                    token_upload = _agendar_upload_documento(documento, caminho_completo)
+                    if token_upload:
+                        uploads_agendados.append(token_upload)
                 nf_cached = (getattr(doc_existente, 'nf_extraida', None) or doc_existente.numero_nf)
                 nf_cached = (nf_cached or '').strip() or None
                 if nf_cached:
@@ -1300,7 +914,7 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
                     # Se valor ainda não foi persistido, re-extrai só o valor do PDF
                     if dados_extraidos.get('valor_boleto') is None and os.path.isfile(caminho_completo):
                         try:
-                            dados_pdf = _processar_pdf(caminho_completo, tipo)
+                            dados_pdf = _dados_pdf_do_lote(extraido, caminho_completo, tipo)
                             if dados_pdf and dados_pdf.get('valor_boleto') is not None:
                                 documento.valor = dados_pdf.get('valor_boleto')
                                 dados_extraidos['valor_boleto'] = documento.valor
@@ -1308,11 +922,15 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
                         except Exception:
                             pass
                 else:
-                    dados_extraidos = _processar_pdf(caminho_completo, tipo)
+                    dados_extraidos = _dados_pdf_do_lote(extraido, caminho_completo, tipo)
                     if dados_extraidos is None:
                         resultado['erros'] += 1
-                        resultado['mensagens'].append(f"Erro ao re-processar {arquivo}")
+                        resultado['mensagens'].append(f"Erro ao re-processar {arquivo}{_sufixo_falha(extraido)}")
+                        if extraido.get('falha'):
+                            documento.falha_extracao = extraido['falha']
+                            db.session.commit()
                         continue
+                    documento.falha_extracao = None
                     documento.cnpj = dados_extraidos.get('cnpj')
                     documento.numero_nf = dados_extraidos.get('numero_nf')
                     documento.razao_social = dados_extraidos.get('razao_social')
@@ -1326,10 +944,10 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
                 # dados_extraidos pronto; continuar com a lógica de vínculo abaixo
             else:
                 # Documento não existe, processar PDF normalmente (sempre roda OCR)
-                dados_extraidos = _processar_pdf(caminho_completo, tipo)
+                dados_extraidos = _dados_pdf_do_lote(extraido, caminho_completo, tipo)
                 if dados_extraidos is None:
                     resultado['erros'] += 1
-                    resultado['mensagens'].append(f"Erro ao processar {arquivo}")
+                    resultado['mensagens'].append(f"Erro ao processar {arquivo}{_sufixo_falha(extraido)}")
                     continue
                 # documento será criado abaixo no bloco try
             
@@ -1349,19 +967,12 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
                 # Exceção: NFs inválidas não vinculam automaticamente
                 nfs_invalidas = ('S/N', '0', 'Falta_nota', '')
                 if nf_limpa and nf_limpa not in nfs_invalidas:
-                    # Buscar TODAS as vendas e normalizar suas NFs para comparação
-                    # Isso garante que encontramos vendas mesmo com formatos diferentes (zeros à esquerda, prefixos, etc.)
-                    todas_vendas = Venda.query.filter(
-                        Venda.nf.isnot(None)
-                    ).options(
-                        joinedload(Venda.cliente), joinedload(Venda.produto)
-                    ).all()
-                    vendas_candidatas = []
-                    for v in todas_vendas:
-                        if v.nf:
-                            nf_venda_norm = _normalizar_nf(str(v.nf))
-                            if nf_venda_norm == nf_limpa:
-                                vendas_candidatas.append(v)
+                    # Busca pela NF normalizada indexada (zeros à esquerda, prefixos, etc.
+                    # já resolvidos na gravação) — sem carregar todas as vendas.
+                    vendas_candidatas = vendas_por_nf(
+                        nf_limpa, sufixo=False,
+                        opcoes=(joinedload(Venda.cliente), joinedload(Venda.produto)),
+                    )
                     
                     # Log das variantes tentadas (para debug)
                     variants = [nf_limpa, 'NF-' + nf_limpa, 'NF' + nf_limpa, 'NF ' + nf_limpa]
@@ -1545,22 +1156,9 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
                 if documento is None:
                     nf_val = dados_extraidos.get('numero_nf')
                     usuario_id = user_id_forcado if user_id_forcado else (current_user.id if current_user.is_authenticated else None)
-                    url_arquivo = None
-                    public_id = None
-
-                    # OBRIGATÓRIO: Fazer o upload para a nuvem ANTES de salvar no banco
-                    url_arquivo, public_id = _upload_cloudinary_documento_local(caminho_completo)
-                    if not url_arquivo and not (os.environ.get('CLOUDINARY_URL') or app.config.get('CLOUDINARY_URL')):
-                        app.logger.warning("⚠️ Cloudinary não configurado. Salvando sem URL.")
-                    elif not url_arquivo and not os.path.isfile(caminho_completo):
-                        app.logger.warning(
-                            f"⚠️ Arquivo local ausente; documento será salvo sem URL na nuvem: {caminho_completo}"
-                        )
 
                     documento = Documento(
                         caminho_arquivo=caminho_relativo,
-                        url_arquivo=url_arquivo,
-                        public_id=public_id,
                         tipo=tipo,
                         cnpj=dados_extraidos.get('cnpj'),
                         numero_nf=nf_val,
@@ -1577,6 +1175,13 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
                     )
                     db.session.add(documento)
                     db.session.flush()
+                    # Envio à nuvem em background (spool); url_arquivo/public_id
+                    # chegam depois do commit. Sem Cloudinary: fica sem URL.
+                    token_upload = _agendar_upload_documento(documento, caminho_completo)
+                    if token_upload:
+                        uploads_agendados.append(token_upload)
+                    elif not nuvem_configurada():
+                        app.logger.warning("⚠️ Cloudinary não configurado. Salvando sem URL.")
                 _log_detalhado(f"DEBUG: Documento {'atualizado' if doc_existente else 'criado'}: ID={documento.id}, venda_id={venda_id}, venda_match={venda_match is not None}")
                 
                 # FORÇAR VÍNCULO: Se encontrou exatamente 1 venda válida, vincular IMEDIATAMENTE
@@ -1699,6 +1304,9 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
                 app.logger.debug(f"DEBUG: Traceback: {traceback.format_exc()}")
                 resultado['erros'] += 1
                 resultado['mensagens'].append(f"❌ {mensagem_erro}")
+
+        _atualizar_manifesto_pasta(manifesto, alterados)
+    manifesto.salvar()
     
     _log_detalhado(f"DEBUG: Processamento finalizado: {resultado['processados']} processados, {resultado['vinculos_novos']} vinculados, {resultado['erros']} erros")
     
@@ -1729,14 +1337,16 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
             docs_query = docs_query.filter(
                 or_(Documento.empresa_id == eid_atual, Documento.empresa_id.is_(None))
             )
-        docs_sem_arquivo = docs_query.all()
-
-        vendas_query = Venda.query.filter(
-            Venda.nf.isnot(None), Venda.nf != ''
+        # Processamento de um arquivo só (fila de documentos): sem varredura global.
+        docs_sem_arquivo = docs_query.all() if somente is None else []
+
+        # Vendas candidatas de todos os documentos em poucas consultas pela
+        # NF normalizada indexada (sem o teto de 5000 vendas de antes).
+        vendas_por_nf_p2 = vendas_por_nfs(
+            [(d.nf_extraida or d.numero_nf or '').strip() for d in docs_sem_arquivo],
+            empresa_id=eid_atual,
+            opcoes=(joinedload(Venda.cliente),),
         )
-        if eid_atual is not None:
-            vendas_query = vendas_query.filter(Venda.empresa_id == eid_atual)
-        vendas_com_nf_cache = vendas_query.options(joinedload(Venda.cliente)).limit(5000).all()
 
         for doc_pendente in docs_sem_arquivo:
             # Pular se existe localmente (já foi processado no loop acima)
@@ -1755,11 +1365,7 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
             if not nf_doc_norm or nf_doc_norm in ('S/N', '0', ''):
                 continue
 
-            vendas_validas_p2 = [
-                v for v in vendas_com_nf_cache
-                if _nf_match(nf_doc_norm, _normalizar_nf(str(v.nf)))
-            ]
-            vendas_validas_p2 = _deduplicar_vendas_por_pedido(vendas_validas_p2)
+            vendas_validas_p2 = _deduplicar_vendas_por_pedido(vendas_por_nf_p2.get(nf_doc_norm, []))
             if len(vendas_validas_p2) != 1:
                 continue  # Ambiguidade ou não encontrado → triagem manual
 
@@ -1792,6 +1398,9 @@ def _processar_documentos_pendentes(capturar_logs_memoria=False, user_id_forcado
         _log_detalhado(f"[P2-url-only] ERRO na passagem 2: {e_p2_outer}")
     # ─────────────────────────────────────────────────────────────────────────
 
+    # Envios ao Cloudinary só depois dos commits acima (o job confere a linha).
+    disparar_uploads(uploads_agendados)
+
     # Se estiver capturando logs em memória, adicionar ao resultado
     if capturar_logs_memoria:
         resultado['logs'] = logs_memoria
@@ -1810,21 +1419,25 @@ def _reprocessar_boletos_atualizar_extracao():
     ok, erros = 0, 0
     if not os.path.exists(pasta):
         return {'atualizados': 0, 'erros': 0}
-    for nome in os.listdir(pasta):
-        if not nome.lower().endswith('.pdf'):
-            continue
-        path_full = os.path.join(pasta, nome)
-        if not os.path.isfile(path_full):
-            continue
-        path_rel = os.path.join('documentos_entrada', 'boletos', nome).replace(os.sep, '/')
-        doc = Documento.query.filter_by(caminho_arquivo=path_rel).first()
-        if not doc:
-            continue
-        dados = _processar_pdf(path_full, 'BOLETO')
+    arquivos = {
+        os.path.join('documentos_entrada', 'boletos', nome).replace(os.sep, '/'): os.path.join(pasta, nome)
+        for nome in os.listdir(pasta)
+        if nome.lower().endswith('.pdf') and os.path.isfile(os.path.join(pasta, nome))
+    }
+    docs = _documentos_por_caminho(arquivos)
+    alvos = [(docs[rel], arquivos[rel]) for rel in arquivos if rel in docs]
+    # Leitura em lote, nos processos isolados da extração.
+    extraidos = extrair_lote([TarefaExtracao(path_full, 'BOLETO', False, True) for _, path_full in alvos])
+    for (doc, _), extraido in zip(alvos, extraidos):
+        dados = extraido.get('dados')
         if dados is None:
+            if extraido.get('falha'):
+                doc.falha_extracao = extraido['falha']
+                db.session.commit()
             erros += 1
             continue
         try:
+            doc.falha_extracao = None
             doc.numero_nf = dados.get('numero_nf')
             doc.cnpj = dados.get('cnpj')
             doc.razao_social = dados.get('razao_social')
@@ -1839,69 +1452,6 @@ def _reprocessar_boletos_atualizar_extracao():
     return {'atualizados': ok, 'erros': erros}
 
 
-def _reprocessar_vencimentos_vendas():
-    """Percorre vendas com boleto vinculado e extrai data_vencimento do PDF para atualizar a venda.
-    Retorna dict com estatísticas: {'total': int, 'atualizados': int, 'sem_data': int, 'erros': int, 'detalhes': list}"""
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    resultado = {'total': 0, 'atualizados': 0, 'sem_data': 0, 'erros': 0, 'detalhes': []}
-    
-    # Buscar vendas com boleto vinculado
-    vendas = Venda.query.filter(Venda.caminho_boleto.isnot(None)).all()
-    resultado['total'] = len(vendas)
-    
-    for venda in vendas:
-        caminho = (venda.caminho_boleto or '').strip()
-        if not caminho:
-            continue
-        
-        path_full = os.path.join(base_dir, caminho)
-        if not os.path.isfile(path_full):
-            resultado['erros'] += 1
-            resultado['detalhes'].append(f"Venda {venda.id}: Arquivo não encontrado: {caminho}")
-            continue
-        
-        try:
-            dados = _processar_pdf(path_full, 'BOLETO')
-            if dados is None:
-                resultado['erros'] += 1
-                resultado['detalhes'].append(f"Venda {venda.id}: Erro ao processar PDF")
-                continue
-            
-            dv = dados.get('data_vencimento')
-            if dv:
-                venda.aplicar_vencimento_e_prazo(dv)
-                db.session.commit()
-                resultado['atualizados'] += 1
-                resultado['detalhes'].append(f"Venda {venda.id}: Vencimento atualizado para {dv.strftime('%d/%m/%Y')}")
-            else:
-                resultado['sem_data'] += 1
-                resultado['detalhes'].append(f"Venda {venda.id}: Nenhuma data de vencimento encontrada no PDF")
-        except Exception as e:
-            db.session.rollback()
-            resultado['erros'] += 1
-            resultado['detalhes'].append(f"Venda {venda.id}: Exceção: {str(e)}")
-    
-    # Também atualizar vendas que têm documento vinculado mas não têm data_vencimento ainda
-    vendas_sem_dv = Venda.query.filter(
-        Venda.data_vencimento.is_(None),
-        Venda.caminho_boleto.isnot(None)
-    ).all()
-    
-    for venda in vendas_sem_dv:
-        # Tentar obter do Documento se existir
-        doc = Documento.query.filter_by(caminho_arquivo=venda.caminho_boleto).first()
-        if doc and doc.data_vencimento:
-            venda.aplicar_vencimento_e_prazo(doc.data_vencimento)
-            try:
-                db.session.commit()
-                resultado['atualizados'] += 1
-                resultado['detalhes'].append(f"Venda {venda.id}: Vencimento copiado do Documento: {doc.data_vencimento.strftime('%d/%m/%Y')}")
-            except Exception:
-                db.session.rollback()
-    
-    return resultado
-
-
 def _deduplicar_vendas_por_id(vendas):
     """Remove duplicidades de objetos Venda mantendo IDs únicos.
 
@@ -1930,9 +1480,11 @@ def _deduplicar_vendas_por_pedido(vendas):
     return list(unicas.values())
 
 
-def _diagnosticar_vinculo_falhou(doc, vendas_com_nf_cache=None):
+def _diagnosticar_vinculo_falhou(doc, vendas_por_nf_cache=None):
     """Diagnostica por que um documento não foi vinculado automaticamente.
     Lógica simplificada: compara APENAS NF (normalizada, sem zeros à esquerda).
+    ``vendas_por_nf_cache``: ``{nf_normalizada: [Venda]}`` de ``vendas_por_nfs``
+    (fila do dashboard); NF fora dele é consultada pelo índice.
     Retorna dict com: cenario ('A', 'B', 'C' ou None), mensagem, cliente_id, cliente_nome, nf_tentada."""
     if not doc or doc.venda_id is not None:
         return None
@@ -1954,17 +1506,11 @@ def _diagnosticar_vinculo_falhou(doc, vendas_com_nf_cache=None):
             'nf_tentada': nf_limpa,
             'nf_lida': doc_nf
         }
-    # Buscar vendas com NF preenchida (evita carregar tabela inteira)
-    vendas_validas = []
-    vendas_com_nf = vendas_com_nf_cache
-    if vendas_com_nf is None:
-        vendas_com_nf = Venda.query.filter(
-            Venda.nf.isnot(None), Venda.nf != ''
-        ).options(joinedload(Venda.cliente)).limit(5000).all()
-    for v in vendas_com_nf:
-        nf_venda_norm = _normalizar_nf(str(v.nf))
-        if _nf_match(nf_limpa, nf_venda_norm):
-            vendas_validas.append(v)
+    # Vendas que casam pela NF normalizada indexada (igual ou base + sufixo).
+    if vendas_por_nf_cache is not None and nf_limpa in vendas_por_nf_cache:
+        vendas_validas = vendas_por_nf_cache[nf_limpa]
+    else:
+        vendas_validas = vendas_por_nf(nf_limpa, opcoes=(joinedload(Venda.cliente),))
     vendas_validas = _deduplicar_vendas_por_pedido(vendas_validas)
     
     if len(vendas_validas) == 0:
@@ -2008,18 +1554,20 @@ def _listar_documentos_recem_chegados():
     Regra de negócio da fila "Documentos Recém-Chegados":
     - exibir apenas documentos sem vínculo com venda (``venda_id IS NULL``)
 
-    AUTO-LINK:
-    Quando ``_diagnosticar_vinculo_falhou`` retorna cenário 'A' (exatamente uma
-    venda correspondente à NF), o vínculo é gravado imediatamente — o documento
-    nunca fica preso na fila exibindo a mensagem azul "NF encontrada" sem ser
-    resolvido automaticamente.  Isso cobre documentos sem arquivo local (uploads
-    via bot/Cloudinary) que o ``_processar_documentos_pendentes`` nunca alcança.
+    O diagnóstico de cada documento (``_diagnosticar_vinculo_falhou``) vem
+    pré-calculado em ``Documento.diagnostico`` e o auto-vínculo do cenário
+    'A' é feito pelo job de ``services/diagnostico_vinculo.py`` — listar
+    a fila é uma consulta só, sem gravação no GET. Documento com
+    diagnóstico ainda pendente aparece sem mensagem até o job passar.
+    Legados sem ``empresa_id`` (fora do job) são diagnosticados na
+    request, contra as vendas do tenant atual, sem auto-vínculo.
     """
     resultado_processamento = {"sucesso": 0, "falha": 0, "erros": [], "vinculos_novos": 0, "processados": 0}
     # Auditoria P0 (A2): a fila do dashboard é tenant-aware. Apenas documentos
     # do próprio tenant (ou órfãos legados sem empresa_id) entram na fila.
     eid_atual = empresa_id_atual()
-    query = Documento.query.filter(Documento.venda_id.is_(None))
+    # Documentos ainda na fila de processamento (PROCESSANDO) entram quando o worker terminar.
+    query = Documento.query.filter(Documento.venda_id.is_(None), fora_do_processamento())
     if eid_atual is not None:
         query = query.filter(
             or_(Documento.empresa_id == eid_atual, Documento.empresa_id.is_(None))
@@ -2028,54 +1576,15 @@ def _listar_documentos_recem_chegados():
     # Mantemos o parâmetro user_id por compatibilidade, mas sem restringir esta listagem.
     # Limite defensivo para evitar timeout de worker em bases grandes.
     docs = query.order_by(Documento.id.desc()).limit(300).all()
-    # Cache da consulta de vendas por NF nesta mesma request (evita N x 5000 scans).
-    vendas_query = Venda.query.filter(Venda.nf.isnot(None), Venda.nf != '')
-    if eid_atual is not None:
-        vendas_query = vendas_query.filter(Venda.empresa_id == eid_atual)
-    vendas_com_nf_cache = vendas_query.options(joinedload(Venda.cliente)).limit(5000).all()
+    # Legados sem empresa_id ficam fora do job: diagnosticados aqui, só contra
+    # as vendas deste tenant e sem gravar.
+    diag_legados = diagnosticar_sem_gravar([d for d in docs if d.empresa_id is None], eid_atual)
     documentos = []
     for doc in docs:
-        diag = _diagnosticar_vinculo_falhou(doc, vendas_com_nf_cache=vendas_com_nf_cache)
-
-        # ── AUTO-LINK: cenário A = 1 venda única encontrada ───────────────────
-        # O diagnóstico já fez a busca e conhece o venda_id correto. Em vez de
-        # apenas exibir a mensagem azul esperando clique manual, efetuar o
-        # commit aqui mesmo garante que o documento saia da fila imediatamente.
-        if diag and diag.get('cenario') == 'A':
-            venda_id_diag = diag.get('venda_id')
-            if venda_id_diag:
-                try:
-                    doc.venda_id = venda_id_diag
-                    venda_alvo = db.session.get(Venda, venda_id_diag)
-                    if venda_alvo and doc.caminho_arquivo:
-                        path_rel = doc.caminho_arquivo
-                        for vv in _vendas_do_pedido(venda_alvo):
-                            if (doc.tipo or '').upper() == 'BOLETO':
-                                vv.caminho_boleto = path_rel
-                                if doc.data_vencimento:
-                                    vv.aplicar_vencimento_e_prazo(doc.data_vencimento)
-                            else:
-                                vv.caminho_nf = path_rel
-                    db.session.commit()
-                    resultado_processamento['vinculos_novos'] += 1
-                    current_app.logger.info(
-                        f"[auto-link-dashboard] Documento ID {doc.id} "
-                        f"(NF {doc.numero_nf}) vinculado à venda {venda_id_diag}."
-                    )
-                    # Documento agora tem venda_id → NÃO entra na fila pendente.
-                    continue
-                except Exception as exc:
-                    db.session.rollback()
-                    current_app.logger.warning(
-                        f"[auto-link-dashboard] Falha ao vincular doc ID {doc.id} "
-                        f"→ venda {venda_id_diag}: {exc}"
-                    )
-                    # Em caso de falha, o documento cai na fila normalmente.
-        # ─────────────────────────────────────────────────────────────────────
-
+        diag = diag_legados.get(doc.id) if doc.empresa_id is None else diagnostico_armazenado(doc)
         nf_nao = diag is not None and diag.get('cenario') == 'C' and 'não localizada' in (diag.get('mensagem') or '')
         documentos.append({
-                'doc': doc,
+            'doc': doc,
             'nome_arquivo': os.path.basename(doc.caminho_arquivo or ''),
             'leitura_ok': True,
             'nf_nao_encontrada': nf_nao,
@@ -2110,10 +1619,11 @@ def _auto_vincular_documentos_pendentes_por_nf(user_id=None):
         )
     docs = query.all()
 
-    vendas_query = Venda.query.filter(Venda.nf.isnot(None), Venda.nf != '')
-    if eid_atual is not None:
-        vendas_query = vendas_query.filter(Venda.empresa_id == eid_atual)
-    vendas_com_nf = vendas_query.limit(5000).all()
+    # Vendas candidatas de todos os documentos pela NF normalizada indexada.
+    candidatas_por_nf = vendas_por_nfs(
+        [(d.nf_extraida or d.numero_nf or '').strip() for d in docs],
+        empresa_id=eid_atual,
+    )
 
     for doc in docs:
         try:
@@ -2122,12 +1632,7 @@ def _auto_vincular_documentos_pendentes_por_nf(user_id=None):
             if not nf_doc or nf_doc in ('S/N', '0'):
                 continue
 
-            vendas_candidatas = []
-            for venda in vendas_com_nf:
-                nf_venda = _normalizar_nf(str(venda.nf or '').strip())
-                if _nf_match(nf_doc, nf_venda):
-                    vendas_candidatas.append(venda)
-            vendas_candidatas = _deduplicar_vendas_por_pedido(vendas_candidatas)
+            vendas_candidatas = _deduplicar_vendas_por_pedido(candidatas_por_nf.get(nf_doc, []))
             if len(vendas_candidatas) != 1:
                 continue
             venda_match = vendas_candidatas[0]
@@ -2539,7 +2044,15 @@ def _iniciar_scheduler() -> None:
     Usa RedisJobStore quando Redis estiver disponível (distribui o lock entre
     workers), caso contrário cai para MemoryJobStore.
 
-    O job ``backup_diario`` dispara todo dia às 23h50 (fuso de Brasília/Recife).
+    O job ``backup_diario`` dispara todo dia às 23h50 (fuso de Brasília/Recife);
+    ``fechamento_caixa_mensal`` às 00h10 fecha o mês anterior dos tenants
+    que ainda têm saldo a transportar; ``limpeza_cache_extracao_pdf`` às
+    03h30 poda o cache de extração de PDFs; ``retomar_documentos_parados``
+    a cada 10 minutos reenfileira documentos recebidos que ficaram parados;
+    ``reconciliar_uploads_nuvem`` a cada 5 minutos redespacha envios ao
+    Cloudinary que estão no spool; ``diagnostico_vinculo_documentos`` a
+    cada 5 minutos recalcula o diagnóstico da fila de documentos que
+    ficou pendente.
     """
     global _scheduler
 
@@ -2601,8 +2114,55 @@ def _iniciar_scheduler() -> None:
         id='backup_diario',
         replace_existing=True,
     )
+    # Fechamento mensal do caixa (Fundo de Caixa): antes disparado por todo
+    # GET /caixa. Diário para também transportar lançamentos retroativos
+    # no mês anterior; idempotente por FechamentoMensalCaixa.
+    from services.fechamento_caixa import executar_fechamento_automatico
+    _scheduler.add_job(
+        executar_fechamento_automatico,
+        trigger=CronTrigger(hour=0, minute=10, timezone='America/Recife'),
+        id='fechamento_caixa_mensal',
+        replace_existing=True,
+    )
+    # Poda do cache de extração de PDF (disco local): entradas de mais de
+    # 30 dias ou com textos de uma VERSAO_TEXTO antiga.
+    from services.extracao_pdf import limpar_cache_extracao_pdf
+    _scheduler.add_job(
+        limpar_cache_extracao_pdf,
+        trigger=CronTrigger(hour=3, minute=30, timezone='America/Recife'),
+        id='limpeza_cache_extracao_pdf',
+        replace_existing=True,
+    )
+    # Documentos recebidos que ficaram PROCESSANDO sem worker (restart no meio).
+    from services.fila_documentos import retomar_documentos_parados
+    _scheduler.add_job(
+        retomar_documentos_parados,
+        trigger=CronTrigger(minute='*/10', timezone='America/Recife'),
+        id='retomar_documentos_parados',
+        replace_existing=True,
+    )
+    # Envios ao Cloudinary que falharam (espera vencida) ou ficaram no spool.
+    from services.uploads_nuvem import reconciliar_uploads
+    _scheduler.add_job(
+        reconciliar_uploads,
+        trigger=CronTrigger(minute='*/5', timezone='America/Recife'),
+        id='reconciliar_uploads_nuvem',
+        replace_existing=True,
+    )
+    # Diagnóstico/auto-vínculo pela NF da fila de documentos: o commit que
+    # invalida já agenda; aqui é a rede de segurança (restart, RQ fora).
+    from services.diagnostico_vinculo import executar_atualizacao_diagnosticos
+    _scheduler.add_job(
+        executar_atualizacao_diagnosticos,
+        trigger=CronTrigger(minute='*/5', timezone='America/Recife'),
+        id='diagnostico_vinculo_documentos',
+        replace_existing=True,
+    )
     _scheduler.start()
-    app.logger.info(f"[scheduler] BackgroundScheduler iniciado (pid {os.getpid()}). Backup às 23h50 (Recife).")
+    app.logger.info(
+        f"[scheduler] BackgroundScheduler iniciado (pid {os.getpid()}). "
+        "Backup às 23h50 e fechamento do caixa às 00h10 (Recife)."
+    )
 
 
 # Inicializar somente fora do processo de reloader do Flask dev server
@@ -3976,6 +3536,75 @@ if not os.environ.get('SKIP_DB_BOOTSTRAP'):
             db.session.commit()
         except (OperationalError, Exception):
             db.session.rollback()
+        # NF normalizada indexada em vendas e documentos: o vínculo por NF
+        # consulta o índice em vez de normalizar todas as vendas em Python.
+        # Backfill idempotente; gravações novas são mantidas pelos listeners
+        # de services/indice_nf.py.
+        for _tabela_nf in ('vendas', 'documentos'):
+            try:
+                _adicionar_coluna_se_ausente(_tabela_nf, 'nf_normalizada', 'VARCHAR(50)')
+            except (OperationalError, Exception):
+                db.session.rollback()
+        try:
+            db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_vendas_nf_normalizada ON vendas(nf_normalizada)'))
+            db.session.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_vendas_empresa_nf_normalizada ON vendas(empresa_id, nf_normalizada)'
+            ))
+            db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_documentos_nf_normalizada ON documentos(nf_normalizada)'))
+            db.session.commit()
+        except (OperationalError, Exception):
+            db.session.rollback()
+        try:
+            from services.indice_nf import preencher_nf_normalizada
+            _qtd_nf = preencher_nf_normalizada()
+            db.session.commit()
+            if _qtd_nf['vendas'] or _qtd_nf['documentos']:
+                app.logger.info(
+                    f"NF normalizada preenchida: {_qtd_nf['vendas']} vendas, {_qtd_nf['documentos']} documentos."
+                )
+        except (OperationalError, Exception) as _nf_err:
+            db.session.rollback()
+            app.logger.warning(f"Migração nf_normalizada: {_nf_err}")
+        # Fila de processamento de documentos (services/fila_documentos.py).
+        for col, col_def in [
+            ('status_processamento', 'VARCHAR(20)'),
+            ('tentativas_processamento', 'INTEGER NOT NULL DEFAULT 0'),
+            ('erro_processamento', 'TEXT'),
+            ('processamento_atualizado_em', 'TIMESTAMP'),
+        ]:
+            try:
+                _adicionar_coluna_se_ausente('documentos', col, col_def)
+            except (OperationalError, Exception):
+                db.session.rollback()
+        try:
+            db.session.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_documentos_status_processamento ON documentos(status_processamento)'
+            ))
+            db.session.commit()
+        except (OperationalError, Exception):
+            db.session.rollback()
+        # Falha classificada da leitura do PDF (services/sandbox_extracao.py).
+        try:
+            _adicionar_coluna_se_ausente('documentos', 'falha_extracao', 'VARCHAR(20)')
+        except (OperationalError, Exception):
+            db.session.rollback()
+        # Diagnóstico do vínculo pré-calculado para a fila (services/diagnostico_vinculo.py).
+        # Colunas novas nascem NULL = "a recalcular": o job do scheduler preenche o histórico.
+        for col, col_def in [('diagnostico_cenario', 'VARCHAR(1)'), ('diagnostico', 'TEXT')]:
+            try:
+                _adicionar_coluna_se_ausente('documentos', col, col_def)
+            except (OperationalError, Exception):
+                db.session.rollback()
+        try:
+            db.session.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_documentos_empresa_venda_id ON documentos(empresa_id, venda_id, id)'
+            ))
+            db.session.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_documentos_venda_diagnostico ON documentos(venda_id, diagnostico_cenario)'
+            ))
+            db.session.commit()
+        except (OperationalError, Exception):
+            db.session.rollback()
         # Migração: usuario_id em documentos (quem processou/recuperou)
         try:
             _adicionar_coluna_se_ausente('documentos', 'usuario_id', 'INTEGER')
@@ -4290,38 +3919,14 @@ if not os.environ.get('SKIP_DB_BOOTSTRAP'):
             db.session.commit()
         except (OperationalError, Exception):
             db.session.rollback()
-        # Backfill: percorre lançamentos com venda_id NULL e descrição
-        # contendo 'Venda #N'. Só preenche se a venda existir e pertencer
-        # ao mesmo empresa_id (segurança multi-tenant).
+        # Backfill: vincula lançamentos com venda_id NULL cujo prefixo da
+        # descrição é 'Venda #N -' (o mesmo que o LIKE antigo casava). Só
+        # preenche se a venda existir no mesmo empresa_id (multi-tenant).
+        # Set-based: uma leitura + um UPDATE em lote. Lançamentos novos já
+        # nascem vinculados (listeners em services/pagamentos_venda.py).
         try:
-            import re as _re_bf
-            pendentes = db.session.execute(text(
-                "SELECT id, descricao, empresa_id FROM lancamentos_caixa "
-                "WHERE venda_id IS NULL AND descricao LIKE 'Venda #%'"
-            )).fetchall()
-            atualizados = 0
-            for row in pendentes:
-                lanc_id = row[0]
-                descricao = row[1] or ''
-                emp_id = row[2]
-                m = _re_bf.search(r'Venda #(\d+)', descricao)
-                if not m:
-                    continue
-                try:
-                    vid = int(m.group(1))
-                except (TypeError, ValueError):
-                    continue
-                # Valida existência + tenant
-                v_exists = db.session.execute(text(
-                    'SELECT id FROM vendas WHERE id = :vid AND '
-                    '(empresa_id = :eid OR :eid IS NULL OR empresa_id IS NULL)'
-                ), {'vid': vid, 'eid': emp_id}).fetchone()
-                if not v_exists:
-                    continue
-                db.session.execute(text(
-                    'UPDATE lancamentos_caixa SET venda_id = :vid WHERE id = :lid'
-                ), {'vid': vid, 'lid': lanc_id})
-                atualizados += 1
+            from services.pagamentos_venda import vincular_lancamentos_por_descricao
+            atualizados = vincular_lancamentos_por_descricao()
             db.session.commit()
             if atualizados:
                 app.logger.info(
@@ -4330,6 +3935,22 @@ if not os.environ.get('SKIP_DB_BOOTSTRAP'):
         except (OperationalError, Exception) as _bf_err:
             db.session.rollback()
             app.logger.warning(f"Migração P0 (backfill venda_id): {_bf_err}")
+        # Saldos mensais do caixa (saldos_mensais_caixa): a tabela nasce
+        # vazia no primeiro deploy; monta o histórico uma vez. Dali em
+        # diante os listeners de services/saldos_caixa.py a mantêm.
+        try:
+            from services.saldos_caixa import reconstruir_saldos_mensais
+            _tem_saldos = db.session.execute(text('SELECT 1 FROM saldos_mensais_caixa LIMIT 1')).first()
+            _tem_lanc = db.session.execute(text(
+                'SELECT 1 FROM lancamentos_caixa WHERE empresa_id IS NOT NULL LIMIT 1'
+            )).first()
+            if _tem_lanc and not _tem_saldos:
+                _qtd_saldos = reconstruir_saldos_mensais()
+                db.session.commit()
+                app.logger.info(f"Saldos mensais do caixa reconstruídos: {_qtd_saldos} linhas.")
+        except (OperationalError, Exception) as _sm_err:
+            db.session.rollback()
+            app.logger.warning(f"Migração saldos_mensais_caixa: {_sm_err}")
         try:
             db.session.execute(text("UPDATE lancamentos_caixa SET status_envio = 'Não Enviado' WHERE lower(forma_pagamento) LIKE '%cheque%' AND (status_envio IS NULL OR trim(status_envio) = '')"))
             db.session.commit()
@@ -4397,6 +4018,7 @@ if not os.environ.get('SKIP_DB_BOOTSTRAP'):
             'CREATE INDEX IF NOT EXISTS ix_vendas_empresa ON vendas(empresa_faturadora)',
             'CREATE INDEX IF NOT EXISTS ix_vendas_forma_pag ON vendas(forma_pagamento)',
             'CREATE INDEX IF NOT EXISTS ix_vendas_status_entrega ON vendas(status_entrega)',
+            'CREATE INDEX IF NOT EXISTS ix_vendas_empresa_entrega_data ON vendas(empresa_id, status_entrega, data_venda)',
         ]:
             try:
                 db.session.execute(text(idx_sql))
@@ -4422,15 +4044,13 @@ if not os.environ.get('SKIP_DB_BOOTSTRAP'):
         # os lançamentos de uma venda — SEM índice, isso é sequential scan em
         # `lancamentos_caixa`, repetido uma vez por item do pedido, tudo
         # ENQUANTO a transação segura o FOR UPDATE do produto (ver laudo).
-        # NÃO trocamos para filtrar por `venda_id` aqui: a maioria dos pontos
-        # de criação desses lançamentos em routes/vendas.py e routes/caixa.py
-        # ainda não preenche `venda_id` (só routes/clientes.py o faz hoje),
-        # então migrar a query quebraria o resync de pagamento para a maior
-        # parte do histórico. A correção segura e aditiva é acelerar o
-        # próprio LIKE com um índice dedicado. No Postgres, um índice B-tree
-        # comum só acelera `LIKE 'prefixo%'` sob collation "C"; para
-        # funcionar também sob collations locale-aware (ex.: en_US.UTF-8,
-        # comum na Render), é necessário `varchar_pattern_ops` explicitamente.
+        # Hoje essas buscas filtram por `venda_id` (preenchido pelos listeners
+        # de services/pagamentos_venda.py + backfill acima); o índice segue
+        # servindo o backfill (`LIKE 'Venda #%'`) e os diagnósticos do
+        # painel master que procuram marcadores na descrição. No Postgres,
+        # um índice B-tree comum só acelera `LIKE 'prefixo%'` sob collation
+        # "C"; para funcionar também sob collations locale-aware (ex.:
+        # en_US.UTF-8, comum na Render), é necessário `varchar_pattern_ops`.
         try:
             _uri_atual = app.config.get('SQLALCHEMY_DATABASE_URI', '')
             if _uri_atual.startswith('postgres'):
@@ -4817,7 +4437,7 @@ def _vendas_do_pedido(venda):
 
 
 def _apagar_lancamentos_caixa_por_vendas(vendas):
-    """Remove lançamentos do caixa vinculados por descrição às vendas informadas.
+    """Remove lançamentos do caixa vinculados (``venda_id``) às vendas informadas.
 
     Multi-tenant: filtra os lancamentos pelo empresa_id das vendas informadas
     (todas pertencem ao mesmo tenant, pois sao do mesmo pedido).
@@ -4825,13 +4445,12 @@ def _apagar_lancamentos_caixa_por_vendas(vendas):
     venda_ids = sorted({int(v.id) for v in (vendas or []) if getattr(v, 'id', None) is not None})
     if not venda_ids:
         return 0
-    filtros = [LancamentoCaixa.descricao.like(f"Venda #{vid} -%") for vid in venda_ids]
     _eid = None
     for v in (vendas or []):
         _eid = getattr(v, 'empresa_id', None)
         if _eid is not None:
             break
-    base_q = LancamentoCaixa.query.filter(or_(*filtros))
+    base_q = LancamentoCaixa.query.filter(LancamentoCaixa.venda_id.in_(venda_ids))
     if _eid is not None:
         base_q = base_q.filter(LancamentoCaixa.empresa_id == _eid)
     lancamentos = base_q.all()
@@ -4851,8 +4470,9 @@ def _resincronizar_pagamento_venda(venda):
 
     Algoritmo:
         1. Soma TODOS os ``LancamentoCaixa.tipo == 'ENTRADA'`` ainda
-           presentes no banco com descrição matching ``Venda #<id>`` (e
-           mesmo ``empresa_id`` da venda).
+           presentes no banco com ``venda_id`` da venda (e mesmo
+           ``empresa_id``). Para muitas vendas de uma vez, use
+           ``services.pagamentos_venda.resincronizar_vendas``.
         2. Atribui essa soma a ``venda.valor_pago``.
         3. Reclassifica ``venda.situacao``:
               * ``valor_pago == 0``                       → 'PENDENTE'
@@ -4885,7 +4505,7 @@ def _resincronizar_pagamento_venda(venda):
         eid = getattr(venda, 'empresa_id', None)
         q = LancamentoCaixa.query.filter(
             LancamentoCaixa.tipo == 'ENTRADA',
-            LancamentoCaixa.descricao.like(f"Venda #{venda.id} -%"),
+            LancamentoCaixa.venda_id == venda.id,
         )
         if eid is not None:
             q = q.filter(LancamentoCaixa.empresa_id == eid)
@@ -4968,7 +4588,7 @@ def _resincronizar_pagamento_venda_seguro(venda):
         eid = getattr(venda, 'empresa_id', None)
         q = LancamentoCaixa.query.filter(
             LancamentoCaixa.tipo == 'ENTRADA',
-            LancamentoCaixa.descricao.like(f"Venda #{venda.id} -%"),
+            LancamentoCaixa.venda_id == venda.id,
         )
         if eid is not None:
             q = q.filter(LancamentoCaixa.empresa_id == eid)
@@ -5590,6 +5210,7 @@ from routes.caixa import _limpar_valor_moeda  # re-export para vendas/produtos
 from routes import (
     auth_bp, master_bp, clientes_bp, produtos_bp,
     vendas_bp, documentos_bp, dashboard_bp, caixa_bp, financeiro_bp, push_bp,
+    importacoes_bp, uploads_bp,
 )
 
 app.register_blueprint(auth_bp)
@@ -5602,6 +5223,8 @@ app.register_blueprint(dashboard_bp)
 app.register_blueprint(caixa_bp)
 app.register_blueprint(financeiro_bp)
 app.register_blueprint(push_bp)
+app.register_blueprint(importacoes_bp)
+app.register_blueprint(uploads_bp)
 
 # CSRF exemption CIRÚRGICA — somente endpoints chamados por bots externos
 # (autenticação via token no header Authorization). Todas as demais rotas
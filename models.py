@@ -592,6 +592,11 @@ class Venda(db.Model):
         # Filtros por tipo_operacao (VENDA/PERDA) por empresa — usado
         # nos KPIs do dashboard com `tipo_operacao != 'PERDA'`.
         db.Index('ix_vendas_empresa_tipo_operacao', 'empresa_id', 'tipo_operacao'),
+        # Quadro de logística: pedidos por status de entrega, mais
+        # recentes primeiro (GROUP BY + LIMIT em /logistica).
+        db.Index('ix_vendas_empresa_entrega_data', 'empresa_id', 'status_entrega', 'data_venda'),
+        # Vínculo documento ↔ venda por NF dentro do tenant (services/indice_nf.py).
+        db.Index('ix_vendas_empresa_nf_normalizada', 'empresa_id', 'nf_normalizada'),
     )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -604,6 +609,8 @@ class Venda(db.Model):
     cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), nullable=False, index=True)  # Índice para filtros e joins
     produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), nullable=False, index=True)
     nf = db.Column(db.String(50), index=True)  # Índice para buscas por NF
+    # ``_normalizar_nf(nf)``, mantida por services/indice_nf.py (vínculo de documentos).
+    nf_normalizada = db.Column(db.String(50), nullable=True, index=True)
     preco_venda = db.Column(db.Numeric(10, 2), nullable=False)
     quantidade_venda = db.Column(db.Integer, nullable=False)
     data_venda = db.Column(db.Date, default=date.today, nullable=False, index=True)  # Índice para filtros e ordenação por data
@@ -737,6 +744,98 @@ class LancamentoCaixa(db.Model):
         return f'<LancamentoCaixa {self.id} - {self.tipo} {self.valor}>'
 
 
+# Fechamento mensal do caixa: transporte do saldo por forma de pagamento.
+CATEGORIA_FUNDO_SAIDA = 'Fundo de Caixa (Saída)'
+CATEGORIA_FUNDO_ENTRADA = 'Fundo de Caixa (Entrada)'
+
+# Buckets de forma de pagamento dos saldos mensais ('outros' não entra
+# nos saldos por forma, só nos totais do mês).
+FORMAS_SALDO_CAIXA = ('dinheiro', 'cheque', 'pix', 'boleto', 'outros')
+
+
+class SaldoMensalCaixa(db.Model):
+    """
+    Resumo mensal do Livro Caixa por (empresa, setor, ano, mês, forma).
+
+    Mantido na mesma transação de cada insert/edição/exclusão de
+    ``LancamentoCaixa`` (services/saldos_caixa.py). A tela do Caixa monta
+    os cabeçalhos dos meses, o saldo anterior e os totais do ano a partir
+    daqui, sem carregar os lançamentos.
+
+    Attributes:
+        forma: bucket em ``FORMAS_SALDO_CAIXA``.
+        entradas / saidas: somas do mês no bucket.
+        saidas_fornecedor / saidas_pessoal: saídas por categoria.
+        qtd_lancamentos: quantidade de lançamentos no bucket.
+        qtd_fundo_saida: saídas "Fundo de Caixa (Saída)" (mês fechado).
+    """
+
+    __tablename__ = 'saldos_mensais_caixa'
+    __table_args__ = (
+        db.UniqueConstraint('empresa_id', 'setor', 'ano', 'mes', 'forma', name='uq_saldo_mensal_caixa'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    empresa_id = db.Column(
+        db.Integer,
+        db.ForeignKey('empresas.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+    )
+    setor = db.Column(db.String(50), nullable=False)
+    ano = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    forma = db.Column(db.String(20), nullable=False)
+    entradas = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    saidas = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    saidas_fornecedor = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    saidas_pessoal = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    qtd_lancamentos = db.Column(db.Integer, nullable=False, default=0)
+    qtd_fundo_saida = db.Column(db.Integer, nullable=False, default=0)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<SaldoMensalCaixa {self.empresa_id} {self.setor} {self.ano}-{self.mes:02d} {self.forma}>'
+
+
+class FechamentoMensalCaixa(db.Model):
+    """
+    Registro de fechamento mensal do caixa (chave de idempotência).
+
+    Um mês/setor de um tenant só pode ser fechado uma vez: a
+    ``UniqueConstraint`` impede que dois fechamentos concorrentes (job
+    agendado + botão manual, ou dois workers) transportem o saldo em
+    dobro. Ver services/fechamento_caixa.py.
+
+    Attributes:
+        origem: ``'AUTOMATICO'`` (job agendado) ou ``'MANUAL'`` (botão).
+        valor_transportado: soma dos saldos positivos transportados.
+    """
+
+    __tablename__ = 'fechamentos_mensais_caixa'
+    __table_args__ = (
+        db.UniqueConstraint('empresa_id', 'setor', 'ano', 'mes', name='uq_fechamento_mensal_caixa'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    empresa_id = db.Column(
+        db.Integer,
+        db.ForeignKey('empresas.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+    )
+    setor = db.Column(db.String(50), nullable=False)
+    ano = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    origem = db.Column(db.String(20), nullable=False, default='MANUAL')
+    valor_transportado = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id', ondelete='SET NULL'), nullable=True)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<FechamentoMensalCaixa {self.empresa_id} {self.setor} {self.ano}-{self.mes:02d}>'
+
+
 class ContagemGaveta(db.Model):
     """Estado salvo da contagem de gaveta (dinheiro/cheques) por dia e usuário."""
     __tablename__ = 'contagens_gaveta'
@@ -915,6 +1014,12 @@ class VotoFrase(db.Model):
         return f'<VotoFrase {self.id} gostou={self.gostou}>'
 
 
+# Estados de ``Documento.status_processamento`` (recepção em background).
+DOC_PROCESSANDO = 'PROCESSANDO'
+DOC_CONCLUIDO = 'CONCLUIDO'
+DOC_ERRO = 'ERRO'
+
+
 class Documento(db.Model):
     """
     Documento PDF (boleto ou nota fiscal) armazenado no Cloudinary.
@@ -927,6 +1032,12 @@ class Documento(db.Model):
     """
 
     __tablename__ = "documentos"
+    __table_args__ = (
+        # Fila "Documentos Recém-Chegados": órfãos do tenant, mais recentes primeiro.
+        db.Index('ix_documentos_empresa_venda_id', 'empresa_id', 'venda_id', 'id'),
+        # Órfãos com diagnóstico a recalcular (services/diagnostico_vinculo.py).
+        db.Index('ix_documentos_venda_diagnostico', 'venda_id', 'diagnostico_cenario'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     empresa_id = db.Column(
@@ -942,14 +1053,164 @@ class Documento(db.Model):
     cnpj = db.Column(db.String(18))  # CNPJ extraído do documento
     numero_nf = db.Column(db.String(50))  # Número da NF (se aplicável)
     nf_extraida = db.Column(db.String(50))  # Cache OCR: NF extraída; se preenchida, não roda OCR de novo
+    nf_normalizada = db.Column(db.String(50), nullable=True, index=True)  # ``_normalizar_nf`` de nf_extraida/numero_nf
     razao_social = db.Column(db.String(200))  # Razão social extraída
     data_vencimento = db.Column(db.Date)  # Data de vencimento (para boletos)
     valor = db.Column(db.Numeric(12, 2), nullable=True)  # Valor total extraído (boleto/NF)
     venda_id = db.Column(db.Integer, db.ForeignKey('vendas.id', ondelete='CASCADE'), nullable=True, index=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=True, index=True)
     data_processamento = db.Column(db.Date, default=date.today, nullable=False)  # Quando foi processado
+    # Fila de processamento (services/fila_documentos.py). NULL = legado, tratado como concluído.
+    status_processamento = db.Column(db.String(20), nullable=True, index=True)
+    tentativas_processamento = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    erro_processamento = db.Column(db.Text, nullable=True)
+    processamento_atualizado_em = db.Column(db.DateTime, nullable=True)
+    # Leitura do PDF que falhou: 'TIMEOUT', 'CORROMPIDO' ou 'GRANDE_DEMAIS' (services/sandbox_extracao.py).
+    falha_extracao = db.Column(db.String(20), nullable=True)
+    # Diagnóstico do vínculo pela NF, pré-calculado para a fila (services/diagnostico_vinculo.py):
+    # 'A', 'B', 'C' ou '' (NF inválida); NULL = a recalcular. ``diagnostico``: JSON exibido na fila.
+    diagnostico_cenario = db.Column(db.String(1), nullable=True)
+    diagnostico = db.Column(db.Text, nullable=True)
 
     empresa = db.relationship('Empresa', backref=db.backref('documentos', lazy='dynamic'))
     
     def __repr__(self):
         return f'<Documento {self.public_id or self.id} - Tipo: {self.tipo}>'
+
+
+# Estados de um JobImportacao.
+JOB_PENDENTE = 'PENDENTE'
+JOB_PROCESSANDO = 'PROCESSANDO'
+JOB_CONCLUIDO = 'CONCLUIDO'
+JOB_ERRO = 'ERRO'
+JOB_STATUS_FINAIS = (JOB_CONCLUIDO, JOB_ERRO)
+
+
+class JobImportacao(db.Model):
+    """
+    Importação de planilha (vendas, produtos, clientes ou caixa) executada
+    em background — fila RQ ou thread local (ver services/importacao_jobs.py).
+
+    A tela de acompanhamento consulta esta linha por polling; o resultado
+    final (``erros_detalhados`` + mensagens de sucesso) fica gravado aqui
+    para a página de resultado renderizar exatamente o que a importação
+    síncrona mostrava.
+
+    Attributes:
+        id: UUID (string) — não sequencial, vai na URL de acompanhamento.
+        tipo: 'vendas', 'produtos', 'clientes' ou 'caixa'.
+        status: PENDENTE, PROCESSANDO, CONCLUIDO ou ERRO.
+        caminho_arquivo: Upload salvo em disco até o job terminar.
+        total_linhas / linhas_processadas: base do progresso e do ETA.
+        erros_detalhados: JSON (lista de mensagens por linha).
+        mensagens: JSON (lista de ``[categoria, texto]`` para flash).
+    """
+
+    __tablename__ = 'jobs_importacao'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    empresa_id = db.Column(
+        db.Integer,
+        db.ForeignKey('empresas.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+    )
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id', ondelete='SET NULL'), nullable=True, index=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=JOB_PENDENTE, server_default=JOB_PENDENTE, index=True)
+    nome_arquivo = db.Column(db.String(255), nullable=True)
+    caminho_arquivo = db.Column(db.String(500), nullable=True)
+    total_linhas = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    linhas_processadas = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    sucesso = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    erros = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    ignorados = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    erros_detalhados = db.Column(db.Text, nullable=True)
+    mensagens = db.Column(db.Text, nullable=True)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    iniciado_em = db.Column(db.DateTime, nullable=True)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    concluido_em = db.Column(db.DateTime, nullable=True)
+
+    @staticmethod
+    def _lista_json(raw):
+        try:
+            parsed = json.loads(raw) if raw else []
+        except (TypeError, ValueError):
+            return []
+        return parsed if isinstance(parsed, list) else []
+
+    def lista_erros(self):
+        return self._lista_json(self.erros_detalhados)
+
+    def lista_mensagens(self):
+        return [tuple(m) for m in self._lista_json(self.mensagens) if isinstance(m, list) and len(m) == 2]
+
+    @property
+    def finalizado(self):
+        return self.status in JOB_STATUS_FINAIS
+
+    def eta_segundos(self, agora=None):
+        """Estimativa simples: ritmo médio desde o início × linhas restantes."""
+        if self.status != JOB_PROCESSANDO or not self.iniciado_em:
+            return None
+        if not self.total_linhas or not self.linhas_processadas:
+            return None
+        decorrido = ((agora or datetime.utcnow()) - self.iniciado_em).total_seconds()
+        restantes = max(self.total_linhas - self.linhas_processadas, 0)
+        return int(round(decorrido / self.linhas_processadas * restantes))
+
+    def to_dict(self):
+        percentual = 0
+        if self.total_linhas:
+            percentual = min(100, int(self.linhas_processadas * 100 / self.total_linhas))
+        if self.status == JOB_CONCLUIDO:
+            percentual = 100
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'status': self.status,
+            'nome_arquivo': self.nome_arquivo,
+            'total_linhas': self.total_linhas,
+            'linhas_processadas': self.linhas_processadas,
+            'percentual': percentual,
+            'sucesso': self.sucesso,
+            'erros': self.erros,
+            'ignorados': self.ignorados,
+            'eta_segundos': self.eta_segundos(),
+            'finalizado': self.finalizado,
+        }
+
+    def __repr__(self):
+        return f'<JobImportacao {self.id} {self.tipo} {self.status}>'
+
+
+class GeocodeCache(db.Model):
+    """
+    Cache global de geocodificação (Nominatim) por endereço normalizado.
+
+    Evita consultar o Nominatim de novo para o mesmo endereço — entre
+    clientes, tenants e depois de um cadastro ser editado e voltar ao
+    endereço anterior. Guarda também os "não encontrados" para não
+    martelar o serviço com o mesmo endereço ruim (ver
+    services/geocodificacao.py).
+
+    Attributes:
+        endereco_normalizado: chave (maiúsculas, sem acento, espaços colapsados).
+        latitude / longitude: ``None`` quando o Nominatim não achou.
+        consultado_em: data da consulta (base para reconsultar negativos).
+    """
+
+    __tablename__ = 'geocode_cache'
+
+    endereco_normalizado = db.Column(db.String(300), primary_key=True)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    consultado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    @property
+    def encontrado(self):
+        return self.latitude is not None and self.longitude is not None
+
+    def __repr__(self):
+        return f'<GeocodeCache {self.endereco_normalizado!r}>'
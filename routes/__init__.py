@@ -56,6 +56,9 @@ Estado atual:
                            /caixa/{salvar_gaveta,obter_gaveta},
                            /api/orcamento
     * ``financeiro_bp``  → /api/balanco/dados-atuais, /api/balanco/exportar-csv
+    * ``importacoes_bp`` → /importacoes/<job_id>, /importacoes/<job_id>/resultado,
+                           /api/importacoes/<job_id>
+    * ``uploads_bp``     → /uploads/pendentes/<token>
     * ``push_bp``        → /api/push/subscribe, /api/push/unsubscribe,
                            /api/push/vapid-public-key, /api/vapid-public-key (legado),
                            /api/push/status, /api/notificacoes/verificar_pendencias,
@@ -102,6 +105,8 @@ from .dashboard import dashboard_bp
 from .caixa import caixa_bp
 from .financeiro import financeiro_bp
 from .push import push_bp
+from .importacoes import importacoes_bp
+from .uploads import uploads_bp
 
 __all__ = [
     'auth_bp',
@@ -114,4 +119,6 @@ __all__ = [
     'caixa_bp',
     'financeiro_bp',
     'push_bp',
+    'importacoes_bp',
+    'uploads_bp',
 ]
@@ -31,7 +31,10 @@ Eventos SQLAlchemy:
     forçam ``status_envio='Não Enviado'`` para cheques) são registrados
     aqui no nível do módulo. Como o blueprint é importado durante o
     bootstrap do ``app.py``, os listeners ficam ativos para todas as
-    transações daquele em diante.
+    transações daquele em diante. Caminhos em lote (importação, exclusão
+    em massa) usam ``INSERT``/``DELETE`` set-based, que não passam por
+    esses listeners — preenchem ``status_envio`` e recalculam os saldos
+    mensais explicitamente.
 
 Multi-tenant:
     O ``before_request`` aplica ``login_required`` + ``tenant_required``
@@ -50,22 +53,28 @@ from flask import (
     flash, jsonify, current_app, session,
 )
 from flask_login import current_user
-from sqlalchemy import event, func, case
-import cloudinary
-import cloudinary.uploader
+from sqlalchemy import event, func, case, delete, insert, select
 
-from models import db, Venda, LancamentoCaixa, ContagemGaveta, ItemOrcamento, CATEGORIAS_ORCAMENTO
+from models import (
+    db, Venda, LancamentoCaixa, ContagemGaveta, ItemOrcamento, SaldoMensalCaixa,
+    CATEGORIAS_ORCAMENTO, CATEGORIA_FUNDO_SAIDA, CATEGORIA_FUNDO_ENTRADA,
+)
+from services.fechamento_caixa import fechar_mes_caixa
+from services.saldos_caixa import recalcular_saldos_meses, saldos_mensais_do_ano
 from services.auth_utils import tenant_required, admin_required, _checar_permissao_ou_redirecionar
 from services.db_utils import (
     query_tenant, empresa_id_atual, _safe_db_commit,
 )
 from services.config_helpers import get_hoje_brasil
 from services.files_utils import _arquivo_imagem_permitido
-from services.config_helpers import _EXTERNAL_TIMEOUT
-from services.vendas_services import _resincronizar_pagamento_venda
+from services.pagamentos_venda import resincronizar_vendas, venda_id_do_marcador, vendas_vinculaveis
 from services.error_utils import erro_json
-from services.query_utils import filtro_ano_data_venda
 from services.cache_utils import limpar_cache_dashboard
+from services.normalizacao_planilha import normalizar_caixa
+from services.importacao_jobs import criar_job_importacao, enfileirar_job_importacao
+from services.uploads_nuvem import (
+    DESTINO_CHEQUE, disparar_uploads, guardar_para_upload, resolver_urls_provisorias, url_provisoria,
+)
 
 
 caixa_bp = Blueprint('caixa', __name__)
@@ -317,9 +326,6 @@ def _normalizar_itens_contagem(itens, incluir_nome=False):
 # Categorias do Caixa + Fechamento Mensal (Fundo de Caixa)
 # ─────────────────────────────────────────────────────────────────────────────
 
-CATEGORIA_FUNDO_SAIDA = 'Fundo de Caixa (Saída)'
-CATEGORIA_FUNDO_ENTRADA = 'Fundo de Caixa (Entrada)'
-
 CATEGORIAS_CAIXA = (
     'Entrada Cliente',
     'Saída Pessoal',
@@ -328,30 +334,6 @@ CATEGORIAS_CAIXA = (
     CATEGORIA_FUNDO_SAIDA,
 )
 
-# Formas canônicas usadas no transporte (espelham o select do modal).
-FORMAS_FUNDO_CAIXA = ('Dinheiro', 'Pix', 'Cheque', 'Boleto')
-
-
-def _normalizar_bucket_forma(forma_pagamento):
-    """Mapeia forma livre → bucket canônico (Dinheiro/Pix/Cheque/Boleto) ou None."""
-    forma = str(forma_pagamento or '').strip().lower()
-    if not forma:
-        return None
-    if 'dinheiro' in forma:
-        return 'Dinheiro'
-    if 'cheque' in forma:
-        return 'Cheque'
-    if 'pix' in forma or 'transfer' in forma:
-        return 'Pix'
-    if 'boleto' in forma:
-        return 'Boleto'
-    return None
-
-
-def _ultimo_dia_mes(ano, mes):
-    import calendar
-    return date(ano, mes, calendar.monthrange(ano, mes)[1])
-
 
 def _primeiro_dia_mes_seguinte(ano, mes):
     if mes == 12:
@@ -359,170 +341,15 @@ def _primeiro_dia_mes_seguinte(ano, mes):
     return date(ano, mes + 1, 1)
 
 
-def _calcular_saldos_por_forma(mes, ano, setor='GERAL'):
-    """Saldo líquido (entradas − saídas) do mês/ano por forma canônica."""
-    eid = empresa_id_atual()
-    inicio = date(int(ano), int(mes), 1)
-    fim = _primeiro_dia_mes_seguinte(int(ano), int(mes))
-    saldos = {f: Decimal('0.00') for f in FORMAS_FUNDO_CAIXA}
-
-    q = LancamentoCaixa.query.filter(
-        LancamentoCaixa.data >= inicio,
-        LancamentoCaixa.data < fim,
-        LancamentoCaixa.setor == setor,
-    )
-    if eid is not None:
-        q = q.filter(LancamentoCaixa.empresa_id == eid)
-
-    for lanc in q.all():
-        bucket = _normalizar_bucket_forma(lanc.forma_pagamento)
-        if not bucket:
-            continue
-        valor = Decimal(str(lanc.valor or 0))
-        if str(lanc.tipo or '').upper() == 'ENTRADA':
-            saldos[bucket] += valor
-        else:
-            saldos[bucket] -= valor
-    return saldos
-
-
-def _mes_ja_fechado(mes, ano, setor='GERAL'):
-    """True se já existe SAÍDA 'Fundo de Caixa (Saída)' naquele mês/setor/tenant."""
-    eid = empresa_id_atual()
-    inicio = date(int(ano), int(mes), 1)
-    fim = _primeiro_dia_mes_seguinte(int(ano), int(mes))
-    q = LancamentoCaixa.query.filter(
-        LancamentoCaixa.data >= inicio,
-        LancamentoCaixa.data < fim,
-        LancamentoCaixa.setor == setor,
-        LancamentoCaixa.tipo == 'SAIDA',
-        LancamentoCaixa.categoria == CATEGORIA_FUNDO_SAIDA,
-    )
-    if eid is not None:
-        q = q.filter(LancamentoCaixa.empresa_id == eid)
-    return q.first() is not None
-
-
 def realizar_fechamento_mensal(mes, ano, setor='GERAL'):
-    """Transporta saldo positivo do mês para o 1º dia do mês seguinte, por forma.
+    """Fecha o mês do tenant atual (botão "Zerar e Transportar Saldo").
 
-    Para cada forma (Dinheiro, Pix, Cheque, Boleto) com saldo > 0:
-      * SAÍDA no último dia do mês — categoria ``Fundo de Caixa (Saída)``
-      * ENTRADA no 1º dia do mês seguinte — ``Fundo de Caixa (Entrada)``
-
-    Idempotente: se o mês já tiver Fundo de Caixa (Saída), não altera nada.
-    Retorna dict com ``ok``, ``mensagem``, ``transportado`` (lista de formas/valores).
+    Delega para ``services.fechamento_caixa.fechar_mes_caixa`` — o mesmo
+    caminho do job agendado, protegido pela chave de idempotência
+    ``FechamentoMensalCaixa``.
     """
-    mes = int(mes)
-    ano = int(ano)
-    setor = (setor or 'GERAL').strip().upper()
-    if setor not in ('GERAL', 'BACALHAU'):
-        setor = 'GERAL'
-    if mes < 1 or mes > 12:
-        return {'ok': False, 'mensagem': 'Mês inválido.', 'transportado': []}
-
-    if _mes_ja_fechado(mes, ano, setor=setor):
-        return {
-            'ok': True,
-            'mensagem': 'Este mês já possui fechamento (Fundo de Caixa).',
-            'transportado': [],
-            'ja_fechado': True,
-        }
-
-    saldos = _calcular_saldos_por_forma(mes, ano, setor=setor)
-    a_transportar = {
-        forma: valor
-        for forma, valor in saldos.items()
-        if valor is not None and Decimal(str(valor)) > Decimal('0.00')
-    }
-    if not a_transportar:
-        return {
-            'ok': True,
-            'mensagem': 'Nenhum saldo positivo por forma de pagamento para transportar.',
-            'transportado': [],
-        }
-
-    eid = empresa_id_atual()
     uid = current_user.id if getattr(current_user, 'is_authenticated', False) else None
-    data_saida = _ultimo_dia_mes(ano, mes)
-    data_entrada = _primeiro_dia_mes_seguinte(ano, mes)
-    meses_pt = {
-        1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril', 5: 'Maio', 6: 'Junho',
-        7: 'Julho', 8: 'Agosto', 9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro',
-    }
-    rotulo_mes = f"{meses_pt[mes]}/{ano}"
-
-    transportado = []
-    try:
-        for forma, valor in a_transportar.items():
-            valor_dec = Decimal(str(valor)).quantize(Decimal('0.01'))
-            if valor_dec <= 0:
-                continue
-            db.session.add(LancamentoCaixa(
-                data=data_saida,
-                descricao=f'Fechamento mensal — transporte {forma} ({rotulo_mes})',
-                tipo='SAIDA',
-                categoria=CATEGORIA_FUNDO_SAIDA,
-                forma_pagamento=forma,
-                setor=setor,
-                valor=valor_dec,
-                usuario_id=uid,
-                empresa_id=eid,
-                status_envio=_status_envio_por_forma_pagamento(forma),
-            ))
-            db.session.add(LancamentoCaixa(
-                data=data_entrada,
-                descricao=f'Abertura de mês — fundo transportado de {rotulo_mes} ({forma})',
-                tipo='ENTRADA',
-                categoria=CATEGORIA_FUNDO_ENTRADA,
-                forma_pagamento=forma,
-                setor=setor,
-                valor=valor_dec,
-                usuario_id=uid,
-                empresa_id=eid,
-                status_envio=_status_envio_por_forma_pagamento(forma),
-            ))
-            transportado.append({'forma': forma, 'valor': float(valor_dec)})
-
-        db.session.commit()
-        limpar_cache_dashboard()
-        return {
-            'ok': True,
-            'mensagem': (
-                f'Fechamento de {rotulo_mes} concluído. '
-                f'{len(transportado)} forma(s) transportada(s) para {data_entrada.strftime("%d/%m/%Y")}.'
-            ),
-            'transportado': transportado,
-            'data_saida': data_saida.isoformat(),
-            'data_entrada': data_entrada.isoformat(),
-        }
-    except Exception as e:
-        db.session.rollback()
-        current_app.logger.error('Falha no fechamento mensal do caixa', exc_info=True)
-        return {
-            'ok': False,
-            'mensagem': f'Erro ao realizar fechamento mensal: {e}',
-            'transportado': [],
-        }
-
-
-def _tentar_fechamento_automatico_mes_anterior(setor='GERAL'):
-    """Se o mês civil anterior ainda tem saldo positivo e não foi fechado, fecha.
-
-    Retorna o dict de ``realizar_fechamento_mensal`` ou None se não havia nada a fazer.
-    """
-    hoje = date.today()
-    if hoje.month == 1:
-        mes_ant, ano_ant = 12, hoje.year - 1
-    else:
-        mes_ant, ano_ant = hoje.month - 1, hoje.year
-
-    if _mes_ja_fechado(mes_ant, ano_ant, setor=setor):
-        return None
-    saldos = _calcular_saldos_por_forma(mes_ant, ano_ant, setor=setor)
-    if not any(Decimal(str(v)) > 0 for v in saldos.values()):
-        return None
-    return realizar_fechamento_mensal(mes_ant, ano_ant, setor=setor)
+    return fechar_mes_caixa(empresa_id_atual(), setor, mes=mes, ano=ano, usuario_id=uid, origem='MANUAL')
 
 
 def _status_envio_por_forma_pagamento(forma_pagamento):
@@ -554,6 +381,78 @@ def _lancamento_caixa_before_update_status_envio(mapper, connection, target):
         target.status_envio = None
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Montagem da tela do Caixa (resumo mensal + carga dos lançamentos por mês)
+# ─────────────────────────────────────────────────────────────────────────────
+
+_MESES_PT = {1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril', 5: 'Maio', 6: 'Junho',
+             7: 'Julho', 8: 'Agosto', 9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'}
+_FORMAS_SALDO_TELA = ('dinheiro', 'cheque', 'pix', 'boleto')
+
+
+def _grupos_meses_caixa(empresa_id, setor, ano):
+    """Cabeçalhos dos meses do ano a partir de ``saldos_mensais_caixa``.
+
+    Mesmas chaves que a tela sempre recebeu (totais, saldos por forma,
+    ``fechado``/``pode_fechar``, saldo anterior/final acumulado), mas sem
+    carregar nenhum lançamento: ``itens`` vem vazio e ``carregado=False``.
+    Ordem decrescente (mês mais recente primeiro).
+    """
+    zero = Decimal('0.00')
+    mes_civil = date.today().strftime('%Y-%m')
+    grupos = {}
+    for mes, por_forma in saldos_mensais_do_ano(empresa_id, setor, ano).items():
+        qtd_itens = sum(int(s.qtd_lancamentos or 0) for s in por_forma.values())
+        if not qtd_itens:
+            continue
+        chave = f'{ano:04d}-{mes:02d}'
+        grupo = {
+            'titulo': _MESES_PT[mes],
+            'id_html': f'mes-{chave}',
+            'itens': [],
+            'qtd_itens': qtd_itens,
+            'carregado': False,
+            'ano': ano,
+            'mes': mes,
+            'entradas_mes': sum((s.entradas for s in por_forma.values()), zero),
+            'saidas_mes': sum((s.saidas for s in por_forma.values()), zero),
+            'saidas_fornecedor_mes': sum((s.saidas_fornecedor for s in por_forma.values()), zero),
+            'saidas_pessoal_mes': sum((s.saidas_pessoal for s in por_forma.values()), zero),
+            'fechado': any(int(s.qtd_fundo_saida or 0) > 0 for s in por_forma.values()),
+        }
+        for forma in _FORMAS_SALDO_TELA:
+            s = por_forma.get(forma)
+            grupo[f'entradas_{forma}'] = s.entradas if s else zero
+            grupo[f'saldo_{forma}'] = (s.entradas - s.saidas) if s else zero
+        grupo['saldo_mes'] = grupo['entradas_mes'] - grupo['saidas_mes']
+        # Botão só em meses anteriores ao mês civil atual (não fecha o mês corrente).
+        tem_saldo_positivo = any(grupo[f'saldo_{f}'] > 0 for f in _FORMAS_SALDO_TELA)
+        grupo['pode_fechar'] = bool(chave < mes_civil and not grupo['fechado'] and tem_saldo_positivo)
+        grupos[chave] = grupo
+
+    saldo_acumulado = zero
+    for chave in sorted(grupos):
+        grupo = grupos[chave]
+        grupo['saldo_anterior'] = saldo_acumulado
+        saldo_acumulado += grupo['saldo_mes']
+        grupo['saldo_final'] = saldo_acumulado
+    return dict(sorted(grupos.items(), key=lambda x: x[0], reverse=True))
+
+
+def _lancamentos_do_mes(setor, ano, mes):
+    """Lançamentos do tenant/setor no mês, na ordem da tabela (mais recente primeiro)."""
+    return (
+        query_tenant(LancamentoCaixa)
+        .filter_by(setor=setor)
+        .filter(
+            LancamentoCaixa.data >= date(ano, mes, 1),
+            LancamentoCaixa.data < _primeiro_dia_mes_seguinte(ano, mes),
+        )
+        .order_by(LancamentoCaixa.data.desc(), LancamentoCaixa.id.desc())
+        .all()
+    )
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Rotas
 # ─────────────────────────────────────────────────────────────────────────────
@@ -564,17 +463,9 @@ def caixa():
     if setor_atual not in ('GERAL', 'BACALHAU'):
         setor_atual = 'GERAL'
 
-    # Gatilho automático: fecha o mês civil anterior se ainda houver saldo
-    # positivo por forma e não existir Fundo de Caixa (Saída). Idempotente.
-    try:
-        resultado_auto = _tentar_fechamento_automatico_mes_anterior(setor_atual)
-        if resultado_auto and resultado_auto.get('ok') and resultado_auto.get('transportado'):
-            flash(resultado_auto.get('mensagem') or 'Fechamento mensal automático concluído.', 'success')
-            return redirect(url_for('caixa.caixa', setor=setor_atual))
-        if resultado_auto and not resultado_auto.get('ok'):
-            flash(resultado_auto.get('mensagem') or 'Falha no fechamento automático do mês anterior.', 'error')
-    except Exception:
-        current_app.logger.exception('Erro no gatilho de fechamento mensal automático')
+    # O fechamento automático do mês anterior roda no job agendado
+    # ``fechamento_caixa_mensal`` (services/fechamento_caixa.py): este GET
+    # só lê.
 
     # Filtro por ano ativo (mesmo padrão de Vendas/Produtos): em vez de
     # ``.limit(500)``, recortamos a janela ao ano selecionado pelo usuário
@@ -587,7 +478,6 @@ def caixa():
     #   * é coerente com o restante do sistema fiscal (saldo do mês reinicia
     #     em janeiro do ano ativo).
     ano_ativo = session.get('ano_ativo', datetime.now().year)
-    _ini_ano, _fim_ano = filtro_ano_data_venda(ano_ativo, LancamentoCaixa.data)
 
     # P0 (perf): consolidamos os 4 SUMs separados em 1 única query com
     # CASE WHEN. Antes: 4 round-trips ao Postgres por GET /caixa, cada um
@@ -625,96 +515,18 @@ def caixa():
     total_saidas = _agg.total_saidas or 0.0
     saldo_atual = Decimal(str(total_entradas or Decimal('0.00'))) - Decimal(str(total_saidas or Decimal('0.00')))
 
-    lancamentos = (
-        query_tenant(LancamentoCaixa)
-        .filter_by(setor=setor_atual)
-        .filter(_ini_ano, _fim_ano)
-        .order_by(LancamentoCaixa.data.desc(), LancamentoCaixa.id.desc())
-        .all()
-    )
-    meses_pt = {1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril', 5: 'Maio', 6: 'Junho',
-                7: 'Julho', 8: 'Agosto', 9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'}
-    lancamentos_agrupados = {}
-    for lancamento in lancamentos:
-        chave_mes = lancamento.data.strftime('%Y-%m')
-        if chave_mes not in lancamentos_agrupados:
-            lancamentos_agrupados[chave_mes] = {
-                'titulo': f"{meses_pt[lancamento.data.month]}",
-                'id_html': f"mes-{chave_mes}",
-                'itens': [],
-                'entradas_mes': Decimal('0.00'),
-                'saidas_mes': Decimal('0.00'),
-                'saidas_fornecedor_mes': Decimal('0.00'),
-                'saidas_pessoal_mes': Decimal('0.00'),
-                'saldo_dinheiro': Decimal('0.00'),
-                'saldo_cheque': Decimal('0.00'),
-                'saldo_pix': Decimal('0.00'),
-                'saldo_boleto': Decimal('0.00'),
-                'entradas_dinheiro': Decimal('0.00'),
-                'entradas_cheque': Decimal('0.00'),
-                'entradas_pix': Decimal('0.00'),
-                'entradas_boleto': Decimal('0.00'),
-            }
-        lancamentos_agrupados[chave_mes]['itens'].append(lancamento)
-        valor_sinal = lancamento.valor if lancamento.tipo == 'ENTRADA' else -lancamento.valor
-        forma = str(lancamento.forma_pagamento or '').lower()
-        if 'dinheiro' in forma:
-            lancamentos_agrupados[chave_mes]['saldo_dinheiro'] += valor_sinal
-        elif 'cheque' in forma:
-            lancamentos_agrupados[chave_mes]['saldo_cheque'] += valor_sinal
-        elif 'pix' in forma or 'transfer' in forma:
-            lancamentos_agrupados[chave_mes]['saldo_pix'] += valor_sinal
-        elif 'boleto' in forma:
-            lancamentos_agrupados[chave_mes]['saldo_boleto'] += valor_sinal
-        if lancamento.tipo == 'ENTRADA':
-            lancamentos_agrupados[chave_mes]['entradas_mes'] += lancamento.valor
-            if 'dinheiro' in forma:
-                lancamentos_agrupados[chave_mes]['entradas_dinheiro'] += lancamento.valor
-            elif 'cheque' in forma:
-                lancamentos_agrupados[chave_mes]['entradas_cheque'] += lancamento.valor
-            elif 'pix' in forma or 'transfer' in forma:
-                lancamentos_agrupados[chave_mes]['entradas_pix'] += lancamento.valor
-            elif 'boleto' in forma:
-                lancamentos_agrupados[chave_mes]['entradas_boleto'] += lancamento.valor
-        else:
-            lancamentos_agrupados[chave_mes]['saidas_mes'] += lancamento.valor
-            if lancamento.categoria and 'Fornecedor' in lancamento.categoria:
-                lancamentos_agrupados[chave_mes]['saidas_fornecedor_mes'] += lancamento.valor
-            elif lancamento.categoria and 'Pessoal' in lancamento.categoria:
-                lancamentos_agrupados[chave_mes]['saidas_pessoal_mes'] += lancamento.valor
-
-    for chave, grupo in lancamentos_agrupados.items():
-        grupo['saldo_mes'] = grupo['entradas_mes'] - grupo['saidas_mes']
-        try:
-            ano_g, mes_g = int(chave[:4]), int(chave[5:7])
-        except Exception:
-            ano_g, mes_g = None, None
-        grupo['ano'] = ano_g
-        grupo['mes'] = mes_g
-        grupo['fechado'] = any(
-            str(getattr(l, 'tipo', '') or '').upper() == 'SAIDA'
-            and str(getattr(l, 'categoria', '') or '') == CATEGORIA_FUNDO_SAIDA
-            for l in grupo.get('itens') or []
-        )
-        # Botão só em meses anteriores ao mês civil atual (não fecha o mês corrente).
-        mes_civil = date.today().strftime('%Y-%m')
-        tem_saldo_positivo = any(
-            Decimal(str(grupo.get(k) or 0)) > 0
-            for k in ('saldo_dinheiro', 'saldo_cheque', 'saldo_pix', 'saldo_boleto')
-        )
-        grupo['pode_fechar'] = bool(
-            chave < mes_civil and not grupo['fechado'] and tem_saldo_positivo
-        )
-
-    chaves_ordenadas = sorted(lancamentos_agrupados.keys())
-    saldo_acumulado = Decimal('0.00')
-    for chave in chaves_ordenadas:
-        grupo = lancamentos_agrupados[chave]
-        grupo['saldo_anterior'] = saldo_acumulado
-        saldo_acumulado += grupo['saldo_mes']
-        grupo['saldo_final'] = saldo_acumulado
-    lancamentos_agrupados = dict(sorted(lancamentos_agrupados.items(), key=lambda x: x[0], reverse=True))
+    # Cabeçalhos dos meses, saldo anterior e "pode fechar" saem do resumo
+    # mensal (``saldos_mensais_caixa``); os lançamentos em si só são
+    # carregados para o mês corrente e o mês pedido em ``abrir_mes`` — os
+    # demais chegam via ``/caixa/mes/<ano>/<mes>`` quando o card é aberto.
+    abrir_mes_raw = (request.args.get('abrir_mes') or '').strip()
+    abrir_mes = abrir_mes_raw if re.match(r'^\d{4}-\d{2}$', abrir_mes_raw) else ''
     mes_atual_str = date.today().strftime('%Y-%m')
+    lancamentos_agrupados = _grupos_meses_caixa(_eid, setor_atual, int(ano_ativo))
+    for chave in {mes_atual_str, abrir_mes} & set(lancamentos_agrupados):
+        grupo = lancamentos_agrupados[chave]
+        grupo['itens'] = _lancamentos_do_mes(setor_atual, grupo['ano'], grupo['mes'])
+        grupo['carregado'] = True
     hoje = date.today()
     ontem = hoje - timedelta(days=1)
 
@@ -734,10 +546,9 @@ def caixa():
     # Feedback visual pós-mutação: a rota POST de adicionar/editar/deletar
     # propaga ?abrir_mes=YYYY-MM&destaque_id=N para que o template possa
     # auto-expandir o card do mês correspondente e dar destaque na linha
-    # recém-tocada. Saneamos os valores aqui (regex/cast) para o template
-    # nunca receber payload arbitrário.
-    abrir_mes_raw = (request.args.get('abrir_mes') or '').strip()
-    abrir_mes = abrir_mes_raw if re.match(r'^\d{4}-\d{2}$', abrir_mes_raw) else ''
+    # recém-tocada. ``abrir_mes`` já foi saneado (regex) acima; o
+    # ``destaque_id`` passa por cast para o template nunca receber payload
+    # arbitrário.
     destaque_id = request.args.get('destaque_id', type=int) or 0
 
     return render_template(
@@ -760,6 +571,36 @@ def caixa():
     )
 
 
+@caixa_bp.route('/caixa/mes/<int:ano>/<int:mes>')
+def itens_mes_caixa(ano, mes):
+    """Linhas (tabela e cards) de um mês do Caixa, sob demanda.
+
+    Chamada pelo ``toggleMesCaixa`` na primeira vez que o card do mês é
+    aberto. Devolve os mesmos partials que a tela usa no render inicial.
+    """
+    if not 1 <= mes <= 12 or not 1900 <= ano <= 9999:
+        return jsonify({'ok': False, 'mensagem': 'Mês inválido.'}), 400
+    setor_atual = (request.args.get('setor', 'GERAL') or 'GERAL').strip().upper()
+    if setor_atual not in ('GERAL', 'BACALHAU'):
+        setor_atual = 'GERAL'
+    itens = _lancamentos_do_mes(setor_atual, ano, mes)
+    grupo = {'id_html': f'mes-{ano:04d}-{mes:02d}', 'itens': itens, 'carregado': True}
+    hoje = date.today()
+    contexto = dict(
+        grupo=grupo,
+        setor_atual=setor_atual,
+        hoje=hoje,
+        ontem=hoje - timedelta(days=1),
+        destaque_id=request.args.get('destaque_id', type=int) or 0,
+    )
+    return jsonify(
+        ok=True,
+        qtd=len(itens),
+        rows=render_template('_linhas_caixa.html', **contexto),
+        cards=render_template('_cards_caixa.html', **contexto),
+    )
+
+
 @caixa_bp.route('/api/caixa/fechar_mes', methods=['POST'])
 def api_fechar_mes_caixa():
     """Fecha um mês explicitamente: zera saldos positivos e transporta ao mês seguinte."""
@@ -888,9 +729,14 @@ def upload_imagem_cheque():
     if not _arquivo_imagem_permitido(file.filename):
         return jsonify({'error': 'Tipo de arquivo não permitido. Use PNG, JPG, JPEG, GIF ou WEBP.'}), 400
 
+    # A imagem vai para o spool e sobe em background; até lá a URL provisória
+    # serve o arquivo local (``routes/uploads.py``) e, depois, redireciona.
     try:
-        upload_result = cloudinary.uploader.upload(file, folder='cheques_gaveta', timeout=_EXTERNAL_TIMEOUT)
-        return jsonify({'url': upload_result.get('secure_url')}), 200
+        token = guardar_para_upload(file, DESTINO_CHEQUE, pasta='cheques_gaveta', empresa_id=empresa_id_atual())
+        if not token:
+            return jsonify({'error': 'Armazenamento de imagens (Cloudinary) não configurado.'}), 503
+        disparar_uploads([token])
+        return jsonify({'url': url_provisoria(token)}), 200
     except Exception as e:
         return erro_json(
             e,
@@ -924,17 +770,19 @@ def salvar_contagem_gaveta():
 
     estado = {'dinheiro': dinheiro, 'cheques': cheques}
     hoje = get_hoje_brasil()
+    # Foto de cheque já enviada à nuvem: grava a URL definitiva.
+    estado_json = resolver_urls_provisorias(json.dumps(estado, ensure_ascii=False))
 
     try:
         registro = query_tenant(ContagemGaveta).filter_by(usuario_id=current_user.id).order_by(ContagemGaveta.id.desc()).first()
         if registro:
             registro.data = hoje
-            registro.estado_json = json.dumps(estado, ensure_ascii=False)
+            registro.estado_json = estado_json
         else:
             novo = ContagemGaveta(
                 data=hoje,
                 usuario_id=current_user.id,
-                estado_json=json.dumps(estado, ensure_ascii=False),
+                estado_json=estado_json,
                 empresa_id=empresa_id_atual(),
             )
             db.session.add(novo)
@@ -1362,43 +1210,45 @@ def toggle_status_cheque(id):
         return jsonify({'success': False, 'message': 'Erro ao atualizar status do cheque.'}), 500
 
 
-_RE_MARCADOR_VENDA = re.compile(r'Venda #(\d+)')
-
-
 def _coletar_vendas_afetadas(lancamentos):
     """Extrai IDs de venda únicos referenciados nos lançamentos.
 
-    Trabalha sobre uma lista de ``LancamentoCaixa`` já carregados e
-    devolve um set de inteiros com os ``venda_id`` extraídos do marcador
-    ``Venda #N`` na descrição. Considera apenas lançamentos do tipo
-    ENTRADA — saídas (repasses a fornecedor) não afetam ``valor_pago``
-    da venda do cliente.
+    Trabalha sobre ``LancamentoCaixa`` já carregados (ou linhas com
+    ``tipo``/``venda_id``/``descricao``, como o ``RETURNING`` do
+    ``DELETE`` em lote) e devolve um set com o ``venda_id`` de cada um **e** o ID do marcador
+    ``Venda #N -`` da descrição atual — numa edição ainda não gravada os
+    dois podem divergir (o listener só realinha ``venda_id`` no flush) e
+    ambas as vendas precisam de ressync. Considera apenas lançamentos do
+    tipo ENTRADA — saídas (repasses a fornecedor) não afetam
+    ``valor_pago`` da venda do cliente.
     """
     venda_ids = set()
     for lanc in lancamentos:
         if (lanc.tipo or '').upper() != 'ENTRADA':
             continue
-        match = _RE_MARCADOR_VENDA.search(lanc.descricao or '')
-        if match:
-            try:
-                venda_ids.add(int(match.group(1)))
-            except (TypeError, ValueError):
-                continue
+        if lanc.venda_id is not None:
+            venda_ids.add(int(lanc.venda_id))
+        vid = venda_id_do_marcador(lanc.descricao)
+        if vid is not None:
+            venda_ids.add(vid)
     return venda_ids
 
 
-def _resincronizar_vendas_por_ids(venda_ids):
-    """Aplica ``_resincronizar_pagamento_venda`` em batch.
+def _resincronizar_vendas_por_ids(venda_ids, empresa_id=None):
+    """Ressincroniza ``valor_pago`` + ``situacao`` de várias vendas em lote.
 
-    Carrega vendas no tenant atual e ressincroniza ``valor_pago`` +
-    ``situacao`` de cada uma. NÃO faz commit — chamador agrupa.
+    Restrito ao tenant atual (ou ao ``empresa_id`` explícito, para uso
+    fora de request). Delega a ``resincronizar_vendas``: um ``GROUP BY``
+    e um ``UPDATE``, qualquer que seja o número de vendas. NÃO faz
+    commit — chamador agrupa.
     """
     if not venda_ids:
         return 0
-    vendas = query_tenant(Venda).filter(Venda.id.in_(list(venda_ids))).all()
-    for venda in vendas:
-        _resincronizar_pagamento_venda(venda)
-    return len(vendas)
+    if empresa_id is None:
+        empresa_id = empresa_id_atual()
+        if empresa_id is None:
+            return 0
+    return resincronizar_vendas(venda_ids, empresa_id=empresa_id)
 
 
 @caixa_bp.route('/caixa/deletar/<int:id>', methods=['POST'])
@@ -1457,6 +1307,39 @@ def deletar_caixa(id):
     return _redirect_caixa(setor=setor_redirect, abrir_mes=abrir_mes_redirect)
 
 
+def _apagar_lancamentos_em_lote(*filtros):
+    """Apaga lançamentos do tenant atual num único ``DELETE`` set-based.
+
+    Retorna ``(quantidade, venda_ids)``. As linhas apagadas voltam pelo
+    próprio ``DELETE ... RETURNING`` (SELECT + DELETE onde o dialeto não
+    suporta) e passam por ``_coletar_vendas_afetadas``. Como o
+    ``DELETE`` em lote não dispara os listeners de mapper, os saldos
+    mensais dos meses tocados são recalculados aqui. NÃO faz commit.
+    """
+    empresa_id = empresa_id_atual()
+    if empresa_id is None:
+        return 0, set()
+    condicao = (LancamentoCaixa.empresa_id == empresa_id, *filtros)
+    colunas = (
+        LancamentoCaixa.tipo, LancamentoCaixa.venda_id, LancamentoCaixa.descricao,
+        LancamentoCaixa.setor, LancamentoCaixa.data,
+    )
+    opcoes = {'synchronize_session': False}
+    if db.session.get_bind().dialect.delete_returning:
+        apagados = db.session.execute(
+            delete(LancamentoCaixa).where(*condicao).returning(*colunas),
+            execution_options=opcoes,
+        ).all()
+    else:
+        apagados = db.session.execute(select(*colunas).where(*condicao)).all()
+        db.session.execute(delete(LancamentoCaixa).where(*condicao), execution_options=opcoes)
+    recalcular_saldos_meses(empresa_id, {
+        (lanc.setor, lanc.data.year, lanc.data.month)
+        for lanc in apagados if lanc.data is not None
+    })
+    return len(apagados), _coletar_vendas_afetadas(apagados)
+
+
 @caixa_bp.route('/caixa/deletar_massa', methods=['POST'])
 def deletar_massa_caixa():
     """Deleta múltiplos lançamentos com ressincronização de vendas afetadas (admin only).
@@ -1489,12 +1372,7 @@ def deletar_massa_caixa():
 
         if deletar_tudo:
             try:
-                lancamentos = query_tenant(LancamentoCaixa).all()
-                venda_ids = _coletar_vendas_afetadas(lancamentos)
-                count = len(lancamentos)
-                for lanc in lancamentos:
-                    db.session.delete(lanc)
-                db.session.flush()
+                count, venda_ids = _apagar_lancamentos_em_lote()
                 _resincronizar_vendas_por_ids(venda_ids)
                 ok, err = _safe_db_commit()
                 if not ok:
@@ -1518,24 +1396,17 @@ def deletar_massa_caixa():
                     exc_info=True,
                 )
                 flash(f'Erro ao excluir lançamentos: {msg}', 'error')
-            current_app.logger.info(f"[CAIXA-MASSA-DEL] redirecting (deletar_tudo)")
+            current_app.logger.info("[CAIXA-MASSA-DEL] redirecting (deletar_tudo)")
             return redirect(url_for('caixa.caixa'))
 
         if not ids:
-            current_app.logger.info(f"[CAIXA-MASSA-DEL] redirecting (nenhum_id)")
+            current_app.logger.info("[CAIXA-MASSA-DEL] redirecting (nenhum_id)")
             flash('Nenhum lançamento selecionado para exclusão.', 'error')
             return redirect(url_for('caixa.caixa'))
 
         try:
             ids_int = [int(x) for x in ids]
-            lancamentos = query_tenant(LancamentoCaixa).filter(
-                LancamentoCaixa.id.in_(ids_int)
-            ).all()
-            venda_ids = _coletar_vendas_afetadas(lancamentos)
-            count = len(lancamentos)
-            for lanc in lancamentos:
-                db.session.delete(lanc)
-            db.session.flush()
+            count, venda_ids = _apagar_lancamentos_em_lote(LancamentoCaixa.id.in_(ids_int))
             _resincronizar_vendas_por_ids(venda_ids)
             ok, err = _safe_db_commit()
             if not ok:
@@ -1559,7 +1430,7 @@ def deletar_massa_caixa():
             )
             flash(f'Erro ao excluir lançamentos: {msg}', 'error')
 
-        current_app.logger.info(f"[CAIXA-MASSA-DEL] redirecting")
+        current_app.logger.info("[CAIXA-MASSA-DEL] redirecting")
         return redirect(url_for('caixa.caixa'))
 
     return _impl()
@@ -1569,20 +1440,10 @@ def deletar_massa_caixa():
 def importar_caixa():
     """Importa lançamentos a partir de CSV/TSV/TXT (5 colunas posicionais).
 
-    Padrão robusto:
-    - Rollback defensivo no início (sessão suja vinda do pool em produção).
-    - Tracing ``[CAIXA-IMPORT]`` em start/parsed/batch-commit-ok/
-      batch-commit-fail/commit-final-ok/exception/redirecting.
-    - **Commits em batches de ``BATCH_SIZE`` linhas** evitam transação
-      única longa, que em CSVs grandes causa escalonamento de locks no
-      Postgres e timeout do worker do Gunicorn (Render). Falha em um
-      batch faz rollback só do batch e segue, alinhado ao espírito do
-      código original (``erros = []`` por linha — importação parcial).
-    - ``msg = str(e) or repr(e) or e.__class__.__name__`` em flash.
-    - ``exc_info=True`` no logger para traceback completo nos logs.
+    O POST só valida o upload e cria um ``JobImportacao``; o processamento
+    (``processar_importacao_caixa``) roda em background e o resultado
+    volta como flash na tela do Caixa.
     """
-    BATCH_SIZE = 100
-
     arquivo_filename = ''
     if 'arquivo' in request.files:
         arquivo_filename = (request.files['arquivo'].filename or '')
@@ -1591,251 +1452,271 @@ def importar_caixa():
         f"[CAIXA-IMPORT] start filename={arquivo_filename!r}"
     )
 
-    try:
-        db.session.rollback()
-    except Exception:
-        pass
-
     if 'arquivo' not in request.files:
         flash('Nenhum arquivo enviado.', 'error')
-        current_app.logger.info(f"[CAIXA-IMPORT] redirecting (sem_arquivo)")
+        current_app.logger.info("[CAIXA-IMPORT] redirecting (sem_arquivo)")
         return redirect(url_for('caixa.caixa'))
 
     arquivo = request.files['arquivo']
     if arquivo.filename == '':
         flash('Nenhum arquivo selecionado.', 'error')
-        current_app.logger.info(f"[CAIXA-IMPORT] redirecting (filename_vazio)")
+        current_app.logger.info("[CAIXA-IMPORT] redirecting (filename_vazio)")
         return redirect(url_for('caixa.caixa'))
 
     fn = arquivo.filename.lower()
-    if arquivo and (fn.endswith('.csv') or fn.endswith('.tsv') or fn.endswith('.txt')):
+    if not (fn.endswith('.csv') or fn.endswith('.tsv') or fn.endswith('.txt')):
+        flash('Por favor, envie um arquivo .csv, .tsv ou .txt válido.', 'error')
+        return redirect(url_for('caixa.caixa'))
+
+    try:
+        db.session.rollback()
+    except Exception:
+        pass
+
+    try:
+        job = criar_job_importacao('caixa', arquivo, empresa_id=empresa_id_atual(), usuario_id=current_user.id)
+        enfileirar_job_importacao(job)
+    except Exception as e:
+        db.session.rollback()
+        msg = str(e) or repr(e) or e.__class__.__name__
+        current_app.logger.error(
+            f"[CAIXA-IMPORT] exception filename={arquivo_filename!r} "
+            f"type={e.__class__.__name__} msg={msg!r}",
+            exc_info=True,
+        )
+        flash(f'Erro fatal ao processar o arquivo: {msg}', 'error')
+        return redirect(url_for('caixa.caixa'))
+
+    current_app.logger.info(f"[CAIXA-IMPORT] enfileirado job={job.id} filename={arquivo_filename!r}")
+    return redirect(url_for('importacoes.acompanhar_importacao', job_id=job.id))
+
+
+def processar_importacao_caixa(caminho, nome_arquivo, *, empresa_id, usuario_id, progresso=None):
+    """Importador do livro caixa executado pelo job (sem ``current_user``).
+
+    Padrão robusto:
+    - Rollback defensivo no início (sessão suja vinda do pool).
+    - Tracing ``[CAIXA-IMPORT]`` em parsed/insert-ok/insert-fail/
+      commit-final-ok/exception.
+    - Conversão vetorizada (``normalizar_caixa``), duplicatas checadas
+      contra UMA consulta do período do arquivo e gravação num único
+      ``INSERT`` em lote. Saldos mensais e ressync das vendas marcadas
+      (``Venda #N -``) vão na mesma transação — ou entra o arquivo
+      inteiro, ou nada. Linhas com erro de formato continuam só sendo
+      puladas e listadas em ``erros``.
+    - ``msg = str(e) or repr(e) or e.__class__.__name__`` na mensagem.
+    - ``exc_info=True`` no logger para traceback completo nos logs.
+
+    As mensagens que antes iam direto para ``flash`` voltam em
+    ``mensagens`` e são exibidas na tela do Caixa ao fim do job.
+    """
+    mensagens = []
+    erros = []
+    linhas_sucesso = 0
+    linhas_duplicadas = 0
+
+    try:
+        db.session.rollback()
+    except Exception:
+        pass
+
+    try:
+        with open(caminho, 'rb') as f:
+            raw = f.read()
         try:
-            raw = arquivo.stream.read()
-            try:
-                conteudo = raw.decode('utf-8-sig', errors='replace')
-            except Exception:
-                conteudo = raw.decode('latin-1', errors='replace')
-
-            stream = io.StringIO(conteudo, newline=None)
-            primeira_linha = stream.readline()
-            if '\t' in primeira_linha:
-                delimitador = '\t'
-            elif ';' in primeira_linha:
-                delimitador = ';'
-            else:
-                delimitador = ','
-            stream.seek(0)
-
-            leitor = csv.reader(stream, delimiter=delimitador)
-            linhas_sucesso = 0
-            linhas_duplicadas = 0
-            erros = []
-            adicionados_no_batch = 0
-            total_lidas = 0
-            # Conjunto de IDs de venda referenciadas em descrições do tipo
-            # ``Venda #N``. Ressincronizamos no FIM da importação (depois
-            # do commit final), porque commits em batch já gravaram os
-            # ``LancamentoCaixa`` — ``_resincronizar_pagamento_venda`` lê
-            # do banco. Agrupar num set evita recalcular a mesma venda
-            # várias vezes quando o CSV traz N parcelas da mesma.
-            venda_ids_para_ressync = set()
-
-            for i, linha in enumerate(leitor, start=1):
-                total_lidas = i
-                if not linha or all(c.strip() == '' for c in linha):
-                    continue
-
-                if 'data' in str(linha).lower() or 'valor' in str(linha).lower() or (linha and 'descri' in str(linha[0]).lower()):
-                    continue
-
-                if len(linha) < 5:
-                    erros.append(f"Linha {i}: Faltam colunas.")
-                    continue
+            conteudo = raw.decode('utf-8-sig', errors='replace')
+        except Exception:
+            conteudo = raw.decode('latin-1', errors='replace')
+
+        stream = io.StringIO(conteudo, newline=None)
+        primeira_linha = stream.readline()
+        if '\t' in primeira_linha:
+            delimitador = '\t'
+        elif ';' in primeira_linha:
+            delimitador = ';'
+        else:
+            delimitador = ','
+        stream.seek(0)
+
+        leitor = csv.reader(stream, delimiter=delimitador)
+        total_lidas = 0
+        # IDs de venda referenciadas em descrições ``Venda #N`` (ENTRADA).
+        # Um set: o CSV pode trazer N parcelas da mesma venda e a
+        # ressync é uma só, no fim.
+        venda_ids_para_ressync = set()
+
+        # 1ª passada: só separa as linhas de dados (pula vazias e
+        # cabeçalho); a conversão de valor/data é vetorizada abaixo.
+        linhas_dados = []
+        numeros_linha = []
+        erros_estrutura = []
+        for i, linha in enumerate(leitor, start=1):
+            total_lidas = i
+            if not linha or all(c.strip() == '' for c in linha):
+                continue
 
-                try:
-                    descricao = str(linha[0]).strip()
-                    valor_raw = str(linha[1]).strip()
-                    data_str = str(linha[2]).strip()
-                    categoria = str(linha[3]).strip() or 'Outros'
-                    forma_pagamento = str(linha[4]).strip() or 'Dinheiro'
-
-                    s = data_str.split()[0]
-                    for fmt in ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y'):
-                        try:
-                            data_lanc = datetime.strptime(s, fmt).date()
-                            break
-                        except ValueError:
-                            continue
-                    else:
-                        erros.append(f"Linha {i}: Data inválida '{data_str}'.")
-                        continue
-
-                    is_saida = '-' in valor_raw or 'saída' in categoria.lower() or 'saida' in categoria.lower()
-                    tipo_lancamento = 'SAIDA' if is_saida else 'ENTRADA'
-
-                    v_str = valor_raw.replace('R$', '').replace('-', '').replace(' ', '').strip()
-                    if ',' in v_str:
-                        v_str = v_str.replace('.', '').replace(',', '.')
-                    else:
-                        if '.' in v_str and len(v_str.split('.')[-1]) == 3:
-                            v_str = v_str.replace('.', '')
-                    valor = float(v_str) if v_str else 0.0
-
-                    ja_existe = query_tenant(LancamentoCaixa).filter_by(
-                        data=data_lanc,
-                        descricao=descricao,
-                        tipo=tipo_lancamento,
-                        categoria=categoria,
-                        forma_pagamento=forma_pagamento,
-                        valor=abs(valor),
-                        usuario_id=current_user.id,
-                    ).first()
-
-                    if ja_existe:
-                        linhas_duplicadas += 1
-                        continue
-
-                    novo_lancamento = LancamentoCaixa(
-                        data=data_lanc,
-                        descricao=descricao,
-                        tipo=tipo_lancamento,
-                        categoria=categoria,
-                        forma_pagamento=forma_pagamento,
-                        valor=abs(valor),
-                        usuario_id=current_user.id,
-                        empresa_id=empresa_id_atual(),
-                    )
-                    db.session.add(novo_lancamento)
-                    linhas_sucesso += 1
-                    adicionados_no_batch += 1
-
-                    if tipo_lancamento == 'ENTRADA':
-                        match = _RE_MARCADOR_VENDA.search(descricao or '')
-                        if match:
-                            try:
-                                venda_ids_para_ressync.add(int(match.group(1)))
-                            except (TypeError, ValueError):
-                                pass
-
-                    if adicionados_no_batch >= BATCH_SIZE:
-                        ok, err = _safe_db_commit()
-                        if not ok:
-                            current_app.logger.warning(
-                                f"[CAIXA-IMPORT] batch-commit-fail "
-                                f"ate_linha={i} err={err}"
-                            )
-                            try:
-                                db.session.rollback()
-                            except Exception:
-                                pass
-                            erros.append(f"Batch ate linha {i}: {err}")
-                        else:
-                            current_app.logger.info(
-                                f"[CAIXA-IMPORT] batch-commit-ok "
-                                f"ate_linha={i} acumulado_sucesso={linhas_sucesso}"
-                            )
-                        adicionados_no_batch = 0
-
-                except Exception as e:
-                    erros.append(f"Linha {i}: Erro nos dados -> {str(e)}")
-                    continue
+            if 'data' in str(linha).lower() or 'valor' in str(linha).lower() or (linha and 'descri' in str(linha[0]).lower()):
+                continue
 
-            current_app.logger.info(
-                f"[CAIXA-IMPORT] parsed total_lidas={total_lidas} "
-                f"sucesso={linhas_sucesso} duplicadas={linhas_duplicadas} "
-                f"erros={len(erros)}"
-            )
+            if len(linha) < 5:
+                erros_estrutura.append((i, f"Linha {i}: Faltam colunas."))
+                continue
+            linhas_dados.append(linha)
+            numeros_linha.append(i)
+
+        planilha = normalizar_caixa(linhas_dados)
+        pendentes_estrutura = iter(erros_estrutura)
+        proximo_estrutura = next(pendentes_estrutura, None)
+
+        total_linhas = len(numeros_linha)
+        if progresso:
+            progresso(0, total_linhas, len(erros_estrutura))
+
+        # Chaves de duplicata já gravadas no período do arquivo, numa
+        # consulta só (antes era um SELECT por linha). Mesma regra do
+        # filtro antigo: data, descrição, tipo, categoria, forma, valor e
+        # usuário. As linhas aceitas entram no set, então uma linha
+        # repetida dentro do próprio arquivo também conta como ignorada.
+        datas = [d for d in planilha['data'] if d is not None] if total_linhas else []
+        ja_gravados = set()
+        if datas:
+            ja_gravados = {
+                (d, desc, tipo, cat, forma, Decimal(str(valor)))
+                for d, desc, tipo, cat, forma, valor in db.session.query(
+                    LancamentoCaixa.data, LancamentoCaixa.descricao, LancamentoCaixa.tipo,
+                    LancamentoCaixa.categoria, LancamentoCaixa.forma_pagamento, LancamentoCaixa.valor,
+                ).filter(
+                    LancamentoCaixa.empresa_id == empresa_id,
+                    LancamentoCaixa.usuario_id == usuario_id,
+                    LancamentoCaixa.data >= min(datas),
+                    LancamentoCaixa.data <= max(datas),
+                )
+            }
 
-            # Commit final: o que sobrou no último batch incompleto.
-            if adicionados_no_batch > 0:
-                ok, err = _safe_db_commit()
-                if not ok:
-                    current_app.logger.warning(
-                        f"[CAIXA-IMPORT] commit-final-fail "
-                        f"sobra={adicionados_no_batch} err={err}"
-                    )
-                    try:
-                        db.session.rollback()
-                    except Exception:
-                        pass
-                    erros.append(f"Commit final: {err}")
-                    # Compensa: lançamentos que estavam no batch final
-                    # não chegaram a persistir.
-                    linhas_sucesso -= adicionados_no_batch
-                    adicionados_no_batch = 0
-
-            # Ressincroniza vendas referenciadas pelas descrições
-            # importadas. Sem isso, o CSV traria os pagamentos para
-            # ``LancamentoCaixa`` mas as ``Venda`` ficariam PENDENTE
-            # com valor cheio. Faz num commit dedicado, porque os
-            # ``LancamentoCaixa`` já estão persistidos pelos batches
-            # anteriores (``_resincronizar_pagamento_venda`` faz SELECT,
-            # então precisa do estado committado).
-            if venda_ids_para_ressync:
-                try:
-                    _resincronizar_vendas_por_ids(venda_ids_para_ressync)
-                    ok_rs, err_rs = _safe_db_commit()
-                    if not ok_rs:
-                        current_app.logger.warning(
-                            f"[CAIXA-IMPORT] ressync-commit-fail "
-                            f"vendas={len(venda_ids_para_ressync)} err={err_rs}"
-                        )
-                        try:
-                            db.session.rollback()
-                        except Exception:
-                            pass
-                    else:
-                        current_app.logger.info(
-                            f"[CAIXA-IMPORT] ressync-commit-ok "
-                            f"vendas_ressync={len(venda_ids_para_ressync)}"
-                        )
-                except Exception as e_rs:
-                    try:
-                        db.session.rollback()
-                    except Exception:
-                        pass
-                    current_app.logger.error(
-                        f"[CAIXA-IMPORT] ressync-exception "
-                        f"vendas={len(venda_ids_para_ressync)} "
-                        f"type={e_rs.__class__.__name__} msg={str(e_rs)!r}",
-                        exc_info=True,
-                    )
+        novos = []
+        for processadas, (i, r) in enumerate(zip(numeros_linha, planilha.itertuples(index=False)), start=1):
+            if progresso:
+                progresso(processadas, total_linhas, len(erros))
+            # Mantém as mensagens na ordem das linhas do arquivo.
+            while proximo_estrutura is not None and proximo_estrutura[0] < i:
+                erros.append(proximo_estrutura[1])
+                proximo_estrutura = next(pendentes_estrutura, None)
+
+            if r.erro is not None:
+                erros.append(f"Linha {i}: Erro nos dados -> {r.erro}")
+                continue
+            if r.data is None:
+                erros.append(f"Linha {i}: Data inválida '{r.data_bruta}'.")
+                continue
 
-            if linhas_sucesso > 0:
-                _invalidar_cache_dashboard_seguro()
-                current_app.logger.info(
-                    f"[CAIXA-IMPORT] commit-final-ok success={linhas_sucesso} "
-                    f"dup={linhas_duplicadas} err={len(erros)}"
+            valor = Decimal(str(abs(r.valor)))
+            chave = (r.data, r.descricao, r.tipo, r.categoria, r.forma_pagamento, valor)
+            if chave in ja_gravados:
+                linhas_duplicadas += 1
+                continue
+            ja_gravados.add(chave)
+            novos.append({
+                'data': r.data,
+                'descricao': r.descricao,
+                'tipo': r.tipo,
+                'categoria': r.categoria,
+                'forma_pagamento': r.forma_pagamento,
+                'valor': valor,
+                'setor': 'GERAL',
+                'usuario_id': usuario_id,
+                'empresa_id': empresa_id,
+            })
+
+        while proximo_estrutura is not None:
+            erros.append(proximo_estrutura[1])
+            proximo_estrutura = next(pendentes_estrutura, None)
+
+        current_app.logger.info(
+            f"[CAIXA-IMPORT] parsed total_lidas={total_lidas} "
+            f"novos={len(novos)} duplicadas={linhas_duplicadas} "
+            f"erros={len(erros)}"
+        )
+
+        if novos:
+            # ``INSERT`` em lote não passa pelos listeners de mapper:
+            # ``status_envio``, ``venda_id`` e os saldos mensais são
+            # preenchidos aqui, com as mesmas regras.
+            marcadores = [venda_id_do_marcador(n['descricao']) for n in novos]
+            vinculaveis = vendas_vinculaveis(
+                {vid for vid in marcadores if vid is not None}, empresa_id
+            )
+            for novo, vid in zip(novos, marcadores):
+                novo['status_envio'] = _status_envio_por_forma_pagamento(novo['forma_pagamento'])
+                novo['venda_id'] = vid if vid in vinculaveis else None
+                # Ressync também de marcador não vinculável: a
+                # ``resincronizar_vendas`` já ignora o que não é do tenant.
+                if novo['tipo'] == 'ENTRADA' and vid is not None:
+                    venda_ids_para_ressync.add(vid)
+            try:
+                db.session.execute(insert(LancamentoCaixa), novos)
+                recalcular_saldos_meses(
+                    empresa_id, {('GERAL', n['data'].year, n['data'].month) for n in novos}
                 )
-                msg = f'{linhas_sucesso} novos lançamentos importados!'
-                if linhas_duplicadas > 0:
-                    msg += f' ({linhas_duplicadas} ignorados pois já existiam).'
-                if erros:
-                    msg += f' (Com {len(erros)} erros de formatação).'
-                flash(msg, 'success')
-            elif linhas_duplicadas > 0:
-                flash(f'Nenhum dado novo. Todos os {linhas_duplicadas} lançamentos da planilha já estavam no sistema!', 'info')
-            else:
+                # Mesma transação do INSERT: o GROUP BY da ressync já
+                # enxerga os lançamentos novos.
+                _resincronizar_vendas_por_ids(venda_ids_para_ressync, empresa_id=empresa_id)
+                ok, err = _safe_db_commit()
+            except Exception as e_ins:
                 try:
                     db.session.rollback()
                 except Exception:
                     pass
-                msg_erro = erros[0] if erros else "Formato de colunas inválido. Esperado: Descrição, Valor, Data, Categoria, Forma (5 colunas)."
-                flash(f'Falha na importação. {msg_erro}', 'error')
-                if len(erros) > 1:
-                    flash('Detalhes: ' + '; '.join(erros[:3]) + ('...' if len(erros) > 3 else ''), 'warning')
+                ok, err = False, str(e_ins) or e_ins.__class__.__name__
+            if ok:
+                linhas_sucesso = len(novos)
+                current_app.logger.info(
+                    f"[CAIXA-IMPORT] insert-ok linhas={linhas_sucesso} "
+                    f"vendas_ressync={len(venda_ids_para_ressync)}"
+                )
+            else:
+                current_app.logger.warning(
+                    f"[CAIXA-IMPORT] insert-fail linhas={len(novos)} err={err}",
+                )
+                erros.append(f"Gravação: {err}")
 
-        except Exception as e:
-            db.session.rollback()
-            msg = str(e) or repr(e) or e.__class__.__name__
-            current_app.logger.error(
-                f"[CAIXA-IMPORT] exception filename={arquivo_filename!r} "
-                f"type={e.__class__.__name__} msg={msg!r}",
-                exc_info=True,
+        if linhas_sucesso > 0:
+            _invalidar_cache_dashboard_seguro()
+            current_app.logger.info(
+                f"[CAIXA-IMPORT] commit-final-ok success={linhas_sucesso} "
+                f"dup={linhas_duplicadas} err={len(erros)}"
             )
-            flash(f'Erro fatal ao processar o arquivo: {msg}', 'error')
-    else:
-        flash('Por favor, envie um arquivo .csv, .tsv ou .txt válido.', 'error')
+            msg = f'{linhas_sucesso} novos lançamentos importados!'
+            if linhas_duplicadas > 0:
+                msg += f' ({linhas_duplicadas} ignorados pois já existiam).'
+            if erros:
+                msg += f' (Com {len(erros)} erros de formatação).'
+            mensagens.append(('success', msg))
+        elif linhas_duplicadas > 0:
+            mensagens.append(('info', f'Nenhum dado novo. Todos os {linhas_duplicadas} lançamentos da planilha já estavam no sistema!'))
+        else:
+            try:
+                db.session.rollback()
+            except Exception:
+                pass
+            msg_erro = erros[0] if erros else "Formato de colunas inválido. Esperado: Descrição, Valor, Data, Categoria, Forma (5 colunas)."
+            mensagens.append(('error', f'Falha na importação. {msg_erro}'))
+            if len(erros) > 1:
+                mensagens.append(('warning', 'Detalhes: ' + '; '.join(erros[:3]) + ('...' if len(erros) > 3 else '')))
 
-    current_app.logger.info(f"[CAIXA-IMPORT] redirecting filename={arquivo_filename!r}")
-    return redirect(url_for('caixa.caixa'))
+    except Exception as e:
+        db.session.rollback()
+        msg = str(e) or repr(e) or e.__class__.__name__
+        current_app.logger.error(
+            f"[CAIXA-IMPORT] exception filename={nome_arquivo!r} "
+            f"type={e.__class__.__name__} msg={msg!r}",
+            exc_info=True,
+        )
+        mensagens.append(('error', f'Erro fatal ao processar o arquivo: {msg}'))
+
+    return {
+        'sucesso': linhas_sucesso,
+        'erros': len(erros),
+        'ignorados': linhas_duplicadas,
+        'erros_detalhados': erros,
+        'mensagens': mensagens,
+    }
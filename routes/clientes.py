@@ -44,7 +44,6 @@ from sqlalchemy.orm import joinedload
 from sqlalchemy.exc import IntegrityError, OperationalError, TimeoutError as SATimeoutError
 import pandas as pd
 from werkzeug.exceptions import HTTPException
-from werkzeug.utils import secure_filename
 
 from models import db, Cliente, Venda, LancamentoCaixa, Produto
 from services.auth_utils import tenant_required, admin_required, _is_ajax, _checar_permissao_ou_redirecionar
@@ -52,11 +51,14 @@ from services.db_utils import query_tenant, empresa_id_atual
 from services.cache_utils import limpar_cache_dashboard
 from services.error_utils import erro_json, erro_flash
 from services.config_helpers import registrar_log, _EXTERNAL_TIMEOUT
-from services.vendas_services import _resincronizar_pagamento_venda
+from services.pagamentos_venda import resincronizar_vendas
 from services.csv_utils import (
-    _msg_linha, _strip_quotes,
+    _msg_linha,
     _parse_clientes_raw_tsv, _sanitizar_cnpj_importacao,
 )
+from services.normalizacao_planilha import coluna, strip_quotes_serie
+from services.importacao_jobs import criar_job_importacao, enfileirar_job_importacao
+from services.geocodificacao import agendar_geocodificacao
 
 
 clientes_bp = Blueprint('clientes', __name__)
@@ -297,14 +299,20 @@ def _aplicar_endereco_formulario(cliente, form):
     if composto:
         cliente.endereco = composto
 
-def _processar_linhas_clientes_upsert(linhas, erros_detalhados, sucesso_ref, erros_ref, linha_offset=0):
+def _processar_linhas_clientes_upsert(linhas, erros_detalhados, sucesso_ref, erros_ref, linha_offset=0, empresa_id=None, progresso=None):
     """Processa lista de dicts (nome_cliente, razao_social, cnpj, cidade,
     endereco, telefone). Upsert por ``nome_cliente`` (Apelido).
 
     Atualiza ``sucesso_ref[0]`` e ``erros_ref[0]`` (passados como listas
     para emular passagem por referência) e faz append em ``erros_detalhados``.
+    ``empresa_id`` explícito (default: tenant do usuário logado) permite
+    rodar dentro do job de importação.
     """
+    if empresa_id is None:
+        empresa_id = empresa_id_atual()
     for idx, row in enumerate(linhas):
+        if progresso:
+            progresso(idx + 1, len(linhas), erros_ref[0])
         linha_num = linha_offset + idx + 1
         nome = (row.get('nome_cliente') or '').strip()
         razao_social = (row.get('razao_social') or '').strip() or nome
@@ -320,7 +328,7 @@ def _processar_linhas_clientes_upsert(linhas, erros_detalhados, sucesso_ref, err
             telefone_tsv = (row.get('telefone') or row.get('whatsapp') or '').strip() or None
             cliente = (
                 Cliente.query
-                .filter_by(empresa_id=empresa_id_atual())
+                .filter_by(empresa_id=empresa_id)
                 .filter(func.lower(Cliente.nome_cliente) == nome.lower())
                 .first()
             )
@@ -334,7 +342,7 @@ def _processar_linhas_clientes_upsert(linhas, erros_detalhados, sucesso_ref, err
                 db.session.commit()
                 sucesso_ref[0] += 1
             else:
-                if cnpj and Cliente.query.filter_by(empresa_id=empresa_id_atual(), cnpj=cnpj).first():
+                if cnpj and Cliente.query.filter_by(empresa_id=empresa_id, cnpj=cnpj).first():
                     erros_detalhados.append(_msg_linha(linha_num, nome, "O CNPJ já está cadastrado para outro cliente. Use um CNPJ único.", True))
                     erros_ref[0] += 1
                     continue
@@ -345,7 +353,7 @@ def _processar_linhas_clientes_upsert(linhas, erros_detalhados, sucesso_ref, err
                     cnpj=cnpj,
                     cidade=cidade or None,
                     endereco=endereco,
-                    empresa_id=empresa_id_atual(),
+                    empresa_id=empresa_id,
                 )
                 db.session.add(cliente)
                 db.session.commit()
@@ -565,6 +573,7 @@ def migrar_enderecos():
             'CLIENTES',
             f'Migração de endereços: {atualizados} cliente(s) atualizado(s).',
         )
+        agendar_geocodificacao(empresa_id_atual())
         return jsonify({
             'ok': True,
             'atualizados': atualizados,
@@ -711,6 +720,7 @@ def novo_cliente():
             db.session.add(cliente)
             db.session.commit()
             registrar_log('CRIAR', 'CLIENTES', f"Cliente #{cliente.id} — {cliente.nome_cliente} criado.")
+            agendar_geocodificacao(cliente.empresa_id)
             if _is_ajax():
                 return jsonify(ok=True, mensagem='Cliente cadastrado com sucesso!')
             flash('Cliente cadastrado com sucesso!', 'success')
@@ -778,6 +788,7 @@ def editar_cliente(id):
                 flash('Erro: Este CNPJ já está cadastrado no sistema.', 'error')
                 return redirect(url_for('clientes.listar_clientes'))
             registrar_log('EDITAR', 'CLIENTES', f"Cliente #{cliente.id} — {cliente.nome_cliente} editado.")
+            agendar_geocodificacao(cliente.empresa_id)
             if _is_ajax():
                 return jsonify(ok=True, mensagem='Cliente atualizado com sucesso!')
             flash('Cliente atualizado com sucesso!', 'success')
@@ -1023,6 +1034,9 @@ def importar_clientes():
     """Importação em lote de clientes (CSV/Excel/TSV).
 
     Exige ``admin_required`` adicional além do tenant guard global.
+    A lista colada (TSV) é pequena e segue síncrona; arquivos viram um
+    ``JobImportacao`` processado em background
+    (``processar_importacao_clientes``).
     """
     @admin_required
     def _importar():
@@ -1031,112 +1045,136 @@ def importar_clientes():
             tem_arquivo = 'arquivo' in request.files and request.files['arquivo'] and request.files['arquivo'].filename
             if not lista_raw and not tem_arquivo:
                 return render_template('clientes/importar.html', erros_detalhados=['Cole a lista (TAB) no campo de texto ou selecione um arquivo.'], sucesso=0, erros=1)
-            filepath = None
+            if not lista_raw:
+                try:
+                    job = criar_job_importacao('clientes', request.files['arquivo'], empresa_id=empresa_id_atual(), usuario_id=current_user.id)
+                    enfileirar_job_importacao(job)
+                except Exception as e:
+                    db.session.rollback()
+                    return render_template('clientes/importar.html', erros_detalhados=[f'Erro ao processar: {str(e)}'], sucesso=0, erros=1)
+                return redirect(url_for('importacoes.acompanhar_importacao', job_id=job.id))
             try:
-                sucesso = 0
-                erros = 0
                 erros_detalhados = []
                 sucesso_ref = [0]
                 erros_ref = [0]
-
-                if lista_raw:
-                    linhas = _parse_clientes_raw_tsv(lista_raw)
-                    if not linhas:
-                        return render_template('clientes/importar.html', erros_detalhados=['Nenhuma linha válida encontrada. Use uma linha por cliente, campos separados por TAB: Apelido, Razão Social, CNPJ, Cidade.'], sucesso=0, erros=1)
-                    _processar_linhas_clientes_upsert(linhas, erros_detalhados, sucesso_ref, erros_ref, linha_offset=0)
-                    sucesso, erros = sucesso_ref[0], erros_ref[0]
-                else:
-                    arquivo = request.files['arquivo']
-                    filename = secure_filename(arquivo.filename)
-                    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                    arquivo.save(filepath)
-                    content = None
-                    if filename.endswith('.csv'):
-                        with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-                            content = f.read()
-                    processado_raw = False
-                    if content and content.splitlines():
-                        first_line = content.splitlines()[0]
-                        if '\t' in first_line:
-                            linhas = _parse_clientes_raw_tsv(content)
-                            if linhas:
-                                _processar_linhas_clientes_upsert(linhas, erros_detalhados, sucesso_ref, erros_ref, linha_offset=0)
-                                sucesso, erros = sucesso_ref[0], erros_ref[0]
-                                processado_raw = True
-                    if not processado_raw:
-                        if filename.endswith('.csv'):
-                            df = pd.read_csv(filepath, sep=None, engine='python', quoting=3, on_bad_lines='warn')
-                        else:
-                            df = pd.read_excel(filepath)
-                        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
-                        first_iter = True
-                        for idx, row in df.iterrows():
-                            if first_iter:
-                                first_iter = False
-                            linha_num = idx + 2
-                            nome = _strip_quotes(row.get('nome_cliente', row.get('nome', '')))
-                            contexto = (nome[:40] + '...') if nome and len(nome) > 40 else (nome or 'sem nome')
-                            try:
-                                if not nome:
-                                    erros_detalhados.append(_msg_linha(linha_num, '', "O campo 'nome_cliente' (ou 'nome') está vazio", True))
-                                    erros += 1
-                                    continue
-                                cnpj_raw = _strip_quotes(row.get('cnpj', '')) or None
-                                cnpj = _sanitizar_cnpj_importacao(cnpj_raw) if cnpj_raw else None
-                                if cnpj and query_tenant(Cliente).filter_by(cnpj=cnpj).first():
-                                    existente = query_tenant(Cliente).filter_by(cnpj=cnpj).first()
-                                    erros_detalhados.append(_msg_linha(linha_num, nome, f"O CNPJ já está cadastrado para o cliente '{existente.nome_cliente}'. Use um CNPJ único.", True))
-                                    erros += 1
-                                    continue
-                                endereco = _strip_quotes(row.get('endereco', '')) or None
-                                cliente = query_tenant(Cliente).filter(func.lower(Cliente.nome_cliente) == nome.lower()).first()
-                                telefone_imp = _strip_quotes(row.get('telefone', row.get('whatsapp', ''))) or None
-                                if cliente:
-                                    cliente.razao_social = _strip_quotes(row.get('razao_social', row.get('razao', ''))) or nome
-                                    cliente.cnpj = cnpj
-                                    cliente.cidade = _strip_quotes(row.get('cidade', '')) or None
-                                    cliente.endereco = endereco
-                                    if telefone_imp:
-                                        cliente.telefone = telefone_imp
-                                    db.session.commit()
-                                    sucesso += 1
-                                else:
-                                    cliente = Cliente(
-                                        nome_cliente=nome,
-                                        telefone=telefone_imp,
-                                        razao_social=_strip_quotes(row.get('razao_social', row.get('razao', ''))) or None,
-                                        cnpj=cnpj,
-                                        cidade=_strip_quotes(row.get('cidade', '')) or None,
-                                        endereco=endereco,
-                                        empresa_id=empresa_id_atual(),
-                                    )
-                                    db.session.add(cliente)
-                                    db.session.commit()
-                                    sucesso += 1
-                            except Exception as e:
-                                db.session.rollback()
-                                erros_detalhados.append(_msg_linha(linha_num, contexto, str(e), True))
-                                erros += 1
-
-                if filepath and os.path.exists(filepath):
-                    os.remove(filepath)
+                linhas = _parse_clientes_raw_tsv(lista_raw)
+                if not linhas:
+                    return render_template('clientes/importar.html', erros_detalhados=['Nenhuma linha válida encontrada. Use uma linha por cliente, campos separados por TAB: Apelido, Razão Social, CNPJ, Cidade.'], sucesso=0, erros=1)
+                _processar_linhas_clientes_upsert(linhas, erros_detalhados, sucesso_ref, erros_ref, linha_offset=0)
+                sucesso, erros = sucesso_ref[0], erros_ref[0]
+                if sucesso:
+                    agendar_geocodificacao(empresa_id_atual())
                 if erros > 0:
                     return render_template('clientes/importar.html', erros_detalhados=erros_detalhados, sucesso=sucesso, erros=erros)
                 flash(f'Importação concluída com sucesso! {sucesso} cliente(s) importado(s).', 'success')
                 return redirect(url_for('clientes.listar_clientes'))
             except Exception as e:
                 db.session.rollback()
-                if filepath and os.path.exists(filepath):
-                    try:
-                        os.remove(filepath)
-                    except Exception:
-                        pass
                 return render_template('clientes/importar.html', erros_detalhados=[f'Erro ao processar: {str(e)}'], sucesso=0, erros=1)
         return render_template('clientes/importar.html')
 
     return _importar()
 
 
+def processar_importacao_clientes(caminho, nome_arquivo, *, empresa_id, usuario_id=None, progresso=None):
+    """Importador de clientes (arquivo) executado pelo job (sem ``current_user``).
+
+    Mesmo contrato de ``services.importacao_jobs``: devolve contadores,
+    ``erros_detalhados`` e as ``mensagens`` de flash da importação.
+    """
+    sucesso = 0
+    erros = 0
+    erros_detalhados = []
+    sucesso_ref = [0]
+    erros_ref = [0]
+    content = None
+    if nome_arquivo.endswith('.csv'):
+        with open(caminho, 'r', encoding='utf-8', errors='replace') as f:
+            content = f.read()
+    processado_raw = False
+    if content and content.splitlines():
+        first_line = content.splitlines()[0]
+        if '\t' in first_line:
+            linhas = _parse_clientes_raw_tsv(content)
+            if linhas:
+                _processar_linhas_clientes_upsert(linhas, erros_detalhados, sucesso_ref, erros_ref, linha_offset=0, empresa_id=empresa_id, progresso=progresso)
+                sucesso, erros = sucesso_ref[0], erros_ref[0]
+                processado_raw = True
+    if not processado_raw:
+        if nome_arquivo.endswith('.csv'):
+            df = pd.read_csv(caminho, sep=None, engine='python', quoting=3, on_bad_lines='warn')
+        else:
+            df = pd.read_excel(caminho)
+        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
+        col_nome = strip_quotes_serie(coluna(df, 'nome_cliente', 'nome', padrao=''))
+        col_cnpj = strip_quotes_serie(coluna(df, 'cnpj', padrao=''))
+        col_endereco = strip_quotes_serie(coluna(df, 'endereco', padrao=''))
+        col_telefone = strip_quotes_serie(coluna(df, 'telefone', 'whatsapp', padrao=''))
+        col_razao = strip_quotes_serie(coluna(df, 'razao_social', 'razao', padrao=''))
+        col_cidade = strip_quotes_serie(coluna(df, 'cidade', padrao=''))
+        linhas_planilha = zip(
+            df.index + 2, col_nome, col_cnpj, col_endereco,
+            col_telefone, col_razao, col_cidade,
+        )
+        total_linhas = len(df)
+        if progresso:
+            progresso(0, total_linhas, 0)
+        for processadas, (linha_num, nome, cnpj_raw, endereco, telefone_imp, razao, cidade) in enumerate(linhas_planilha, start=1):
+            if progresso:
+                progresso(processadas, total_linhas, erros)
+            contexto = (nome[:40] + '...') if nome and len(nome) > 40 else (nome or 'sem nome')
+            try:
+                if not nome:
+                    erros_detalhados.append(_msg_linha(linha_num, '', "O campo 'nome_cliente' (ou 'nome') está vazio", True))
+                    erros += 1
+                    continue
+                cnpj = _sanitizar_cnpj_importacao(cnpj_raw) if cnpj_raw else None
+                if cnpj and Cliente.query.filter_by(empresa_id=empresa_id, cnpj=cnpj).first():
+                    existente = Cliente.query.filter_by(empresa_id=empresa_id, cnpj=cnpj).first()
+                    erros_detalhados.append(_msg_linha(linha_num, nome, f"O CNPJ já está cadastrado para o cliente '{existente.nome_cliente}'. Use um CNPJ único.", True))
+                    erros += 1
+                    continue
+                endereco = endereco or None
+                cliente = Cliente.query.filter_by(empresa_id=empresa_id).filter(func.lower(Cliente.nome_cliente) == nome.lower()).first()
+                telefone_imp = telefone_imp or None
+                if cliente:
+                    cliente.razao_social = razao or nome
+                    cliente.cnpj = cnpj
+                    cliente.cidade = cidade or None
+                    cliente.endereco = endereco
+                    if telefone_imp:
+                        cliente.telefone = telefone_imp
+                    db.session.commit()
+                    sucesso += 1
+                else:
+                    cliente = Cliente(
+                        nome_cliente=nome,
+                        telefone=telefone_imp,
+                        razao_social=razao or None,
+                        cnpj=cnpj,
+                        cidade=cidade or None,
+                        endereco=endereco,
+                        empresa_id=empresa_id,
+                    )
+                    db.session.add(cliente)
+                    db.session.commit()
+                    sucesso += 1
+            except Exception as e:
+                db.session.rollback()
+                erros_detalhados.append(_msg_linha(linha_num, contexto, str(e), True))
+                erros += 1
+
+    if sucesso:
+        agendar_geocodificacao(empresa_id)
+    return {
+        'sucesso': sucesso,
+        'erros': erros,
+        'ignorados': 0,
+        'erros_detalhados': erros_detalhados,
+        'mensagens': [('success', f'Importação concluída com sucesso! {sucesso} cliente(s) importado(s).')],
+    }
+
+
 @clientes_bp.route('/cliente/<int:id>/receber_lote', methods=['POST'])
 def receber_lote_cliente(id):
     """Abatimento Inteligente: recebe valor em lote e abate nas vendas pendentes mais antigas.
@@ -1148,19 +1186,20 @@ def receber_lote_cliente(id):
            ser abatido (até o saldo devedor) e cria um ``LancamentoCaixa``
            ENTRADA com descrição
            ``Venda #N - <cliente> (Lote: R$ <valor_total_pago>)``.
-           Esse padrão de descrição é o que ``_resincronizar_pagamento_venda``
-           usa (regex ``Venda #(\\d+)``) para somar o ``valor_pago`` da
-           venda — por isso é OBRIGATÓRIO manter o prefixo ``Venda #N -``
-           exato. O sufixo ``(Lote: R$ X)`` é puramente para auditoria
-           visual no Caixa Diário: quando um pagamento de R$ 20.000 é
+           O ``venda_id`` do lançamento é o que o resync usa para somar o
+           ``valor_pago`` da venda; o prefixo ``Venda #N -`` continua
+           OBRIGATÓRIO (é o vínculo visível no Caixa e o que o listener
+           de ``services/pagamentos_venda.py`` reconhece). O sufixo
+           ``(Lote: R$ X)`` é puramente para auditoria visual no Caixa
+           Diário: quando um pagamento de R$ 20.000 é
            fatiado entre N vendas, todos os lançamentos exibem o valor
            original do lote, dando rastreabilidade ao operador.
         3. Se a forma é BOLETO, cria também o ``Repasse Lote: R$ X``
            (SAIDA por venda) — EXCETO quando a triangulação está
            ativa (ver passo 5), pra não duplicar saídas.
         4. Faz ``flush()`` para que os lançamentos estejam visíveis na query
-           do resync, e chama ``_resincronizar_pagamento_venda(venda)`` para
-           CADA venda afetada — assim o ``valor_pago`` e a ``situacao``
+           do resync, e chama ``resincronizar_vendas`` com TODAS as vendas
+           afetadas de uma vez — assim o ``valor_pago`` e a ``situacao``
            viram PARCIAL/PAGO automaticamente, ativando o badge laranja
            "Saldo devedor" na tela de Vendas.
         5. Triangulação opcional (``repassar_fornecedor=1``): cliente
@@ -1227,8 +1266,8 @@ def receber_lote_cliente(id):
         # LancamentoCaixa gerados nesta requisição — independentemente do
         # fatiamento do dinheiro entre N vendas. Permite ao operador, ao
         # olhar o Caixa Diário, lembrar que esses lançamentos vieram de UM
-        # único pagamento real do cliente. Não interfere no regex
-        # ``_RE_MARCADOR_VENDA = r'Venda #(\d+)'`` (que casa apenas o prefixo).
+        # único pagamento real do cliente. Não interfere no
+        # marcador ``Venda #N -`` (que casa apenas o prefixo).
         # Dentro do try para qualquer falha cair no except tratado (evita 500 puro).
         _valor_lote_int, _valor_lote_dec = divmod(int((valor_recebido * 100)), 100)
         _valor_lote_fmt = f"{_valor_lote_int:,}".replace(',', '.') + f",{_valor_lote_dec:02d}"
@@ -1318,9 +1357,9 @@ def receber_lote_cliente(id):
         # Resync de TODAS as vendas afetadas: fonte única da verdade para
         # valor_pago e situacao. Garante que o badge laranja "Saldo devedor"
         # apareça na listagem de Vendas para PARCIAIS e que PAGOs sumam do
-        # filtro "Pendentes".
-        for venda in vendas_afetadas:
-            _resincronizar_pagamento_venda(venda)
+        # filtro "Pendentes". Em lote: um GROUP BY + um UPDATE, e os
+        # objetos ``vendas_afetadas`` já saem com os valores novos.
+        resincronizar_vendas([v.id for v in vendas_afetadas], empresa_id=empresa_id_atual())
 
         db.session.commit()
         limpar_cache_dashboard()
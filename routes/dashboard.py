@@ -51,7 +51,9 @@ from sqlalchemy import and_, case, desc, func, or_
 from sqlalchemy.orm import joinedload
 
 from extensions import cache
-from models import db, Cliente, Produto, Venda, Documento, LancamentoCaixa, VotoFrase
+from models import (
+    db, Cliente, Produto, Venda, Documento, LancamentoCaixa, VotoFrase, DOC_PROCESSANDO, DOC_ERRO,
+)
 from services.auth_utils import (
     tenant_required, _e_admin_tenant, _usuario_pode_gerenciar_venda,
     _checar_permissao_ou_redirecionar,
@@ -63,6 +65,7 @@ from services.cache_utils import _dashboard_cache_key
 from services.error_utils import erro_json
 from services.query_utils import filtro_ano_data_venda
 from services.config_helpers import get_hoje_brasil, registrar_log, _EXTERNAL_TIMEOUT
+from services.fila_documentos import fora_do_processamento
 
 
 dashboard_bp = Blueprint('dashboard', __name__)
@@ -1244,7 +1247,11 @@ def api_dashboard_detalhes(filtro):
 
 @dashboard_bp.route('/api/dashboard/documentos_pendentes/resumo', methods=['GET'])
 def api_dashboard_documentos_pendentes_resumo():
-    """Resumo leve da fila de documentos pendentes (polling do dashboard)."""
+    """Resumo leve da fila de documentos pendentes (polling do dashboard).
+
+    ``total`` conta os que já podem aparecer na fila; ``processando`` e
+    ``com_erro`` vêm da fila de processamento (services/fila_documentos.py).
+    """
     try:
         eid_atual = empresa_id_atual()
         base_query = Documento.query.filter(Documento.venda_id.is_(None))
@@ -1252,13 +1259,24 @@ def api_dashboard_documentos_pendentes_resumo():
             base_query = base_query.filter(
                 or_(Documento.empresa_id == eid_atual, Documento.empresa_id.is_(None))
             )
-        total = base_query.count()
-        ultimo = base_query.with_entities(Documento.id).order_by(Documento.id.desc()).first()
+        por_status = dict(
+            base_query.with_entities(Documento.status_processamento, func.count(Documento.id))
+            .group_by(Documento.status_processamento)
+            .all()
+        )
+        processando = int(por_status.get(DOC_PROCESSANDO) or 0)
+        total = sum(int(n or 0) for n in por_status.values()) - processando
+        ultimo = (
+            base_query.filter(fora_do_processamento())
+            .with_entities(Documento.id).order_by(Documento.id.desc()).first()
+        )
         ultimo_id = int(ultimo[0]) if ultimo else None
         response = jsonify({
             'ok': True,
             'total': int(total),
             'ultimo_id': ultimo_id,
+            'processando': processando,
+            'com_erro': int(por_status.get(DOC_ERRO) or 0),
         })
         response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
         response.headers['Pragma'] = 'no-cache'
@@ -11,6 +11,8 @@ Rotas extraídas do legado ``app.py`` (Fase 3 da refatoração):
     * POST /upload                               upload_documento     (csrf-exempt + token)
     * POST /api/receber_automatico               api_receber_automatico (público + token)
     * POST /api/bot/upload                       api_bot_upload       (público + token)
+    * GET  /api/documentos/<id>/status           status_documento
+    * GET  /api/documentos/fila                  fila_documentos
     * POST /processar_documentos                 processar_documentos
     * POST /reprocessar_boletos                  reprocessar_boletos
     * GET  /admin/arquivos                       admin_arquivos
@@ -24,6 +26,7 @@ Rotas extraídas do legado ``app.py`` (Fase 3 da refatoração):
     * POST /admin/forcar_leitura_pasta           forcar_leitura_pasta (master)
     * POST /admin/limpar_fantasmas               limpar_fantasmas     (master)
     * POST /admin/limpar_vinculos_quebrados      limpar_vinculos_quebrados (master)
+    * GET  /admin/manutencao/<job_id>            status_manutencao    (master)
     * POST /debug/testar_log                     debug_testar_log     (master)
     * GET  /debug-vincular                       debug_vincular       (admin)
 
@@ -43,9 +46,9 @@ tenants (debug de OCR, raio-x, limpeza global).
 """
 from datetime import date, datetime
 import html
-import io
 import os
 import re
+import tempfile
 import urllib.parse
 import urllib.request
 
@@ -61,9 +64,10 @@ from werkzeug.utils import secure_filename
 
 import cloudinary  # noqa: F401
 import cloudinary.uploader
-import pdfplumber
 
-from models import db, Documento, Venda, Cliente, Usuario
+from models import (
+    db, Documento, Venda, Cliente, Usuario, DOC_PROCESSANDO, DOC_CONCLUIDO, DOC_ERRO,
+)
 from extensions import limiter
 from services.auth_utils import (
     tenant_required, admin_required, master_required,
@@ -77,16 +81,31 @@ from services.config_helpers import _EXTERNAL_TIMEOUT
 from services.files_utils import _deletar_cloudinary_seguro
 from services.vendas_services import _vendas_do_pedido
 from services.documentos_services import (
-    _processar_documento, _processar_pdf,
     _processar_documentos_pendentes,
     _empresa_id_para_documento, _resolver_caminho_documento_seguro,
     _reprocessar_boletos_atualizar_extracao,
     _reprocessar_vencimentos_vendas,
+    _documentos_por_caminho,
+)
+from services.extracao_pdf import DESCRICAO_FALHA, TarefaExtracao, extrair_lote
+from services.manifesto_documentos import limpar_manifesto
+from services.manutencao_documentos import (
+    raio_x_documentos, resgatar_orfaos as _resgatar_orfaos,
+    limpar_fantasmas as _limpar_fantasmas,
+    limpar_vinculos_quebrados as _limpar_vinculos_quebrados,
+    agendar_manutencao, estado_manutencao,
+)
+from services.fila_documentos import (
+    SUBPASTA_POR_TIPO, receber_documento, enfileirar_processamento_documento, tipo_pelo_nome,
 )
 
 
 documentos_bp = Blueprint('documentos', __name__)
 
+# Uploads aceitos: PDF, XML da NF-e (lido direto, sem PDF) e fotos do documento.
+EXTENSOES_UPLOAD = frozenset({'.pdf', '.xml', '.png', '.jpg', '.jpeg'})
+MIMES_UPLOAD = frozenset({'application/pdf', 'application/xml', 'text/xml', 'image/png', 'image/jpeg'})
+
 
 # ============================================================
 # Proteção automática de tenant para todo o blueprint
@@ -130,20 +149,15 @@ def _resposta_debug_desabilitado():
     return jsonify({'erro': 'Endpoint de debug desabilitado neste ambiente.'}), 404
 
 
-def _extrair_texto_raw_pdfplumber(arquivo_pdf):
+def _extrair_texto_raw_pdfplumber(caminho_pdf):
     """Extrai texto com a mesma abordagem usada no processamento:
-    pdfplumber + crop superior (75%)."""
-    texto_completo = ""
-    with pdfplumber.open(arquivo_pdf) as pdf:
-        for pagina in pdf.pages:
-            h = float(pagina.height) or 842
-            w = float(pagina.width) or 595
-            crop_bottom = max(0, h * 0.75)
-            cropped = pagina.crop((0, 0, w, crop_bottom)) if crop_bottom > 0 else pagina
-            texto_pagina = cropped.extract_text()
-            if texto_pagina:
-                texto_completo += texto_pagina + "\n"
-    return texto_completo
+    pdfplumber + crop superior (75%). Passa pelo cache de extração.
+
+    Roda nos processos isolados da extração (``extrair_lote``): um PDF
+    problemático não prende o worker web. Retorna ``(texto, falha)``.
+    """
+    extraido = extrair_lote([TarefaExtracao(caminho_pdf, None, False, False, True)])[0]
+    return extraido.get('texto_recortado') or '', extraido.get('falha')
 
 
 def _token_upload_required(f):
@@ -193,15 +207,17 @@ def debug_texto_arquivo(id):
 
     documento = Documento.query.get_or_404(id)
     try:
-        texto_extraido = ""
+        texto_extraido, falha = "", None
         if documento.url_arquivo:
             with urllib.request.urlopen(documento.url_arquivo, timeout=_EXTERNAL_TIMEOUT) as resp:
                 conteudo_pdf = resp.read()
-            pdf_buffer = io.BytesIO(conteudo_pdf)
+            # O processo isolado lê de um caminho: o PDF baixado vai para um temporário.
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+                tmp.write(conteudo_pdf)
             try:
-                texto_extraido = _extrair_texto_raw_pdfplumber(pdf_buffer)
+                texto_extraido, falha = _extrair_texto_raw_pdfplumber(tmp.name)
             finally:
-                pdf_buffer.close()
+                os.remove(tmp.name)
         else:
             path = (documento.caminho_arquivo or '').strip()
             if not path:
@@ -219,14 +235,19 @@ def debug_texto_arquivo(id):
                 caminho_local = next((c for c in candidatos if os.path.isfile(c)), None)
             if not caminho_local:
                 return "<html><body><h3>Debug</h3><p>Arquivo PDF não encontrado localmente.</p></body></html>", 404
-            texto_extraido = _extrair_texto_raw_pdfplumber(caminho_local)
+            texto_extraido, falha = _extrair_texto_raw_pdfplumber(caminho_local)
 
         texto_escapado = html.escape(texto_extraido or "(sem texto extraído)")
+        linha_falha = (
+            f"<p><strong>Falha de extração:</strong> {html.escape(DESCRICAO_FALHA[falha])}</p>"
+            if falha else ""
+        )
         return (
             "<html><body>"
             "<h3>Texto Extraído (Raio-X)</h3>"
             f"<p><strong>Documento ID:</strong> {documento.id}</p>"
             f"<p><strong>Tipo:</strong> {html.escape(str(documento.tipo or '-'))}</p>"
+            f"{linha_falha}"
             f"<pre style='white-space: pre-wrap; word-break: break-word;'>{texto_escapado}</pre>"
             "</body></html>"
         )
@@ -412,7 +433,8 @@ def ver_nf_venda(id):
         flash('Arquivo da nota fiscal não encontrado no servidor.', 'error')
         return redirect(request.referrer or url_for('vendas.listar_vendas'))
     try:
-        return send_file(full, mimetype='application/pdf')
+        mimetype = 'application/xml' if full.lower().endswith('.xml') else 'application/pdf'
+        return send_file(full, mimetype=mimetype)
     except FileNotFoundError:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.is_json:
             return jsonify({
@@ -432,9 +454,10 @@ def ver_nf_venda(id):
 @_token_upload_required
 def upload_documento():
     """
-    Rota para o bot enviar arquivos. Salva na sala de espera (documentos_entrada).
-    O upload para Cloudinary e criação do Documento ocorrem em
-    ``_processar_documentos_pendentes`` (Organizar).
+    Rota para o bot enviar arquivos. Salva na sala de espera (documentos_entrada)
+    e enfileira leitura, vínculo e envio ao Cloudinary
+    (``services/fila_documentos.py``). Responde 202 com ``documento_id``;
+    o andamento fica em ``/api/documentos/<id>/status``.
     Campo ``tipo``: 'boleto' -> boletos ; 'nfe' -> notas_fiscais
     """
     # CSRF está exempt para esta rota — exemption aplicada no app.py após
@@ -446,8 +469,8 @@ def upload_documento():
         return jsonify({'mensagem': 'Nenhum arquivo enviado.'}), 400
     nome_arquivo = secure_filename(arquivo.filename or '')
     extensao = os.path.splitext(nome_arquivo)[1].lower()
-    extensoes_permitidas = {'.pdf', '.png', '.jpg', '.jpeg'}
-    mimes_permitidos = {'application/pdf', 'image/png', 'image/jpeg'}
+    extensoes_permitidas = EXTENSOES_UPLOAD
+    mimes_permitidos = MIMES_UPLOAD
     mime = (getattr(arquivo, 'mimetype', '') or '').lower()
     if extensao not in extensoes_permitidas:
         return jsonify({'mensagem': 'Extensão de arquivo não permitida.'}), 400
@@ -463,31 +486,17 @@ def upload_documento():
         return jsonify({'mensagem': "Campo 'tipo' inválido. Use 'boleto' ou 'nfe'."}), 400
 
     try:
-        base_dir = os.path.join(current_app.root_path, 'documentos_entrada')
-        caminho_final = os.path.join(base_dir, subpasta)
-        os.makedirs(caminho_final, exist_ok=True)
-        caminho_completo = os.path.join(caminho_final, nome_arquivo)
-        arquivo.save(caminho_completo)
-
         uid = current_user.id if current_user.is_authenticated else None
-        _processar_documento(caminho_completo, user_id_forcado=uid)
-        limpar_cache_dashboard()
-        caminho_relativo = os.path.join('documentos_entrada', subpasta, nome_arquivo).replace('\\', '/')
-        doc_criado = Documento.query.filter_by(caminho_arquivo=caminho_relativo).order_by(Documento.id.desc()).first()
-        if not doc_criado:
-            tipo_doc = 'BOLETO' if subpasta == 'boletos' else 'NOTA_FISCAL'
-            doc_criado = Documento(
-                caminho_arquivo=caminho_relativo,
-                tipo=tipo_doc,
-                usuario_id=uid,
-                empresa_id=_empresa_id_para_documento(fallback_user_id=uid),
-                venda_id=None,
-                data_processamento=date.today(),
-            )
-            db.session.add(doc_criado)
-            db.session.commit()
-            limpar_cache_dashboard()
-        return jsonify({'mensagem': 'Sucesso'}), 200
+        documento = receber_documento(
+            arquivo, nome_arquivo, subpasta=subpasta, usuario_id=uid,
+            empresa_id=_empresa_id_para_documento(fallback_user_id=uid),
+        )
+        enfileirar_processamento_documento(documento.id)
+        return jsonify({
+            'mensagem': 'Sucesso',
+            'documento_id': documento.id,
+            'status_processamento': documento.status_processamento,
+        }), 202
     except Exception as e:
         db.session.rollback()
         return erro_json(
@@ -502,6 +511,9 @@ def upload_documento():
 def api_receber_automatico():
     """API para receber arquivos automaticamente. Requer token em Authorization.
 
+    O arquivo é gravado e enfileirado (``services/fila_documentos.py``):
+    envio ao Cloudinary, leitura e vínculo rodam no worker. Responde 202.
+
     Endpoint público (token-based). O ``before_request`` deste blueprint
     está configurado para NÃO exigir login_required nesta rota.
     """
@@ -524,7 +536,7 @@ def api_receber_automatico():
                 return jsonify({'status': 'erro', 'mensagem': 'Nome de arquivo inválido.'}), 400
 
             extensao = os.path.splitext(filename)[1].lower()
-            if extensao not in {'.pdf', '.png', '.jpg', '.jpeg'}:
+            if extensao not in EXTENSOES_UPLOAD:
                 return jsonify({'status': 'erro', 'mensagem': 'Extensão de arquivo não permitida.'}), 400
 
             tipo_bruto = (request.form.get('tipo') or request.form.get('type') or '').strip().lower()
@@ -533,7 +545,7 @@ def api_receber_automatico():
             elif tipo_bruto in ('nfe', 'nf', 'nota_fiscal', 'nota fiscal', 'notas_fiscais'):
                 tipo_documento = 'NOTA_FISCAL'
             else:
-                tipo_documento = 'NOTA_FISCAL' if ('nfe' in filename.lower() or 'nota' in filename.lower()) else 'BOLETO'
+                tipo_documento = tipo_pelo_nome(filename)
 
             user_id = None
             if current_user.is_authenticated:
@@ -543,32 +555,6 @@ def api_receber_automatico():
                 if primeiro_user:
                     user_id = primeiro_user.id
 
-            url_arquivo = None
-            public_id = None
-            if os.environ.get('CLOUDINARY_URL') or current_app.config.get('CLOUDINARY_URL'):
-                try:
-                    arquivo.stream.seek(0)
-                    resultado_nuvem = cloudinary.uploader.upload(arquivo, resource_type='raw', timeout=_EXTERNAL_TIMEOUT)
-                    url_arquivo = resultado_nuvem.get('secure_url')
-                    public_id = resultado_nuvem.get('public_id')
-                except Exception as e:
-                    return erro_json(
-                        e,
-                        'Falha no upload do arquivo para o Cloudinary.',
-                        extras={'status': 'erro'},
-                        chave_mensagem='mensagem',
-                        contexto='api_receber_automatico:cloudinary',
-                    )
-
-            caminho_relativo = None
-            if not url_arquivo:
-                pasta = current_app.config['UPLOAD_FOLDER']
-                os.makedirs(pasta, exist_ok=True)
-                caminho = os.path.join(pasta, filename)
-                arquivo.stream.seek(0)
-                arquivo.save(caminho)
-                caminho_relativo = os.path.relpath(caminho, current_app.root_path)
-
             valor_raw = (
                 request.form.get('valor')
                 or request.form.get('valor_boleto')
@@ -586,28 +572,21 @@ def api_receber_automatico():
                     except Exception:
                         valor_doc = None
 
-            novo_documento = Documento(
-                url_arquivo=url_arquivo,
-                public_id=public_id,
-                caminho_arquivo=caminho_relativo,
-                tipo=tipo_documento,
+            documento = receber_documento(
+                arquivo, filename, subpasta=SUBPASTA_POR_TIPO[tipo_documento], usuario_id=user_id,
+                empresa_id=_empresa_id_para_documento(fallback_user_id=user_id),
                 numero_nf=(request.form.get('numero_nf') or request.form.get('nf') or None),
                 razao_social=(request.form.get('razao_social') or request.form.get('pagador') or None),
                 valor=valor_doc,
-                usuario_id=user_id,
-                empresa_id=_empresa_id_para_documento(fallback_user_id=user_id),
-                venda_id=None,
-                data_processamento=date.today(),
             )
-            db.session.add(novo_documento)
-            db.session.commit()
-            limpar_cache_dashboard()
+            enfileirar_processamento_documento(documento.id)
             return jsonify({
                 'status': 'success',
                 'mensagem': 'Arquivo recebido',
-                'documento_id': novo_documento.id,
-                'url_arquivo': novo_documento.url_arquivo,
-            }), 200
+                'documento_id': documento.id,
+                'url_arquivo': documento.url_arquivo,
+                'status_processamento': documento.status_processamento,
+            }), 202
         except Exception as e:
             db.session.rollback()
             return erro_json(
@@ -628,6 +607,9 @@ def api_bot_upload():
     Autenticação via header X-API-KEY validado contra a variável de ambiente
     API_BOT_TOKEN. Aceita campos: file/arquivo/documento (arquivo),
     tipo (boleto|nfe), numero_nf, razao_social.
+
+    Responde 202 assim que o arquivo é gravado; o processamento segue na
+    fila (``services/fila_documentos.py``).
     """
     @limiter.limit("10 per minute")
     def _impl():
@@ -646,8 +628,8 @@ def api_bot_upload():
             return jsonify({'erro': 'Nome de arquivo inválido.'}), 400
 
         extensao = os.path.splitext(nome_arquivo)[1].lower()
-        extensoes_permitidas = {'.pdf', '.png', '.jpg', '.jpeg'}
-        mimes_permitidos = {'application/pdf', 'image/png', 'image/jpeg'}
+        extensoes_permitidas = EXTENSOES_UPLOAD
+        mimes_permitidos = MIMES_UPLOAD
         mime = (getattr(arquivo, 'mimetype', '') or '').lower()
         if extensao not in extensoes_permitidas:
             return jsonify({'erro': 'Extensão de arquivo não permitida.'}), 400
@@ -666,41 +648,22 @@ def api_bot_upload():
         user_id = primeiro_user.id if primeiro_user else None
 
         try:
-            base_dir = os.path.join(current_app.root_path, 'documentos_entrada')
-            caminho_final = os.path.join(base_dir, subpasta)
-            os.makedirs(caminho_final, exist_ok=True)
-            caminho_completo = os.path.join(caminho_final, nome_arquivo)
-
-            arquivo.stream.seek(0)
-            arquivo.save(caminho_completo)
-            _processar_documento(caminho_completo, user_id_forcado=user_id)
-            limpar_cache_dashboard()
-
-            caminho_relativo = os.path.join('documentos_entrada', subpasta, nome_arquivo).replace('\\', '/')
-            doc_criado = Documento.query.filter_by(caminho_arquivo=caminho_relativo).order_by(Documento.id.desc()).first()
-            if not doc_criado:
-                tipo_doc = 'BOLETO' if subpasta == 'boletos' else 'NOTA_FISCAL'
-                doc_criado = Documento(
-                    caminho_arquivo=caminho_relativo,
-                    tipo=tipo_doc,
-                    usuario_id=user_id,
-                    empresa_id=_empresa_id_para_documento(fallback_user_id=user_id),
-                    venda_id=None,
-                    data_processamento=date.today(),
-                )
-                db.session.add(doc_criado)
-                db.session.commit()
-
+            documento = receber_documento(
+                arquivo, nome_arquivo, subpasta=subpasta, usuario_id=user_id,
+                empresa_id=_empresa_id_para_documento(fallback_user_id=user_id),
+                numero_nf=(request.form.get('numero_nf') or None),
+                razao_social=(request.form.get('razao_social') or None),
+            )
+            enfileirar_processamento_documento(documento.id)
+            # Dados extraídos (NF, CNPJ, vencimento) chegam depois: /api/documentos/<id>/status.
             return jsonify({
                 'status': 'success',
-                'mensagem': 'Arquivo recebido e processado com sucesso.',
-                'documento_id': doc_criado.id if doc_criado else None,
-                'tipo': doc_criado.tipo if doc_criado else ('BOLETO' if subpasta == 'boletos' else 'NOTA_FISCAL'),
-                'numero_nf': getattr(doc_criado, 'numero_nf', None),
-                'cnpj': getattr(doc_criado, 'cnpj', None),
-                'data_vencimento': doc_criado.data_vencimento.strftime('%Y-%m-%d') if getattr(doc_criado, 'data_vencimento', None) else None,
-                'url_arquivo': getattr(doc_criado, 'url_arquivo', None),
-            }), 200
+                'mensagem': 'Arquivo recebido; leitura e vínculo em processamento.',
+                'documento_id': documento.id,
+                'tipo': documento.tipo,
+                'numero_nf': documento.numero_nf,
+                'status_processamento': documento.status_processamento,
+            }), 202
 
         except Exception as e:
             db.session.rollback()
@@ -709,10 +672,59 @@ def api_bot_upload():
     return _impl()
 
 
+def _status_processamento_json(doc):
+    return {
+        'id': doc.id,
+        'status_processamento': doc.status_processamento or DOC_CONCLUIDO,
+        'tentativas': int(doc.tentativas_processamento or 0),
+        'erro': doc.erro_processamento,
+        'tipo': doc.tipo,
+        'numero_nf': doc.numero_nf,
+        'venda_id': doc.venda_id,
+        'url_arquivo': doc.url_arquivo,
+        'nome_arquivo': os.path.basename(doc.caminho_arquivo or ''),
+    }
+
+
+@documentos_bp.route('/api/documentos/<int:id>/status', methods=['GET'])
+def status_documento(id):
+    """Andamento de um documento recebido (fila de processamento)."""
+    doc = query_documentos_tenant().filter(Documento.id == id).first()
+    if doc is None:
+        return jsonify({'ok': False, 'mensagem': 'Documento não encontrado.'}), 404
+    return jsonify({'ok': True, **_status_processamento_json(doc)})
+
+
+@documentos_bp.route('/api/documentos/fila', methods=['GET'])
+def fila_documentos():
+    """Contadores da fila de processamento do tenant + documentos em andamento/com erro."""
+    docs_tenant = query_documentos_tenant()
+    processando = docs_tenant.filter(Documento.status_processamento == DOC_PROCESSANDO).count()
+    com_erro = docs_tenant.filter(Documento.status_processamento == DOC_ERRO).count()
+    docs = (
+        docs_tenant.filter(Documento.status_processamento.in_((DOC_PROCESSANDO, DOC_ERRO)))
+        .order_by(Documento.id.desc())
+        .limit(50)
+        .all()
+    )
+    response = jsonify({
+        'ok': True,
+        'processando': int(processando),
+        'com_erro': int(com_erro),
+        'documentos': [_status_processamento_json(d) for d in docs],
+    })
+    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    return response
+
+
 @documentos_bp.route('/processar_documentos', methods=['POST'])
 def processar_documentos():
-    """Rota para processar documentos manualmente (opcional, via AJAX)."""
-    resultado = _processar_documentos_pendentes()
+    """Rota para processar documentos manualmente (opcional, via AJAX).
+
+    ``forcar=1`` ignora o manifesto e revê todos os arquivos das pastas.
+    """
+    forcar = str(request.values.get('forcar', '')).strip().lower() in ('1', 'true', 'sim', 'on')
+    resultado = _processar_documentos_pendentes(forcar=forcar)
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify(ok=True, **resultado)
     flash(f"Processados {resultado['processados']} documento(s).", 'success')
@@ -786,11 +798,10 @@ def upload_massa_arquivos():
     if len(arquivos) > 20:
         return jsonify({'success': False, 'error': 'Selecione no máximo 20 arquivos por envio.'}), 400
 
-    arquivos_salvos = 0
-    arquivos_processados = 0
-    erros_processamento = []
+    erros_recebimento = []
     documentos_ids = []
     try:
+        empresa_id = _empresa_id_para_documento(fallback_user_id=current_user.id)
         for arquivo in arquivos:
             if not arquivo or not arquivo.filename:
                 continue
@@ -799,34 +810,28 @@ def upload_massa_arquivos():
             if not nome_seguro:
                 continue
 
-            pasta_upload = current_app.config['UPLOAD_FOLDER']
-            os.makedirs(pasta_upload, exist_ok=True)
-            caminho_temporario = os.path.join(pasta_upload, nome_seguro)
-            arquivo.save(caminho_temporario)
-
             try:
-                _processar_documento(caminho_temporario, user_id_forcado=current_user.id)
-                arquivos_processados += 1
-                doc_criado = Documento.query.filter(
-                    Documento.caminho_arquivo.ilike(f"%/{nome_seguro}")
-                ).order_by(Documento.id.desc()).first()
-                if doc_criado:
-                    documentos_ids.append(doc_criado.id)
+                # Sem tipo declarado: fica na raiz e o worker classifica pela 1ª página.
+                documento = receber_documento(
+                    arquivo, nome_seguro, usuario_id=current_user.id, empresa_id=empresa_id,
+                )
+                documentos_ids.append(documento.id)
             except Exception as e:
-                erros_processamento.append(f'{nome_seguro}: {str(e)}')
-            arquivos_salvos += 1
+                db.session.rollback()
+                erros_recebimento.append(f'{nome_seguro}: {str(e)}')
 
-        if arquivos_salvos == 0:
+        if not documentos_ids:
+            if erros_recebimento:
+                return jsonify({'success': False, 'error': 'Nenhum arquivo pôde ser gravado. Verifique os logs do servidor.'}), 500
             return jsonify({'success': False, 'error': 'Nenhum arquivo válido foi enviado.'}), 400
 
-        if arquivos_processados == 0 and erros_processamento:
-            return jsonify({'success': False, 'error': 'Nenhum arquivo pôde ser processado. Verifique o formato dos documentos.'}), 500
+        for documento_id in documentos_ids:
+            enfileirar_processamento_documento(documento_id)
 
-        msg = f'{arquivos_processados} arquivo(s) importado(s) e enviado(s) para extração automática.'
-        if erros_processamento:
-            msg += f' {len(erros_processamento)} arquivo(s) com falha foram ignorados.'
-        limpar_cache_dashboard()
-        return jsonify({'success': True, 'mensagem': msg, 'erros': erros_processamento})
+        msg = f'{len(documentos_ids)} arquivo(s) recebido(s). A leitura e o vínculo seguem em segundo plano.'
+        if erros_recebimento:
+            msg += f' {len(erros_recebimento)} arquivo(s) com falha foram ignorados.'
+        return jsonify({'success': True, 'mensagem': msg, 'erros': erros_recebimento, 'documentos_ids': documentos_ids})
     except Exception as e:
         return erro_json(
             e,
@@ -877,6 +882,27 @@ def admin_arquivos_deletar_massa():
     return redirect(url_for('documentos.admin_arquivos'))
 
 
+def _parametros_manutencao():
+    """``empresa_id`` opcional (form ou query) das rotas de manutenção; ``None`` = global."""
+    empresa_id = request.values.get('empresa_id', type=int)
+    return {'empresa_id': empresa_id} if empresa_id is not None else {}
+
+
+def _manutencao_em_background():
+    return request.values.get('background', '').strip().lower() in ('1', 'true', 'sim')
+
+
+def _resposta_manutencao_agendada(operacao, **parametros):
+    """Despacha a operação (``services/manutencao_documentos.py``) e responde 202."""
+    estado = agendar_manutencao(operacao, **parametros)
+    return jsonify({
+        'ok': True,
+        'job_id': estado['id'],
+        'status': estado['status'],
+        'status_url': url_for('documentos.status_manutencao', job_id=estado['id']),
+    }), 202
+
+
 @documentos_bp.route('/admin/reprocessar-vencimentos', methods=['GET', 'POST'])
 def admin_reprocessar_vencimentos():
     """Reprocessa todos os PDFs de boletos vinculados às vendas para
@@ -885,7 +911,8 @@ def admin_reprocessar_vencimentos():
     MASTER-only: a operação varre TODOS os boletos do SaaS para extrair
     data_vencimento; abrir para DONO reabriria a brecha cross-tenant.
     GET: exibe página de confirmação com preview
-    POST: executa o reprocessamento
+    POST: executa o reprocessamento (``background=1``: responde 202 com
+    o ``job_id``; ``empresa_id`` restringe a um tenant)
     """
     @master_required
     def _impl():
@@ -926,7 +953,10 @@ def admin_reprocessar_vencimentos():
 </body>
 </html>'''
 
-        resultado = _reprocessar_vencimentos_vendas()
+        parametros = _parametros_manutencao()
+        if _manutencao_em_background():
+            return _resposta_manutencao_agendada('reprocessar_vencimentos', **parametros)
+        resultado = _reprocessar_vencimentos_vendas(**parametros)
 
         return f'''<!DOCTYPE html>
 <html lang="pt-BR">
@@ -939,6 +969,7 @@ def admin_reprocessar_vencimentos():
 <body class="bg-gray-100 min-h-screen flex items-center justify-center p-4">
     <div class="bg-white rounded-xl shadow-lg p-8 max-w-2xl w-full">
         <h1 class="text-2xl font-bold text-emerald-700 mb-4">Reprocessamento Concluído</h1>
+        <p class="text-sm text-gray-500 mb-4">Tempo de execução: {resultado['segundos']:.2f} s</p>
         <div class="grid grid-cols-2 gap-4 mb-6">
             <div class="bg-blue-50 border border-blue-200 rounded-lg p-4 text-center">
                 <p class="text-3xl font-bold text-blue-700">{resultado['total']}</p>
@@ -1031,11 +1062,16 @@ def vincular_documento_venda(id):
         data_venc_boleto = None
         if is_boleto and documento.data_vencimento:
             data_venc_boleto = documento.data_vencimento
-        elif is_boleto:
+        elif is_boleto and not documento.falha_extracao:
+            # Sem vencimento gravado: lê o PDF nos processos isolados da
+            # extração. PDF que já falhou na leitura não é relido aqui.
             path_full = os.path.join(current_app.root_path, path)
             if os.path.isfile(path_full):
-                dados_pdf = _processar_pdf(path_full, 'BOLETO')
-                if dados_pdf and dados_pdf.get('data_vencimento'):
+                extraido = extrair_lote([TarefaExtracao(path_full, 'BOLETO', False, True)])[0]
+                dados_pdf = extraido.get('dados')
+                if extraido.get('falha'):
+                    documento.falha_extracao = extraido['falha']
+                elif dados_pdf and dados_pdf.get('data_vencimento'):
                     data_venc_boleto = dados_pdf['data_vencimento']
                     documento.data_vencimento = data_venc_boleto
 
@@ -1205,31 +1241,56 @@ def desvincular_documento_venda(venda_id):
 
 @documentos_bp.route('/admin/raio_x', methods=['GET'])
 def raio_x():
-    """Diagnóstico: últimos 5 documentos cadastrados e ID do usuário atual.
+    """Diagnóstico: contagens de documentos/vínculos, últimos 5 documentos e ID do usuário atual.
 
     MASTER-only: a query lê documentos cross-tenant para diagnóstico.
+    ``?formato=json`` devolve as contagens em JSON; ``background=1``
+    responde 202 com o ``job_id``.
     """
     @master_required
     def _impl():
-        docs = Documento.query.order_by(Documento.id.desc()).limit(5).all()
+        parametros = _parametros_manutencao()
+        if _manutencao_em_background():
+            return _resposta_manutencao_agendada('raio_x', **parametros)
+        raio = raio_x_documentos(**parametros)
+        if request.args.get('formato') == 'json':
+            return jsonify({'ok': True, **raio})
         page = '''<!DOCTYPE html>
 <html lang="pt-BR">
 <head><meta charset="UTF-8"><title>Raio-X Documentos</title>
-<style>body{font-family:system-ui,sans-serif;max-width:900px;margin:2rem auto;padding:1rem;background:#f5f5f5;}h1{color:#0d9488;}table{border-collapse:collapse;width:100%;background:white;box-shadow:0 1px 3px rgba(0,0,0,.1);}th,td{padding:.75rem;text-align:left;border-bottom:1px solid #e5e7eb;}th{background:#0d9488;color:white;}tr:hover{background:#f0fdfa;}p.info{background:#e0f2fe;padding:1rem;border-radius:8px;margin-bottom:1.5rem;}</style>
+<style>body{font-family:system-ui,sans-serif;max-width:900px;margin:2rem auto;padding:1rem;background:#f5f5f5;}h1{color:#0d9488;}table{border-collapse:collapse;width:100%;background:white;box-shadow:0 1px 3px rgba(0,0,0,.1);margin-bottom:1.5rem;}th,td{padding:.75rem;text-align:left;border-bottom:1px solid #e5e7eb;}th{background:#0d9488;color:white;}tr:hover{background:#f0fdfa;}p.info{background:#e0f2fe;padding:1rem;border-radius:8px;margin-bottom:1.5rem;}</style>
 </head>
 <body>
 <h1>🔍 Raio-X Documentos</h1>
 <p class="info"><strong>Seu ID atual:</strong> ''' + str(current_user.id) + ''' (usuário: ''' + str(current_user.username) + ''')</p>
+<h2>Contagens</h2>
+<table>
+<tr><th>Indicador</th><th>Quantidade</th></tr>'''
+        for rotulo, chave in (
+            ('Documentos', 'documentos'),
+            ('Vinculados', 'vinculados'),
+            ('Sem vínculo', 'sem_vinculo'),
+            ('Sem dono (usuario_id NULL)', 'sem_dono'),
+            ('Na nuvem', 'na_nuvem'),
+            ('Processando', 'processando'),
+            ('Falha de extração', 'falha_extracao'),
+            ('Documentos com venda inexistente', 'documentos_venda_inexistente'),
+            ('Vendas com boleto sem documento', 'vendas_boleto_sem_documento'),
+            ('Vendas com NF sem documento', 'vendas_nf_sem_documento'),
+        ):
+            page += f'<tr><td>{rotulo}</td><td>{raio[chave]}</td></tr>'
+        page += '''</table>
 <h2>Últimos 5 documentos</h2>
 <table>
 <tr><th>ID</th><th>Nome do Arquivo</th><th>ID Dono (usuario_id)</th><th>Status</th><th>Data de Upload</th></tr>'''
-        for d in docs:
-            nome = os.path.basename(d.caminho_arquivo or '')
-            status = 'Vinculado' if d.venda_id else 'Sem vínculo'
-            usuario_id_str = str(d.usuario_id) if d.usuario_id is not None else '<em>NULL</em>'
-            data_str = d.data_processamento.strftime('%d/%m/%Y') if d.data_processamento else '-'
-            page += f'<tr><td>{d.id}</td><td>{nome}</td><td>{usuario_id_str}</td><td>{status}</td><td>{data_str}</td></tr>'
-        page += '''</table>
+        for d in raio['ultimos']:
+            nome = html.escape(d['nome_arquivo'])
+            status = 'Vinculado' if d['vinculado'] else 'Sem vínculo'
+            usuario_id_str = str(d['usuario_id']) if d['usuario_id'] is not None else '<em>NULL</em>'
+            data_str = d['data_processamento'].strftime('%d/%m/%Y') if d['data_processamento'] else '-'
+            page += f'<tr><td>{d["id"]}</td><td>{nome}</td><td>{usuario_id_str}</td><td>{status}</td><td>{data_str}</td></tr>'
+        page += f'''</table>
+<p>Tempo de execução: {raio['segundos']:.3f} s</p>
 </body></html>'''
         return page
 
@@ -1245,13 +1306,16 @@ def resgatar_orfaos():
     @master_required
     def _impl():
         db.session.rollback()
+        parametros = _parametros_manutencao()
+        if _manutencao_em_background():
+            return _resposta_manutencao_agendada('resgatar_orfaos', usuario_id=current_user.id, **parametros)
         try:
-            orfaos = Documento.query.filter(Documento.usuario_id.is_(None)).all()
-            count = len(orfaos)
-            for doc in orfaos:
-                doc.usuario_id = current_user.id
-            db.session.commit()
-            flash(f'Recuperados {count} documento(s) órfão(s).', 'success')
+            resultado = _resgatar_orfaos(current_user.id, **parametros)
+            flash(
+                f"Recuperados {resultado['recuperados']} documento(s) órfão(s) "
+                f"em {resultado['segundos']:.2f} s.",
+                'success',
+            )
         except Exception as e:
             db.session.rollback()
             erro_flash(e, 'Erro ao resgatar documentos órfãos.', contexto='resgatar_orfaos')
@@ -1263,7 +1327,8 @@ def resgatar_orfaos():
 @documentos_bp.route('/admin/forcar_leitura_pasta', methods=['POST'])
 def forcar_leitura_pasta():
     """Rota de emergência: lê PDFs em boletos e notas_fiscais, cria registros
-    Documento para os que não existem no banco.
+    Documento para os que não existem no banco e descarta o manifesto da
+    varredura incremental (a próxima passada revê todos os arquivos).
 
     MASTER-only: opera diretamente sobre o filesystem do servidor.
     """
@@ -1277,6 +1342,7 @@ def forcar_leitura_pasta():
         }
         ressuscitados = 0
         try:
+            arquivos = {}  # caminho relativo -> (tipo, caminho absoluto)
             for tipo, pasta in pastas.items():
                 if not os.path.exists(pasta):
                     continue
@@ -1288,55 +1354,45 @@ def forcar_leitura_pasta():
                         'boletos' if tipo == 'BOLETO' else 'notas_fiscais',
                         nome,
                     ).replace(os.sep, '/')
-                    doc_existente = Documento.query.filter_by(caminho_arquivo=caminho_relativo).first()
-                    if not doc_existente:
-                        caminho_full = os.path.join(
-                            base_dir,
-                            'boletos' if tipo == 'BOLETO' else 'notas_fiscais',
-                            nome,
-                        )
-                        url_arquivo = None
-                        public_id = None
-                        if os.environ.get('CLOUDINARY_URL') or current_app.config.get('CLOUDINARY_URL'):
-                            try:
-                                resultado_nuvem = cloudinary.uploader.upload(
-                                    caminho_full, resource_type='raw', timeout=_EXTERNAL_TIMEOUT,
-                                )
-                                url_arquivo = resultado_nuvem.get('secure_url')
-                                public_id = resultado_nuvem.get('public_id')
-                            except Exception as ex:
-                                current_app.logger.error(f"Erro Cloudinary (forcar_leitura): {ex}")
-                        doc = Documento(
-                            caminho_arquivo=caminho_relativo,
-                            url_arquivo=url_arquivo,
-                            public_id=public_id,
-                            tipo=tipo,
-                            usuario_id=current_user.id,
-                            empresa_id=_empresa_id_para_documento(fallback_user_id=current_user.id),
-                            data_processamento=date.today(),
+                    arquivos[caminho_relativo] = (tipo, os.path.join(pasta, nome))
+            # Existência de todos os arquivos em consultas IN (antes: uma por arquivo).
+            existentes = _documentos_por_caminho(arquivos)
+            for caminho_relativo, (tipo, caminho_full) in arquivos.items():
+                if caminho_relativo in existentes:
+                    continue
+                url_arquivo = None
+                public_id = None
+                if os.environ.get('CLOUDINARY_URL') or current_app.config.get('CLOUDINARY_URL'):
+                    try:
+                        resultado_nuvem = cloudinary.uploader.upload(
+                            caminho_full, resource_type='raw', timeout=_EXTERNAL_TIMEOUT,
                         )
-                        db.session.add(doc)
-                        ressuscitados += 1
+                        url_arquivo = resultado_nuvem.get('secure_url')
+                        public_id = resultado_nuvem.get('public_id')
+                    except Exception as ex:
+                        current_app.logger.error(f"Erro Cloudinary (forcar_leitura): {ex}")
+                doc = Documento(
+                    caminho_arquivo=caminho_relativo,
+                    url_arquivo=url_arquivo,
+                    public_id=public_id,
+                    tipo=tipo,
+                    usuario_id=current_user.id,
+                    empresa_id=_empresa_id_para_documento(fallback_user_id=current_user.id),
+                    data_processamento=date.today(),
+                )
+                db.session.add(doc)
+                existentes[caminho_relativo] = doc
+                ressuscitados += 1
             db.session.commit()
-            for tipo, pasta in pastas.items():
-                if not os.path.exists(pasta):
-                    continue
-                for nome in os.listdir(pasta):
-                    if not nome.lower().endswith('.pdf'):
-                        continue
-                    caminho_full = os.path.join(pasta, nome)
-                    doc = Documento.query.filter_by(
-                        caminho_arquivo=os.path.join(
-                            'documentos_entrada',
-                            'boletos' if tipo == 'BOLETO' else 'notas_fiscais',
-                            nome,
-                        ).replace(os.sep, '/')
-                    ).first()
-                    if doc and doc.url_arquivo and os.path.exists(caminho_full):
-                        try:
-                            os.remove(caminho_full)
-                        except Exception as rm_err:
-                            current_app.logger.warning(f"Aviso: não foi possível remover {caminho_full}: {rm_err}")
+            for caminho_relativo, (tipo, caminho_full) in arquivos.items():
+                doc = existentes.get(caminho_relativo)
+                if doc and doc.url_arquivo and os.path.exists(caminho_full):
+                    try:
+                        os.remove(caminho_full)
+                    except Exception as rm_err:
+                        current_app.logger.warning(f"Aviso: não foi possível remover {caminho_full}: {rm_err}")
+            # Leitura forçada: a próxima varredura de pendentes revê todos os arquivos.
+            limpar_manifesto()
         except Exception as e:
             db.session.rollback()
             return erro_json(
@@ -1362,16 +1418,11 @@ def limpar_fantasmas():
     @master_required
     def _impl():
         db.session.rollback()
-        base_path = current_app.root_path
-        removidos = 0
+        parametros = _parametros_manutencao()
+        if _manutencao_em_background():
+            return _resposta_manutencao_agendada('limpar_fantasmas', **parametros)
         try:
-            docs = Documento.query.filter(Documento.url_arquivo.is_(None)).limit(2000).all()
-            for doc in docs:
-                caminho_full = os.path.join(base_path, doc.caminho_arquivo or '')
-                if doc.caminho_arquivo and not os.path.exists(caminho_full):
-                    db.session.delete(doc)
-                    removidos += 1
-            db.session.commit()
+            resultado = _limpar_fantasmas(**parametros)
         except Exception as e:
             db.session.rollback()
             return erro_json(
@@ -1380,7 +1431,12 @@ def limpar_fantasmas():
                 extras={'removidos': 0},
                 contexto='limpar_fantasmas',
             )
-        return jsonify({'removidos': removidos, 'mensagem': f'{removidos} fantasma(s) removido(s) do banco.'})
+        return jsonify({
+            **resultado,
+            'mensagem': resultado.get('recusado') or (
+                f"{resultado['removidos']} fantasma(s) removido(s) do banco em {resultado['segundos']:.2f} s."
+            ),
+        })
 
     return _impl()
 
@@ -1395,40 +1451,17 @@ def limpar_vinculos_quebrados():
     """
     @master_required
     def _impl():
+        parametros = _parametros_manutencao()
+        if _manutencao_em_background():
+            return _resposta_manutencao_agendada('limpar_vinculos_quebrados', **parametros)
         try:
-            limpos_boleto = 0
-            limpos_nf = 0
-            limpos_docs = 0
-
-            vendas_com_boleto = Venda.query.filter(Venda.caminho_boleto.isnot(None)).all()
-            for v in vendas_com_boleto:
-                caminho = (v.caminho_boleto or '').strip()
-                if caminho:
-                    doc = Documento.query.filter(or_(Documento.caminho_arquivo == caminho, Documento.url_arquivo == caminho)).first()
-                    if not doc:
-                        v.caminho_boleto = None
-                        limpos_boleto += 1
-
-            vendas_com_nf = Venda.query.filter(Venda.caminho_nf.isnot(None)).all()
-            for v in vendas_com_nf:
-                caminho = (v.caminho_nf or '').strip()
-                if caminho:
-                    doc = Documento.query.filter(or_(Documento.caminho_arquivo == caminho, Documento.url_arquivo == caminho)).first()
-                    if not doc:
-                        v.caminho_nf = None
-                        limpos_nf += 1
-
-            documentos_com_venda = Documento.query.filter(Documento.venda_id.isnot(None)).all()
-            for doc in documentos_com_venda:
-                venda = Venda.query.get(doc.venda_id)
-                if not venda:
-                    doc.venda_id = None
-                    limpos_docs += 1
-
-            db.session.commit()
-            total = limpos_boleto + limpos_nf + limpos_docs
-            flash(f'✅ Limpeza concluída: {limpos_boleto} vínculo(s) de boleto, {limpos_nf} vínculo(s) de NF e {limpos_docs} documento(s) órfão(s) removidos ({total} total).', 'success')
-            current_app.logger.debug(f"DEBUG LIMPEZA: {limpos_boleto} boletos, {limpos_nf} NFs e {limpos_docs} documentos órfãos limpos")
+            resultado = _limpar_vinculos_quebrados(**parametros)
+            flash(
+                f"✅ Limpeza concluída: {resultado['boletos']} vínculo(s) de boleto, {resultado['notas']} vínculo(s) de NF "
+                f"e {resultado['documentos']} documento(s) órfão(s) removidos ({resultado['total']} total) "
+                f"em {resultado['segundos']:.2f} s.",
+                'success',
+            )
         except Exception as e:
             db.session.rollback()
             erro_flash(e, 'Erro ao limpar vínculos quebrados.', contexto='limpar_vinculos_quebrados')
@@ -1438,6 +1471,19 @@ def limpar_vinculos_quebrados():
     return _impl()
 
 
+@documentos_bp.route('/admin/manutencao/<job_id>', methods=['GET'])
+def status_manutencao(job_id):
+    """Estado de uma manutenção agendada com ``background=1`` (contagens e tempo quando concluída)."""
+    @master_required
+    def _impl():
+        estado = estado_manutencao(job_id)
+        if estado is None:
+            return jsonify({'ok': False, 'mensagem': 'Job de manutenção não encontrado ou expirado.'}), 404
+        return jsonify({'ok': True, **estado})
+
+    return _impl()
+
+
 @documentos_bp.route('/debug/testar_log', methods=['POST'])
 def debug_testar_log():
     """Endpoint de debug para testar criação de arquivo de log.
@@ -1480,7 +1526,7 @@ def debug_vincular():
     @admin_required
     def _impl():
         try:
-            resultado = _processar_documentos_pendentes(capturar_logs_memoria=True)
+            resultado = _processar_documentos_pendentes(capturar_logs_memoria=True, forcar=True)
             resposta = {
                 'sucesso': True,
                 'timestamp': datetime.now().isoformat(),
@@ -20,11 +20,11 @@ from flask import (
     Blueprint, current_app, jsonify, request, send_file, session,
 )
 from flask_login import current_user
-from sqlalchemy import and_, case, func, or_
 
-from models import db, ContagemGaveta, Fornecedor, LancamentoCaixa, Produto, Venda
+from models import ContagemGaveta
 from routes.caixa import _limpar_valor_moeda
 from services.auth_utils import tenant_required, _checar_permissao_ou_redirecionar
+from services.balanco import totais_balanco
 from services.config_helpers import get_hoje_brasil
 from services.db_utils import empresa_id_atual, query_tenant
 
@@ -71,36 +71,6 @@ def _fmt_brl(valor: float) -> str:
     return f'-R$ {s}' if negativo else f'R$ {s}'
 
 
-def _soma_vendas_pendentes() -> float:
-    """Soma integral a receber: todas as vendas PENDENTE/PARCIAL (qualquer forma).
-
-    Usa ``situacao`` (campo real do modelo). Exclui ``PERDA``. Em PARCIAL
-    considera só o saldo remanescente (face − valor_pago).
-    """
-    eid = empresa_id_atual()
-    face = Venda.preco_venda * Venda.quantidade_venda
-    saldo = face - func.coalesce(Venda.valor_pago, 0)
-    filtro_sem_perda = func.upper(func.coalesce(Venda.tipo_operacao, 'VENDA')) != 'PERDA'
-    valor_expr = case(
-        (func.upper(func.coalesce(Venda.situacao, '')) == 'PENDENTE', face),
-        (
-            and_(
-                func.upper(func.coalesce(Venda.situacao, '')) == 'PARCIAL',
-                saldo > 0,
-            ),
-            saldo,
-        ),
-        else_=0,
-    )
-    q = db.session.query(func.coalesce(func.sum(valor_expr), 0)).filter(
-        filtro_sem_perda,
-        func.upper(func.coalesce(Venda.situacao, '')).in_(['PENDENTE', 'PARCIAL']),
-    )
-    if eid is not None:
-        q = q.filter(Venda.empresa_id == eid)
-    return float(q.scalar() or 0)
-
-
 def _carregar_estado_gaveta() -> dict:
     """Última contagem de gaveta do usuário (fallback: mais recente do tenant)."""
     estado = {'dinheiro': [], 'cheques': []}
@@ -139,106 +109,29 @@ def _total_dinheiro_gaveta(estado: dict) -> float:
     return round(total, 2)
 
 
-def _total_cheques_em_caixa() -> float:
-    """Soma cheques ainda retidos no caixa (não enviados / não compensados).
+def _calcular_dados_balanco() -> dict:
+    """Consolida os totais automáticos do sistema para o balanço rápido.
 
-    Fonte: ``LancamentoCaixa`` com forma Cheque, tipo ENTRADA e
-    ``status_envio`` diferente de Enviado/Compensado. Não usa o histórico
-    bruto da gaveta (que pode acumular títulos já baixados).
+    Vendas a receber, cheques, Pix, estoque e fornecedores vêm de
+    ``services.balanco.totais_balanco`` (uma query, em cache por tenant);
+    só a gaveta — que é por usuário — é lida aqui.
     """
-    eid = empresa_id_atual()
-    forma_cheque = func.lower(func.coalesce(LancamentoCaixa.forma_pagamento, '')).like('%cheque%')
-    status_norm = func.upper(func.trim(func.coalesce(LancamentoCaixa.status_envio, '')))
-    # Aceitos como "ainda no caixa": vazio, Não Enviado, Pendente, Em Caixa, A Compensar
-    status_em_caixa = or_(
-        LancamentoCaixa.status_envio.is_(None),
-        status_norm == '',
-        status_norm == 'NÃO ENVIADO',
-        status_norm == 'NAO ENVIADO',
-        status_norm == 'PENDENTE',
-        status_norm == 'EM CAIXA',
-        status_norm == 'A COMPENSAR',
-    )
-    status_baixado = status_norm.in_(['ENVIADO', 'COMPENSADO', 'COMPENSADA', 'DEPOSITADO'])
-
-    q = db.session.query(func.coalesce(func.sum(LancamentoCaixa.valor), 0)).filter(
-        forma_cheque,
-        LancamentoCaixa.tipo == 'ENTRADA',
-        status_em_caixa,
-        ~status_baixado,
-    )
-    if eid is not None:
-        q = q.filter(LancamentoCaixa.empresa_id == eid)
-    return round(float(q.scalar() or 0), 2)
-
-
-def _saldo_pix_livro_caixa() -> float:
-    """Saldo líquido (entradas − saídas) de Pix/Transfer no livro do ano ativo."""
-    eid = empresa_id_atual()
     ano = int(session.get('ano_ativo', datetime.now().year))
-    forma_pix = or_(
-        func.lower(func.coalesce(LancamentoCaixa.forma_pagamento, '')).like('%pix%'),
-        func.lower(func.coalesce(LancamentoCaixa.forma_pagamento, '')).like('%transfer%'),
-    )
-    sinal = case(
-        (LancamentoCaixa.tipo == 'ENTRADA', LancamentoCaixa.valor),
-        else_=-LancamentoCaixa.valor,
-    )
-    q = db.session.query(func.coalesce(func.sum(sinal), 0)).filter(
-        forma_pix,
-        LancamentoCaixa.data >= datetime(ano, 1, 1).date(),
-        LancamentoCaixa.data < datetime(ano + 1, 1, 1).date(),
-        LancamentoCaixa.setor == 'GERAL',
-    )
-    if eid is not None:
-        q = q.filter(LancamentoCaixa.empresa_id == eid)
-    saldo = float(q.scalar() or 0)
-    # Pix "em caixa" como ativo: não reporta negativo no resumo do balanço.
-    return round(max(saldo, 0.0), 2)
-
-
-def _total_valor_estoque() -> float:
-    """Soma financeira do estoque: ``estoque_atual * preco_custo`` por produto."""
-    eid = empresa_id_atual()
-    valor_expr = func.coalesce(Produto.estoque_atual, 0) * func.coalesce(Produto.preco_custo, 0)
-    q = db.session.query(func.coalesce(func.sum(valor_expr), 0)).filter(
-        func.coalesce(Produto.estoque_atual, 0) > 0,
-    )
-    if eid is not None:
-        q = q.filter(Produto.empresa_id == eid)
-    return round(float(q.scalar() or 0), 2)
-
-
-def _listar_fornecedores_balanco() -> list:
-    """Fornecedores do tenant, ordenados por nome, para os passivos manuais."""
-    rows = query_tenant(Fornecedor).order_by(Fornecedor.nome.asc()).all()
-    return [
-        {'id': int(f.id), 'nome': (f.nome or '').strip() or f'Fornecedor #{f.id}'}
-        for f in rows
-        if f.id is not None
-    ]
-
-
-def _calcular_dados_balanco() -> dict:
-    """Consolida os totais automáticos do sistema para o balanço rápido."""
+    totais = totais_balanco(empresa_id_atual(), ano)
     estado = _carregar_estado_gaveta()
-    total_pendentes = round(_soma_vendas_pendentes(), 2)
-    # Dinheiro: contagem física atual da gaveta (snapshot), não soma histórica.
-    total_dinheiro = _total_dinheiro_gaveta(estado)
-    # Cheques: só títulos ENTRADA ainda não enviados/compensados no livro.
-    total_cheques = _total_cheques_em_caixa()
-    total_pix = _saldo_pix_livro_caixa()
-    total_estoque = _total_valor_estoque()
+    total_pendentes = totais['total_vendas_pendentes']
     return {
         'ok': True,
         'total_vendas_pendentes': total_pendentes,
         # Alias retroativo (modal/CSV antigos ainda podem enviar esta chave)
         'total_boletos_pendentes': total_pendentes,
-        'total_dinheiro_caixa': total_dinheiro,
-        'total_cheques_caixa': total_cheques,
-        'total_pix_caixa': total_pix,
-        'total_valor_estoque': total_estoque,
-        'fornecedores': _listar_fornecedores_balanco(),
+        # Dinheiro: contagem física atual da gaveta (snapshot), não soma histórica.
+        'total_dinheiro_caixa': _total_dinheiro_gaveta(estado),
+        # Cheques: só títulos ENTRADA ainda não enviados/compensados no livro.
+        'total_cheques_caixa': totais['total_cheques_caixa'],
+        'total_pix_caixa': totais['total_pix_caixa'],
+        'total_valor_estoque': totais['total_valor_estoque'],
+        'fornecedores': list(totais['fornecedores']),
         'gerado_em': get_hoje_brasil().isoformat(),
     }
 
@@ -270,7 +163,8 @@ def api_balanco_exportar_csv():
     if not isinstance(payload, dict):
         payload = request.form.to_dict(flat=True) if request.form else {}
 
-    # Preferir valores enviados pelo formulário; estoque sempre recalculado no servidor.
+    # Preferir valores enviados pelo formulário; estoque sempre do servidor
+    # (mesmo snapshot em cache que o modal acabou de carregar).
     sistema = _calcular_dados_balanco()
     pendentes = _float_seguro(
         payload.get('total_vendas_pendentes', payload.get('total_boletos_pendentes')),
@@ -0,0 +1,106 @@
+"""Blueprint ``importacoes`` — acompanhamento das importações em background.
+
+Rotas:
+    * GET /importacoes/<job_id>             acompanhar_importacao (barra de progresso)
+    * GET /api/importacoes/<job_id>         status_importacao (JSON para o polling)
+    * GET /importacoes/<job_id>/resultado   resultado_importacao
+
+O job é criado pelos POSTs de ``/vendas/importar``, ``/produtos/importar``,
+``/clientes/importar`` e ``/caixa/importar`` (ver
+``services/importacao_jobs.py``). Ao terminar, o resultado é exibido do
+mesmo jeito que a importação síncrona fazia: template ``<tipo>/importar.html``
+com ``erros_detalhados`` quando houve erro; senão ``flash`` + redirect para
+a listagem do módulo.
+
+Multi-tenant:
+    ``before_request`` aplica ``login_required`` + ``tenant_required`` e
+    todo job é buscado filtrando por ``empresa_id_atual()``.
+"""
+from flask import (
+    Blueprint, render_template, redirect, url_for, flash, jsonify, abort,
+)
+
+from models import JobImportacao
+from services.auth_utils import tenant_required
+from services.db_utils import empresa_id_atual
+from services.importacao_jobs import marcar_se_abandonado
+
+
+importacoes_bp = Blueprint('importacoes', __name__)
+
+# Template da tela de importação de cada tipo (erros detalhados).
+_TEMPLATE_RESULTADO = {
+    'vendas': 'vendas/importar.html',
+    'produtos': 'produtos/importar.html',
+    'clientes': 'clientes/importar.html',
+}
+
+# Destino do redirect quando não há erros a listar.
+_DESTINO_RESULTADO = {
+    'vendas': 'vendas.listar_vendas',
+    'produtos': 'produtos.listar_produtos',
+    'clientes': 'clientes.listar_clientes',
+    'caixa': 'caixa.caixa',
+}
+
+
+@importacoes_bp.before_request
+def _exigir_tenant_em_todas_rotas():
+    """Aplica ``login_required`` + ``tenant_required`` em todas as rotas."""
+    @tenant_required
+    def _ok():
+        return None
+
+    return _ok()
+
+
+def _job_do_tenant_or_404(job_id):
+    job = JobImportacao.query.filter_by(id=job_id, empresa_id=empresa_id_atual()).first()
+    if job is None:
+        abort(404)
+    return job
+
+
+@importacoes_bp.route('/importacoes/<job_id>')
+def acompanhar_importacao(job_id):
+    job = _job_do_tenant_or_404(job_id)
+    marcar_se_abandonado(job)
+    if job.finalizado:
+        return redirect(url_for('importacoes.resultado_importacao', job_id=job.id))
+    return render_template(
+        'importacoes/acompanhar.html',
+        job=job,
+        destino=url_for(_DESTINO_RESULTADO.get(job.tipo, 'dashboard.dashboard')),
+    )
+
+
+@importacoes_bp.route('/api/importacoes/<job_id>')
+def status_importacao(job_id):
+    job = _job_do_tenant_or_404(job_id)
+    marcar_se_abandonado(job)
+    return jsonify(job.to_dict())
+
+
+@importacoes_bp.route('/importacoes/<job_id>/resultado')
+def resultado_importacao(job_id):
+    job = _job_do_tenant_or_404(job_id)
+    marcar_se_abandonado(job)
+    if not job.finalizado:
+        return redirect(url_for('importacoes.acompanhar_importacao', job_id=job.id))
+
+    template = _TEMPLATE_RESULTADO.get(job.tipo)
+    if template and job.erros:
+        return render_template(
+            template,
+            erros_detalhados=job.lista_erros(),
+            sucesso=job.sucesso or 0,
+            erros=job.erros,
+            ignorados=job.ignorados or 0,
+        )
+
+    for categoria, texto in job.lista_mensagens():
+        flash(texto, categoria)
+    if job.tipo == 'caixa' and not job.lista_mensagens():
+        for texto in job.lista_erros()[:1]:
+            flash(texto, 'error')
+    return redirect(url_for(_DESTINO_RESULTADO.get(job.tipo, 'dashboard.dashboard')))
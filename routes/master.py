@@ -192,7 +192,7 @@ def _classificar_resync_dry_run(venda):
     eid = getattr(venda, 'empresa_id', None)
     q = LancamentoCaixa.query.filter(
         LancamentoCaixa.tipo == 'ENTRADA',
-        LancamentoCaixa.descricao.like(f"Venda #{venda.id} -%"),
+        LancamentoCaixa.venda_id == venda.id,
     )
     if eid is not None:
         q = q.filter(LancamentoCaixa.empresa_id == eid)
@@ -712,8 +712,8 @@ def auditar_lote_cliente(cliente_id):
 
     1. **Estado real** — para cada venda em aberto do cliente, qual é o
        ``valor_pago`` que está na coluna do banco vs. qual é a soma real
-       dos ``LancamentoCaixa`` ENTRADA com descrição
-       ``Venda #N -%``. Se houver diff, esta é uma "bomba-relógio":
+       dos ``LancamentoCaixa`` ENTRADA vinculados (``venda_id``).
+       Se houver diff, esta é uma "bomba-relógio":
        quando o resync (``_resincronizar_pagamento_venda``) rodar ao
        fim de um lote real, ele vai sobrescrever o ``valor_pago`` com
        a soma dos lançamentos, podendo rebaixar/promover a venda de
@@ -798,7 +798,7 @@ def auditar_lote_cliente(cliente_id):
         eid_v = getattr(venda, 'empresa_id', None)
         q = LancamentoCaixa.query.filter(
             LancamentoCaixa.tipo == 'ENTRADA',
-            LancamentoCaixa.descricao.like(f"Venda #{venda.id} -%"),
+            LancamentoCaixa.venda_id == venda.id,
         )
         if eid_v is not None:
             q = q.filter(LancamentoCaixa.empresa_id == eid_v)
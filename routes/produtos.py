@@ -46,19 +46,17 @@ from datetime import date, datetime
 from decimal import Decimal
 import csv
 import io
-import os
 import re
 
 from flask import (
     Blueprint, render_template, request, redirect, url_for,
-    flash, jsonify, current_app, session, Response,
+    flash, jsonify, current_app, session,
 )
+from flask_login import current_user
 from sqlalchemy import asc, case, desc, extract, func
 from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import IntegrityError
 import pandas as pd
-from werkzeug.utils import secure_filename
-import cloudinary.uploader
 
 from models import db, Produto, ProdutoFoto, Fornecedor, TipoProduto, Venda
 from services.auth_utils import (
@@ -68,19 +66,28 @@ from services.auth_utils import (
 from services.db_utils import query_tenant, empresa_id_atual, _safe_db_commit
 from services.cache_utils import limpar_cache_dashboard
 from services.error_utils import erro_json
-from services.config_helpers import (
-    registrar_log, _EXTERNAL_TIMEOUT,
-)
+from services.config_helpers import registrar_log
 from services.files_utils import (
     _arquivo_imagem_permitido, _deletar_cloudinary_seguro,
     _cloudinary_thumb_url,
 )
 from services.vendas_services import _produto_com_lock
 from services.estoque_fifo import listar_lotes_fifo
+from services.importacao_jobs import criar_job_importacao, enfileirar_job_importacao
+from services.uploads_nuvem import (
+    DESTINO_PRODUTO_FOTO, PREFIXO_URL_PROVISORIA,
+    disparar_uploads, guardar_para_upload, nuvem_configurada, url_provisoria,
+)
+from services.exportacao import (
+    YIELD_PER, celula_segura, formato_exportacao, resposta_relatorio_streaming,
+)
 from services.csv_utils import (
-    _msg_linha, _strip_quotes, _normalizar_nome_coluna,
-    _normalizar_nome_busca, _parse_preco, _parse_quantidade,
-    _parse_data_flex, COLUNA_ARQUIVO_PARA_BANCO,
+    _msg_linha, _normalizar_nome_coluna,
+    _normalizar_nome_busca, COLUNA_ARQUIVO_PARA_BANCO,
+)
+from services.normalizacao_planilha import (
+    coluna_primeiro_valor, texto_primeiro_valor, strip_quotes_serie,
+    parse_preco_serie, parse_quantidade_serie, parse_data_serie,
 )
 # ``_limpar_valor_moeda`` foi extraído para ``routes/caixa.py`` (helper
 # nativo do livro caixa, mas reutilizado aqui em formulários monetários).
@@ -132,12 +139,14 @@ def _strip_acentos(s):
     return str(s).strip().upper().translate(_ACENTOS_MAP)
 
 
-def _carregar_tipos_cadastrados_set():
+def _carregar_tipos_cadastrados_set(empresa_id=None):
     """Carrega o set de TipoProduto.nome (uppercase, sem acento) da empresa atual.
-    Centraliza a query para reuso entre os call sites do _normalizar_tipo_ui."""
+    Centraliza a query para reuso entre os call sites do _normalizar_tipo_ui.
+    ``empresa_id`` explícito permite o uso fora de request (job de importação)."""
+    consulta = TipoProduto.query.filter_by(empresa_id=empresa_id) if empresa_id is not None else query_tenant(TipoProduto)
     return {
         _strip_acentos(t.nome)
-        for t in query_tenant(TipoProduto).all()
+        for t in consulta.all()
         if t.nome
     }
 
@@ -251,17 +260,36 @@ def _extrair_config_atributos_form(form):
     }
 
 
-def _row_get(row, *keys):
-    for k in keys:
-        if k not in row:
+def _guardar_fotos_produto(produto, fotos):
+    """Cria as ``ProdutoFoto`` com URL provisória e põe as imagens no spool.
+
+    Devolve os tokens para ``disparar_uploads`` depois do commit; o envio
+    troca ``arquivo``/``public_id`` pela URL do Cloudinary.
+    """
+    tokens = []
+    for foto in fotos:
+        if not foto or not foto.filename:
+            continue
+        if not _arquivo_imagem_permitido(foto.filename):
+            current_app.logger.info(f"Upload de foto ignorado (extensão inválida): {foto.filename}")
             continue
-        v = row[k]
-        if pd.isna(v):
+        nova_foto = ProdutoFoto(produto_id=produto.id, arquivo='')
+        db.session.add(nova_foto)
+        db.session.flush()
+        try:
+            token = guardar_para_upload(
+                foto, DESTINO_PRODUTO_FOTO, nova_foto.id,
+                pasta='menino_do_alho/produtos', empresa_id=produto.empresa_id,
+            )
+        except OSError as e:
+            current_app.logger.error(f"Erro ao guardar foto para upload (produto {produto.id}): {e}")
+            token = None
+        if not token:
+            db.session.delete(nova_foto)
             continue
-        s = str(v).strip()
-        if s != '':
-            return v
-    return None
+        nova_foto.arquivo = url_provisoria(token)
+        tokens.append(token)
+    return tokens
 
 
 # Ordem posicional para importação "raw" (sem cabeçalho): coluna 3 = Valor Total (ignorada)
@@ -650,30 +678,30 @@ def exportar_relatorio_produtos():
     if filtro_nacionalidade != 'TODAS':
         query = query.filter(func.upper(func.coalesce(Produto.nacionalidade, 'N/A')) == filtro_nacionalidade)
 
-    produtos = query.order_by(asc(Produto.data_chegada), asc(Produto.id)).all()
-    produto_ids = [p.id for p in produtos]
-
-    quantidade_vendida_por_produto = {}
-    lucro_realizado_por_produto = {}
-    if produto_ids:
-        vendas_agregadas = db.session.query(
-            Venda.produto_id,
-            func.sum(Venda.quantidade_venda).label('total_vendido')
-        ).filter(Venda.produto_id.in_(produto_ids)).group_by(Venda.produto_id).all()
-        for produto_id, total_vendido in vendas_agregadas:
-            quantidade_vendida_por_produto[produto_id] = int(total_vendido or 0)
-
-        lucros_agregados = db.session.query(
-            Venda.produto_id,
-            func.sum((Venda.preco_venda - Produto.preco_custo) * Venda.quantidade_venda).label('lucro_total')
-        ).join(Produto, Venda.produto_id == Produto.id)\
-         .filter(Venda.produto_id.in_(produto_ids))\
-         .group_by(Venda.produto_id).all()
-        for produto_id, lucro_total in lucros_agregados:
-            lucro_realizado_por_produto[produto_id] = Decimal(str(lucro_total or 0))
+    # Agregados de vendas por lote calculados no próprio banco e trazidos
+    # no mesmo SELECT via OUTER JOIN — evita o ``IN (<todos os ids>)``
+    # que exigia materializar a lista de produtos antes de exportar.
+    agregados_vendas = (
+        db.session.query(
+            Venda.produto_id.label('produto_id'),
+            func.sum(Venda.quantidade_venda).label('total_vendido'),
+            func.sum((Venda.preco_venda - Produto.preco_custo) * Venda.quantidade_venda).label('lucro_total'),
+        )
+        .join(Produto, Venda.produto_id == Produto.id)
+        .filter(Venda.empresa_id == empresa_id_atual())
+        .group_by(Venda.produto_id)
+        .subquery()
+    )
+    query = (
+        query.outerjoin(agregados_vendas, agregados_vendas.c.produto_id == Produto.id)
+        .add_columns(agregados_vendas.c.total_vendido, agregados_vendas.c.lucro_total)
+        .order_by(asc(Produto.data_chegada), asc(Produto.id))
+        .yield_per(YIELD_PER)
+    )
+    formato = formato_exportacao(request.form.get('formato'))
+    eh_xlsx = formato == 'xlsx'
 
-    def _qtd_entrada_exibicao(produto):
-        qtd_vendida = quantidade_vendida_por_produto.get(produto.id, 0)
+    def _qtd_entrada_exibicao(produto, qtd_vendida):
         if produto.quantidade_entrada == 0 or produto.quantidade_entrada < (produto.estoque_atual + qtd_vendida):
             return int((produto.estoque_atual or 0) + qtd_vendida)
         return int(produto.quantidade_entrada or 0)
@@ -690,61 +718,67 @@ def exportar_relatorio_produtos():
             return ''
         return valor.strftime('%d/%m/%Y') if hasattr(valor, 'strftime') else str(valor)
 
-    def _csv_safe(valor):
-        s = '' if valor is None else str(valor)
-        return "'" + s if s[:1] in ('=', '+', '-', '@') else s
-
-    output = io.StringIO()
-    output.write('\ufeff')
-    writer = csv.writer(output, delimiter=';')
-    writer.writerow([colunas_disponiveis[c] for c in colunas])
-
-    soma_qtd_entrada = 0
-    soma_valor_total = Decimal('0.0')
-    soma_estoque = 0
-    soma_lucro = Decimal('0.0')
-
-    for produto in produtos:
-        qtd_entrada = _qtd_entrada_exibicao(produto)
-        preco = Decimal(str(produto.preco_custo or 0))
-        valor_total = preco * Decimal(str(qtd_entrada))
-        estoque_atual = int(produto.estoque_atual or 0)
-        lucro_realizado = Decimal(str(lucro_realizado_por_produto.get(produto.id, Decimal('0.0'))))
-
-        soma_qtd_entrada += qtd_entrada
-        soma_valor_total += valor_total
-        soma_estoque += estoque_atual
-        soma_lucro += lucro_realizado
-
-        linha = {
-            'produto': _csv_safe(produto.nome_produto or ''),
-            'preco': _fmt_num(preco),
-            'qtd_entrada': str(qtd_entrada),
-            'valor_total': _fmt_num(valor_total),
-            'estoque_atual': str(estoque_atual),
-            'lucro_realizado': _fmt_num(lucro_realizado),
-            'data_chegada': _fmt_data(produto.data_chegada),
-            'tipo': _csv_safe(produto.tipo or ''),
-            'fornecedor': _csv_safe(produto.fornecedor or 'NENHUM'),
-            'nacionalidade': _csv_safe(produto.nacionalidade or 'N/A'),
+    def _linhas():
+        soma_qtd_entrada = 0
+        soma_valor_total = Decimal('0.0')
+        soma_estoque = 0
+        soma_lucro = Decimal('0.0')
+
+        for produto, total_vendido, lucro_total in query:
+            qtd_entrada = _qtd_entrada_exibicao(produto, int(total_vendido or 0))
+            preco = Decimal(str(produto.preco_custo or 0))
+            valor_total = preco * Decimal(str(qtd_entrada))
+            estoque_atual = int(produto.estoque_atual or 0)
+            lucro_realizado = Decimal(str(lucro_total or 0))
+
+            soma_qtd_entrada += qtd_entrada
+            soma_valor_total += valor_total
+            soma_estoque += estoque_atual
+            soma_lucro += lucro_realizado
+
+            # No XLSX o ``gerar_xlsx`` protege o texto; o ``'`` é só do CSV.
+            texto = str if eh_xlsx else celula_segura
+            textos = {
+                'produto': texto(produto.nome_produto or ''),
+                'tipo': texto(produto.tipo or ''),
+                'fornecedor': texto(produto.fornecedor or 'NENHUM'),
+                'nacionalidade': texto(produto.nacionalidade or 'N/A'),
+            }
+            if eh_xlsx:
+                linha = {
+                    **textos,
+                    'preco': preco,
+                    'qtd_entrada': qtd_entrada,
+                    'valor_total': valor_total,
+                    'estoque_atual': estoque_atual,
+                    'lucro_realizado': lucro_realizado,
+                    'data_chegada': produto.data_chegada,
+                }
+            else:
+                linha = {
+                    **textos,
+                    'preco': _fmt_num(preco),
+                    'qtd_entrada': str(qtd_entrada),
+                    'valor_total': _fmt_num(valor_total),
+                    'estoque_atual': str(estoque_atual),
+                    'lucro_realizado': _fmt_num(lucro_realizado),
+                    'data_chegada': _fmt_data(produto.data_chegada),
+                }
+            yield [linha[c] for c in colunas]
+
+        linha_total = [''] * len(colunas)
+        if linha_total:
+            linha_total[0] = 'TOTAL GERAL'
+        totais = {
+            'qtd_entrada': soma_qtd_entrada if eh_xlsx else str(soma_qtd_entrada),
+            'valor_total': soma_valor_total if eh_xlsx else _fmt_num(soma_valor_total),
+            'estoque_atual': soma_estoque if eh_xlsx else str(soma_estoque),
+            'lucro_realizado': soma_lucro if eh_xlsx else _fmt_num(soma_lucro),
         }
-        writer.writerow([linha[c] for c in colunas])
-
-    linha_total = [''] * len(colunas)
-    if linha_total:
-        linha_total[0] = 'TOTAL GERAL'
-    if 'qtd_entrada' in colunas:
-        linha_total[colunas.index('qtd_entrada')] = str(soma_qtd_entrada)
-    if 'valor_total' in colunas:
-        linha_total[colunas.index('valor_total')] = _fmt_num(soma_valor_total)
-    if 'estoque_atual' in colunas:
-        linha_total[colunas.index('estoque_atual')] = str(soma_estoque)
-    if 'lucro_realizado' in colunas:
-        linha_total[colunas.index('lucro_realizado')] = _fmt_num(soma_lucro)
-    writer.writerow(linha_total)
-
-    csv_content = output.getvalue()
-    output.close()
+        for chave, valor in totais.items():
+            if chave in colunas:
+                linha_total[colunas.index(chave)] = valor
+        yield linha_total
 
     data_hoje = datetime.now().strftime('%d-%m-%Y')
     partes = ['relatorio_produtos', data_hoje]
@@ -761,12 +795,12 @@ def exportar_relatorio_produtos():
     if filtro_nacionalidade and filtro_nacionalidade != 'TODAS':
         partes.append(_normalizar_nome_arquivo(filtro_nacionalidade))
 
-    nome_arquivo = f"{'_'.join([p for p in partes if p])}.csv"
-
-    return Response(
-        csv_content,
-        mimetype='text/csv; charset=utf-8',
-        headers={'Content-Disposition': f'attachment; filename={nome_arquivo}'}
+    return resposta_relatorio_streaming(
+        _linhas(),
+        [colunas_disponiveis[c] for c in colunas],
+        nome_base='_'.join([p for p in partes if p]),
+        formato=formato,
+        titulo_aba='Produtos',
     )
 
 
@@ -1166,23 +1200,10 @@ def novo_produto():
             flash(msg, "error")
             return render_template("produtos/formulario.html", produto=None)
 
-        # Upload de fotos para Cloudinary (até 5)
-        if os.environ.get('CLOUDINARY_URL') or current_app.config.get('CLOUDINARY_URL') or (current_app.config.get('CLOUDINARY_CLOUD_NAME') and current_app.config.get('CLOUDINARY_API_KEY')):
-            fotos = request.files.getlist('fotos')
-            for foto in fotos[:5]:
-                if foto and foto.filename:
-                    if not _arquivo_imagem_permitido(foto.filename):
-                        current_app.logger.info(f"Upload de foto ignorado (extensão inválida): {foto.filename}")
-                        continue
-                    try:
-                        upload_result = cloudinary.uploader.upload(foto, folder="menino_do_alho/produtos", timeout=_EXTERNAL_TIMEOUT)
-                        url_segura = upload_result.get('secure_url')
-                        public_id_foto = upload_result.get('public_id')
-                        if url_segura:
-                            nova_foto = ProdutoFoto(produto_id=produto.id, arquivo=url_segura, public_id=public_id_foto)
-                            db.session.add(nova_foto)
-                    except Exception as e:
-                        current_app.logger.error(f"Erro ao fazer upload para o Cloudinary (produto {produto.id}): {e}")
+        # Fotos para o Cloudinary (até 5), enviadas em background
+        uploads_fotos = []
+        if nuvem_configurada():
+            uploads_fotos = _guardar_fotos_produto(produto, request.files.getlist('fotos')[:5])
         ok2, err2 = _safe_db_commit()
         if not ok2:
             msg = err2 or "Produto criado, mas falha ao salvar fotos. Edite o produto para adicionar fotos."
@@ -1190,6 +1211,7 @@ def novo_produto():
                 return jsonify(ok=False, mensagem=msg), 500
             flash(msg, "warning")
             return redirect(url_for("produtos.listar_produtos"))
+        disparar_uploads(uploads_fotos)
 
         limpar_cache_dashboard()
         registrar_log('CRIAR', 'PRODUTOS', f"Produto #{produto.id} — {nome_produto} criado ({quantidade_entrada} un., custo R$ {produto.preco_custo}).")
@@ -1295,41 +1317,11 @@ def editar_produto(id):
 
             fotos_existentes = ProdutoFoto.query.filter_by(produto_id=produto.id).count()
             slots_disponiveis = max(0, 5 - fotos_existentes)
-            if slots_disponiveis > 0 and (
-                os.environ.get('CLOUDINARY_URL')
-                or current_app.config.get('CLOUDINARY_URL')
-                or (
-                    current_app.config.get('CLOUDINARY_CLOUD_NAME')
-                    and current_app.config.get('CLOUDINARY_API_KEY')
+            uploads_fotos = []
+            if slots_disponiveis > 0 and nuvem_configurada():
+                uploads_fotos = _guardar_fotos_produto(
+                    produto, request.files.getlist('fotos')[:slots_disponiveis]
                 )
-            ):
-                fotos = request.files.getlist('fotos')
-                for foto in fotos[:slots_disponiveis]:
-                    if foto and foto.filename:
-                        if not _arquivo_imagem_permitido(foto.filename):
-                            current_app.logger.info(
-                                f"Upload de foto ignorado (extensão inválida): {foto.filename}"
-                            )
-                            continue
-                        try:
-                            upload_result = cloudinary.uploader.upload(
-                                foto,
-                                folder="menino_do_alho/produtos",
-                                timeout=_EXTERNAL_TIMEOUT,
-                            )
-                            url_segura = upload_result.get('secure_url')
-                            public_id_foto = upload_result.get('public_id')
-                            if url_segura:
-                                nova_foto = ProdutoFoto(
-                                    produto_id=produto.id,
-                                    arquivo=url_segura,
-                                    public_id=public_id_foto,
-                                )
-                                db.session.add(nova_foto)
-                        except Exception as e:
-                            current_app.logger.error(
-                                f"Erro ao fazer upload para o Cloudinary (produto {produto.id}): {e}"
-                            )
 
             ok, err = _safe_db_commit()
             if not ok:
@@ -1338,6 +1330,7 @@ def editar_produto(id):
                     return jsonify({'ok': False, 'success': False, 'error': msg}), 500
                 flash(msg, 'error')
                 return redirect(url_for('produtos.listar_produtos'))
+            disparar_uploads(uploads_fotos)
 
             limpar_cache_dashboard()
             registrar_log('EDITAR', 'PRODUTOS', f"Produto #{produto.id} — {nome_produto} editado.")
@@ -1572,7 +1565,11 @@ def produtos_atualizar_tipo_batch():
 
 @produtos_bp.route('/produtos/importar', methods=['GET', 'POST'])
 def importar_produtos():
-    """Importação em lote de produtos. Exige admin além do tenant guard."""
+    """Importação em lote de produtos. Exige admin além do tenant guard.
+
+    O POST só salva o arquivo e cria um ``JobImportacao``; o processamento
+    roda em background (``processar_importacao_produtos``).
+    """
     @admin_required
     def _importar():
         if request.method == 'POST':
@@ -1581,172 +1578,184 @@ def importar_produtos():
             arquivo = request.files['arquivo']
             if arquivo.filename == '':
                 return render_template('produtos/importar.html', erros_detalhados=['Nenhum arquivo selecionado. Escolha um arquivo e tente novamente.'], sucesso=0, erros=1)
-            filepath = None
             try:
-                filename = secure_filename(arquivo.filename)
-                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                arquivo.save(filepath)
-                is_raw = False
-                if filename.endswith('.csv'):
-                    df, is_raw = _load_csv_produtos_flexible(filepath)
-                    if df is None:
-                        return render_template('produtos/importar.html', erros_detalhados=['O arquivo CSV está vazio ou não pôde ser lido.'], sucesso=0, erros=1)
-                else:
-                    df = pd.read_excel(filepath)
-                if not is_raw:
-                    rename_dict = {}
-                    seen_canonical = set()
-                    for col in list(df.columns):
-                        n = _normalizar_nome_coluna(col)
-                        can = COLUNA_ARQUIVO_PARA_BANCO.get(n)
-                        if can and can not in seen_canonical:
-                            rename_dict[col] = can
-                            seen_canonical.add(can)
-                    df = df.rename(columns=rename_dict)
-                sucesso = 0
-                erros = 0
-                ignorados = 0
-                erros_detalhados = []
-                outros_nomes = []
-                tipos_cadastrados_set_import = _carregar_tipos_cadastrados_set()
-                for idx, row in df.iterrows():
-                    linha_num = (idx + 1) if is_raw else (idx + 2)
-                    v = _row_get(row, 'nome_produto', 'produto', 'nome')
-                    nome_produto_arquivo = _strip_quotes(v) if v is not None else None
-                    if nome_produto_arquivo == '':
-                        nome_produto_arquivo = None
-                    try:
-                        tipo_raw = _strip_quotes(_row_get(row, 'tipo', 'categoria') or '').upper()
-                        tipo = _normalizar_tipo_ui(tipo_raw, tipos_cadastrados_set_import)
-                        nacionalidade = _strip_quotes(_row_get(row, 'nacionalidade', 'origem') or '')
-                        marca = _strip_quotes(_row_get(row, 'marca') or '')
-                        tamanho_raw = _row_get(row, 'tamanho', 'classificacao')
-                        tamanho = _strip_quotes(tamanho_raw or '').upper() if tamanho_raw is not None else ''
-                        tamanho = (tamanho or '').strip()
-                        contexto = nome_produto_arquivo or f'{tipo} {marca} {tamanho}'.strip() or 'linha'
-                        contexto = (contexto[:45] + '...') if len(contexto) > 45 else contexto
-
-                        if tipo == 'SACOLA':
-                            nacionalidade = 'N/A'
-                            marca = 'SOPACK'
-                            t_norm = tamanho.replace(' ', '')
-                            if t_norm not in ('P', 'M', 'G', 'S/N'):
-                                erros_detalhados.append(_msg_linha(linha_num, contexto, "Para SACOLA, o tamanho deve ser P, M, G ou S/N. Valor informado inválido ou vazio", True))
-                                erros += 1
-                                continue
-                            tamanho = t_norm
-                        else:
-                            nacionalidade = nacionalidade or ''
-                            tamanho = tamanho or ''
-                            if not marca:
-                                erros_detalhados.append(_msg_linha(linha_num, contexto, "O campo 'marca' está vazio. Preencha com o nome da marca (ex: IMPORFOZ)", True))
-                                erros += 1
-                                continue
-
-                        quantidade = _parse_quantidade(_row_get(row, 'quantidade_entrada', 'quantidade', 'qtd'))
-                        if quantidade is None or quantidade < 0:
-                            qraw = _row_get(row, 'quantidade_entrada', 'quantidade', 'qtd')
-                            erros_detalhados.append(_msg_linha(linha_num, contexto, f"A quantidade está vazia ou inválida ({qraw}). Use um número inteiro (ex: 10)", True))
-                            erros += 1
-                            continue
-                        fornecedor_valor = _strip_quotes(_row_get(row, 'fornecedor') or '')
-                        preco_raw = _row_get(row, 'preco_custo', 'preco', 'preço')
-                        preco_custo_valor = _parse_preco(preco_raw)
-                        caminhoneiro_valor = _strip_quotes(_row_get(row, 'caminhoneiro') or '')
-                        if not fornecedor_valor:
-                            erros_detalhados.append(_msg_linha(linha_num, contexto, "O campo 'fornecedor' está vazio. Use DESTAK ou PATY", True))
-                            erros += 1
-                            continue
-                        if preco_custo_valor is None:
-                            txt = f"O preço '{preco_raw}' não pôde ser convertido. Use formato brasileiro (ex: 143,00 ou -120,00 para ajustes) ou use ponto como decimal" if preco_raw else "O campo 'preco_custo' (ou 'preco') está vazio"
-                            erros_detalhados.append(_msg_linha(linha_num, contexto, txt, True))
-                            erros += 1
-                            continue
-                        if not caminhoneiro_valor:
-                            erros_detalhados.append(_msg_linha(linha_num, contexto, "O campo 'caminhoneiro' está vazio. Informe o nome do caminhoneiro", True))
-                            erros += 1
-                            continue
-                        fornecedor_valor = fornecedor_valor.upper()
-                        data_chegada_valor = _row_get(row, 'data_chegada', 'data')
-                        if data_chegada_valor is not None and pd.notna(data_chegada_valor):
-                            data_parsed, _ = _parse_data_flex(data_chegada_valor)
-                            data_chegada = data_parsed if data_parsed else date.today()
-                        else:
-                            data_chegada = date.today()
-                        if nome_produto_arquivo:
-                            nome_produto = nome_produto_arquivo
-                        else:
-                            nome_produto = gerar_nome_produto(tipo, nacionalidade, marca, data_chegada, tamanho)
-                        dup = query_tenant(Produto).filter(
-                            Produto.nome_produto == nome_produto,
-                            Produto.data_chegada == data_chegada,
-                            Produto.quantidade_entrada == quantidade,
-                            Produto.fornecedor == fornecedor_valor
-                        ).first()
-                        if dup:
-                            ignorados += 1
-                            continue
-                        produto_existente = query_tenant(Produto).filter_by(nome_produto=nome_produto).first()
-                        if produto_existente:
-                            produto_existente.estoque_atual += quantidade
-                            produto_existente.preco_custo = Decimal(str(preco_custo_valor))
-                            produto_existente.fornecedor = fornecedor_valor
-                            produto_existente.caminhoneiro = caminhoneiro_valor
-                            db.session.commit()
-                            sucesso += 1
-                        else:
-                            produto = Produto(
-                                tipo=tipo,
-                                nacionalidade=nacionalidade,
-                                marca=marca,
-                                tamanho=tamanho,
-                                fornecedor=fornecedor_valor,
-                                caminhoneiro=caminhoneiro_valor,
-                                preco_custo=Decimal(str(preco_custo_valor)),
-                                quantidade_entrada=quantidade,
-                                estoque_atual=quantidade,
-                                data_chegada=data_chegada,
-                                nome_produto=nome_produto,
-                                empresa_id=empresa_id_atual()
-                            )
-                            db.session.add(produto)
-                            db.session.commit()
-                            sucesso += 1
-                            if tipo == 'OUTROS':
-                                outros_nomes.append(nome_produto)
-                    except Exception as e:
-                        db.session.rollback()
-                        ctx = (nome_produto_arquivo or f'linha {linha_num}')
-                        ctx = (ctx[:45] + '...') if len(ctx) > 45 else ctx
-                        erros_detalhados.append(_msg_linha(linha_num, ctx, str(e), True))
-                        erros += 1
-                if filepath and os.path.exists(filepath):
-                    os.remove(filepath)
-                if erros > 0:
-                    return render_template('produtos/importar.html', erros_detalhados=erros_detalhados, sucesso=sucesso, erros=erros, ignorados=ignorados)
-                msg = f'Importação concluída: {sucesso} novo(s).'
-                if ignorados > 0:
-                    msg += f' {ignorados} ignorado(s) por já existirem.'
-                flash(msg, 'success')
-                if outros_nomes:
-                    nomes_lista = ', '.join(outros_nomes[:20])
-                    if len(outros_nomes) > 20:
-                        nomes_lista += f' e mais {len(outros_nomes) - 20}.'
-                    flash(f'Atenção: {len(outros_nomes)} produto(s) foram movidos para "OUTROS" por falta de categoria: {nomes_lista}', 'warning')
-                return redirect(url_for('produtos.listar_produtos'))
+                job = criar_job_importacao('produtos', arquivo, empresa_id=empresa_id_atual(), usuario_id=current_user.id)
+                enfileirar_job_importacao(job)
             except Exception as e:
                 db.session.rollback()
-                if filepath and os.path.exists(filepath):
-                    try:
-                        os.remove(filepath)
-                    except Exception:
-                        pass
                 return render_template('produtos/importar.html', erros_detalhados=[f'Erro ao processar o arquivo: {str(e)}'], sucesso=0, erros=1)
+            return redirect(url_for('importacoes.acompanhar_importacao', job_id=job.id))
         return render_template('produtos/importar.html')
 
     return _importar()
 
 
+def processar_importacao_produtos(caminho, nome_arquivo, *, empresa_id, usuario_id=None, progresso=None):
+    """Importador de produtos executado pelo job (sem ``current_user``).
+
+    Mesmo contrato de ``services.importacao_jobs``: devolve contadores,
+    ``erros_detalhados`` e as ``mensagens`` de flash da importação.
+    """
+    is_raw = False
+    if nome_arquivo.endswith('.csv'):
+        df, is_raw = _load_csv_produtos_flexible(caminho)
+        if df is None:
+            return {'sucesso': 0, 'erros': 1, 'ignorados': 0, 'erros_detalhados': ['O arquivo CSV está vazio ou não pôde ser lido.'], 'mensagens': []}
+    else:
+        df = pd.read_excel(caminho)
+    if not is_raw:
+        rename_dict = {}
+        seen_canonical = set()
+        for col in list(df.columns):
+            n = _normalizar_nome_coluna(col)
+            can = COLUNA_ARQUIVO_PARA_BANCO.get(n)
+            if can and can not in seen_canonical:
+                rename_dict[col] = can
+                seen_canonical.add(can)
+        df = df.rename(columns=rename_dict)
+    sucesso = 0
+    erros = 0
+    ignorados = 0
+    erros_detalhados = []
+    outros_nomes = []
+    tipos_cadastrados_set_import = _carregar_tipos_cadastrados_set(empresa_id)
+    # Conversão vetorizada da planilha inteira antes do laço
+    # (sem ``iterrows``); o laço só valida e grava.
+    nomes_arquivo = coluna_primeiro_valor(df, 'nome_produto', 'produto', 'nome')
+    col_nome = strip_quotes_serie(nomes_arquivo).where(nomes_arquivo.notna(), None)
+    col_tipo = texto_primeiro_valor(df, 'tipo', 'categoria').str.upper()
+    col_nacionalidade = texto_primeiro_valor(df, 'nacionalidade', 'origem')
+    col_marca = texto_primeiro_valor(df, 'marca')
+    col_tamanho = texto_primeiro_valor(df, 'tamanho', 'classificacao').str.upper().str.strip()
+    col_qtd_bruta = coluna_primeiro_valor(df, 'quantidade_entrada', 'quantidade', 'qtd')
+    col_qtd = parse_quantidade_serie(col_qtd_bruta)
+    col_fornecedor = texto_primeiro_valor(df, 'fornecedor')
+    col_preco_bruto = coluna_primeiro_valor(df, 'preco_custo', 'preco', 'preço')
+    col_preco = parse_preco_serie(col_preco_bruto)
+    col_caminhoneiro = texto_primeiro_valor(df, 'caminhoneiro')
+    col_data, _ = parse_data_serie(coluna_primeiro_valor(df, 'data_chegada', 'data'))
+    linhas_planilha = zip(
+        df.index + (1 if is_raw else 2), col_nome, col_tipo, col_nacionalidade,
+        col_marca, col_tamanho, col_qtd_bruta, col_qtd, col_fornecedor,
+        col_preco_bruto, col_preco, col_caminhoneiro, col_data,
+    )
+    total_linhas = len(df)
+    if progresso:
+        progresso(0, total_linhas, 0)
+    for processadas, (linha_num, nome_produto_arquivo, tipo_raw, nacionalidade, marca, tamanho,
+            qraw, quantidade, fornecedor_valor, preco_raw, preco_custo_valor,
+            caminhoneiro_valor, data_parsed) in enumerate(linhas_planilha, start=1):
+        if progresso:
+            progresso(processadas, total_linhas, erros)
+        if nome_produto_arquivo == '':
+            nome_produto_arquivo = None
+        try:
+            tipo = _normalizar_tipo_ui(tipo_raw, tipos_cadastrados_set_import)
+            contexto = nome_produto_arquivo or f'{tipo} {marca} {tamanho}'.strip() or 'linha'
+            contexto = (contexto[:45] + '...') if len(contexto) > 45 else contexto
+
+            if tipo == 'SACOLA':
+                nacionalidade = 'N/A'
+                marca = 'SOPACK'
+                t_norm = tamanho.replace(' ', '')
+                if t_norm not in ('P', 'M', 'G', 'S/N'):
+                    erros_detalhados.append(_msg_linha(linha_num, contexto, "Para SACOLA, o tamanho deve ser P, M, G ou S/N. Valor informado inválido ou vazio", True))
+                    erros += 1
+                    continue
+                tamanho = t_norm
+            else:
+                nacionalidade = nacionalidade or ''
+                tamanho = tamanho or ''
+                if not marca:
+                    erros_detalhados.append(_msg_linha(linha_num, contexto, "O campo 'marca' está vazio. Preencha com o nome da marca (ex: IMPORFOZ)", True))
+                    erros += 1
+                    continue
+
+            if quantidade is None or quantidade < 0:
+                erros_detalhados.append(_msg_linha(linha_num, contexto, f"A quantidade está vazia ou inválida ({qraw}). Use um número inteiro (ex: 10)", True))
+                erros += 1
+                continue
+            if not fornecedor_valor:
+                erros_detalhados.append(_msg_linha(linha_num, contexto, "O campo 'fornecedor' está vazio. Use DESTAK ou PATY", True))
+                erros += 1
+                continue
+            if preco_custo_valor is None:
+                txt = f"O preço '{preco_raw}' não pôde ser convertido. Use formato brasileiro (ex: 143,00 ou -120,00 para ajustes) ou use ponto como decimal" if preco_raw else "O campo 'preco_custo' (ou 'preco') está vazio"
+                erros_detalhados.append(_msg_linha(linha_num, contexto, txt, True))
+                erros += 1
+                continue
+            if not caminhoneiro_valor:
+                erros_detalhados.append(_msg_linha(linha_num, contexto, "O campo 'caminhoneiro' está vazio. Informe o nome do caminhoneiro", True))
+                erros += 1
+                continue
+            fornecedor_valor = fornecedor_valor.upper()
+            data_chegada = data_parsed if data_parsed else date.today()
+            if nome_produto_arquivo:
+                nome_produto = nome_produto_arquivo
+            else:
+                nome_produto = gerar_nome_produto(tipo, nacionalidade, marca, data_chegada, tamanho)
+            dup = Produto.query.filter(
+                Produto.empresa_id == empresa_id,
+                Produto.nome_produto == nome_produto,
+                Produto.data_chegada == data_chegada,
+                Produto.quantidade_entrada == quantidade,
+                Produto.fornecedor == fornecedor_valor
+            ).first()
+            if dup:
+                ignorados += 1
+                continue
+            produto_existente = Produto.query.filter_by(empresa_id=empresa_id, nome_produto=nome_produto).first()
+            if produto_existente:
+                produto_existente.estoque_atual += quantidade
+                produto_existente.preco_custo = Decimal(str(preco_custo_valor))
+                produto_existente.fornecedor = fornecedor_valor
+                produto_existente.caminhoneiro = caminhoneiro_valor
+                db.session.commit()
+                sucesso += 1
+            else:
+                produto = Produto(
+                    tipo=tipo,
+                    nacionalidade=nacionalidade,
+                    marca=marca,
+                    tamanho=tamanho,
+                    fornecedor=fornecedor_valor,
+                    caminhoneiro=caminhoneiro_valor,
+                    preco_custo=Decimal(str(preco_custo_valor)),
+                    quantidade_entrada=quantidade,
+                    estoque_atual=quantidade,
+                    data_chegada=data_chegada,
+                    nome_produto=nome_produto,
+                    empresa_id=empresa_id
+                )
+                db.session.add(produto)
+                db.session.commit()
+                sucesso += 1
+                if tipo == 'OUTROS':
+                    outros_nomes.append(nome_produto)
+        except Exception as e:
+            db.session.rollback()
+            ctx = (nome_produto_arquivo or f'linha {linha_num}')
+            ctx = (ctx[:45] + '...') if len(ctx) > 45 else ctx
+            erros_detalhados.append(_msg_linha(linha_num, ctx, str(e), True))
+            erros += 1
+    msg = f'Importação concluída: {sucesso} novo(s).'
+    if ignorados > 0:
+        msg += f' {ignorados} ignorado(s) por já existirem.'
+    mensagens = [('success', msg)]
+    if outros_nomes:
+        nomes_lista = ', '.join(outros_nomes[:20])
+        if len(outros_nomes) > 20:
+            nomes_lista += f' e mais {len(outros_nomes) - 20}.'
+        mensagens.append(('warning', f'Atenção: {len(outros_nomes)} produto(s) foram movidos para "OUTROS" por falta de categoria: {nomes_lista}'))
+    return {
+        'sucesso': sucesso,
+        'erros': erros,
+        'ignorados': ignorados,
+        'erros_detalhados': erros_detalhados,
+        'mensagens': mensagens,
+    }
+
+
 # ============================================================
 # API endpoints
 # ============================================================
@@ -1769,7 +1778,7 @@ def get_fotos_produto(produto_id):
     fotos = ProdutoFoto.query.filter_by(produto_id=produto.id).all()
     items = []
     for f in fotos:
-        if f.arquivo and (f.arquivo.startswith('http://') or f.arquivo.startswith('https://')):
+        if f.arquivo and ('://' in f.arquivo or f.arquivo.startswith(PREFIXO_URL_PROVISORIA)):
             full = f.arquivo
         elif f.arquivo:
             full = url_for('static', filename=f'uploads/{f.arquivo}')
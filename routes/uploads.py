@@ -0,0 +1,51 @@
+"""Blueprint ``uploads`` — imagens ainda no spool de envio ao Cloudinary.
+
+Rotas:
+    * GET /uploads/pendentes/<token>   imagem_pendente
+
+Fotos de produto e de cheque ganham uma URL provisória enquanto o envio
+em background (``services/uploads_nuvem.py``) não termina: esta rota
+serve o arquivo do spool e, depois do envio, redireciona para a URL
+definitiva. Só imagens; PDFs de documentos não passam por aqui.
+
+Multi-tenant:
+    ``before_request`` aplica ``login_required`` + ``tenant_required``; o
+    token só é servido para a empresa gravada no spool.
+"""
+import os
+
+from flask import Blueprint, abort, redirect, send_file
+
+from services.auth_utils import tenant_required
+from services.db_utils import empresa_id_atual
+from services.uploads_nuvem import PREFIXO_URL_PROVISORIA, caminho_arquivo_spool, ler_upload
+
+
+uploads_bp = Blueprint('uploads', __name__)
+
+
+@uploads_bp.before_request
+def _exigir_tenant_em_todas_rotas():
+    """Aplica ``login_required`` + ``tenant_required`` em todas as rotas."""
+    @tenant_required
+    def _ok():
+        return None
+
+    return _ok()
+
+
+@uploads_bp.route(PREFIXO_URL_PROVISORIA + '<token>')
+def imagem_pendente(token):
+    meta = ler_upload(token)
+    if meta is None or meta.get('resource_type') != 'image':
+        abort(404)
+    if meta.get('empresa_id') is not None and meta['empresa_id'] != empresa_id_atual():
+        abort(404)
+    if meta.get('url'):
+        return redirect(meta['url'])
+    caminho = caminho_arquivo_spool(meta)
+    if not os.path.isfile(caminho):
+        abort(404)
+    resposta = send_file(caminho, max_age=0)
+    resposta.headers['Cache-Control'] = 'no-store'
+    return resposta
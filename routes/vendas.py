@@ -44,23 +44,21 @@ import io
 import json
 import os
 import re
-import time
 import urllib.error
 import urllib.parse
 import urllib.request
 
 from flask import (
     Blueprint, render_template, request, redirect, url_for,
-    flash, jsonify, session, current_app, Response,
+    flash, jsonify, session, current_app,
 )
 from flask_login import current_user
 from sqlalchemy import and_, asc, case, desc, func, or_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 import pandas as pd
-from werkzeug.utils import secure_filename
 
-from models import db, Cliente, Produto, Venda, Documento, LancamentoCaixa, Lembrete
+from models import db, Cliente, Produto, Venda, Documento, LancamentoCaixa, Lembrete, DOC_PROCESSANDO
 from quotes import frase_do_dia, FRASES
 from services.auth_utils import (
     tenant_required, admin_required, _is_ajax,
@@ -78,6 +76,11 @@ from services.config_helpers import (
     registrar_log, get_hoje_brasil,
 )
 from services.query_utils import filtro_ano_data_venda
+from services.roteirizacao import otimizar_rota
+from services.geocodificacao import NOMINATIM_USER_AGENT, agendar_geocodificacao, coords_em_cache
+from services.exportacao import (
+    YIELD_PER, celula_segura, formato_exportacao, resposta_relatorio_streaming,
+)
 from services.files_utils import _deletar_cloudinary_seguro
 from services.vendas_services import (
     _vendas_do_pedido, _apagar_lancamentos_caixa_por_vendas,
@@ -85,11 +88,8 @@ from services.vendas_services import (
     _resincronizar_pagamento_venda,
 )
 from services.estoque_fifo import alocar_baixa_fifo
-from services.csv_utils import (
-    _msg_linha, _strip_quotes,
-    _normalizar_nome_busca, _parse_preco, _parse_quantidade,
-    _parse_data_flex,
-)
+from services.importacao_vendas import importar_vendas_dataframe
+from services.importacao_jobs import criar_job_importacao, enfileirar_job_importacao
 # ``_limpar_valor_moeda`` é helper nativo do livro caixa, reutilizado
 # aqui em formulários monetários.
 from routes.caixa import _limpar_valor_moeda
@@ -304,7 +304,13 @@ def salvar_ordem_logistica():
 # Sobrescrevíveis via env GALPAO_LAT / GALPAO_LON.
 _GALPAO_LAT_DEFAULT = -9.3891
 _GALPAO_LON_DEFAULT = -40.5030
-_NOMINATIM_USER_AGENT = 'SistemaMeninoDoAlho/1.0 (logistica-rota; contato@meninodoalho.local)'
+# Timeout do OSRM quando usado só como refinamento da rota local.
+_OSRM_TIMEOUT_REFINO = 4
+
+
+def _osrm_refino_habilitado():
+    """``LOGISTICA_OSRM_REFINAR=1`` liga o refinamento da rota pelo OSRM público."""
+    return (os.environ.get('LOGISTICA_OSRM_REFINAR') or '').strip().lower() in ('1', 'true', 'sim', 'yes')
 
 
 def _coords_galpao():
@@ -317,33 +323,11 @@ def _coords_galpao():
         return _GALPAO_LAT_DEFAULT, _GALPAO_LON_DEFAULT
 
 
-def _geocodificar_nominatim(endereco):
-    """Consulta Nominatim e retorna (lat, lon) ou (None, None). Timeout 2s."""
-    endereco = (endereco or '').strip()
-    if not endereco:
-        return None, None
-    q = urllib.parse.quote(endereco)
-    url = (
-        'https://nominatim.openstreetmap.org/search'
-        f'?format=json&q={q}&limit=1&countrycodes=br'
-    )
-    req = urllib.request.Request(
-        url,
-        headers={'User-Agent': _NOMINATIM_USER_AGENT, 'Accept': 'application/json'},
-    )
-    try:
-        with urllib.request.urlopen(req, timeout=2) as resp:
-            data = json.loads(resp.read().decode('utf-8'))
-        if not data:
-            return None, None
-        return float(data[0]['lat']), float(data[0]['lon'])
-    except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError,
-            ValueError, KeyError, TypeError, json.JSONDecodeError):
-        return None, None
-
-
 def _resolver_coords_cliente(cliente):
-    """Usa lat/lon cacheados ou geocodifica e persiste no cliente.
+    """Coordenadas do cliente (cacheadas no cadastro ou no ``GeocodeCache``).
+
+    Só leitura — nunca chama o Nominatim no request. Cliente sem
+    coordenada é geocodificado em background (``agendar_geocodificacao``).
 
     Returns:
         tuple: (lat, lon, endereco_usado) ou (None, None, endereco_ou_vazio).
@@ -362,21 +346,17 @@ def _resolver_coords_cliente(cliente):
     if not endereco:
         return None, None, ''
 
-    lat, lon = _geocodificar_nominatim(endereco)
-    if lat is None or lon is None:
+    coords = coords_em_cache(endereco)
+    if coords is None:
         return None, None, endereco
 
+    lat, lon = coords
     cliente.latitude = lat
     cliente.longitude = lon
-    try:
-        db.session.commit()
-    except Exception:
-        db.session.rollback()
-        # Coordenadas ainda são válidas para esta requisição mesmo se o save falhar
     return lat, lon, endereco
 
 
-def _chamar_osrm_trip(coords_lon_lat):
+def _chamar_osrm_trip(coords_lon_lat, timeout=10):
     """Chama OSRM Trip Service. coords_lon_lat: lista de (lon, lat).
 
     Returns:
@@ -392,10 +372,10 @@ def _chamar_osrm_trip(coords_lon_lat):
     )
     req = urllib.request.Request(
         url,
-        headers={'User-Agent': _NOMINATIM_USER_AGENT, 'Accept': 'application/json'},
+        headers={'User-Agent': NOMINATIM_USER_AGENT, 'Accept': 'application/json'},
     )
     try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
             data = json.loads(resp.read().decode('utf-8'))
     except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError,
             ValueError, json.JSONDecodeError):
@@ -423,7 +403,16 @@ def _chamar_osrm_trip(coords_lon_lat):
 
 @vendas_bp.route('/api/logistica/otimizar-rota', methods=['POST'])
 def otimizar_rota_logistica():
-    """Otimiza a ordem de entrega dos pedidos selecionados via OSRM Trip + Nominatim."""
+    """Otimiza a ordem de entrega dos pedidos selecionados.
+
+    A ordem sai do roteirizador local (``services.roteirizacao``:
+    haversine + vizinho mais próximo + 2-opt/Or-opt) sobre as coordenadas
+    cacheadas dos clientes. Cliente ainda sem coordenada fica fora da rota
+    (com aviso) e é geocodificado em background — nenhuma chamada ao
+    Nominatim acontece neste request. Com ``LOGISTICA_OSRM_REFINAR=1`` o OSRM público é
+    consultado como refinamento (distâncias viárias reais); se falhar ou
+    demorar, fica a rota local.
+    """
     payload = request.get_json(silent=True) or {}
     pedido_ids_raw = payload.get('pedido_ids') or payload.get('ids') or []
 
@@ -460,7 +449,7 @@ def otimizar_rota_logistica():
 
     pontos = []  # dicts com pedido_id, cliente, lat, lon, endereco...
     avisos = []
-    geocode_feitos = 0
+    sem_coordenada = 0
 
     for pid in pedido_ids:
         venda = vendas_por_id.get(pid)
@@ -472,22 +461,14 @@ def otimizar_rota_logistica():
             avisos.append(f'Pedido #{pid} sem cliente vinculado.')
             continue
 
-        precisa_geocode = cliente.latitude is None or cliente.longitude is None
-        if precisa_geocode and geocode_feitos > 0:
-            # Nominatim: no máximo 1 req/s
-            time.sleep(1.1)
-
         lat, lon, endereco = _resolver_coords_cliente(cliente)
-        if precisa_geocode:
-            geocode_feitos += 1
-
         if lat is None or lon is None:
             nome = cliente.nome_cliente or f'#{cliente.id}'
-            avisos.append(
-                f'Endereço não localizado para "{nome}"'
-                + (f' ({endereco})' if endereco else ' — endereço vazio')
-                + '.'
-            )
+            if endereco:
+                sem_coordenada += 1
+                avisos.append(f'Endereço de "{nome}" ainda não localizado no mapa ({endereco}).')
+            else:
+                avisos.append(f'Endereço não localizado para "{nome}" — endereço vazio.')
             continue
 
         pontos.append({
@@ -499,6 +480,16 @@ def otimizar_rota_logistica():
             'longitude': lon,
         })
 
+    # Coordenadas vindas do GeocodeCache ficam gravadas no cliente.
+    if db.session.dirty:
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+    if sem_coordenada:
+        agendar_geocodificacao(empresa_id_atual())
+        avisos.append('A localização desses endereços está sendo buscada; tente otimizar de novo em alguns minutos.')
+
     if len(pontos) < 2:
         return jsonify({
             'success': False,
@@ -510,24 +501,27 @@ def otimizar_rota_logistica():
         }), 422
 
     galpao_lat, galpao_lon = _coords_galpao()
-    # OSRM usa lon,lat; primeiro ponto = partida fixa (source=first)
-    coords = [(galpao_lon, galpao_lat)] + [
-        (p['longitude'], p['latitude']) for p in pontos
-    ]
-
-    resultado = _chamar_osrm_trip(coords)
-    if not resultado:
-        return jsonify({
-            'success': False,
-            'message': 'Falha ao calcular a rota no OSRM. Tente novamente em instantes.',
-            'avisos': avisos,
-        }), 502
-
-    # order_by_trip inclui o galpão (índice 0 em coords). Entregas começam em 1.
-    ordem_otima = [
-        i for i in resultado['order_by_trip']
-        if i >= 1
-    ]
+    # Índice 0 = galpão (partida fixa); entregas começam em 1.
+    rota_local = otimizar_rota([(galpao_lat, galpao_lon)] + [
+        (p['latitude'], p['longitude']) for p in pontos
+    ])
+    resultado = {
+        'distance_m': rota_local['distancia_m'],
+        'duration_s': rota_local['duracao_s'],
+    }
+    ordem_otima = rota_local['ordem']
+    fonte_rota = 'local'
+
+    if _osrm_refino_habilitado():
+        # OSRM usa lon,lat; primeiro ponto = partida fixa (source=first)
+        coords = [(galpao_lon, galpao_lat)] + [
+            (p['longitude'], p['latitude']) for p in pontos
+        ]
+        resultado_osrm = _chamar_osrm_trip(coords, timeout=_OSRM_TIMEOUT_REFINO)
+        if resultado_osrm:
+            resultado = resultado_osrm
+            ordem_otima = [i for i in resultado_osrm['order_by_trip'] if i >= 1]
+            fonte_rota = 'osrm'
     pedidos_ordenados = []
     for trip_pos, coord_idx in enumerate(ordem_otima, start=1):
         ponto = pontos[coord_idx - 1]
@@ -578,6 +572,7 @@ def otimizar_rota_logistica():
             'longitude': galpao_lon,
         },
         'maps_url': maps_url,
+        'fonte': fonte_rota,
         'avisos': avisos,
     })
 
@@ -1379,7 +1374,12 @@ def listar_vendas():
     docs_tenant = query_documentos_tenant()
     total_documentos = docs_tenant.count()
     documentos_vinculados = docs_tenant.filter(Documento.venda_id.isnot(None)).count()
-    documentos_sem_vinculo = total_documentos - documentos_vinculados
+    documentos_processando = docs_tenant.filter(Documento.status_processamento == DOC_PROCESSANDO).count()
+    # Sem vínculo = sem venda e fora da fila (documento em PROCESSANDO pode já ter venda).
+    documentos_sem_vinculo = docs_tenant.filter(
+        Documento.venda_id.is_(None),
+        or_(Documento.status_processamento.is_(None), Documento.status_processamento != DOC_PROCESSANDO),
+    ).count()
     total_boletos = docs_tenant.filter(Documento.tipo == 'BOLETO').count()
     total_notas = docs_tenant.filter(Documento.tipo == 'NOTA_FISCAL').count()
     boletos_vinculados = docs_tenant.filter(Documento.tipo == 'BOLETO', Documento.venda_id.isnot(None)).count()
@@ -1655,6 +1655,7 @@ def listar_vendas():
         total_documentos=total_documentos,
         documentos_vinculados=documentos_vinculados,
         documentos_sem_vinculo=documentos_sem_vinculo,
+        documentos_processando=documentos_processando,
         total_boletos=total_boletos,
         total_notas=total_notas,
         boletos_vinculados=boletos_vinculados,
@@ -1743,9 +1744,12 @@ def exportar_relatorio_vendas():
             _mes_fim = date(int(ano_ativo), int(filtro_mes) + 1, 1)
         query = query.filter(Venda.data_venda >= _mes_ini, Venda.data_venda < _mes_fim)
 
-    vendas = query.order_by(Venda.data_venda.desc(), Venda.id.desc()).all()
-    if not _e_admin_tenant():
-        vendas = [v for v in vendas if _usuario_pode_gerenciar_venda(v)]
+    # Streaming: ``yield_per`` busca o ano em lotes (cursor server-side no
+    # Postgres) em vez de materializar todas as vendas de uma vez.
+    query = query.order_by(Venda.data_venda.desc(), Venda.id.desc()).yield_per(YIELD_PER)
+    filtrar_por_permissao = not _e_admin_tenant()
+    formato = formato_exportacao(request.form.get('formato'))
+    eh_xlsx = formato == 'xlsx'
 
     if filtro_a_receber:
         colunas_disponiveis['valor_total'] = 'Valor a Receber'
@@ -1762,62 +1766,6 @@ def exportar_relatorio_vendas():
             return ''
         return valor.strftime('%d/%m/%Y') if hasattr(valor, 'strftime') else str(valor)
 
-    def _csv_safe(valor):
-        s = '' if valor is None else str(valor)
-        return "'" + s if s[:1] in ('=', '+', '-', '@') else s
-
-    output = io.StringIO()
-    output.write('\ufeff')
-    writer = csv.writer(output, delimiter=';')
-    writer.writerow([colunas_disponiveis[c] for c in colunas])
-
-    soma_qtd = 0
-    soma_valor_total = Decimal('0.0')
-    soma_lucro = Decimal('0.0')
-
-    for venda in vendas:
-        qtd_venda = int(getattr(venda, 'quantidade_venda', 0) or 0)
-        try:
-            valor_face = Decimal(str(venda.calcular_total() or Decimal('0.00')))
-        except Exception:
-            valor_face = Decimal('0.00')
-        sit_venda = (venda.situacao or '').strip().upper()
-        # Alinhado ao Dashboard: PARCIAL exporta/soma só o saldo devedor.
-        if filtro_a_receber and sit_venda == 'PARCIAL':
-            try:
-                valor_pago = Decimal(str(getattr(venda, 'valor_pago', None) or Decimal('0.00')))
-            except Exception:
-                valor_pago = Decimal('0.00')
-            valor_total_venda = valor_face - valor_pago
-            if valor_total_venda < 0:
-                valor_total_venda = Decimal('0.00')
-        else:
-            valor_total_venda = valor_face
-        try:
-            lucro_venda = Decimal(str(venda.calcular_lucro() or Decimal('0.00')))
-        except Exception:
-            lucro_venda = Decimal('0.00')
-
-        soma_qtd += qtd_venda
-        soma_valor_total += valor_total_venda
-        soma_lucro += lucro_venda
-
-        cliente_nome = venda.cliente.nome_cliente if venda.cliente else (getattr(venda, 'cliente_avulso', None) or '-')
-        linha = {
-            'data': _fmt_data(venda.data_venda),
-            'cliente': _csv_safe(cliente_nome),
-            'nf': _csv_safe(venda.nf or '-'),
-            'preco_unit': _fmt_num(getattr(venda, 'preco_venda', 0)),
-            'qtd': str(qtd_venda),
-            'valor_total': _fmt_num(valor_total_venda),
-            'lucro': _fmt_num(lucro_venda),
-            'vencimento': _fmt_data(getattr(venda, 'data_vencimento', None)),
-            'empresa': _csv_safe(venda.empresa_faturadora or 'NENHUM'),
-            'situacao': _csv_safe(venda.situacao or ''),
-            'forma_pagto': _csv_safe(venda.forma_pagamento or ''),
-        }
-        writer.writerow([linha[c] for c in colunas])
-
     def _fmt_total_br(valor):
         try:
             numero = Decimal(str(valor or 0))
@@ -1825,19 +1773,83 @@ def exportar_relatorio_vendas():
             numero = Decimal('0.00')
         return f"{numero:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
 
-    linha_total = [''] * len(colunas)
-    if linha_total:
-        linha_total[0] = 'TOTAL GERAL'
-    if 'qtd' in colunas:
-        linha_total[colunas.index('qtd')] = str(soma_qtd)
-    if 'valor_total' in colunas:
-        linha_total[colunas.index('valor_total')] = _fmt_total_br(soma_valor_total)
-    if 'lucro' in colunas:
-        linha_total[colunas.index('lucro')] = _fmt_total_br(soma_lucro)
-    writer.writerow(linha_total)
+    def _linhas():
+        soma_qtd = 0
+        soma_valor_total = Decimal('0.0')
+        soma_lucro = Decimal('0.0')
+
+        for venda in query:
+            if filtrar_por_permissao and not _usuario_pode_gerenciar_venda(venda):
+                continue
+            qtd_venda = int(getattr(venda, 'quantidade_venda', 0) or 0)
+            try:
+                valor_face = Decimal(str(venda.calcular_total() or Decimal('0.00')))
+            except Exception:
+                valor_face = Decimal('0.00')
+            sit_venda = (venda.situacao or '').strip().upper()
+            # Alinhado ao Dashboard: PARCIAL exporta/soma só o saldo devedor.
+            if filtro_a_receber and sit_venda == 'PARCIAL':
+                try:
+                    valor_pago = Decimal(str(getattr(venda, 'valor_pago', None) or Decimal('0.00')))
+                except Exception:
+                    valor_pago = Decimal('0.00')
+                valor_total_venda = valor_face - valor_pago
+                if valor_total_venda < 0:
+                    valor_total_venda = Decimal('0.00')
+            else:
+                valor_total_venda = valor_face
+            try:
+                lucro_venda = Decimal(str(venda.calcular_lucro() or Decimal('0.00')))
+            except Exception:
+                lucro_venda = Decimal('0.00')
+
+            soma_qtd += qtd_venda
+            soma_valor_total += valor_total_venda
+            soma_lucro += lucro_venda
 
-    csv_content = output.getvalue()
-    output.close()
+            cliente_nome = venda.cliente.nome_cliente if venda.cliente else (getattr(venda, 'cliente_avulso', None) or '-')
+            if eh_xlsx:
+                linha = {
+                    'data': venda.data_venda,
+                    'cliente': cliente_nome,
+                    'nf': venda.nf or '-',
+                    'preco_unit': Decimal(str(getattr(venda, 'preco_venda', 0) or 0)),
+                    'qtd': qtd_venda,
+                    'valor_total': valor_total_venda,
+                    'lucro': lucro_venda,
+                    'vencimento': getattr(venda, 'data_vencimento', None),
+                    'empresa': venda.empresa_faturadora or 'NENHUM',
+                    'situacao': venda.situacao or '',
+                    'forma_pagto': venda.forma_pagamento or '',
+                }
+            else:
+                linha = {
+                    'data': _fmt_data(venda.data_venda),
+                    'cliente': celula_segura(cliente_nome),
+                    'nf': celula_segura(venda.nf or '-'),
+                    'preco_unit': _fmt_num(getattr(venda, 'preco_venda', 0)),
+                    'qtd': str(qtd_venda),
+                    'valor_total': _fmt_num(valor_total_venda),
+                    'lucro': _fmt_num(lucro_venda),
+                    'vencimento': _fmt_data(getattr(venda, 'data_vencimento', None)),
+                    'empresa': celula_segura(venda.empresa_faturadora or 'NENHUM'),
+                    'situacao': celula_segura(venda.situacao or ''),
+                    'forma_pagto': celula_segura(venda.forma_pagamento or ''),
+                }
+            yield [linha[c] for c in colunas]
+
+        linha_total = [''] * len(colunas)
+        if linha_total:
+            linha_total[0] = 'TOTAL GERAL'
+        totais = {
+            'qtd': soma_qtd if eh_xlsx else str(soma_qtd),
+            'valor_total': soma_valor_total if eh_xlsx else _fmt_total_br(soma_valor_total),
+            'lucro': soma_lucro if eh_xlsx else _fmt_total_br(soma_lucro),
+        }
+        for chave, valor in totais.items():
+            if chave in colunas:
+                linha_total[colunas.index(chave)] = valor
+        yield linha_total
 
     data_hoje = datetime.now().strftime('%d-%m-%Y')
     partes_nome = ['relatorio_vendas', data_hoje]
@@ -1856,12 +1868,12 @@ def exportar_relatorio_vendas():
     if filtro_mes is not None:
         partes_nome.append(f"MES_{filtro_mes:02d}")
 
-    nome_arquivo = f"{'_'.join([p for p in partes_nome if p])}.csv"
-
-    return Response(
-        csv_content,
-        mimetype='text/csv; charset=utf-8',
-        headers={'Content-Disposition': f'attachment; filename={nome_arquivo}'},
+    return resposta_relatorio_streaming(
+        _linhas(),
+        [colunas_disponiveis[c] for c in colunas],
+        nome_base='_'.join([p for p in partes_nome if p]),
+        formato=formato,
+        titulo_aba='Vendas',
     )
 
 
@@ -1881,42 +1893,83 @@ def _formatar_data_com_dia_semana(data_venda):
     return f"{data_venda.strftime('%d/%m/%Y')} ({dia_semana})"
 
 
-@vendas_bp.route('/logistica')
-def logistica():
-    """Roteirizador de Entregas: lista cada venda individualmente por status de entrega."""
-    filtro_status = request.args.get('status', 'PENDENTE')
-    if filtro_status not in ('PENDENTE', 'ENTREGUE'):
-        filtro_status = 'PENDENTE'
+# Janela padrão da aba "Já Entregues": sem ela a aba carregava o
+# histórico inteiro de entregas. ``?dias=0`` desliga o limite.
+_LOGISTICA_JANELA_ENTREGUES_DIAS = 90
+_LOGISTICA_POR_PAGINA = 20
+_CNPJS_CONSUMIDOR_FINAL = ('0', '00000000000000', '')
 
-    page = request.args.get('page', 1, type=int)
-    per_page = 20
-    is_ajax = (
-        request.args.get('ajax') == '1'
-        or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
-    )
 
-    vendas = query_tenant(Venda).filter_by(status_entrega=filtro_status).options(
+def _chave_pedido_logistica(v):
+    """Chave de agrupamento de um pedido (mesma regra em SQL e em Python).
+
+    Consumidor final (CNPJ vazio/zerado) agrupa por cliente + data; os
+    demais por cliente + NF + data.
+    """
+    cnpj_cliente = (v.cliente.cnpj or '').strip()
+    data_venda_normalizada = v.data_venda.date() if hasattr(v.data_venda, 'date') else v.data_venda
+    if cnpj_cliente in _CNPJS_CONSUMIDOR_FINAL:
+        return (v.cliente_id, data_venda_normalizada)
+    nf_normalizada = str(v.nf).strip() if v.nf else ''
+    return (v.cliente_id, nf_normalizada, data_venda_normalizada)
+
+
+def _grupos_logistica(filtro_status, data_minima=None):
+    """Query agregada: uma linha por pedido (cliente, NF, data).
+
+    Devolve ``(cliente_id, nf_chave, data_venda, min_id)``; ``min_id``
+    identifica o pedido de forma única (os grupos são disjuntos).
+    Vendas sem cliente ficam de fora pelo JOIN, como antes.
+    """
+    consumidor_final = or_(
+        Cliente.cnpj.is_(None),
+        func.trim(Cliente.cnpj).in_(_CNPJS_CONSUMIDOR_FINAL),
+    )
+    nf_chave = case(
+        (consumidor_final, ''),
+        else_=func.coalesce(func.trim(Venda.nf), ''),
+    )
+    consulta = (
+        query_tenant(Venda)
+        .join(Cliente, Venda.cliente_id == Cliente.id)
+        .filter(Venda.status_entrega == filtro_status)
+    )
+    if data_minima is not None:
+        consulta = consulta.filter(Venda.data_venda >= data_minima)
+    return consulta.with_entities(
+        Venda.cliente_id,
+        nf_chave.label('nf_chave'),
+        Venda.data_venda,
+        func.min(Venda.id).label('min_id'),
+    ).group_by(Venda.cliente_id, nf_chave, Venda.data_venda)
+
+
+def _carregar_pedidos_logistica(filtro_status, data_minima, pares):
+    """Carrega as vendas dos pedidos informados e monta os dicts da tela.
+
+    ``pares`` são ``(cliente_id, data_venda)`` — só os da página, então o
+    SELECT com JOIN em cliente/produto fica limitado a poucos pedidos.
+    Retorna ``{min_id: pedido}``.
+    """
+    if not pares:
+        return {}
+    consulta = query_tenant(Venda).filter(
+        Venda.status_entrega == filtro_status,
+        or_(*[and_(Venda.cliente_id == cid, Venda.data_venda == dt) for cid, dt in set(pares)]),
+    )
+    if data_minima is not None:
+        consulta = consulta.filter(Venda.data_venda >= data_minima)
+    vendas = consulta.options(
         joinedload(Venda.cliente),
         joinedload(Venda.produto),
-    ).order_by(Venda.data_venda.desc()).all()
+    ).order_by(Venda.id.asc()).all()
 
     pedidos_dict = {}
-    pedidos_ordenados_keys = []
-
     for v in vendas:
         cliente = v.cliente
         if not cliente:
             continue
-
-        cnpj_cliente = (cliente.cnpj or '').strip()
-        is_consumidor_final = cnpj_cliente in ('0', '00000000000000', '')
-        data_venda_normalizada = v.data_venda.date() if hasattr(v.data_venda, 'date') else v.data_venda
-        if is_consumidor_final:
-            pedido_key = (v.cliente_id, data_venda_normalizada)
-        else:
-            nf_normalizada = str(v.nf).strip() if v.nf else ''
-            pedido_key = (v.cliente_id, nf_normalizada, data_venda_normalizada)
-
+        pedido_key = _chave_pedido_logistica(v)
         if pedido_key not in pedidos_dict:
             pedidos_dict[pedido_key] = {
                 'pedido_key': str(pedido_key),
@@ -1929,44 +1982,116 @@ def logistica():
                 'total': 0.0,
                 'status_entrega': v.status_entrega or 'PENDENTE',
             }
-            pedidos_ordenados_keys.append(pedido_key)
-
         produto_nome = v.produto.nome_produto if v.produto else 'Item'
         pedidos_dict[pedido_key]['ids'].append(v.id)
         pedidos_dict[pedido_key]['produtos'].append(f"{v.quantidade_venda}x {produto_nome}")
         pedidos_dict[pedido_key]['total'] += float(v.calcular_total())
+    # Vendas em ordem de id: a primeira de cada pedido é o ``min_id``.
+    return {p['ids'][0]: p for p in pedidos_dict.values()}
 
-    pedidos_agrupados = [pedidos_dict[k] for k in pedidos_ordenados_keys]
 
-    # Aplica ordem customizada salva via drag & drop (sessão)
-    _ordem_log = session.get('logistica_ordem') or []
-    if _ordem_log and pedidos_agrupados:
-        _idx = {','.join(str(i) for i in e['ids']): n for n, e in enumerate(pedidos_agrupados)}
-        def _sort_key(e):
-            key = ','.join(str(i) for i in e['ids'])
-            try:
-                return (_ordem_log.index(key), _idx.get(key, 0))
-            except ValueError:
-                return (len(_ordem_log) + _idx.get(key, 0), _idx.get(key, 0))
-        pedidos_agrupados = sorted(pedidos_agrupados, key=_sort_key)
+def _pedidos_fixados_logistica(filtro_status, data_minima, ordem):
+    """Resolve a ordem salva na sessão (drag & drop / rota otimizada).
 
-    total_pedidos = len(pedidos_agrupados)
+    Cada item de ``ordem`` é ``ids`` unidos por vírgula (``data-id`` da
+    tela). Retorna a lista de pedidos que ainda existem na aba, na ordem
+    salva. Só carrega as vendas citadas na sessão, nunca a aba inteira.
+    """
+    ids_citados = set()
+    for chave in ordem:
+        for parte in str(chave).split(','):
+            parte = parte.strip()
+            if parte.isdigit():
+                ids_citados.add(int(parte))
+    if not ids_citados:
+        return []
+    consulta = query_tenant(Venda).with_entities(Venda.cliente_id, Venda.data_venda).filter(
+        Venda.id.in_(ids_citados),
+        Venda.status_entrega == filtro_status,
+    )
+    if data_minima is not None:
+        consulta = consulta.filter(Venda.data_venda >= data_minima)
+    pares = [tuple(r) for r in consulta.distinct().all()]
+    por_chave = {
+        ','.join(str(i) for i in p['ids']): p
+        for p in _carregar_pedidos_logistica(filtro_status, data_minima, pares).values()
+    }
+    fixados = []
+    for chave in ordem:
+        pedido = por_chave.pop(chave, None)
+        if pedido is not None:
+            fixados.append(pedido)
+    return fixados
+
+
+@vendas_bp.route('/logistica')
+def logistica():
+    """Roteirizador de Entregas: lista os pedidos por status de entrega.
+
+    O agrupamento por pedido e a paginação são feitos no banco
+    (``GROUP BY`` + ``LIMIT/OFFSET``): só as vendas dos pedidos da página
+    são carregadas. Pedidos com ordem salva na sessão vêm primeiro, na
+    ordem salva. A aba ENTREGUE mostra por padrão só os últimos
+    ``_LOGISTICA_JANELA_ENTREGUES_DIAS`` dias (``?dias=N``; ``0`` = tudo).
+    """
+    filtro_status = request.args.get('status', 'PENDENTE')
+    if filtro_status not in ('PENDENTE', 'ENTREGUE'):
+        filtro_status = 'PENDENTE'
+
+    page = max(1, request.args.get('page', 1, type=int) or 1)
+    per_page = _LOGISTICA_POR_PAGINA
+    is_ajax = (
+        request.args.get('ajax') == '1'
+        or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    )
+
+    hoje = get_hoje_brasil()
+    janela_dias = None
+    data_minima = None
+    if filtro_status == 'ENTREGUE':
+        janela_dias = request.args.get('dias', _LOGISTICA_JANELA_ENTREGUES_DIAS, type=int)
+        if janela_dias is None or janela_dias <= 0:
+            janela_dias = 0
+        else:
+            data_minima = hoje - timedelta(days=janela_dias)
+
+    # Pedidos fixados pela ordem customizada (sessão) ocupam o topo.
+    fixados = _pedidos_fixados_logistica(
+        filtro_status, data_minima, session.get('logistica_ordem') or [],
+    )
     start_idx = (page - 1) * per_page
     end_idx = start_idx + per_page
-    entregas = pedidos_agrupados[start_idx:end_idx]
-    has_next = end_idx < total_pedidos
+    entregas = fixados[start_idx:end_idx]
+
+    # Restante da página: demais pedidos, mais recentes primeiro.
+    restante = per_page - len(entregas)
+    grupos = _grupos_logistica(filtro_status, data_minima)
+    ids_fixados = [p['ids'][0] for p in fixados]
+    if ids_fixados:
+        grupos = grupos.having(func.min(Venda.id).notin_(ids_fixados))
+    linhas = (
+        grupos
+        .order_by(Venda.data_venda.desc(), func.min(Venda.id).desc())
+        .offset(max(0, start_idx - len(fixados)))
+        .limit(restante + 1)
+        .all()
+    )
+    has_next = len(fixados) > end_idx or len(linhas) > restante
+    linhas = linhas[:restante]
+    if linhas:
+        carregados = _carregar_pedidos_logistica(
+            filtro_status, data_minima, [(r.cliente_id, r.data_venda) for r in linhas],
+        )
+        entregas += [carregados[r.min_id] for r in linhas if r.min_id in carregados]
 
     # Volume a carregar: soma de quantidades ainda PENDENTES (sempre, independente da aba).
-    if filtro_status == 'PENDENTE':
-        total_caixas_pendentes = sum(int(getattr(v, 'quantidade_venda', 0) or 0) for v in vendas)
-    else:
-        total_caixas_pendentes = int(
-            query_tenant(Venda)
-            .with_entities(func.coalesce(func.sum(Venda.quantidade_venda), 0))
-            .filter(Venda.status_entrega == 'PENDENTE')
-            .scalar()
-            or 0
-        )
+    total_caixas_pendentes = int(
+        query_tenant(Venda)
+        .with_entities(func.coalesce(func.sum(Venda.quantidade_venda), 0))
+        .filter(Venda.status_entrega == 'PENDENTE')
+        .scalar()
+        or 0
+    )
 
     if is_ajax:
         return jsonify({
@@ -1975,11 +2100,11 @@ def logistica():
             'has_next': has_next,
             'page': page,
             'status': filtro_status,
+            'dias': janela_dias,
             'total_caixas_pendentes': total_caixas_pendentes,
         })
 
     # Resumo da semana: entregas concluídas de segunda a domingo (ordem crescente).
-    hoje = get_hoje_brasil()
     inicio_semana = hoje - timedelta(days=hoje.weekday())
     fim_semana = inicio_semana + timedelta(days=6)
 
@@ -2005,19 +2130,11 @@ def logistica():
         if not cliente:
             continue
 
-        cnpj_cliente = (cliente.cnpj or '').strip()
-        is_consumidor_final = cnpj_cliente in ('0', '00000000000000', '')
-        data_venda_normalizada = v.data_venda.date() if hasattr(v.data_venda, 'date') else v.data_venda
-        if is_consumidor_final:
-            pedido_key = (v.cliente_id, data_venda_normalizada)
-        else:
-            nf_normalizada = str(v.nf).strip() if v.nf else ''
-            pedido_key = (v.cliente_id, nf_normalizada, data_venda_normalizada)
-
+        pedido_key = _chave_pedido_logistica(v)
         if pedido_key not in semana_dict:
             semana_dict[pedido_key] = {
                 'data': _formatar_data_com_dia_semana(v.data_venda),
-                'data_ordenacao': data_venda_normalizada,
+                'data_ordenacao': pedido_key[-1],
                 'cliente_nome': cliente.nome_cliente or 'Sem Nome',
                 'produtos': [],
                 'qtd_itens': 0,
@@ -2039,6 +2156,7 @@ def logistica():
         filtro_status=filtro_status,
         has_next_logistica=has_next,
         total_caixas_pendentes=total_caixas_pendentes,
+        janela_dias=janela_dias,
         entregues_semana=entregues_semana,
         total_semana=total_semana,
         inicio_semana=inicio_semana,
@@ -2301,7 +2419,7 @@ def nova_venda():
         # --- INTEGRAÇÃO COM CAIXA (PILOTO AUTOMÁTICO V4) ---
         if venda and tipo_operacao != 'PERDA' and str(venda.situacao or '').strip().upper() in ('PAGO', 'CONCLUÍDO'):
             lancamentos_existentes = query_tenant(LancamentoCaixa).filter(
-                LancamentoCaixa.descricao.like(f"Venda #{venda.id} -%")
+                LancamentoCaixa.venda_id == venda.id
             ).all()
             if not lancamentos_existentes:
                 cliente = query_tenant(Cliente).filter_by(id=venda.cliente_id).first()
@@ -2928,7 +3046,7 @@ def editar_venda(id):
             vendas_do_pedido = vendas_do_pedido_alvo
             venda_id_busca = vendas_do_pedido[0].id if vendas_do_pedido else venda.id
             lancamentos_existentes = query_tenant(LancamentoCaixa).filter(
-                LancamentoCaixa.descricao.like(f"Venda #{venda_id_busca} -%")
+                LancamentoCaixa.venda_id == venda_id_busca
             ).all()
             status_atual = str(venda.situacao).strip().upper() if venda.situacao else ''
             status_pago = status_atual in ('PAGO', 'CONCLUÍDO', 'PARCIAL')
@@ -3191,7 +3309,7 @@ def atualizar_status_venda(id_venda):
             v.valor_pago = Decimal('0.00')
     # --- INTEGRAÇÃO COM CAIXA (PILOTO AUTOMÁTICO V4) ---
     lancamentos_existentes = query_tenant(LancamentoCaixa).filter(
-        LancamentoCaixa.descricao.like(f"Venda #{venda.id} -%")
+        LancamentoCaixa.venda_id == venda.id
     ).all()
     eh_bacalhau = any(
         (getattr(vv, 'produto', None) is not None) and
@@ -3278,7 +3396,7 @@ def atualizar_situacao_rapida(id):
     (sem iterar pelos itens do pedido — esta rota é por venda individual).
 
     Mudança PAGO → PENDENTE: deleta o(s) ``LancamentoCaixa`` associado(s)
-    pela descrição ``Venda #N -%`` e zera ``valor_pago``.
+    (``venda_id``) e zera ``valor_pago``.
     """
     try:
         data = request.get_json(silent=True) or {}
@@ -3311,12 +3429,12 @@ def atualizar_situacao_rapida(id):
         elif nova_situacao == 'PAGO':
             valor_total = Decimal(str(venda.calcular_total() or Decimal('0.00')))
             venda.valor_pago = valor_total
-            # Cria lançamento no caixa só se ainda não existir um casando
-            # ``Venda #N -%``. Evita duplicar quando o usuário alterna o
+            # Cria lançamento no caixa só se ainda não existir um vinculado
+            # à venda (``venda_id``). Evita duplicar quando o usuário alterna o
             # select PAGO → PAGO (idempotência defensiva).
             if valor_total > Decimal('0.00') and situacao_atual != 'PAGO':
                 lancamentos_existentes = query_tenant(LancamentoCaixa).filter(
-                    LancamentoCaixa.descricao.like(f"Venda #{venda.id} -%")
+                    LancamentoCaixa.venda_id == venda.id
                 ).all()
                 if not lancamentos_existentes:
                     cliente = query_tenant(Cliente).filter_by(id=venda.cliente_id).first()
@@ -3356,7 +3474,7 @@ def atualizar_situacao_rapida(id):
             # Reabre a cobrança: deleta lançamentos da venda e zera valor_pago.
             if situacao_atual in ('PAGO', 'PARCIAL'):
                 lancamentos_existentes = query_tenant(LancamentoCaixa).filter(
-                    LancamentoCaixa.descricao.like(f"Venda #{venda.id} -%")
+                    LancamentoCaixa.venda_id == venda.id
                 ).all()
                 for lanc in lancamentos_existentes:
                     db.session.delete(lanc)
@@ -3871,7 +3989,12 @@ def vendas_deletar_massa():
 
 @vendas_bp.route('/vendas/importar', methods=['GET', 'POST'])
 def importar_vendas():
-    """Importação de vendas via CSV/TSV/XLSX. Apenas admin do tenant."""
+    """Importação de vendas via CSV/TSV/XLSX. Apenas admin do tenant.
+
+    O POST só salva o arquivo e cria um ``JobImportacao``; o processamento
+    roda em background (``processar_importacao_vendas``) e o usuário
+    acompanha em ``/importacoes/<id>``.
+    """
     @admin_required
     def _impl():
         if request.method == 'POST':
@@ -3880,174 +4003,43 @@ def importar_vendas():
             arquivo = request.files['arquivo']
             if arquivo.filename == '':
                 return render_template('vendas/importar.html', erros_detalhados=['Nenhum arquivo selecionado. Escolha um arquivo e tente novamente.'], sucesso=0, erros=1)
-            filepath = None
             try:
-                filename = secure_filename(arquivo.filename)
-                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                arquivo.save(filepath)
-                is_raw = False
-                if filename.endswith('.csv'):
-                    df, is_raw = _load_csv_vendas_flexible(filepath)
-                    if df is None:
-                        return render_template('vendas/importar.html', erros_detalhados=['O arquivo CSV/TSV está vazio ou não pôde ser lido.'], sucesso=0, erros=1)
-                else:
-                    df = pd.read_excel(filepath)
-                if not is_raw:
-                    df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
-                vendas_novas = 0
-                vendas_ignoradas = 0
-                erros = 0
-                erros_detalhados = []
-                _produtos_por_nome_normalizado = {
-                    _normalizar_nome_busca(p.nome_produto): p
-                    for p in query_tenant(Produto).limit(5000).all()
-                }
-                first_iter = True
-                for idx, row in df.iterrows():
-                    if first_iter:
-                        first_iter = False
-                    linha_num = (idx + 1) if is_raw else (idx + 2)
-                    nome_cliente = _strip_quotes(row.get('cliente', row.get('nome_cliente', '')))
-                    nome_produto = _strip_quotes(row.get('produto', row.get('nome_produto', '')))
-                    contexto = f"{nome_cliente or '?'} / {nome_produto or '?'}"[:50]
-                    try:
-                        cnpj_cliente = _strip_quotes(row.get('cnpj', '')) or None
-                        cliente = None
-                        if cnpj_cliente:
-                            cliente = query_tenant(Cliente).filter_by(cnpj=cnpj_cliente).first()
-                        if not cliente and nome_cliente:
-                            cliente = query_tenant(Cliente).filter(func.lower(Cliente.nome_cliente) == nome_cliente.lower()).first()
-                        if not cliente:
-                            erros_detalhados.append(_msg_linha(linha_num, nome_cliente or 'vazio', "O cliente não foi encontrado. Verifique se está cadastrado com esse nome exato (ou use o CNPJ)", True))
-                            erros += 1
-                            continue
-                        if not nome_produto:
-                            erros_detalhados.append(_msg_linha(linha_num, contexto, "O campo 'produto' (ou 'nome_produto') está vazio", True))
-                            erros += 1
-                            continue
-                        nome_produto_clean = _normalizar_nome_busca(nome_produto)
-                        produto_cache = _produtos_por_nome_normalizado.get(nome_produto_clean)
-                        if not produto_cache:
-                            erros_detalhados.append(_msg_linha(linha_num, nome_produto, "O produto não foi encontrado. Verifique se está cadastrado (o nome é comparado ignorando espaços extras e maiúsculas/minúsculas)", True))
-                            erros += 1
-                            continue
-                        qtd_raw = row.get('quantidade', row.get('quantidade_venda', row.get('qtd', 0)))
-                        quantidade_venda = _parse_quantidade(qtd_raw)
-                        if quantidade_venda is None or quantidade_venda <= 0:
-                            erros_detalhados.append(_msg_linha(linha_num, contexto, f"A quantidade está vazia ou inválida ({qtd_raw}). Use um número inteiro (ex: 5)", True))
-                            erros += 1
-                            continue
-                        produto = _produto_com_lock(produto_cache.id)
-                        if produto.estoque_atual < quantidade_venda:
-                            erros_detalhados.append(_msg_linha(linha_num, nome_produto, f"Estoque insuficiente. Disponível: {produto.estoque_atual} unidades, solicitado: {quantidade_venda}. Ajuste a quantidade ou o estoque", True))
-                            erros += 1
-                            continue
-                        preco_raw = row.get('preco_venda', row.get('preco', 0))
-                        preco_venda = _parse_preco(preco_raw)
-                        if preco_venda is None:
-                            txt = f"O preço '{preco_raw}' não pôde ser convertido. Use formato brasileiro (ex: 143,00 ou -120,00 para perdas) ou use ponto como decimal" if preco_raw and str(preco_raw).strip() else "O campo 'preco_venda' (ou 'preco') está vazio"
-                            erros_detalhados.append(_msg_linha(linha_num, contexto, txt, True))
-                            erros += 1
-                            continue
-                        if preco_venda < 0:
-                            preco_venda = 0.0
-                        data_raw = row.get('data_venda', row.get('data', ''))
-                        data_venda, raw_used = _parse_data_flex(data_raw)
-                        if raw_used and raw_used.strip() and data_venda is None:
-                            erros_detalhados.append(_msg_linha(linha_num, contexto, f"O formato da data '{raw_used}' é inválido. Use dd/mm/aaaa ou dd/mm/yy (ex: 01/01/2026 ou 01/01/26)", True))
-                            erros += 1
-                            continue
-                        if data_venda is None:
-                            data_venda = date.today()
-                        nf_raw = _strip_quotes(row.get('nf', row.get('nota_fiscal', '')))
-                        nf_val = (nf_raw or '').strip()
-                        nf_sn_zero = (
-                            nf_val.upper() in ('S/N', '0', '0.0') or nf_val == '' or
-                            (nf_val.replace('.', '').replace(',', '').strip() == '0')
-                        )
-                        base_dup = query_tenant(Venda).filter(
-                            Venda.cliente_id == cliente.id,
-                            Venda.produto_id == produto_cache.id,
-                            Venda.data_venda == data_venda,
-                        )
-                        if nf_sn_zero:
-                            base_dup = base_dup.filter(
-                                or_(
-                                    Venda.nf.is_(None),
-                                    Venda.nf == '',
-                                    Venda.nf == '0',
-                                    Venda.nf == '0.0',
-                                    func.lower(Venda.nf) == 's/n',
-                                )
-                            )
-                            base_dup = base_dup.filter(
-                                Venda.preco_venda == Decimal(str(preco_venda)),
-                                Venda.quantidade_venda == quantidade_venda,
-                            )
-                        else:
-                            base_dup = base_dup.filter(
-                                Venda.nf == nf_val,
-                                Venda.preco_venda == Decimal(str(preco_venda)),
-                                Venda.quantidade_venda == quantidade_venda,
-                            )
-                        if base_dup.first():
-                            vendas_ignoradas += 1
-                            continue
-                        empresa_raw = row.get('empresa', row.get('empresa_faturadora', ''))
-                        empresa_val = _strip_quotes(empresa_raw).upper().strip() if empresa_raw else ''
-                        if empresa_val not in ('PATY', 'DESTAK', 'NENHUM'):
-                            empresa_val = 'DESTAK'
-
-                        situacao_crua = str(row.get('situacao', row.get('situação', row.get('status', 'PENDENTE')))).strip().upper()
-                        situacao_crua = _strip_quotes(situacao_crua) if situacao_crua else ''
-                        if 'PAGO' in situacao_crua:
-                            situacao_val = 'PAGO'
-                        elif 'PEND' in situacao_crua:
-                            situacao_val = 'PENDENTE'
-                        else:
-                            situacao_val = 'PENDENTE'
-                        forma_pagamento_raw = _strip_quotes(row.get('forma_pagamento', row.get('forma', '')))
-                        forma_pagamento_val = (forma_pagamento_raw or '').strip() or None
-                        venda = Venda(
-                            cliente_id=cliente.id,
-                            produto_id=produto.id,
-                            nf=nf_val if nf_val else None,
-                            preco_venda=Decimal(str(preco_venda)),
-                            quantidade_venda=quantidade_venda,
-                            data_venda=data_venda,
-                            empresa_faturadora=empresa_val,
-                            situacao=situacao_val,
-                            forma_pagamento=forma_pagamento_val,
-                            empresa_id=empresa_id_atual(),
-                        )
-                        db.session.add(venda)
-                        produto.estoque_atual -= quantidade_venda
-                        db.session.commit()
-                        vendas_novas += 1
-                    except Exception as e:
-                        db.session.rollback()
-                        erros_detalhados.append(_msg_linha(linha_num, contexto, f"Erro inesperado: {str(e)}", True))
-                        erros += 1
-                if filepath and os.path.exists(filepath):
-                    os.remove(filepath)
-                if erros > 0:
-                    return render_template('vendas/importar.html', erros_detalhados=erros_detalhados, sucesso=vendas_novas, erros=erros, ignorados=vendas_ignoradas)
-                if vendas_novas > 0 or vendas_ignoradas > 0:
-                    mensagem = f'🎉 Tudo pronto! Salvamos {vendas_novas} vendas novas no sistema.'
-                    if vendas_ignoradas > 0:
-                        mensagem += f' Ah, e encontramos {vendas_ignoradas} vendas que já estavam cadastradas e pulamos elas para não duplicar nada! 😉'
-                    flash(mensagem, 'success')
-                else:
-                    flash('A planilha estava vazia ou não encontramos dados válidos.', 'warning')
-                return redirect(url_for('vendas.listar_vendas'))
+                job = criar_job_importacao('vendas', arquivo, empresa_id=empresa_id_atual(), usuario_id=current_user.id)
+                enfileirar_job_importacao(job)
             except Exception as e:
                 db.session.rollback()
-                if filepath and os.path.exists(filepath):
-                    try:
-                        os.remove(filepath)
-                    except Exception:
-                        pass
                 return render_template('vendas/importar.html', erros_detalhados=[f'Erro ao processar o arquivo: {str(e)}'], sucesso=0, erros=1)
+            return redirect(url_for('importacoes.acompanhar_importacao', job_id=job.id))
         return render_template('vendas/importar.html')
 
     return _impl()
+
+
+def processar_importacao_vendas(caminho, nome_arquivo, *, empresa_id, usuario_id=None, progresso=None):
+    """Importador de vendas executado pelo job (sem ``current_user``).
+
+    Mesmo contrato de ``services.importacao_jobs``: devolve contadores,
+    ``erros_detalhados`` e as ``mensagens`` de flash da importação.
+    """
+    is_raw = False
+    if nome_arquivo.endswith('.csv'):
+        df, is_raw = _load_csv_vendas_flexible(caminho)
+        if df is None:
+            return {'sucesso': 0, 'erros': 1, 'ignorados': 0, 'erros_detalhados': ['O arquivo CSV/TSV está vazio ou não pôde ser lido.'], 'mensagens': []}
+    else:
+        df = pd.read_excel(caminho)
+    if not is_raw:
+        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
+    resultado = importar_vendas_dataframe(df, is_raw=is_raw, empresa_id=empresa_id, progresso=progresso)
+    vendas_novas = resultado['sucesso']
+    vendas_ignoradas = resultado['ignorados']
+    mensagens = []
+    if vendas_novas > 0 or vendas_ignoradas > 0:
+        mensagem = f'🎉 Tudo pronto! Salvamos {vendas_novas} vendas novas no sistema.'
+        if vendas_ignoradas > 0:
+            mensagem += f' Ah, e encontramos {vendas_ignoradas} vendas que já estavam cadastradas e pulamos elas para não duplicar nada! 😉'
+        mensagens.append(('success', mensagem))
+    else:
+        mensagens.append(('warning', 'A planilha estava vazia ou não encontramos dados válidos.'))
+    resultado['mensagens'] = mensagens
+    return resultado
@@ -0,0 +1,123 @@
+"""Tempo e acerto das heurísticas de campo sobre o corpus de textos.
+
+Uso:
+
+    python scripts_dev/benchmark_campos_texto.py [repeticoes]
+    python scripts_dev/benchmark_campos_texto.py --gravar
+
+Lê os textos anonimizados de ``scripts_dev/corpus_extracao/`` (o que o
+pdfplumber devolve de boletos Bradesco/Itaú/BB/Sicoob, DANFEs de venda,
+bonificação, transferência e um comprovante que não é nem um nem outro)
+e roda cada heurística de ``services/extracao_pdf.py``: classificação,
+bonificação, CNPJ, NF, razão social, vencimento, valor e DESTAK.
+
+Para cada campo mostra o tempo médio por documento (µs) e o acerto
+contra ``corpus_extracao/esperado.json`` — o comportamento gravado das
+heurísticas. Na linha ``documento`` estão todos os campos sobre o mesmo
+texto, como numa análise de verdade. Sai com código 1 se algum campo
+divergir do gravado.
+
+``--gravar`` regrava ``esperado.json`` com o resultado atual: use só
+quando a mudança de comportamento for intencional (e revise o diff).
+
+Não acessa banco nem rede.
+"""
+import glob
+import json
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import extracao_pdf as ex  # noqa: E402
+
+PASTA_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus_extracao')
+ARQUIVO_ESPERADO = os.path.join(PASTA_CORPUS, 'esperado.json')
+REPETICOES_PADRAO = 300
+
+CAMPOS = {
+    'classificacao': ex._classificar_pdf,
+    'bonificacao': ex._detectar_bonificacao,
+    'cnpj': ex._extrair_cnpj,
+    'numero_nf': ex._extrair_numero_nf,
+    'razao_social': ex._extrair_razao_social,
+    'data_vencimento': ex._extrair_data_vencimento,
+    'valor_boleto': ex._extrair_valor_boleto,
+    'empresa_destak': ex._detectar_empresa_destak,
+}
+
+
+def _corpus():
+    textos = {}
+    for caminho in sorted(glob.glob(os.path.join(PASTA_CORPUS, '*.txt'))):
+        with open(caminho, encoding='utf-8') as f:
+            textos[os.path.basename(caminho)] = f.read()
+    return textos
+
+
+def _json(valor):
+    return valor.isoformat() if isinstance(valor, date) else valor
+
+
+def _extrair(texto):
+    return {campo: _json(funcao(texto)) for campo, funcao in CAMPOS.items()}
+
+
+def _esquecer_normalizacao():
+    # Cada documento paga a própria normalização, como na extração real.
+    limpar = getattr(ex, 'limpar_cache_normalizacao', None)
+    if limpar:
+        limpar()
+
+
+def _cronometrar(textos, repeticoes, funcoes):
+    total = 0.0
+    for _ in range(repeticoes):
+        for texto in textos:
+            _esquecer_normalizacao()
+            inicio = time.perf_counter()
+            for funcao in funcoes:
+                funcao(texto)
+            total += time.perf_counter() - inicio
+    return total / (repeticoes * len(textos)) * 1e6
+
+
+def main():
+    argumentos = sys.argv[1:]
+    corpus = _corpus()
+    atual = {nome: _extrair(texto) for nome, texto in corpus.items()}
+    if '--gravar' in argumentos:
+        with open(ARQUIVO_ESPERADO, 'w', encoding='utf-8') as f:
+            json.dump(atual, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'{ARQUIVO_ESPERADO}: {len(atual)} textos gravados.')
+        return
+
+    repeticoes = int(argumentos[0]) if argumentos else REPETICOES_PADRAO
+    with open(ARQUIVO_ESPERADO, encoding='utf-8') as f:
+        esperado = json.load(f)
+    textos = list(corpus.values())
+    divergencias = []
+    print(f'{len(textos)} textos x {repeticoes} repetições')
+    print(f"{'campo':<16} {'µs/doc':>9} {'acerto':>8}")
+    for campo, funcao in CAMPOS.items():
+        iguais = 0
+        for nome in corpus:
+            if atual[nome][campo] == esperado.get(nome, {}).get(campo):
+                iguais += 1
+            else:
+                divergencias.append((nome, campo, atual[nome][campo], esperado.get(nome, {}).get(campo)))
+        micros = _cronometrar(textos, repeticoes, [funcao])
+        print(f'{campo:<16} {micros:9.1f} {iguais:>4}/{len(corpus):<3}')
+    micros = _cronometrar(textos, repeticoes, list(CAMPOS.values()))
+    print(f"{'documento':<16} {micros:9.1f}")
+    for nome, campo, obtido, gravado in divergencias:
+        print(f'  DIVERGE {nome} {campo}: atual={obtido!r} gravado={gravado!r}')
+    if divergencias:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Benchmark da extração de PDFs em lote (``services/extracao_pdf.py``).
+
+Uso:
+
+    python scripts_dev/benchmark_extracao_pdf.py [qtd ...]
+
+Gera boletos e DANFEs sintéticos (metade de cada) num diretório
+temporário e mede ``extrair_lote`` com 1, 2, 4... workers até o nº de
+CPUs, para lotes de 50 e 200 arquivos por padrão. Confere que o
+resultado paralelo é idêntico ao serial e mostra o tempo por etapa
+(``AnalisePdf.tempos``: abrir, 1ª página, recorte, cada campo).
+
+Não acessa banco nem rede. Os PDFs são montados à mão (texto Helvetica),
+sem depender de biblioteca de geração.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Mede a extração de verdade: com o cache por SHA-256 ligado, só a 1ª rodada parsearia.
+os.environ['EXTRACAO_PDF_CACHE_DIR'] = 'off'
+
+from services.extracao_pdf import TarefaExtracao, extrair_lote, somar_tempos  # noqa: E402
+
+QTDS_PADRAO = (50, 200)
+
+
+def _escapar(texto):
+    return texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _pdf_texto(paginas):
+    """PDF mínimo válido: uma lista de páginas, cada uma uma lista de linhas."""
+    objetos = ['<< /Type /Catalog /Pages 2 0 R >>', None,
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>']
+    kids = []
+    for linhas in paginas:
+        corpo = 'BT /F1 9 Tf 11 TL 40 800 Td ' + ' '.join(
+            f'({_escapar(linha)}) Tj T*' for linha in linhas
+        ) + ' ET'
+        dados = corpo.encode('cp1252')
+        objetos.append(f'<< /Length {len(dados)} >>\nstream\n' + dados.decode('latin-1') + '\nendstream')
+        conteudo = len(objetos)
+        objetos.append(
+            '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {conteudo} 0 R >>'
+        )
+        kids.append(f'{len(objetos)} 0 R')
+    objetos[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'
+
+    saida = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for i, obj in enumerate(objetos, start=1):
+        offsets.append(len(saida))
+        saida += f'{i} 0 obj\n{obj}\nendobj\n'.encode('latin-1')
+    xref = len(saida)
+    saida += f'xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n'.encode()
+    for off in offsets:
+        saida += f'{off:010d} 00000 n \n'.encode()
+    saida += f'trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return bytes(saida)
+
+
+def _cnpj(rnd):
+    d = [rnd.randint(0, 9) for _ in range(12)] + [rnd.randint(0, 9), rnd.randint(0, 9)]
+    s = ''.join(map(str, d))
+    return f'{s[:2]}.{s[2:5]}.{s[5:8]}/{s[8:12]}-{s[12:]}'
+
+
+def _boleto(rnd, n):
+    nf = rnd.randint(10000, 99999)
+    linhas = [
+        'Banco Bradesco S.A. 237-2  Recibo do Pagador',
+        'Beneficiario: PATY COMERCIO DE ALIMENTOS LTDA  CNPJ 03.553.665/0002-00',
+        f'Pagador: CLIENTE SINTETICO {n} LTDA',
+        f'CNPJ/CPF: {_cnpj(rnd)}',
+        f'Numero Documento {nf}/1',
+        f'Vencimento {rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/2026',
+        f'Valor do Documento R$ {rnd.randint(100, 9999)},{rnd.randint(0, 99):02d}',
+    ]
+    linhas += [f'Instrucao {i}: nao receber apos o vencimento, juros de 0,33% ao dia' for i in range(40)]
+    return [linhas]
+
+
+def _danfe(rnd, n):
+    nf = rnd.randint(10000, 99999)
+    pag1 = [
+        'DANFE - Documento Auxiliar da Nota Fiscal Eletronica',
+        f'NF-e Nº {nf:09d} Serie 1',
+        'NATUREZA DA OPERACAO: VENDA DE MERCADORIA',
+        'DESTINATARIO / REMETENTE',
+        f'CLIENTE SINTETICO {n} LTDA {_cnpj(rnd)} 05/01/2026',
+        f'Valor Total da Nota {rnd.randint(100, 9999)},{rnd.randint(0, 99):02d}',
+    ]
+    pag1 += [f'{i:03d} ALHO NACIONAL CX 10KG  UN  10,000  185,00  1.850,00' for i in range(60)]
+    pag2 = [f'{i:03d} ALHO IMPORTADO CX 10KG  UN  5,000  210,00  1.050,00' for i in range(60)]
+    return [pag1, pag2]
+
+
+def _gerar(pasta, qtd, semente=42):
+    rnd = random.Random(semente)
+    tarefas = []
+    for n in range(qtd):
+        boleto = n % 2 == 0
+        caminho = os.path.join(pasta, f'{"boleto" if boleto else "danfe"}_{n:04d}.pdf')
+        with open(caminho, 'wb') as f:
+            f.write(_pdf_texto(_boleto(rnd, n) if boleto else _danfe(rnd, n)))
+        tarefas.append(TarefaExtracao(caminho, 'BOLETO' if boleto else 'NOTA_FISCAL'))
+    return tarefas
+
+
+def _sem_tempos(resultados):
+    return [{k: v for k, v in r.items() if k not in ('segundos', 'tempos')} for r in resultados]
+
+
+def _bench(qtd, niveis):
+    with tempfile.TemporaryDirectory() as pasta:
+        tarefas = _gerar(pasta, qtd)
+        referencia = None
+        base = None
+        for workers in niveis:
+            inicio = time.perf_counter()
+            resultados = extrair_lote(tarefas, max_workers=workers)
+            segundos = time.perf_counter() - inicio
+            if referencia is None:
+                referencia, base = _sem_tempos(resultados), segundos
+                com_nf = sum(1 for r in resultados if (r.get('dados') or {}).get('numero_nf'))
+                etapas = somar_tempos(resultados)
+            elif _sem_tempos(resultados) != referencia:
+                raise SystemExit(f'Divergência com {workers} workers em {qtd} arquivos')
+            print(
+                f"{qtd:>4} PDFs | {workers:>2} workers | {segundos:6.2f} s | "
+                f"{qtd / segundos:6.1f} PDFs/s | {base / segundos:4.2f}x"
+            )
+        print(f"     NF extraída em {com_nf}/{qtd}; resultados idênticos ao serial.")
+        print("     Etapas (serial, s): " + ', '.join(f"{e} {s:.2f}" for e, s in etapas.items()))
+
+
+def main():
+    qtds = [int(a) for a in sys.argv[1:]] or list(QTDS_PADRAO)
+    cpus = os.cpu_count() or 1
+    niveis = sorted({1, cpus} | {w for w in (2, 4, 8, 16) if w < cpus})
+    print(f"CPUs: {cpus}")
+    for qtd in qtds:
+        _bench(qtd, niveis)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark do roteirizador local (``services/roteirizacao.py``).
+
+Uso:
+
+    python scripts_dev/benchmark_roteirizacao.py [repeticoes]
+
+Para 10, 30 e 100 paradas sorteadas num raio de ~50 km do galpão, mede
+o tempo de ``otimizar_rota`` e compara a distância com a rota gulosa
+(vizinho mais próximo) e com a ordem de seleção (aleatória). Para 8
+paradas confere contra a força bruta (rota ótima).
+
+Não acessa banco nem rede. Pode rodar em qualquer ambiente.
+"""
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.roteirizacao import (  # noqa: E402
+    custo_rota, matriz_haversine, otimizar_rota, vizinho_mais_proximo,
+)
+
+GALPAO = (-9.3891, -40.5030)
+TAMANHOS = (10, 30, 100)
+
+
+def _pontos(rnd, n):
+    return [GALPAO] + [
+        (GALPAO[0] + rnd.uniform(-0.45, 0.45), GALPAO[1] + rnd.uniform(-0.45, 0.45))
+        for _ in range(n)
+    ]
+
+
+def _bench(rnd, n, repeticoes):
+    tempos, ganho_nn, ganho_sel = [], [], []
+    for _ in range(repeticoes):
+        coords = _pontos(rnd, n)
+        dist = matriz_haversine(coords)
+        selecao = custo_rota(dist, list(range(n + 1)))
+        guloso = custo_rota(dist, vizinho_mais_proximo(dist))
+        inicio = time.perf_counter()
+        rota = otimizar_rota(coords)
+        tempos.append((time.perf_counter() - inicio) * 1000.0)
+        final = rota['distancia_reta_m'] / 1000.0
+        ganho_nn.append(100.0 * (guloso - final) / guloso)
+        ganho_sel.append(100.0 * (selecao - final) / selecao)
+    print(
+        f"{n:>4} paradas | mediana {statistics.median(tempos):7.1f} ms | "
+        f"máx {max(tempos):7.1f} ms | -{statistics.mean(ganho_nn):4.1f}% vs guloso | "
+        f"-{statistics.mean(ganho_sel):4.1f}% vs ordem de seleção"
+    )
+
+
+def _conferir_otimo(rnd, n=8, repeticoes=20):
+    gaps = []
+    for _ in range(repeticoes):
+        coords = _pontos(rnd, n)
+        dist = matriz_haversine(coords)
+        otimo = min(custo_rota(dist, [0, *p]) for p in itertools.permutations(range(1, n + 1)))
+        obtido = custo_rota(dist, [0, *otimizar_rota(coords)['ordem']])
+        gaps.append(100.0 * (obtido - otimo) / otimo)
+    print(
+        f"{n:>4} paradas | força bruta: gap médio {statistics.mean(gaps):.2f}% | "
+        f"máx {max(gaps):.2f}% | ótimo em {sum(g < 1e-9 for g in gaps)}/{repeticoes}"
+    )
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rnd = random.Random(42)
+    otimizar_rota(_pontos(rnd, 5))  # aquece NumPy
+    for n in TAMANHOS:
+        _bench(rnd, n, repeticoes)
+    _conferir_otimo(rnd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Paridade da linha digitável com as regex de vencimento/valor.
+
+Uso:
+
+    python scripts_dev/paridade_linha_digitavel.py [qtd]
+    python scripts_dev/paridade_linha_digitavel.py caminho/da/pasta_com_pdfs
+
+Sem argumentos (ou com ``qtd``, padrão 200): gera boletos sintéticos com
+linha digitável coerente com o vencimento e o valor impressos — bancos
+variados, vencimentos antes e depois da virada do fator (22/02/2025),
+arrecadação de 48 dígitos, DV adulterado e boleto sem linha — e confere
+que ``AnalisePdf`` (linha digitável primeiro) devolve o mesmo vencimento
+e valor que ``_extrair_data_vencimento``/``_extrair_valor_boleto`` sobre
+o texto recortado. Termina com código 1 se houver divergência. Mostra
+também o tempo de ``vencimento_e_valor_pdf`` contra ``_processar_pdf``.
+
+Com uma pasta: roda a mesma comparação nos PDFs de verdade e lista as
+divergências (ali não há gabarito: cada uma merece um olhar).
+
+Não acessa banco nem rede.
+"""
+import glob
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ['EXTRACAO_PDF_CACHE_DIR'] = 'off'
+
+from benchmark_extracao_pdf import _cnpj, _pdf_texto  # noqa: E402
+from services.extracao_pdf import (  # noqa: E402
+    AnalisePdf, _extrair_data_vencimento, _extrair_valor_boleto, _processar_pdf,
+    vencimento_e_valor_pdf,
+)
+from services.linha_digitavel import _mod10, _mod11_bancario  # noqa: E402
+
+QTD_PADRAO = 200
+_BANCOS = ('237', '341', '001', '104', '033', '756')
+
+
+def _linha_bancaria(rnd, banco, vencimento, valor):
+    fator = (vencimento - date(1997, 10, 7)).days
+    while fator > 9999:
+        fator -= 9000
+    livre = ''.join(str(rnd.randint(0, 9)) for _ in range(25))
+    sem_dv = f'{banco}9{fator:04d}{round(valor * 100):010d}{livre}'
+    codigo = sem_dv[:4] + str(_mod11_bancario(sem_dv)) + sem_dv[4:]
+    campos = [codigo[:4] + codigo[19:24], codigo[24:34], codigo[34:44]]
+    partes = [f'{c[:5]}.{c[5:]}{_mod10(c)}' for c in campos]
+    return ' '.join(partes + [codigo[4], codigo[5:19]])
+
+
+def _linha_arrecadacao(rnd, valor):
+    resto = ''.join(str(rnd.randint(0, 9)) for _ in range(29))
+    sem_dv = f'826{round(valor * 100):011d}{resto}'
+    codigo = sem_dv[:3] + str(_mod10(sem_dv)) + sem_dv[3:]
+    blocos = [codigo[i:i + 11] for i in range(0, 44, 11)]
+    return ' '.join(f'{b}-{_mod10(b)}' for b in blocos)
+
+
+def _adulterar(linha):
+    i = linha.index(' ') + 3
+    return linha[:i] + str((int(linha[i]) + 1) % 10) + linha[i + 1:]
+
+
+def _boleto(rnd, n, caso):
+    vencimento = date(2024, 6, 1) + timedelta(days=rnd.randint(0, 900))
+    valor = rnd.randint(100, 99999) / 100 * rnd.choice((1, 1, 10))
+    linhas_topo = []
+    if caso in ('bancario', 'adulterado'):
+        linha = _linha_bancaria(rnd, rnd.choice(_BANCOS), vencimento, valor)
+        linhas_topo = [f'Recibo do Pagador   {_adulterar(linha) if caso == "adulterado" else linha}']
+    elif caso == 'arrecadacao':
+        linhas_topo = [f'Linha digitavel {_linha_arrecadacao(rnd, valor)}']
+    valor_fmt = f'{valor:,.2f}'.replace(',', '_').replace('.', ',').replace('_', '.')
+    linhas = linhas_topo + [
+        'Banco Sintetico S.A.  Ficha de Compensacao',
+        'Beneficiario: PATY COMERCIO DE ALIMENTOS LTDA  CNPJ 03.553.665/0002-00',
+        f'Pagador: CLIENTE SINTETICO {n} LTDA',
+        f'CNPJ/CPF: {_cnpj(rnd)}',
+        f'Numero Documento {rnd.randint(10000, 99999)}/1',
+        f'Vencimento {vencimento:%d/%m/%Y}',
+        f'Valor do Documento R$ {valor_fmt}',
+    ]
+    linhas += [f'Instrucao {i}: nao receber apos o vencimento' for i in range(30)]
+    return _pdf_texto([linhas])
+
+
+def _comparar(caminho):
+    """(fonte, decodificado, regex) de vencimento e valor de um PDF."""
+    with AnalisePdf(caminho, 'BOLETO') as analise:
+        novo = (analise.data_vencimento, analise.valor_boleto)
+        fonte = 'linha' if analise.linha_digitavel is not None else 'regex'
+        texto = analise.texto_recortado
+    antigo = (_extrair_data_vencimento(texto), _extrair_valor_boleto(texto))
+    return fonte, novo, antigo
+
+
+def _cronometrar(caminhos, funcao):
+    inicio = time.perf_counter()
+    for caminho in caminhos:
+        funcao(caminho)
+    return time.perf_counter() - inicio
+
+
+def _relatorio(caminhos, rotulos=None):
+    divergencias, fontes = [], {}
+    for i, caminho in enumerate(caminhos):
+        fonte, novo, antigo = _comparar(caminho)
+        chave = f'{rotulos[i]}/{fonte}' if rotulos else fonte
+        fontes[chave] = fontes.get(chave, 0) + 1
+        if novo != antigo:
+            divergencias.append((os.path.basename(caminho), novo, antigo))
+    print('Fonte do vencimento/valor: ' + ', '.join(f'{k} {v}' for k, v in sorted(fontes.items())))
+    rapido = _cronometrar(caminhos, vencimento_e_valor_pdf)
+    completo = _cronometrar(caminhos, lambda c: _processar_pdf(c, 'BOLETO'))
+    print(f'vencimento_e_valor_pdf: {rapido:.2f} s | _processar_pdf: {completo:.2f} s | {completo / rapido:.2f}x')
+    for nome, novo, antigo in divergencias:
+        print(f'  DIVERGE {nome}: linha={novo} regex={antigo}')
+    print(f'{len(caminhos) - len(divergencias)}/{len(caminhos)} iguais às regex.')
+    return divergencias
+
+
+def main():
+    argumento = sys.argv[1] if len(sys.argv) > 1 else None
+    if argumento and os.path.isdir(argumento):
+        caminhos = sorted(glob.glob(os.path.join(argumento, '**', '*.pdf'), recursive=True))
+        _relatorio(caminhos)
+        return
+    qtd = int(argumento) if argumento else QTD_PADRAO
+    rnd = random.Random(45)
+    casos = ('bancario', 'bancario', 'bancario', 'arrecadacao', 'adulterado', 'sem_linha')
+    with tempfile.TemporaryDirectory() as pasta:
+        caminhos, rotulos = [], []
+        for n in range(qtd):
+            caso = casos[n % len(casos)]
+            caminho = os.path.join(pasta, f'boleto_{n:04d}.pdf')
+            with open(caminho, 'wb') as f:
+                f.write(_boleto(rnd, n, caso))
+            caminhos.append(caminho)
+            rotulos.append(caso)
+        if _relatorio(caminhos, rotulos):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
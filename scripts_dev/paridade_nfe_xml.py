@@ -0,0 +1,184 @@
+"""Paridade e tempo do XML da NF-e contra a leitura da DANFE em PDF.
+
+Uso:
+
+    python scripts_dev/paridade_nfe_xml.py [qtd]
+    python scripts_dev/paridade_nfe_xml.py caminho/da/pasta
+
+Sem argumentos (ou com ``qtd``, padrão 50): gera pares sintéticos
+``nota.pdf`` + ``nota.xml`` (mesma NF, destinatário, total e natureza
+da operação; 1 em cada 5 de bonificação; itens suficientes para a DANFE
+ter duas páginas) e confere que ``dados_nfe_xml`` devolve o mesmo
+número da NF, CNPJ, valor e bonificação que as heurísticas do PDF
+(``_processar_pdf``/``_detectar_bonificacao``). Termina com código 1 se
+houver divergência. Mostra o tempo do XML contra o do PDF.
+
+Com uma pasta: compara todos os pares ``.pdf``/``.xml`` de mesmo nome
+(sem gabarito: cada divergência merece um olhar — em geral é o PDF que
+errou).
+
+Não acessa banco nem rede.
+"""
+import glob
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ['EXTRACAO_PDF_CACHE_DIR'] = 'off'
+
+from benchmark_extracao_pdf import _cnpj, _pdf_texto  # noqa: E402
+from services.extracao_pdf import (  # noqa: E402
+    _detectar_bonificacao, _extrair_texto_primeira_pagina, _processar_pdf, dados_nfe_xml,
+)
+from services.nfe_xml import ler_nfe_xml  # noqa: E402
+
+QTD_PADRAO = 50
+CAMPOS = ('numero_nf', 'cnpj', 'valor_boleto')
+_ITENS = 120
+
+
+def _valor_br(valor):
+    return f'{valor:,.2f}'.replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def _nota(rnd, n):
+    bonificacao = n % 5 == 4
+    return {
+        'nf': rnd.randint(1000, 999999),
+        'cnpj': _cnpj(rnd),
+        'cliente': f'CLIENTE SINTETICO {n} LTDA',
+        'natureza': 'REMESSA EM BONIFICACAO' if bonificacao else 'VENDA DE MERCADORIA',
+        'emissao': f'2026-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}',
+        'valor': round(rnd.randint(10000, 999999) / 100, 2),
+    }
+
+
+def _danfe(nota):
+    ano, mes, dia = nota['emissao'].split('-')
+    pag1 = [
+        'DANFE - Documento Auxiliar da Nota Fiscal Eletronica',
+        f"NF-e Nº {nota['nf']:09d} Serie 1",
+        f"NATUREZA DA OPERACAO: {nota['natureza']}",
+        'DESTINATARIO / REMETENTE',
+        f"{nota['cliente']} {nota['cnpj']} {dia}/{mes}/{ano}",
+        f"Valor Total da Nota {_valor_br(nota['valor'])}",
+        # Texto sem valores depois do total, como no quadro de transporte da
+        # DANFE: a regex lê até 220 caracteres após o rótulo.
+        'TRANSPORTADOR / VOLUMES TRANSPORTADOS',
+        'RAZAO SOCIAL TRANSPORTADORA SINTETICA DE CARGAS LTDA  FRETE POR CONTA DO DESTINATARIO',
+        'ENDERECO RODOVIA BR 232 KM 10 GALPAO B  MUNICIPIO RECIFE  UF PE',
+        'DADOS DOS PRODUTOS / SERVICOS  CODIGO  DESCRICAO  NCM  CST  CFOP  UNIDADE',
+    ]
+    itens = [f'{i:03d} ALHO NACIONAL CX 10KG  UN  10,000  185,00  1.850,00' for i in range(_ITENS)]
+    return _pdf_texto([pag1 + itens[:50], itens[50:]])
+
+
+def _xml(nota):
+    digitos = ''.join(c for c in nota['cnpj'] if c.isdigit())
+    itens = ''.join(
+        f'<det nItem="{i + 1}"><prod><cProd>{i}</cProd><xProd>ALHO NACIONAL CX 10KG</xProd>'
+        f'<qCom>10.0000</qCom><vUnCom>185.00</vUnCom><vProd>1850.00</vProd></prod>'
+        f'<imposto><ICMS><ICMS00><CST>00</CST></ICMS00></ICMS></imposto></det>'
+        for i in range(_ITENS)
+    )
+    chave = f"2626{digitos[:12]}55001{nota['nf']:09d}1{'0' * 8}1"[:44].ljust(44, '0')
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">'
+        f'<NFe><infNFe Id="NFe{chave}" versao="4.00">'
+        f"<ide><cUF>26</cUF><natOp>{nota['natureza']}</natOp><mod>55</mod><serie>1</serie>"
+        f"<nNF>{nota['nf']}</nNF><dhEmi>{nota['emissao']}T10:00:00-03:00</dhEmi></ide>"
+        '<emit><CNPJ>03553665000200</CNPJ><xNome>PATY COMERCIO DE ALIMENTOS LTDA</xNome>'
+        '<enderEmit><xMun>Recife</xMun></enderEmit></emit>'
+        f"<dest><CNPJ>{digitos}</CNPJ><xNome>{nota['cliente']}</xNome></dest>"
+        f"{itens}<total><ICMSTot><vProd>0.00</vProd><vNF>{nota['valor']:.2f}</vNF></ICMSTot></total>"
+        f"<cobr><dup><nDup>001</nDup><dVenc>{nota['emissao']}</dVenc><vDup>{nota['valor']:.2f}</vDup></dup></cobr>"
+        '</infNFe></NFe>'
+        f'<protNFe><infProt><chNFe>{chave}</chNFe><cStat>100</cStat></infProt></protNFe>'
+        '</nfeProc>'
+    ).encode('utf-8')
+
+
+def _ler_pdf(caminho_pdf):
+    """Campos e bonificação pelo PDF, com o XML irmão fora do caminho."""
+    caminho_xml = os.path.splitext(caminho_pdf)[0] + '.xml'
+    escondido = caminho_xml + '.off'
+    shutil.move(caminho_xml, escondido)
+    try:
+        dados = _processar_pdf(caminho_pdf, 'NOTA_FISCAL') or {}
+        bonificacao = _detectar_bonificacao(_extrair_texto_primeira_pagina(caminho_pdf))
+    finally:
+        shutil.move(escondido, caminho_xml)
+    return dados, bonificacao
+
+
+def _ler_xml(caminho_xml):
+    dados = dados_nfe_xml(caminho_xml) or {}
+    nfe = ler_nfe_xml(caminho_xml)
+    natureza = nfe.natureza_operacao if nfe else ''
+    return dados, _detectar_bonificacao(f'NATUREZA DA OPERACAO: {natureza}')
+
+
+def _relatorio(pares):
+    divergencias = []
+    for caminho_pdf, caminho_xml in pares:
+        dados_pdf, bonif_pdf = _ler_pdf(caminho_pdf)
+        dados_xml, bonif_xml = _ler_xml(caminho_xml)
+        pdf = tuple(dados_pdf.get(c) for c in CAMPOS) + (bonif_pdf,)
+        xml = tuple(dados_xml.get(c) for c in CAMPOS) + (bonif_xml,)
+        if pdf != xml:
+            divergencias.append((os.path.basename(caminho_pdf), xml, pdf))
+
+    inicio = time.perf_counter()
+    for _, caminho_xml in pares:
+        dados_nfe_xml(caminho_xml)
+    tempo_xml = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    for caminho_pdf, _ in pares:
+        _ler_pdf(caminho_pdf)
+    tempo_pdf = time.perf_counter() - inicio
+
+    print(f'Campos: {", ".join(CAMPOS)}, bonificacao')
+    print(
+        f'XML: {tempo_xml:.3f} s | PDF: {tempo_pdf:.2f} s | '
+        f'{tempo_pdf / max(tempo_xml, 1e-9):.0f}x ({len(pares)} notas)'
+    )
+    for nome, xml, pdf in divergencias:
+        print(f'  DIVERGE {nome}: xml={xml} pdf={pdf}')
+    print(f'{len(pares) - len(divergencias)}/{len(pares)} iguais ao PDF.')
+    return divergencias
+
+
+def main():
+    argumento = sys.argv[1] if len(sys.argv) > 1 else None
+    if argumento and os.path.isdir(argumento):
+        pares = []
+        for caminho_pdf in sorted(glob.glob(os.path.join(argumento, '**', '*.pdf'), recursive=True)):
+            caminho_xml = os.path.splitext(caminho_pdf)[0] + '.xml'
+            if os.path.isfile(caminho_xml):
+                pares.append((caminho_pdf, caminho_xml))
+        _relatorio(pares)
+        return
+    qtd = int(argumento) if argumento else QTD_PADRAO
+    rnd = random.Random(46)
+    with tempfile.TemporaryDirectory() as pasta:
+        pares = []
+        for n in range(qtd):
+            nota = _nota(rnd, n)
+            base = os.path.join(pasta, f'nota_{n:04d}')
+            with open(base + '.pdf', 'wb') as f:
+                f.write(_danfe(nota))
+            with open(base + '.xml', 'wb') as f:
+                f.write(_xml(nota))
+            pares.append((base + '.pdf', base + '.xml'))
+        if _relatorio(pares):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""Paridade da normalização vetorizada das planilhas com os helpers escalares.
+
+Uso:
+
+    python scripts_dev/paridade_normalizacao_planilha.py [qtd]
+
+Confere, célula a célula, que ``strip_quotes_serie``, ``parse_preco_serie``,
+``parse_quantidade_serie`` e ``parse_data_serie``
+(``services/normalizacao_planilha.py``) devolvem o mesmo valor — e o mesmo
+tipo — que ``_strip_quotes``, ``_parse_preco``, ``_parse_quantidade`` e
+``_parse_data_flex``. Roda uma lista fixa de casos (dinheiro BR com e sem
+``R$``/milhar/sinal, ``dd/mm/aa``, ``dd/mm/aaaa``, ISO, datas inválidas,
+textos com aspas, vazios, ``nan``/``None``/``NaT``, colunas numéricas e
+datetime do Excel) e ``qtd`` células sorteadas (padrão 20000), com o tempo
+de cada versão. Termina com código 1 se houver divergência fora da
+documentada: ``inf`` como quantidade estoura ``OverflowError`` no helper
+escalar e vira ``None`` na versão vetorizada.
+
+O tempo é só referência: aqui os helpers escalares rodam num laço simples,
+sem o ``df.iterrows()`` que os importadores usavam antes — o ganho dos
+importadores vem de tirar o ``iterrows``, não destas colunas em si.
+
+Os helpers escalares vivem no ``app.py``: o import sobe o app contra um
+SQLite descartável (nunca o banco de ``DATABASE_URL``) e sem o scheduler.
+"""
+import atexit
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_PASTA_BANCO = tempfile.mkdtemp(prefix='paridade_planilha_')
+atexit.register(shutil.rmtree, _PASTA_BANCO, ignore_errors=True)
+_BANCO = os.path.join(_PASTA_BANCO, 'paridade.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + _BANCO
+os.environ['WERKZEUG_RUN_MAIN'] = 'true'
+warnings.simplefilter('ignore')
+logging.disable(logging.WARNING)
+
+import pandas as pd  # noqa: E402
+
+import app  # noqa: E402,F401  (sobe o app antes de services.csv_utils, que o reimporta)
+from services.csv_utils import (  # noqa: E402
+    _strip_quotes, _parse_preco, _parse_quantidade, _parse_data_flex,
+)
+from services.normalizacao_planilha import (  # noqa: E402
+    strip_quotes_serie, parse_preco_serie, parse_quantidade_serie, parse_data_serie,
+)
+
+QTD_PADRAO = 20000
+
+TEXTOS = [
+    'abc', '"abc"', "'abc'", '  "  abc  "  ', '\'"abc"\'', '', '   ', '""', "''",
+    'Alho Roxo 7', 'nan', 'None', 123, 1.5, 0, True, None, float('nan'), pd.NaT, pd.NA,
+]
+PRECOS = [
+    '1.234,56', 'R$ 1.234,56', 'R$1.234,56', 'r$ 12,50', '-R$ 120,00', 'R$ -120,00',
+    '- 120,00', '12.50', '12,5', '1234', '1.234.567,89', '1,234.56', '"12,50"', "'7,00'",
+    ' 12,50 ', '12,', ',5', '.5', '5.', '+5', '--5', 'abc', 'R$', '', '   ', 'nan', 'NaN',
+    'inf', '-inf', '1e3', '0', '0,00', None, float('nan'),
+    12.5, -3.0, 0, 7, float('inf'),
+]
+QUANTIDADES = [
+    '10', ' 10 ', '+10', '-10', '10.9', '-10.9', '10,5', '1.000', '1e3', '0', '',
+    '   ', 'abc', 'nan', '"10"', '9' * 15, '9' * 16, '9' * 20, 'inf', '-inf',
+    None, float('nan'), 10, 10.9, -2.5, 0, 1e16, float('inf'), float('-inf'),
+]
+DATAS = [
+    '05/06/2026', '5/6/2026', '05/06/26', '5/6/26', '05-06-2026', '05.06.2026',
+    '2026-06-05', '2026-06-05 10:30:00', '31/02/2026', '29/02/2024', '29/02/2025',
+    '12/31/2026', '00/01/2026', '01/13/2026', '1/1/0999', '1/1/2300', '1/1/202',
+    '"05/06/2026"', "'05/06/26'", '  05/06/2026  ', 'ontem', '', '   ', 'nan',
+    'NaT', None, float('nan'), pd.NaT, pd.NA, 45000, 45000.5,
+    pd.Timestamp('2026-06-05'), datetime(2026, 6, 5, 10, 30),
+]
+
+
+def _mesmo(a, b):
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b
+
+
+def _quantidade_escalar(valor):
+    try:
+        return _parse_quantidade(valor)
+    except OverflowError:
+        return OverflowError
+
+
+def _colunas(valores):
+    """A lista como coluna ``object`` e, se couber, também com o dtype que o pandas inferiria."""
+    colunas = [pd.Series(valores, dtype=object)]
+    inferida = pd.Series(valores)
+    if inferida.dtype != object:
+        colunas.append(inferida)
+    return colunas
+
+
+def _comparar(nome, valores, vetorizada, escalar):
+    """Divergências ``(valor, escalar, vetorizado)``; a do ``inf`` fica à parte."""
+    divergencias, conhecidas = [], []
+    for serie in _colunas(valores):
+        resultado = vetorizada(serie)
+        if nome == 'data':
+            datas, brutos = resultado
+            obtidos = list(zip(datas, brutos))
+        else:
+            obtidos = list(resultado)
+        for valor, obtido in zip(serie, obtidos):
+            esperado = escalar(valor)
+            if nome == 'data':
+                igual = _mesmo(esperado[0], obtido[0]) and _mesmo(esperado[1], obtido[1])
+            else:
+                igual = _mesmo(esperado, obtido)
+            if igual:
+                continue
+            if nome == 'quantidade' and esperado is OverflowError and obtido is None:
+                conhecidas.append(valor)
+            else:
+                divergencias.append((serie.dtype, valor, esperado, obtido))
+    return divergencias, conhecidas
+
+
+def _sorteados(rnd, qtd):
+    def preco():
+        inteiro = rnd.randint(0, 999999)
+        texto = f'{inteiro:,}'.replace(',', '.') + f',{rnd.randint(0, 99):02d}'
+        return rnd.choice([texto, 'R$ ' + texto, '-R$ ' + texto, f'"{texto}"', f'{inteiro}.{rnd.randint(0, 99)}', ''])
+
+    def quantidade():
+        return rnd.choice([str(rnd.randint(-50, 5000)), f'{rnd.uniform(0, 500):.2f}', f' {rnd.randint(0, 99)} ', 'x', ''])
+
+    def data():
+        dia, mes, ano = rnd.randint(1, 31), rnd.randint(1, 12), rnd.randint(2000, 2035)
+        return rnd.choice([
+            f'{dia:02d}/{mes:02d}/{ano}', f'{dia}/{mes}/{ano % 100:02d}', f'{ano}-{mes:02d}-{dia:02d}',
+            f'{dia:02d}-{mes:02d}-{ano}', f'"{dia:02d}/{mes:02d}/{ano}"', '',
+        ])
+
+    def texto():
+        return rnd.choice(['"', "'", ' ', '']) + rnd.choice(['ALHO', 'Cliente X', '123', '']) + rnd.choice(['"', "'", ' ', ''])
+
+    return {
+        'texto': [texto() for _ in range(qtd)],
+        'preco': [preco() for _ in range(qtd)],
+        'quantidade': [quantidade() for _ in range(qtd)],
+        'data': [data() for _ in range(qtd)],
+    }
+
+
+CASOS = {
+    'texto': (TEXTOS, strip_quotes_serie, _strip_quotes),
+    'preco': (PRECOS, parse_preco_serie, _parse_preco),
+    'quantidade': (QUANTIDADES, parse_quantidade_serie, _quantidade_escalar),
+    'data': (DATAS, parse_data_serie, _parse_data_flex),
+}
+
+
+def main():
+    qtd = int(sys.argv[1]) if len(sys.argv) > 1 else QTD_PADRAO
+    sorteados = _sorteados(random.Random(28), qtd)
+    falhou = False
+    for nome, (fixos, vetorizada, escalar) in CASOS.items():
+        divergencias, conhecidas = _comparar(nome, fixos + sorteados[nome], vetorizada, escalar)
+        # Excel entrega datas como datetime64: a coluna inteira vai pelo helper escalar.
+        if nome == 'data':
+            excel = pd.Series(pd.to_datetime(['2026-06-05', '2026-12-31', None]))
+            d, c = _comparar(nome, list(excel), vetorizada, escalar)
+            divergencias += d
+            conhecidas += c
+        serie = pd.Series(sorteados[nome], dtype=object)
+        inicio = time.perf_counter()
+        for valor in serie:
+            escalar(valor)
+        t_escalar = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        vetorizada(serie)
+        t_vetor = time.perf_counter() - inicio
+        print(
+            f'{nome:<11} {len(fixos) + qtd:>7} células | escalar {t_escalar * 1000:8.1f} ms | '
+            f'vetorizada {t_vetor * 1000:7.1f} ms | {t_escalar / max(t_vetor, 1e-9):5.1f}x | '
+            f'divergências {len(divergencias)}'
+        )
+        for dtype, valor, esperado, obtido in divergencias[:20]:
+            print(f'    [{dtype}] {valor!r}: escalar={esperado!r} vetorizada={obtido!r}')
+        if conhecidas:
+            print(f'    divergência documentada (inf → None em vez de OverflowError): {sorted(map(repr, set(conhecidas)))}')
+        falhou |= bool(divergencias)
+    if falhou:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Totais automáticos do Balanço Rápido, consolidados e em cache por tenant.
+
+Por que existir:
+    ``_calcular_dados_balanco`` (routes/financeiro.py) fazia uma query por
+    número — vendas a receber, cheques em caixa, saldo Pix, estoque,
+    fornecedores — e repetia tudo no ``/api/balanco/dados-atuais`` e de
+    novo no ``/api/balanco/exportar-csv`` logo em seguida.
+
+Como funciona:
+    * ``calcular_totais_balanco()`` monta os quatro totais como subqueries
+      escalares de um único ``SELECT`` (uma ida ao banco) + a lista de
+      fornecedores.
+    * ``totais_balanco()`` guarda o resultado no ``cache`` (Flask-Caching)
+      por tenant + ano ativo. A chave carrega uma versão por tenant, que
+      muda no ``after_commit`` de qualquer transação que gravou
+      ``Venda``, ``LancamentoCaixa``, ``Produto`` ou ``Fornecedor``
+      daquele tenant, e a versão global do dashboard (escritas em lote
+      que não passam pelo flush, como a importação de planilhas, já
+      chamam ``limpar_cache_dashboard``).
+
+A contagem da gaveta é por usuário e continua sendo lida na rota.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime
+
+from sqlalchemy import and_, case, event, func, or_, select
+from sqlalchemy.orm import Session
+
+from extensions import cache
+from models import db, Fornecedor, LancamentoCaixa, Produto, Venda
+
+# Teto de vida da entrada; a invalidação por escrita é que mantém o valor em dia.
+_TIMEOUT_CACHE = 600
+_CHAVE_SESSAO = 'balanco_empresas_alteradas'
+_MODELOS_BALANCO = (Venda, LancamentoCaixa, Produto, Fornecedor)
+
+# Status de cheque que contam como "ainda no caixa".
+_STATUS_CHEQUE_EM_CAIXA = ('', 'NÃO ENVIADO', 'NAO ENVIADO', 'PENDENTE', 'EM CAIXA', 'A COMPENSAR')
+_STATUS_CHEQUE_BAIXADO = ('ENVIADO', 'COMPENSADO', 'COMPENSADA', 'DEPOSITADO')
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Cálculo
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _sub_vendas_pendentes(empresa_id):
+    """A receber: PENDENTE pela face, PARCIAL pelo saldo. Exclui PERDA."""
+    face = Venda.preco_venda * Venda.quantidade_venda
+    saldo = face - func.coalesce(Venda.valor_pago, 0)
+    situacao = func.upper(func.coalesce(Venda.situacao, ''))
+    valor = case(
+        (situacao == 'PENDENTE', face),
+        (and_(situacao == 'PARCIAL', saldo > 0), saldo),
+        else_=0,
+    )
+    return select(func.coalesce(func.sum(valor), 0)).where(
+        Venda.empresa_id == empresa_id,
+        func.upper(func.coalesce(Venda.tipo_operacao, 'VENDA')) != 'PERDA',
+        situacao.in_(['PENDENTE', 'PARCIAL']),
+    ).scalar_subquery()
+
+
+def _sub_cheques_em_caixa(empresa_id):
+    """ENTRADAs em cheque ainda não enviadas/compensadas (todo o livro)."""
+    status = func.upper(func.trim(func.coalesce(LancamentoCaixa.status_envio, '')))
+    return select(func.coalesce(func.sum(LancamentoCaixa.valor), 0)).where(
+        LancamentoCaixa.empresa_id == empresa_id,
+        func.lower(func.coalesce(LancamentoCaixa.forma_pagamento, '')).like('%cheque%'),
+        LancamentoCaixa.tipo == 'ENTRADA',
+        or_(LancamentoCaixa.status_envio.is_(None), status.in_(_STATUS_CHEQUE_EM_CAIXA)),
+        ~status.in_(_STATUS_CHEQUE_BAIXADO),
+    ).scalar_subquery()
+
+
+def _sub_saldo_pix(empresa_id, ano):
+    """Entradas − saídas de Pix/Transferência no setor GERAL do ano."""
+    forma = func.lower(func.coalesce(LancamentoCaixa.forma_pagamento, ''))
+    sinal = case(
+        (LancamentoCaixa.tipo == 'ENTRADA', LancamentoCaixa.valor),
+        else_=-LancamentoCaixa.valor,
+    )
+    return select(func.coalesce(func.sum(sinal), 0)).where(
+        LancamentoCaixa.empresa_id == empresa_id,
+        or_(forma.like('%pix%'), forma.like('%transfer%')),
+        LancamentoCaixa.data >= date(ano, 1, 1),
+        LancamentoCaixa.data < date(ano + 1, 1, 1),
+        LancamentoCaixa.setor == 'GERAL',
+    ).scalar_subquery()
+
+
+def _sub_valor_estoque(empresa_id):
+    """``estoque_atual * preco_custo`` dos produtos com estoque."""
+    valor = func.coalesce(Produto.estoque_atual, 0) * func.coalesce(Produto.preco_custo, 0)
+    return select(func.coalesce(func.sum(valor), 0)).where(
+        Produto.empresa_id == empresa_id,
+        func.coalesce(Produto.estoque_atual, 0) > 0,
+    ).scalar_subquery()
+
+
+def calcular_totais_balanco(empresa_id, ano) -> dict:
+    """Totais automáticos do balanço direto do banco (sem cache)."""
+    ano = int(ano)
+    linha = db.session.execute(select(
+        _sub_vendas_pendentes(empresa_id).label('pendentes'),
+        _sub_cheques_em_caixa(empresa_id).label('cheques'),
+        _sub_saldo_pix(empresa_id, ano).label('pix'),
+        _sub_valor_estoque(empresa_id).label('estoque'),
+    )).one()
+    fornecedores = db.session.execute(
+        select(Fornecedor.id, Fornecedor.nome)
+        .where(Fornecedor.empresa_id == empresa_id)
+        .order_by(Fornecedor.nome.asc())
+    ).all()
+    return {
+        'total_vendas_pendentes': round(float(linha.pendentes or 0), 2),
+        'total_cheques_caixa': round(float(linha.cheques or 0), 2),
+        # Pix "em caixa" como ativo: não reporta negativo no resumo do balanço.
+        'total_pix_caixa': round(max(float(linha.pix or 0), 0.0), 2),
+        'total_valor_estoque': round(float(linha.estoque or 0), 2),
+        'fornecedores': [
+            {'id': int(fid), 'nome': (nome or '').strip() or f'Fornecedor #{fid}'}
+            for fid, nome in fornecedores
+            if fid is not None
+        ],
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Cache por tenant
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _chave_versao(empresa_id) -> str:
+    return f'balanco_cache_version:{empresa_id}'
+
+
+def invalidar_cache_balanco(empresa_id) -> None:
+    """Descarta os totais em cache do tenant (todas as variações de ano)."""
+    try:
+        cache.set(_chave_versao(empresa_id), str(int(datetime.utcnow().timestamp() * 1000)), timeout=0)
+    except Exception:
+        pass  # Cache fora do ar: a entrada expira sozinha em _TIMEOUT_CACHE.
+
+
+def totais_balanco(empresa_id, ano) -> dict:
+    """``calcular_totais_balanco`` servido do cache quando possível."""
+    try:
+        versao = cache.get(_chave_versao(empresa_id)) or '0'
+        versao_dashboard = cache.get('dashboard_cache_version') or '0'
+        chave = f'balanco:v{versao_dashboard}:{versao}:emp:{empresa_id}:ano:{int(ano)}'
+        totais = cache.get(chave)
+    except Exception:
+        chave, totais = None, None
+    if totais is None:
+        totais = calcular_totais_balanco(empresa_id, ano)
+        if chave is not None:
+            try:
+                cache.set(chave, totais, timeout=_TIMEOUT_CACHE)
+            except Exception:
+                pass
+    return totais
+
+
+@event.listens_for(Session, 'after_flush')
+def _anotar_empresas_alteradas(session, flush_context):
+    empresas = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _MODELOS_BALANCO):
+            empresa_id = getattr(obj, 'empresa_id', None)
+            if empresa_id is not None:
+                empresas.add(empresa_id)
+    if empresas:
+        session.info.setdefault(_CHAVE_SESSAO, set()).update(empresas)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_empresas_alteradas(session):
+    for empresa_id in session.info.pop(_CHAVE_SESSAO, ()):
+        invalidar_cache_balanco(empresa_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_empresas_alteradas(session):
+    session.info.pop(_CHAVE_SESSAO, None)
+
+
+__all__ = [
+    'calcular_totais_balanco',
+    'totais_balanco',
+    'invalidar_cache_balanco',
+]
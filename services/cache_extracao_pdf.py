@@ -0,0 +1,174 @@
+"""Cache em disco dos resultados de extração de PDF, endereçado pelo conteúdo.
+
+Por que existir:
+    O mesmo PDF é lido várias vezes: classificação em
+    ``organizar_arquivos``, checagem de bonificação, ``_processar_pdf``
+    completo, de novo em ``_reprocessar_boletos_atualizar_extracao`` e nos
+    endpoints de debug. Cada leitura é pdfplumber do zero.
+
+Como funciona:
+    * A chave é o SHA-256 do arquivo: renomear ou mover não invalida,
+      mudar um byte invalida.
+    * Cada entrada é um JSON em ``<dir>/<sha[:2]>/<sha>.json`` com blocos
+      independentes (textos das páginas, campos detectados), cada um com
+      a versão do extrator que o gerou. Quem lê compara a versão do bloco
+      que precisa — subir a versão dos campos não joga fora os textos.
+    * Gravação atômica (arquivo temporário + ``os.replace``): os workers
+      do pool de extração gravam em paralelo sem corromper entradas.
+    * Sem Flask e sem banco — roda nos processos do pool. O disco é o
+      mesmo (efêmero) de ``documentos_entrada/``; o cache vive tanto
+      quanto os próprios PDFs.
+
+Configuração: ``EXTRACAO_PDF_CACHE_DIR`` (padrão
+``instance/cache_extracao_pdf``; ``0``/``off`` desliga).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+_DIR_PADRAO = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'cache_extracao_pdf',
+)
+_BLOCO_LEITURA = 1024 * 1024
+# (caminho, tamanho, mtime_ns) -> sha256: evita re-hash do mesmo arquivo no processo.
+_memo_sha = {}
+_MEMO_MAX = 4096
+
+
+def diretorio_cache() -> str | None:
+    """Diretório do cache, ou ``None`` se desligado."""
+    valor = os.environ.get('EXTRACAO_PDF_CACHE_DIR')
+    if valor is None:
+        return _DIR_PADRAO
+    valor = valor.strip()
+    if valor.lower() in ('', '0', 'off', 'false'):
+        return None
+    return valor
+
+
+def sha256_arquivo(arquivo) -> str:
+    """SHA-256 de um caminho ou de um arquivo binário aberto (posição preservada)."""
+    if isinstance(arquivo, (str, os.PathLike)):
+        caminho = os.path.abspath(arquivo)
+        st = os.stat(caminho)
+        chave = (caminho, st.st_size, st.st_mtime_ns)
+        sha = _memo_sha.get(chave)
+        if sha is None:
+            h = hashlib.sha256()
+            with open(caminho, 'rb') as f:
+                for bloco in iter(lambda: f.read(_BLOCO_LEITURA), b''):
+                    h.update(bloco)
+            sha = h.hexdigest()
+            if len(_memo_sha) >= _MEMO_MAX:
+                _memo_sha.clear()
+            _memo_sha[chave] = sha
+        return sha
+    posicao = arquivo.tell()
+    arquivo.seek(0)
+    h = hashlib.sha256()
+    for bloco in iter(lambda: arquivo.read(_BLOCO_LEITURA), b''):
+        h.update(bloco)
+    arquivo.seek(posicao)
+    return h.hexdigest()
+
+
+def _caminho_entrada(diretorio, sha):
+    return os.path.join(diretorio, sha[:2], f'{sha}.json')
+
+
+def ler_entrada(sha) -> dict:
+    """Entrada do cache para o ``sha`` (``{}`` se não existe ou está ilegível)."""
+    diretorio = diretorio_cache()
+    if not diretorio or not sha:
+        return {}
+    try:
+        with open(_caminho_entrada(diretorio, sha), encoding='utf-8') as f:
+            entrada = json.load(f)
+        return entrada if isinstance(entrada, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as exc:
+        logger.warning(f"[CACHE-EXTRACAO] entrada ilegível {sha[:12]}: {exc!r}")
+        return {}
+
+
+def atualizar_entrada(sha, **blocos) -> None:
+    """Grava/substitui blocos da entrada do ``sha`` (lê, mescla, grava atômico).
+
+    Falha de disco só gera log: o cache nunca derruba a extração.
+    """
+    diretorio = diretorio_cache()
+    if not diretorio or not sha:
+        return
+    destino = _caminho_entrada(diretorio, sha)
+    try:
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        entrada = ler_entrada(sha)
+        entrada.update(blocos)
+        entrada['sha256'] = sha
+        entrada['atualizado_em'] = int(time.time())
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entrada, f, ensure_ascii=False)
+            os.replace(temporario, destino)
+        except BaseException:
+            try:
+                os.remove(temporario)
+            except OSError:
+                pass
+            raise
+    except OSError as exc:
+        logger.warning(f"[CACHE-EXTRACAO] falha ao gravar {sha[:12]}: {exc!r}")
+
+
+def limpar_cache_extracao(dias=30, valida=None) -> dict:
+    """Remove entradas gravadas há mais de ``dias`` ou que ``valida(entrada)`` rejeita.
+
+    ``valida`` recebe a entrada já lida (ex.: checar versões do extrator).
+    Retorna ``{'mantidas': int, 'removidas': int}``.
+    """
+    diretorio = diretorio_cache()
+    resultado = {'mantidas': 0, 'removidas': 0}
+    if not diretorio or not os.path.isdir(diretorio):
+        return resultado
+    limite = time.time() - dias * 86400 if dias else None
+    for raiz, _, arquivos in os.walk(diretorio):
+        for nome in arquivos:
+            caminho = os.path.join(raiz, nome)
+            try:
+                if nome.endswith('.tmp'):
+                    remover = os.path.getmtime(caminho) < time.time() - 3600
+                else:
+                    remover = limite is not None and os.path.getmtime(caminho) < limite
+                    if not remover and valida is not None:
+                        with open(caminho, encoding='utf-8') as f:
+                            remover = not valida(json.load(f))
+                if remover:
+                    os.remove(caminho)
+                    resultado['removidas'] += 1
+                else:
+                    resultado['mantidas'] += 1
+            except (OSError, ValueError):
+                try:
+                    os.remove(caminho)
+                    resultado['removidas'] += 1
+                except OSError:
+                    pass
+    return resultado
+
+
+__all__ = [
+    'diretorio_cache',
+    'sha256_arquivo',
+    'ler_entrada',
+    'atualizar_entrada',
+    'limpar_cache_extracao',
+]
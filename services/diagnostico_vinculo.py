@@ -0,0 +1,420 @@
+"""Diagnóstico do vínculo pela NF, pré-calculado para a fila de documentos.
+
+Por que existir:
+    ``_listar_documentos_recem_chegados`` (fila "Documentos Recém-Chegados"
+    da página de Vendas) buscava até 300 documentos órfãos, as vendas
+    candidatas de todas as NFs com o cliente, rodava
+    ``_diagnosticar_vinculo_falhou`` documento a documento e ainda gravava
+    o auto-vínculo do cenário 'A' dentro do GET — a cada carregamento da
+    página.
+
+Como funciona:
+    * ``Documento.diagnostico_cenario`` ('A', 'B', 'C' ou ``''`` quando a
+      NF é inválida para vínculo) e ``Documento.diagnostico`` (JSON do
+      dict de ``_diagnosticar_vinculo_falhou`` mais ``vendas_candidatas``,
+      os ids das vendas que casam pela NF) guardam o resultado.
+      ``diagnostico_cenario IS NULL`` = a (re)calcular; documento novo já
+      nasce assim.
+    * Invalidação: o ``before_update`` do Documento zera o diagnóstico
+      quando NF, tipo ou vínculo mudam. ``after_insert``/``after_update``/
+      ``after_delete`` da Venda anotam as NFs (antiga e nova) e o
+      ``after_flush`` zera os órfãos que casam com elas (``filtro_nf``, no
+      índice de ``nf_normalizada``). O ``INSERT`` em lote da importação
+      de vendas chama ``invalidar_diagnosticos_por_nf``.
+    * ``atualizar_diagnosticos()`` recalcula os pendentes por tenant
+      (``vendas_por_nfs``, poucas consultas por lote), grava o vínculo do
+      cenário 'A' e guarda o diagnóstico dos demais. Roda depois do commit
+      que invalidou algo (``agendar_atualizacao_diagnosticos``: RQ ou
+      thread local, como a geocodificação) e no scheduler a cada 5
+      minutos, de rede de segurança.
+    * ``diagnostico_armazenado(doc)`` devolve o dict que a fila exibe, sem
+      consulta: listar a fila é um ``SELECT`` só.
+
+Documentos sem ``empresa_id`` (legado) ficam fora do job: sem tenant, a
+busca pela NF cruzaria as vendas de todas as empresas. A fila, que os
+mostra a qualquer tenant, diagnostica esses poucos na própria request
+(``diagnosticar_sem_gravar``), só contra as vendas do tenant atual e sem
+auto-vínculo.
+"""
+from __future__ import annotations
+
+import json
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect as sa_inspect, or_, update
+from sqlalchemy.orm import Session, joinedload
+
+from models import db, Documento, Venda
+from services.indice_nf import filtro_nf, nf_normalizada_de, vendas_por_nfs
+
+_CHAVE_NFS = 'diagnostico_vinculo_nfs'
+_CHAVE_AGENDAR = 'diagnostico_vinculo_agendar'
+# Documentos por volta do job (um commit por volta).
+_LOTE_DOCUMENTOS = 200
+# NFs por UPDATE de invalidação (cada uma vira um ``OR`` de faixa + ``IN``).
+_LOTE_NFS = 100
+_TIMEOUT_JOB_RQ = 10 * 60
+# Dois ids fixos: um job pode estar rodando enquanto o seguinte espera na
+# fila. Reusar o id de um job já enfileirado o poria duas vezes na fila.
+_JOBS_RQ = ('diagnostico-vinculo', 'diagnostico-vinculo-seguinte')
+
+_executor: ThreadPoolExecutor | None = None
+_agendado = False
+_trava_agendado = threading.Lock()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Leitura (fila)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def diagnostico_armazenado(doc):
+    """Dict do diagnóstico gravado no documento (``None`` se ainda não calculado)."""
+    if doc.diagnostico_cenario is None or not doc.diagnostico:
+        return None
+    try:
+        return json.loads(doc.diagnostico)
+    except (TypeError, ValueError):
+        return None
+
+
+def _vendas_candidatas(diag):
+    if diag.get('venda_id'):
+        return [diag['venda_id']]
+    return [v['id'] for v in diag.get('vendas_multiplas', ())]
+
+
+def _gravar_diagnostico(doc, diag):
+    if diag is None:
+        doc.diagnostico_cenario = None
+        doc.diagnostico = None
+        return
+    diag = dict(diag, vendas_candidatas=_vendas_candidatas(diag))
+    doc.diagnostico_cenario = diag.get('cenario') or ''
+    doc.diagnostico = json.dumps(diag, ensure_ascii=False)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Recálculo (job)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _vincular(doc, venda_id):
+    """Grava o vínculo do cenário 'A' (documento + caminhos do pedido)."""
+    from app import _vendas_do_pedido
+
+    venda = db.session.get(Venda, venda_id)
+    if venda is None:
+        return False
+    doc.venda_id = venda.id
+    if doc.caminho_arquivo:
+        for vv in _vendas_do_pedido(venda):
+            if (doc.tipo or '').upper() == 'BOLETO':
+                vv.caminho_boleto = doc.caminho_arquivo
+                if doc.data_vencimento:
+                    vv.aplicar_vencimento_e_prazo(doc.data_vencimento)
+            else:
+                vv.caminho_nf = doc.caminho_arquivo
+    _gravar_diagnostico(doc, None)
+    return True
+
+
+def _diagnosticos(docs, empresa_id):
+    """``[(doc, diag)]`` contra as vendas de ``empresa_id`` (nunca ``None``: seriam todos os tenants)."""
+    from app import _diagnosticar_vinculo_falhou
+
+    vendas_por_nf_cache = vendas_por_nfs(
+        [d.numero_nf for d in docs if d.numero_nf],
+        empresa_id=empresa_id,
+        opcoes=(joinedload(Venda.cliente),),
+    )
+    return [(doc, _diagnosticar_vinculo_falhou(doc, vendas_por_nf_cache=vendas_por_nf_cache)) for doc in docs]
+
+
+def diagnosticar_sem_gravar(docs, empresa_id) -> dict:
+    """``{doc.id: diag}`` dos ``docs`` contra as vendas de ``empresa_id``, sem gravar nem vincular.
+
+    Para os documentos legados sem ``empresa_id``, que o job não diagnostica.
+    """
+    if not docs or empresa_id is None:
+        return {}
+    return {doc.id: diag for doc, diag in _diagnosticos(docs, empresa_id)}
+
+
+def _diagnosticar_lote(docs):
+    """Diagnostica/vincula ``docs`` (todos com ``empresa_id``) sem commit. Retorna ``(diagnosticados, vinculados)``."""
+    diagnosticados = vinculados = 0
+
+    por_empresa = defaultdict(list)
+    for doc in docs:
+        por_empresa[doc.empresa_id].append(doc)
+    for empresa_id, docs_empresa in por_empresa.items():
+        for doc, diag in _diagnosticos(docs_empresa, empresa_id):
+            if diag and diag.get('cenario') == 'A' and _vincular(doc, diag['venda_id']):
+                vinculados += 1
+                current_app.logger.info(
+                    f"[diagnostico-vinculo] Documento ID {doc.id} "
+                    f"(NF {doc.numero_nf}) vinculado à venda {diag['venda_id']}."
+                )
+                continue
+            _gravar_diagnostico(doc, diag)
+            diagnosticados += 1
+    return diagnosticados, vinculados
+
+
+def atualizar_diagnosticos() -> dict:
+    """Recalcula os órfãos com diagnóstico pendente e vincula o cenário 'A'.
+
+    Um commit a cada ``_LOTE_DOCUMENTOS``; lote que falha é desfeito e
+    fica para a próxima execução. Retorna
+    ``{'diagnosticados': int, 'vinculados': int, 'erros': int}``.
+    """
+    resultado = {'diagnosticados': 0, 'vinculados': 0, 'erros': 0}
+    ultimo_id = 0
+    while True:
+        docs = (
+            Documento.query
+            .filter(
+                Documento.venda_id.is_(None),
+                Documento.empresa_id.isnot(None),
+                Documento.diagnostico_cenario.is_(None),
+                Documento.id > ultimo_id,
+            )
+            .order_by(Documento.id)
+            .limit(_LOTE_DOCUMENTOS)
+            .all()
+        )
+        if not docs:
+            break
+        ultimo_id = docs[-1].id
+        try:
+            diagnosticados, vinculados = _diagnosticar_lote(docs)
+            db.session.commit()
+            resultado['diagnosticados'] += diagnosticados
+            resultado['vinculados'] += vinculados
+        except Exception as exc:
+            db.session.rollback()
+            resultado['erros'] += len(docs)
+            current_app.logger.warning(f"[diagnostico-vinculo] lote até doc {ultimo_id} falhou: {exc}")
+    if resultado['vinculados']:
+        from services.cache_utils import limpar_cache_dashboard
+        limpar_cache_dashboard()
+    if resultado['diagnosticados'] or resultado['vinculados'] or resultado['erros']:
+        current_app.logger.info(
+            f"[diagnostico-vinculo] diagnosticados={resultado['diagnosticados']} "
+            f"vinculados={resultado['vinculados']} erros={resultado['erros']}"
+        )
+    return resultado
+
+
+def executar_atualizacao_diagnosticos():
+    """Ponto de entrada do job (worker RQ, thread local ou scheduler)."""
+    global _agendado
+    if not has_app_context():
+        from app import app as app_obj
+        with app_obj.app_context():
+            return executar_atualizacao_diagnosticos()
+    # Sai de "agendado" já no início: o que for invalidado durante esta
+    # execução agenda uma nova passada em vez de ser ignorado.
+    with _trava_agendado:
+        _agendado = False
+    try:
+        return atualizar_diagnosticos()
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.error(f"[diagnostico-vinculo] falha: {exc}", exc_info=True)
+        return None
+    finally:
+        db.session.remove()
+
+
+def _executor_local() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='diagnostico-vinculo')
+    return _executor
+
+
+def _enfileirar_rq(fila) -> bool:
+    """Põe o job na fila RQ, a menos que já haja um esperando lá.
+
+    O ``_agendado`` é do processo web; o job roda no worker e não o
+    enxerga. Quem evita um job por commit é o status no Redis: um job
+    ``queued`` ainda vai ler o que este commit invalidou. Se os dois ids
+    estão rodando, o scheduler pega o resto.
+    """
+    from rq.exceptions import NoSuchJobError
+    from rq.job import Job, JobStatus
+
+    livre = None
+    for job_id in _JOBS_RQ:
+        try:
+            status = Job.fetch(job_id, connection=fila.connection).get_status()
+        except NoSuchJobError:
+            status = None
+        if status in (JobStatus.QUEUED, JobStatus.DEFERRED, JobStatus.SCHEDULED):
+            return False
+        if status != JobStatus.STARTED and livre is None:
+            livre = job_id
+    if livre is None:
+        return False
+    fila.enqueue(
+        executar_atualizacao_diagnosticos,
+        job_id=livre, job_timeout=_TIMEOUT_JOB_RQ,
+    )
+    return True
+
+
+def agendar_atualizacao_diagnosticos() -> str | None:
+    """Despacha ``executar_atualizacao_diagnosticos``.
+
+    Retorna ``'rq'``, ``'thread'`` ou ``None`` (já agendado ou já na fila
+    RQ). Nunca levanta:
+    roda no ``after_commit``.
+    """
+    global _agendado
+    try:
+        with _trava_agendado:
+            if _agendado:
+                return None
+            _agendado = True
+
+        from app import fila_tarefas
+        from services.importacao_jobs import _rq_disponivel
+        if _rq_disponivel(fila_tarefas):
+            enfileirado = _enfileirar_rq(fila_tarefas)
+            with _trava_agendado:
+                _agendado = False
+            return 'rq' if enfileirado else None
+
+        app_obj = current_app._get_current_object()
+
+        def _rodar():
+            with app_obj.app_context():
+                executar_atualizacao_diagnosticos()
+
+        _executor_local().submit(_rodar)
+        return 'thread'
+    except Exception as exc:
+        with _trava_agendado:
+            _agendado = False
+        try:
+            current_app.logger.warning(f"[diagnostico-vinculo] não agendado: {exc}")
+        except Exception:
+            pass
+        return None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Invalidação
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _invalidar(conexao, nfs):
+    d = Documento.__table__
+    nfs = sorted(nfs)
+    for i in range(0, len(nfs), _LOTE_NFS):
+        lote = nfs[i:i + _LOTE_NFS]
+        conexao.execute(
+            update(d)
+            .where(
+                d.c.venda_id.is_(None),
+                d.c.diagnostico_cenario.isnot(None),
+                or_(*[filtro_nf(d.c.nf_normalizada, n) for n in lote]),
+            )
+            .values(diagnostico_cenario=None, diagnostico=None)
+        )
+
+
+def invalidar_diagnosticos_por_nf(nfs):
+    """Zera o diagnóstico dos órfãos que casam com ``nfs`` (escritas fora do ORM).
+
+    Não faz commit; o recálculo é agendado no commit da sessão.
+    """
+    normalizadas = {n for n in (nf_normalizada_de(nf) for nf in nfs) if n}
+    if not normalizadas:
+        return
+    _invalidar(db.session.connection(), normalizadas)
+    db.session.info[_CHAVE_AGENDAR] = True
+
+
+def _anotar_nfs(target, *nfs):
+    sessao = sa_inspect(target).session
+    if sessao is None:
+        return
+    normalizadas = {n for n in (nf_normalizada_de(nf) for nf in nfs) if n}
+    if normalizadas:
+        sessao.info.setdefault(_CHAVE_NFS, set()).update(normalizadas)
+
+
+def _nf_antiga(target):
+    hist = sa_inspect(target).attrs.nf.history
+    return hist.deleted[0] if hist.deleted else target.nf
+
+
+@event.listens_for(Venda, 'after_insert')
+def _venda_after_insert_diagnostico(mapper, connection, target):
+    _anotar_nfs(target, target.nf)
+
+
+@event.listens_for(Venda, 'after_update')
+def _venda_after_update_diagnostico(mapper, connection, target):
+    # O cliente entra na mensagem e na deduplicação por pedido.
+    estado = sa_inspect(target)
+    if estado.attrs.nf.history.has_changes() or estado.attrs.cliente_id.history.has_changes():
+        _anotar_nfs(target, _nf_antiga(target), target.nf)
+
+
+@event.listens_for(Venda, 'after_delete')
+def _venda_after_delete_diagnostico(mapper, connection, target):
+    _anotar_nfs(target, _nf_antiga(target), target.nf)
+
+
+@event.listens_for(Documento, 'after_insert')
+def _documento_after_insert_diagnostico(mapper, connection, target):
+    if target.venda_id is None:
+        sessao = sa_inspect(target).session
+        if sessao is not None:
+            sessao.info[_CHAVE_AGENDAR] = True
+
+
+@event.listens_for(Documento, 'before_update')
+def _documento_before_update_diagnostico(mapper, connection, target):
+    estado = sa_inspect(target)
+    mudou = any(
+        estado.attrs[c].history.has_changes()
+        for c in ('numero_nf', 'nf_extraida', 'tipo', 'venda_id', 'empresa_id')
+    )
+    if mudou and target.venda_id is None:
+        _gravar_diagnostico(target, None)
+        if estado.session is not None:
+            estado.session.info[_CHAVE_AGENDAR] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidar_nfs_anotadas(session, flush_context):
+    nfs = session.info.pop(_CHAVE_NFS, None)
+    if nfs:
+        _invalidar(session.connection(), nfs)
+        session.info[_CHAVE_AGENDAR] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _agendar_apos_commit(session):
+    if session.info.pop(_CHAVE_AGENDAR, False):
+        agendar_atualizacao_diagnosticos()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_anotacoes(session):
+    session.info.pop(_CHAVE_NFS, None)
+    session.info.pop(_CHAVE_AGENDAR, None)
+
+
+__all__ = [
+    'diagnostico_armazenado',
+    'atualizar_diagnosticos',
+    'executar_atualizacao_diagnosticos',
+    'agendar_atualizacao_diagnosticos',
+    'invalidar_diagnosticos_por_nf',
+]
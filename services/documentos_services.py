@@ -12,12 +12,13 @@ imports nos blueprints.
 * ``_processar_pdf(caminho, tipo)`` — passo de extração isolado (texto
   + OCR fallback). Usado por reprocessamentos administrativos.
 * ``_processar_documentos_pendentes(capturar_logs_memoria=False,
-  user_id_forcado=None)`` — varre a pasta ``uploads/`` e processa todos
-  os arquivos ainda não vinculados. Roda no scheduler diário e na rota
-  manual ``/processar_documentos``.
-* ``_listar_documentos_recem_chegados()`` — usado no dashboard para
-  alimentar a fila visual de pendentes; combina o passo de listar com
-  o processamento incremental.
+  user_id_forcado=None, forcar=False, somente=None)`` — varre
+  ``documentos_entrada/`` e processa os arquivos ainda não vinculados.
+  Roda na rota manual ``/processar_documentos``; com ``somente``, trata
+  só os arquivos indicados (worker de ``services/fila_documentos.py``).
+* ``_listar_documentos_recem_chegados()`` — usado na página de Vendas
+  para alimentar a fila visual de pendentes; uma consulta só, com o
+  diagnóstico pré-calculado por ``services/diagnostico_vinculo.py``.
 * ``_empresa_id_para_documento(venda_id=None, fallback_user_id=None)``
   — resolve o ``empresa_id`` correto para gravar em um documento novo,
   prevenindo vazamento entre tenants quando o upload vem do bot externo.
@@ -25,7 +26,10 @@ imports nos blueprints.
   hardening contra path traversal nas rotas que servem arquivos.
 * ``_reprocessar_boletos_atualizar_extracao()`` /
   ``_reprocessar_vencimentos_vendas()`` — utilitários administrativos
-  para recalcular dados extraídos após mudanças no parser.
+  para recalcular dados extraídos após mudanças no parser (o segundo
+  vive em ``services/manutencao_documentos.py``).
+* ``_documentos_por_caminho(caminhos)`` — ``{caminho_arquivo: Documento}``
+  em consultas ``IN`` por lote (varreduras de pasta).
 """
 
 from app import (
@@ -36,7 +40,10 @@ from app import (
     _empresa_id_para_documento,
     _resolver_caminho_documento_seguro,
     _reprocessar_boletos_atualizar_extracao,
-    _reprocessar_vencimentos_vendas,
+    _documentos_por_caminho,
+)
+from services.manutencao_documentos import (
+    reprocessar_vencimentos_vendas as _reprocessar_vencimentos_vendas,
 )
 
 __all__ = [
@@ -48,4 +55,5 @@ __all__ = [
     '_resolver_caminho_documento_seguro',
     '_reprocessar_boletos_atualizar_extracao',
     '_reprocessar_vencimentos_vendas',
+    '_documentos_por_caminho',
 ]
@@ -0,0 +1,196 @@
+"""Exportação de relatórios em streaming (CSV/XLSX) com memória constante.
+
+Por que existir:
+    ``exportar_relatorio_vendas`` e ``exportar_relatorio_produtos``
+    montavam o CSV inteiro num ``io.StringIO`` depois de um ``.all()``
+    que materializava o ano completo em objetos ORM. Para um tenant
+    movimentado isso multiplicava o RSS do worker e, somado ao tempo de
+    formatação, encostava no ``--timeout 60`` do Gunicorn.
+
+    Aqui ficam as peças reutilizáveis para responder com *chunked
+    transfer*:
+
+    * a query é iterada com ``yield_per`` (no Postgres/psycopg2 isso
+      ativa cursor server-side via ``stream_results``);
+    * o CSV é escrito em blocos de ``LINHAS_POR_BLOCO`` linhas e cada
+      bloco vira um ``yield`` de bytes;
+    * o XLSX usa ``Workbook(write_only=True)`` do openpyxl, que despeja
+      as linhas num XML temporário em disco — a memória não cresce com o
+      número de linhas. O zip final é lido do disco em pedaços.
+
+Uso típico (dentro de uma rota):
+
+    from services.exportacao import (
+        formato_exportacao, resposta_relatorio_streaming,
+    )
+
+    formato = formato_exportacao(request.form.get('formato'))
+    return resposta_relatorio_streaming(
+        _linhas(), cabecalho, nome_base='relatorio_vendas',
+        formato=formato, titulo_aba='Vendas',
+    )
+
+``_linhas()`` é um gerador da rota que devolve listas de células já no
+formato certo (strings BR para CSV; tipos nativos para XLSX).
+"""
+from __future__ import annotations
+
+import csv
+import io
+import tempfile
+from decimal import Decimal
+from typing import Iterable, Iterator
+
+from flask import Response, stream_with_context
+
+# Tamanho do lote de linhas buscadas por round-trip no cursor do banco.
+YIELD_PER = 1000
+# Quantas linhas do CSV acumulamos antes de emitir um chunk HTTP.
+LINHAS_POR_BLOCO = 500
+# Tamanho dos pedaços lidos do arquivo temporário do XLSX.
+_BLOCO_ARQUIVO = 64 * 1024
+
+FORMATOS_EXPORTACAO = ('csv', 'xlsx')
+
+_MIMETYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def formato_exportacao(valor) -> str:
+    """Normaliza o campo ``formato`` do formulário (default ``csv``)."""
+    formato = str(valor or '').strip().lower()
+    return formato if formato in FORMATOS_EXPORTACAO else 'csv'
+
+
+# Início de célula que o Excel interpreta como fórmula.
+_INICIO_FORMULA = ('=', '+', '-', '@')
+
+
+def celula_segura(valor) -> str:
+    """Neutraliza injeção de fórmula (``=``, ``+``, ``-``, ``@``) em texto do CSV.
+
+    Só para o CSV: o ``'`` na frente faz o Excel ler a célula como texto.
+    No XLSX o ``gerar_xlsx`` protege sozinho (célula de texto com
+    ``quotePrefix``), sem o apóstrofo aparecer no valor.
+    """
+    s = '' if valor is None else str(valor)
+    return "'" + s if s[:1] in _INICIO_FORMULA else s
+
+
+def valor_xlsx(valor):
+    """Converte um valor tipado para algo que o openpyxl grava nativamente."""
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return valor
+
+
+def _celula_xlsx(ws, valor):
+    """``valor_xlsx``; texto com cara de fórmula vira célula de texto com ``quotePrefix``.
+
+    Sem isso o openpyxl grava strings iniciadas por ``=`` como fórmula.
+    """
+    if isinstance(valor, str) and valor[:1] in _INICIO_FORMULA:
+        from openpyxl.cell import WriteOnlyCell
+
+        celula = WriteOnlyCell(ws, value=valor)
+        celula.data_type = 's'
+        celula.quotePrefix = True
+        return celula
+    return valor_xlsx(valor)
+
+
+def gerar_csv(cabecalho: list[str], linhas: Iterable[list], delimitador: str = ';') -> Iterator[bytes]:
+    """Gera o CSV (UTF-8 com BOM) em blocos de bytes.
+
+    O BOM e o cabeçalho saem no primeiro chunk, para o navegador iniciar
+    o download imediatamente, antes mesmo da primeira linha do banco.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimitador)
+    buffer.write('\ufeff')
+    writer.writerow(cabecalho)
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate(0)
+
+    pendentes = 0
+    for linha in linhas:
+        writer.writerow(linha)
+        pendentes += 1
+        if pendentes >= LINHAS_POR_BLOCO:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+            pendentes = 0
+    resto = buffer.getvalue()
+    if resto:
+        yield resto.encode('utf-8')
+
+
+def gerar_xlsx(cabecalho: list[str], linhas: Iterable[list], titulo_aba: str = 'Relatorio') -> Iterator[bytes]:
+    """Gera um XLSX em modo *write-only* e devolve o arquivo em pedaços.
+
+    O zip só fica pronto depois da última linha; até lá o openpyxl
+    mantém as linhas num arquivo temporário, então o consumo de memória
+    permanece constante.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=(titulo_aba or 'Relatorio')[:31])
+    ws.append(cabecalho)
+    for linha in linhas:
+        ws.append([_celula_xlsx(ws, v) for v in linha])
+
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            bloco = tmp.read(_BLOCO_ARQUIVO)
+            if not bloco:
+                break
+            yield bloco
+
+
+def resposta_relatorio_streaming(
+    linhas: Iterable[list],
+    cabecalho: list[str],
+    *,
+    nome_base: str,
+    formato: str = 'csv',
+    titulo_aba: str = 'Relatorio',
+) -> Response:
+    """Monta a ``Response`` com corpo em streaming (chunked transfer).
+
+    ``stream_with_context`` mantém o request context (sessão, tenant,
+    ``current_user``) vivo enquanto o gerador consome o cursor.
+    """
+    formato = formato_exportacao(formato)
+    if formato == 'xlsx':
+        corpo = gerar_xlsx(cabecalho, linhas, titulo_aba=titulo_aba)
+    else:
+        corpo = gerar_csv(cabecalho, linhas)
+    nome_arquivo = f'{nome_base}.{formato}'
+    return Response(
+        stream_with_context(corpo),
+        mimetype=_MIMETYPES[formato],
+        headers={
+            'Content-Disposition': f'attachment; filename={nome_arquivo}',
+            'X-Accel-Buffering': 'no',
+        },
+    )
+
+
+__all__ = [
+    'YIELD_PER',
+    'LINHAS_POR_BLOCO',
+    'FORMATOS_EXPORTACAO',
+    'formato_exportacao',
+    'celula_segura',
+    'valor_xlsx',
+    'gerar_csv',
+    'gerar_xlsx',
+    'resposta_relatorio_streaming',
+]
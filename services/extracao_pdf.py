@@ -0,0 +1,1326 @@
+"""Extração de texto e campos de PDFs (boletos e notas fiscais).
+
+Por que existir:
+    A análise de layout do pdfplumber é CPU pura e é onde o tempo vai.
+    Fora do ``app.py``, sem Flask e sem banco, as heurísticas rodam em
+    outros processos; ``app.py`` reimporta os nomes para os
+    ``from app import ...`` existentes.
+
+Como funciona:
+    * ``AnalisePdf`` abre cada arquivo uma vez e calcula, sob demanda, as
+      regiões de página (1ª página, recorte de 75%), a classificação, a
+      bonificação e cada campo (CNPJ, NF, razão social, vencimento,
+      valor), com o tempo de cada etapa em ``tempos``. Textos e campos
+      ficam no cache por SHA-256 (``services/cache_extracao_pdf.py``).
+    * Boleto com linha digitável válida (``services/linha_digitavel.py``):
+      vencimento e valor saem dela; as regex ficam de reserva. Nota
+      fiscal com o XML da NF-e ao lado, ou XML sozinho: os campos saem do
+      XML (``services/nfe_xml.py``), sem abrir o PDF.
+    * ``extrair_lote()`` roda um lote de ``TarefaExtracao`` em processos
+      isolados (``services/sandbox_extracao.py``) ou num
+      ``ProcessPoolExecutor`` e devolve dicts simples, na mesma ordem;
+      a falha sai classificada em ``falha`` (``TIMEOUT``, ``CORROMPIDO``
+      ou ``GRANDE_DEMAIS``). O vínculo com o banco fica no processo pai.
+
+Benchmarks: ``python scripts_dev/benchmark_extracao_pdf.py`` (lote de
+PDFs) e ``python scripts_dev/benchmark_campos_texto.py`` (tempo e acerto
+de cada heurística sobre o corpus de ``scripts_dev/corpus_extracao/``).
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from functools import cached_property, lru_cache
+from typing import NamedTuple
+
+import pandas as pd
+import pdfplumber
+
+from services.cache_extracao_pdf import (
+    atualizar_entrada, diretorio_cache, ler_entrada, limpar_cache_extracao, sha256_arquivo,
+)
+from services.linha_digitavel import localizar_linha_digitavel
+from services.nfe_xml import formatar_documento, ler_nfe_xml, xml_irmao
+
+logger = logging.getLogger(__name__)
+
+# Versões gravadas em cada bloco do cache de extração. Suba VERSAO_TEXTO
+# ao mudar a leitura do pdfplumber (recorte, páginas) e VERSAO_CAMPOS ao
+# mudar qualquer heurística de campo: só o bloco afetado é refeito.
+VERSAO_TEXTO = 1
+VERSAO_CAMPOS = 4
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Normalização do texto (uma vez por texto)
+# ─────────────────────────────────────────────────────────────────────────────
+
+# Acentos dobrados depois do ``upper()``. ``str.replace`` por par fica em C e
+# sai mais barato que ``str.translate`` (que consulta a tabela por caractere).
+_SEM_ACENTO = tuple(zip('ÁÀÂÃÉÊÍÓÔÕÚÜÇ', 'AAAAEEIOOOUUC'))
+
+
+@lru_cache(maxsize=8)
+def _maiusculo(texto):
+    """``texto.upper()``, calculado uma vez e compartilhado pelas heurísticas."""
+    return texto.upper()
+
+
+@lru_cache(maxsize=8)
+def _normalizado(texto):
+    """Texto em maiúsculas e sem acentos (``_SEM_ACENTO``)."""
+    normalizado = _maiusculo(texto)
+    for acento, sem_acento in _SEM_ACENTO:
+        normalizado = normalizado.replace(acento, sem_acento)
+    return normalizado
+
+
+def limpar_cache_normalizacao():
+    """Esvazia o cache de ``_maiusculo``/``_normalizado`` (benchmarks)."""
+    _maiusculo.cache_clear()
+    _normalizado.cache_clear()
+
+
+_RE_DATA_BR = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{2,4})$')
+
+
+def _data_br(texto):
+    """Data ``dd/mm/aa`` ou ``dd/mm/aaaa`` capturada no PDF (``aa`` → 20XX), ou ``None``."""
+    m = _RE_DATA_BR.match(texto)
+    if m:
+        d, mo, y = m.groups()
+        if len(y) == 2:
+            y = '20' + y
+        try:
+            return date(int(y), int(mo), int(d))
+        except ValueError:
+            pass
+    parsed = pd.to_datetime(texto, dayfirst=True, errors='coerce')
+    if pd.isna(parsed):
+        return None
+    return parsed.date()
+
+
+# CNPJs de beneficiários/emissores — ignorar ao capturar CNPJ do pagador
+CNPJ_PATY = '03.553.665/0002-00'
+CNPJ_DESTAK = '30.820.528/0001-78'
+CNPJ_EMISSOR_SERVICO = '14.187.040/0001-07'  # CNPJ de serviço/emissor comum
+CNPJS_EMISSORES = frozenset({
+    CNPJ_PATY,
+    CNPJ_DESTAK,
+    CNPJ_EMISSOR_SERVICO,
+    '14.187.040/0001-07',  # Formato alternativo
+})
+
+
+_RE_CNPJ = re.compile(r'\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}')
+_RE_LINHA_DANFE_NOME_CNPJ_DATA = re.compile(
+    r'^([A-Z0-9\s\&\.\-\*]+?)\s+(\d{2}\.\d{3}\.\d{3}/\d{4}\-\d{2})\s+\d{2}/\d{2}/\d{4}',
+    re.MULTILINE,
+)
+# Prioridades 1 a 5 de ``_extrair_cnpj``, na ordem.
+_PADROES_CNPJ_PAGADOR = tuple(re.compile(p, flags) for p, flags in (
+    # 1: CNPJ após "CNPJ/CPF:" próximo ao Pagador (Itaú/DESTAK)
+    (r'Pagador[:\s]*[\s\S]{0,200}?CNPJ\s*/\s*CPF\s*[:\s]*(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', re.IGNORECASE | re.DOTALL),
+    # 2: CNPJ após "Destinatário" (NF-e)
+    (r'Destinat[áa]rio[:\s]*[\s\S]{0,300}?CNPJ\s*[:\s]*(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', re.IGNORECASE | re.DOTALL),
+    # 3: CNPJ após "Razão Social" seguido de CNPJ (NF-e)
+    (r'Raz[ãa]o\s+Social[:\s]*[\s\S]{0,200}?(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', re.IGNORECASE | re.DOTALL),
+    # 4: CNPJ após "CPF/CNPJ" (Bradesco)
+    (r'CPF/CNPJ\s*([\d\.\-\/]{14,18})', re.IGNORECASE),
+    # 4.1: CNPJ após "CPF / CNPJ" com separação por barra e espaços
+    (r'CPF\s*/\s*CNPJ\s*[\s:]*(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', re.IGNORECASE),
+    # 5: CNPJ após "Nome/Razão Social" (NF-e)
+    (r'Nome\s*/\s*Raz[ãa]o\s+Social[:\s]*[\s\S]{0,200}?(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', re.IGNORECASE | re.DOTALL),
+))
+
+
+def _extrair_linha_danfe_nome_cnpj_data(texto):
+    """DANFE: tenta capturar linha com 'NOME/RAZÃO SOCIAL + CNPJ + DATA DA EMISSÃO'."""
+    if not texto:
+        return None, None
+    m = _RE_LINHA_DANFE_NOME_CNPJ_DATA.search(texto)
+    if not m:
+        return None, None
+    nome = (m.group(1) or '').strip()
+    cnpj = (m.group(2) or '').strip()
+    return nome or None, cnpj or None
+
+
+def _extrair_cnpj(texto, nome_arquivo=None):
+    """Extrai CNPJ do PAGADOR/DESTINATÁRIO. Padrão \\d{2}\\.\\d{3}\\.\\d{3}/\\d{4}-\\d{2}.
+    Ignora PATY, DESTAK e emissores conhecidos. Prioriza CNPJ próximo a 'Pagador', 'Destinatário', 'Razão Social'."""
+    todos = _RE_CNPJ.findall(texto)
+    emissores_encontrados = [c for c in todos if c in CNPJS_EMISSORES]
+    candidatos = [c for c in todos if c not in CNPJS_EMISSORES]
+    
+    # Debug: mostrar todos os CNPJs encontrados
+    if nome_arquivo:
+        logger.debug(f"DEBUG: CNPJs localizados no arquivo {nome_arquivo}: {todos}")
+        if emissores_encontrados:
+            logger.debug(f"DEBUG: CNPJs de emissores ignorados: {emissores_encontrados}")
+        if candidatos:
+            logger.debug(f"DEBUG: CNPJs candidatos (pagador): {candidatos}")
+        elif todos:
+            logger.warning("DEBUG: AVISO - Apenas CNPJs de emissores encontrados. CNPJ do pagador não identificado.")
+    
+    if not candidatos:
+        if todos and nome_arquivo:
+            logger.error(f"DEBUG: Erro - Apenas CNPJ(s) do emissor localizado(s) em {nome_arquivo}: {emissores_encontrados}")
+        return None
+
+    # Prioridade 0 (DANFE): linha "NOME / RAZÃO SOCIAL CNPJ / CPF DATA DA EMISSÃO"
+    _, cnpj_danfe = _extrair_linha_danfe_nome_cnpj_data(texto)
+    if cnpj_danfe and cnpj_danfe not in CNPJS_EMISSORES:
+        return cnpj_danfe
+    
+    # Prioridades 1 a 5: CNPJ ancorado em Pagador / Destinatário / Razão Social / CPF-CNPJ
+    for padrao in _PADROES_CNPJ_PAGADOR:
+        m = padrao.search(texto)
+        if m:
+            cnpj = (m.group(1) or '').strip()
+            if cnpj and cnpj not in CNPJS_EMISSORES:
+                return cnpj
+    
+    # Fallback: usar o último CNPJ válido (geralmente o do pagador vem depois do emissor)
+    # Se houver múltiplos, preferir o que não está nos emissores conhecidos
+    for cnpj in reversed(candidatos):
+        if cnpj not in CNPJS_EMISSORES:
+            return cnpj
+    
+    # Último recurso: primeiro candidato válido
+    return candidatos[0] if candidatos else None
+
+
+BLACKLIST_NF = frozenset({
+    '40901685',
+    '08007701685',
+    '08007280728',
+    '08005700011',
+})
+
+
+# DANFE: blocos explícitos de NF-e (aceita zeros à esquerda e número mais longo).
+_PADROES_NF_DANFE = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'NFe?\s*N[º°]\s*(\d{3,12})',
+    r'N[º°]\s*0*(\d{3,12})',
+    r'NFe?\s*N[º°]\s*S[ée]rie[\s\S]{0,40}?(\d{3,12})',
+    r'N[ºo]\s*([\d\.]+)',
+))
+# (padrão, exige rótulo NF): sem o rótulo, 8 dígitos é telefone/CEP, não NF.
+_PADROES_NF = tuple((re.compile(p, re.IGNORECASE), exige_nf) for p, exige_nf in (
+    (r'N[úu]m\.?\s*do\s*documento\s*[:\s]*(?:NF[-]?)?\s*(\d+)', False),
+    (r'N[úu]mero\s*do\s*documento\s*[:\s]*(?:NF[-]?)?\s*(\d+)', False),
+    (r'N[úu]mero\s+Documento\s*[:\s]*(?:NF[-]?)?\s*(\d+)', False),
+    (r'(?:Numero Documento|N[úu]mero do Documento)\s*(?:.*?\s+)?(\d+)(?:/\d+)?', False),
+    (r'NF-(\d+)', True),
+    (r'NF\s+(\d+)', True),
+    (r'NF:\s*(\d+)', True),
+    (r'NF(\d+)', True),
+    (r'(\d+)/\d+\s+DM', False),
+))
+
+
+def _extrair_numero_nf(texto):
+    """Extrai número da NF apenas se colado a 'Núm. do documento', 'NF' ou 'Numero Documento'.
+    Ignora últimos 25%% da página (feito em _processar_pdf). 4–6 dígitos; blacklist de telefones."""
+    for padrao in _PADROES_NF_DANFE:
+        m = padrao.search(texto)
+        if not m:
+            continue
+        n = (m.group(1) or '').strip().replace('.', '')
+        if not n:
+            continue
+        if n in BLACKLIST_NF:
+            continue
+        return n
+
+    for padrao, exige_nf in _PADROES_NF:
+        m = padrao.search(texto)
+        if not m:
+            continue
+        n = m.group(1)
+        if n in BLACKLIST_NF:
+            continue
+        if len(n) == 8 and not exige_nf:
+            continue
+        if len(n) < 3 or len(n) > 12:
+            continue
+        return n
+    return None
+
+
+# NF no nome do arquivo: NF - CB - 12244, NF-BONIF-12345, NF - 12244, etc.
+_PADROES_NF_NOME_ARQUIVO = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'(?:NF\s*[-–—]?\s*)?(?:CB|BONIF)\s*[-–—]\s*(\d{4,6})',  # NF - CB - 12244 ou CB - 12244
+    r'NF\s*[-–—]\s*(\d{4,6})',  # NF - 12244
+    r'NF\s*[-–—]\s*\d+\s*[-–—]\s*(\d{4,6})',  # NF - 01 - 12244
+    r'[-–—]\s*(\d{4,6})\s*[-–—]',  # - 12244 - (entre hífens)
+))
+_RE_DIGITOS = re.compile(r'(\d+)')
+
+
+def _extrair_nf_do_nome_arquivo(nome_arquivo):
+    """Extrai número da NF diretamente do nome do arquivo.
+    Procura sequências de 4-6 dígitos após termos como 'CB', 'BONIF', 'NF' ou após hífens.
+    Exemplos: 'NF - CB - 12244...' → '12244', 'NF-BONIF-12345...' → '12345'
+    
+    Args:
+        nome_arquivo: Nome do arquivo (ex: 'NF - CB - 12244 - CLIENTE.pdf')
+    
+    Returns:
+        String com o número da NF encontrado ou None
+    """
+    if not nome_arquivo:
+        return None
+    
+    for padrao in _PADROES_NF_NOME_ARQUIVO:
+        m = padrao.search(nome_arquivo)
+        if m:
+            nf = m.group(1)
+            # Validar que não está na blacklist e tem tamanho adequado
+            if nf not in BLACKLIST_NF and 4 <= len(nf) <= 6:
+                return nf
+    
+    # Fallback: primeira sequência numérica no nome (ex: NF3439.pdf -> 3439)
+    nf_fallback = _extrair_numero_da_nf(nome_arquivo)
+    if nf_fallback and nf_fallback not in BLACKLIST_NF and 4 <= len(nf_fallback) <= 6:
+        return nf_fallback
+    return None
+
+
+def _extrair_numero_da_nf(nome_arquivo):
+    """Extrai apenas a primeira sequência de dígitos do nome do arquivo.
+    Ex: 'NF3439.pdf' -> '3439', 'NF - 12244 - CLIENTE.pdf' -> '12244' (se outros padrões falharem).
+    """
+    if not nome_arquivo:
+        return None
+    try:
+        nome_limpo = str(nome_arquivo).lower().replace('.pdf', '')
+        m = _RE_DIGITOS.search(nome_limpo)
+        return m.group(1) if m else None
+    except Exception:
+        return None
+
+
+def _eh_linha_cabecalho_pagador(s):
+    """Retorna True se s for linha de cabeçalho (Numero Documento, Vencimento, etc.)."""
+    if not s or len(s) < 3:
+        return True
+    u = s.upper()
+    if 'NUMERO' in u and 'DOCUMENTO' in u:
+        return True
+    if u.strip() in ('VENCIMENTO', 'CPF', 'CNPJ', 'PAGADOR', 'NOME', 'RAZÃO SOCIAL'):
+        return True
+    return False
+
+
+# Sufixos removidos da razão social, na ordem: " NNN/N DD/MM/YYYY",
+# " CNPJ DD/MM/YYYY" e " CNPJ" no fim da linha.
+_SUFIXOS_RAZAO = tuple(re.compile(p) for p in (
+    r'\s+\d{1,5}/\d+\s+\d{1,2}/\d{1,2}/\d{2,4}\s*$',
+    r'\s+\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\s+\d{1,2}/\d{1,2}/\d{2,4}\s*$',
+    r'\s+\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\s*$',
+))
+
+
+def _limpar_razao_ate_cnpj_ou_data(linha):
+    """Remove sufixo tipo '12341/1 26/02/2026' ou 'CNPJ 24.333.585/0001-20 27/01/2026'."""
+    for sufixo in _SUFIXOS_RAZAO:
+        linha = sufixo.sub('', linha)
+    return linha.strip()
+
+
+_RE_BLOCO_DESTINATARIO = re.compile(
+    r'Destinat[áa]rio\s*/\s*Remetente([\s\S]{0,1200}?)(?:Endere[cç]o|CNPJ\s*/\s*CPF)',
+    re.IGNORECASE,
+)
+_RE_QUEBRA_LINHA = re.compile(r'[\r\n]+')
+_RE_ESPACOS = re.compile(r'\s+')
+_RE_ROTULO_NOME_RAZAO = re.compile(r'Nome\s*/\s*Raz[ãa]o\s+Social', re.IGNORECASE)
+_RE_ROTULO_NAO_RAZAO = re.compile(r'Nome\s*/\s*Raz[ãa]o\s+Social|CNPJ|CPF|Insc', re.IGNORECASE)
+# Itaú/DESTAK: "Pagador: CAPIM FRIOS EIRELI" (mesma linha ou próxima)
+_RE_PAGADOR_DOIS_PONTOS = re.compile(
+    r'Pagador\s*:\s*([A-ZÁÉÍÓÚÇa-z0-9][A-ZÁÉÍÓÚÇa-z0-9\s&\.\-(),]+?)(?:\s*[\r\n]|CNPJ|CPF|$)', re.IGNORECASE,
+)
+# Bradesco/PDF com texto colado: "PagadorS N SOARES... CPF/CNPJ ..."
+_RE_PAGADOR_COLADO = re.compile(r'Pagador\s*([A-Za-z0-9\s\&\.\-\*]+?)\s*CPF/CNPJ', re.IGNORECASE)
+# NF-e: "NOME / RAZÃO SOCIAL ..." na linha seguinte "JNS COMERCIO ... LTDA 24.333.585/..."
+_RE_NOME_RAZAO_LINHA_SEGUINTE = re.compile(
+    r'NOME\s*/\s*RAZ[ÃA]O\s+SOCIAL[\s\S]*?[\r\n]+\s*([A-ZÁÉÍÓÚÇa-z0-9][A-ZÁÉÍÓÚÇa-z0-9\s&\.\-(),]+?)\s+\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}',
+    re.IGNORECASE,
+)
+_RE_PAGADOR_FIM_LINHA = re.compile(r'Pagador\s*[\r\n]+', re.IGNORECASE)
+_RE_INICIO_CNPJ = re.compile(r'^\d{2}\.\d{3}\.\d{3}')
+_RE_PAGADOR_ESPACO = re.compile(
+    r'Pagador\s+([A-ZÁÉÍÓÚÇa-z0-9][A-ZÁÉÍÓÚÇa-z0-9\s&\.\-(),]+?)(?:\s{2,}|\d{2}\.\d{3}\.\d{3}|[\r\n]|$)',
+    re.IGNORECASE,
+)
+_PADROES_RAZAO_ROTULO = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'Raz[ãa]o\s+Social[:\s]+([A-ZÁÉÍÓÚÇ][A-ZÁÉÍÓÚÇ\s&\.\-]+)',
+    r'Nome\s+Empresarial[:\s]+([A-ZÁÉÍÓÚÇ][A-ZÁÉÍÓÚÇ\s&\.\-]+)',
+    r'Empresa[:\s]+([A-ZÁÉÍÓÚÇ][A-ZÁÉÍÓÚÇ\s&\.\-]+)',
+))
+
+
+def _extrair_razao_social(texto):
+    """Extrai razão social do PAGADOR (boletos) ou DESTINATÁRIO (NF-e)."""
+    # DANFE: priorizar bloco do destinatário para evitar capturar "Transportador / Volumes Transportados"
+    bloco_dest = _RE_BLOCO_DESTINATARIO.search(texto)
+    if bloco_dest:
+        trecho = bloco_dest.group(1)
+        linhas = [_RE_ESPACOS.sub(' ', linha).strip() for linha in _RE_QUEBRA_LINHA.split(trecho) if linha and linha.strip()]
+        # Se houver cabeçalho "Nome/Razão Social", capturar a linha imediatamente abaixo
+        for i, linha in enumerate(linhas):
+            if _RE_ROTULO_NOME_RAZAO.search(linha):
+                if i + 1 < len(linhas):
+                    cand = _limpar_razao_ate_cnpj_ou_data(linhas[i + 1])
+                    if cand and len(cand) > 3 and not _eh_linha_cabecalho_pagador(cand):
+                        return cand[:200]
+        # Fallback no mesmo bloco: primeira linha textual plausível que não seja cabeçalho
+        for linha in linhas:
+            if _RE_ROTULO_NAO_RAZAO.search(linha):
+                continue
+            cand = _limpar_razao_ate_cnpj_ou_data(linha)
+            if cand and len(cand) > 3 and not _eh_linha_cabecalho_pagador(cand):
+                return cand[:200]
+
+    # DANFE (fallback do plano B): Nome + CNPJ + Data na mesma linha
+    nome_danfe, _ = _extrair_linha_danfe_nome_cnpj_data(texto)
+    if nome_danfe:
+        razao = _limpar_razao_ate_cnpj_ou_data(nome_danfe)
+        if razao and len(razao) > 2 and not _eh_linha_cabecalho_pagador(razao):
+            return razao[:200]
+
+    # Itaú/DESTAK: "Pagador: CAPIM FRIOS EIRELI" (mesma linha ou próxima)
+    m = _RE_PAGADOR_DOIS_PONTOS.search(texto)
+    if m:
+        razao = _limpar_razao_ate_cnpj_ou_data(m.group(1))
+        if razao and len(razao) > 2 and not _eh_linha_cabecalho_pagador(razao):
+            return razao[:200]
+    # Bradesco/PDF com texto colado: "PagadorS N SOARES... CPF/CNPJ ..."
+    m = _RE_PAGADOR_COLADO.search(texto)
+    if m:
+        razao = _limpar_razao_ate_cnpj_ou_data((m.group(1) or '').strip())
+        if razao and len(razao) > 2 and not _eh_linha_cabecalho_pagador(razao):
+            return razao[:200]
+    # NF-e: "NOME / RAZÃO SOCIAL ..." na linha seguinte "JNS COMERCIO ... LTDA 24.333.585/..."
+    m = _RE_NOME_RAZAO_LINHA_SEGUINTE.search(texto)
+    if m:
+        razao = _limpar_razao_ate_cnpj_ou_data(m.group(1))
+        if razao and len(razao) > 3:
+            return razao[:200]
+    # Boletos: Pagador + linhas; pular "Numero Documento Vencimento" e pegar a seguinte
+    pos = 0
+    while True:
+        m = _RE_PAGADOR_FIM_LINHA.search(texto, pos)
+        if not m:
+            break
+        pos = m.end()
+        resto = texto[pos:]
+        linhas = _RE_QUEBRA_LINHA.split(resto)
+        for linha in linhas:
+            linha = _RE_ESPACOS.sub(' ', linha).strip()
+            if not linha or _eh_linha_cabecalho_pagador(linha):
+                continue
+            if len(linha) > 3 and not _RE_INICIO_CNPJ.match(linha):
+                return _limpar_razao_ate_cnpj_ou_data(linha)[:200]
+        break
+    m = _RE_PAGADOR_ESPACO.search(texto)
+    if m:
+        razao = _limpar_razao_ate_cnpj_ou_data(m.group(1))
+        if razao and len(razao) > 2 and not _eh_linha_cabecalho_pagador(razao):
+            return razao[:200]
+    for padrao in _PADROES_RAZAO_ROTULO:
+        m = padrao.search(texto)
+        if m:
+            razao = m.group(1).strip()
+            return razao[:200] if len(razao) > 200 else razao
+    return None
+
+
+# Vencimento, em ordem de prioridade.
+_PADROES_VENCIMENTO = tuple(re.compile(p, re.IGNORECASE | re.DOTALL) for p in (
+    # Padrão flexível: aceita "Vencimento", "Data de Vencimento" com separadores variados
+    r'(?:Vencimento|Data\s+de\s+Vencimento)[\s\n]*[:\-]?[\s\n]*(\d{2}/\d{2}/\d{4})',
+
+    # Padrões específicos mantidos para compatibilidade
+    r'Vencimento[\s\n]*(\d{2}/\d{2}/\d{4})',  # ex: Vencimento 05/02/2026 ou Vencimento\n05/02/2026
+    r'Vencimento\s*[:\s]+\s*(\d{1,2}/\d{1,2}/\d{2,4})',  # Itaú: Vencimento: 08/02/2026
+    r'Vencimento[:\s]+(\d{1,2}/\d{1,2}/\d{2,4})',
+    r'Vencimento\s*[\r\n]+\s*(\d{1,2}/\d{1,2}/\d{2,4})',
+    r'Venc\.?[:\s]+(\d{1,2}/\d{1,2}/\d{2,4})',
+    r'Data\s+de\s+Vencimento[:\s]+(\d{1,2}/\d{1,2}/\d{2,4})',
+
+    # Bradesco: data pode aparecer isolada após "Vencimento" em linhas separadas
+    r'Vencimento[\s\S]{0,50}?(\d{2}/\d{2}/\d{4})',  # Busca data até 50 chars após "Vencimento"
+
+    # PARCELAS (formato de recibo com parcelas)
+    r'PARCELAS\s*[\r\n]+\s*\d+\s+(\d{1,2}/\d{1,2}/\d{2,4})\s',  # 001 26/02/2026 R$
+
+    # Busca genérica: qualquer data dd/mm/yyyy precedida por "Vencimento" em até 100 caracteres
+    r'Vencimento[\s\S]{0,100}?(\d{2}/\d{2}/\d{4})',
+))
+
+
+def _extrair_data_vencimento(texto, debug_paty=False):
+    """Extrai data de vencimento: ao lado de 'Vencimento' ou em PARCELAS (001 DD/MM/YYYY).
+    Prioriza padrão dd/mm/aaaa após 'Vencimento' (ex: 05/02/2026, 08/02/2026).
+    
+    Args:
+        texto: Texto extraído do PDF
+        debug_paty: Se True, imprime debug detalhado no console (para boletos PATY/Bradesco)
+    """
+    if debug_paty:
+        logger.info("\n" + "="*80)
+        logger.debug("DEBUG EXTRAÇÃO DE VENCIMENTO - BOLETO PATY/BRADESCO")
+        logger.info("="*80)
+        logger.info("TEXTO COMPLETO DO PDF (primeiros 2000 caracteres):")
+        logger.info(texto[:2000])
+        logger.info("\n" + "-"*80)
+    
+    for idx, padrao in enumerate(_PADROES_VENCIMENTO):
+        m = padrao.search(texto)
+        if m:
+            data_str = m.group(1)
+            if debug_paty:
+                logger.info(f"\n✓ Match encontrado com padrão {idx}: {padrao.pattern}")
+                logger.info(f"  Data capturada: {data_str}")
+                logger.info(f"  Contexto: ...{texto[max(0, m.start()-50):m.end()+50]}...")
+            
+            data_parsed = _data_br(data_str)
+            if data_parsed:
+                if debug_paty:
+                    logger.info(f"  ✓ Data parseada com sucesso: {data_parsed.strftime('%d/%m/%Y')}")
+                    logger.info("="*80 + "\n")
+                return data_parsed
+            elif debug_paty:
+                logger.error(f"  ✗ Falha ao parsear data: {data_str}")
+    
+    if debug_paty:
+        logger.error("\n✗ NENHUMA DATA DE VENCIMENTO ENCONTRADA")
+        logger.info("="*80 + "\n")
+    
+    return None
+
+
+def _detectar_empresa_destak(texto):
+    """Detecta se o beneficiário é DESTAK. Retorna True se encontrar 'DESTAK EMBALAGEM LTDA' ou CNPJ 30.820.528/0001-78."""
+    if 'DESTAK EMBALAGEM LTDA' in _maiusculo(texto) or CNPJ_DESTAK in texto:
+        return True
+    return False
+
+
+_RE_PREFIXO_REAIS = re.compile(r'R\$\s*', re.IGNORECASE)
+
+
+def _parse_valor_monetario(s):
+    """Converte string 'R$ 1.234,56' ou '-R$ 120,00' para float. Retorna None se inválido. Preserva sinal negativo."""
+    if not s or not isinstance(s, str):
+        return None
+    s = str(s).strip()
+    negativo = s.lstrip().startswith('-')
+    s = _RE_PREFIXO_REAIS.sub('', s).replace(' ', '')
+    s = s.lstrip('-').strip()
+    if ',' in s:
+        s = s.replace('.', '').replace(',', '.')
+    try:
+        n = float(s)
+        return -n if negativo else n
+    except (ValueError, TypeError):
+        return None
+
+
+# DANFE: ancorar no rótulo "Valor Total da Nota" para não capturar zeros de impostos
+_RE_BLOCO_TOTAL_NOTA = re.compile(r'Valor\s+Total\s+da\s+Nota([\s\S]{0,220})', re.IGNORECASE)
+_RE_VALOR_BR = re.compile(r'(\d{1,3}(?:\.\d{3})*,\d{2})')
+_PADROES_VALOR = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'Valor\s*(?:do\s*Documento)?\s*[:\s]*R\$\s*([\d\.]+,\d{2})',
+    r'Valor\s*[:\s]*R\$\s*([\d\.]+,\d{2})',
+    r'Total\s*[:\s]*R\$\s*([\d\.]+,\d{2})',
+    r'(?:Valor|Total)\s+([\d\.]+,\d{2})\b',
+))
+_RE_REAIS = re.compile(r'R\$\s*([\d\.]+,\d{2})')
+
+
+def _extrair_valor_boleto(texto):
+    """Extrai valor principal do boleto (ex.: R$ 2.400,00) e, para DANFE, o Valor Total da Nota."""
+    bloco_total_nota = _RE_BLOCO_TOTAL_NOTA.search(texto)
+    if bloco_total_nota:
+        trecho = bloco_total_nota.group(1)
+        candidatos = _RE_VALOR_BR.findall(trecho)
+        if candidatos:
+            # Usa o último valor não-zero do bloco (normalmente o total final da nota)
+            for raw in reversed(candidatos):
+                v = _parse_valor_monetario(raw)
+                if v is not None and v > 0:
+                    return v
+
+    for padrao in _PADROES_VALOR:
+        m = padrao.search(texto)
+        if m:
+            raw = m.group(1)
+            v = _parse_valor_monetario(raw)
+            if v is not None and v > 0:
+                return v
+    for m in _RE_REAIS.finditer(texto):
+        v = _parse_valor_monetario(m.group(1))
+        if v is not None and v > 0:
+            return v
+    return None
+
+
+def _classificar_pdf(texto):
+    """Classifica um PDF pelo texto da primeira página.
+    Retorna 'NOTA_FISCAL', 'BOLETO' ou 'NAO_IDENTIFICADO'."""
+    u = _maiusculo(texto or "")
+    if "DANFE" in u or "NOTA FISCAL" in u:
+        return "NOTA_FISCAL"
+    if "BOLETO" in u or "LINHA DIGITÁVEL" in u or "LINHA DIGITAVEL" in u:
+        return "BOLETO"
+    if "ITAU" in u or "ITAÚ" in u or "BRADESCO" in u:
+        return "BOLETO"
+    return "NAO_IDENTIFICADO"
+
+
+# Frases exatas que indicam bonificação (baseado nas notas da Paty e Destak),
+# cada uma com o padrão "perto de Natureza/Operação" da prioridade 2.
+_FRASES_BONIFICACAO = {
+    frase: re.compile(r'(NATUREZA|OPERACAO).{0,150}?' + re.escape(frase), re.IGNORECASE | re.DOTALL)
+    for frase in ('REMESSA EM BONIFICACAO', 'REMESSA DE BONIFICACAO', 'DOACAO', 'BRINDE')
+}
+_RE_NATUREZA_OPERACAO = re.compile(
+    r'NATUREZA\s+DA\s+OPERACAO[:\s]*([^\n]{0,300})',
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def _detectar_bonificacao(texto):
+    """
+    Detecta se um documento é uma nota de bonificação/brinde.
+    
+    Lê o conteúdo do PDF e verifica a "Natureza da Operação" procurando por frases exatas
+    que indicam bonificação (baseado nas notas da Paty e Destak).
+    
+    Args:
+        texto: Texto extraído do PDF (primeira página ou completo)
+    
+    Returns:
+        bool: True se for bonificação, False caso contrário
+    """
+    if not texto:
+        return False
+    
+    texto_normalizado = _normalizado(texto)
+
+    # PRIORIDADE 1: "Natureza da Operação" seguido de bonificação
+    match_natureza = _RE_NATUREZA_OPERACAO.search(texto_normalizado)
+    if match_natureza:
+        natureza_texto = match_natureza.group(1)
+        for frase in _FRASES_BONIFICACAO:
+            if frase in natureza_texto:
+                return True
+
+    # PRIORIDADE 2: frase até 150 caracteres depois de "Natureza" ou "Operação"
+    # (a estrutura do PDF pode ter quebrado a linha)
+    for frase, padrao_proximo in _FRASES_BONIFICACAO.items():
+        if frase in texto_normalizado and padrao_proximo.search(texto_normalizado):
+            return True
+
+    return False
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Análise de um PDF (uma abertura por arquivo)
+# ─────────────────────────────────────────────────────────────────────────────
+
+# Campos de ``_processar_pdf``, na ordem do dict devolvido.
+CAMPOS_PDF = (
+    'cnpj', 'numero_nf', 'razao_social', 'data_vencimento',
+    'empresa_destak', 'valor_boleto', 'apenas_emissor',
+)
+# Fração superior de cada página que entra no texto dos campos (ignora rodapé/canhoto).
+_FRACAO_RECORTE = 0.75
+_MAX_PAGINAS_PADRAO = 100
+
+# Classificação da falha de extração (``resultado['falha']`` e
+# ``Documento.falha_extracao``).
+FALHA_TIMEOUT = 'TIMEOUT'
+FALHA_CORROMPIDO = 'CORROMPIDO'
+FALHA_GRANDE_DEMAIS = 'GRANDE_DEMAIS'
+# Ler de novo o mesmo arquivo dá no mesmo: não vale nova tentativa.
+FALHAS_DEFINITIVAS = frozenset({FALHA_CORROMPIDO, FALHA_GRANDE_DEMAIS})
+DESCRICAO_FALHA = {
+    FALHA_TIMEOUT: 'leitura do PDF excedeu o tempo limite',
+    FALHA_CORROMPIDO: 'PDF corrompido ou ilegível',
+    FALHA_GRANDE_DEMAIS: 'PDF grande demais (páginas ou memória)',
+}
+
+
+class PdfGrandeDemais(Exception):
+    """PDF com mais páginas que ``EXTRACAO_PDF_MAX_PAGINAS``."""
+
+
+def max_paginas_pdf() -> int:
+    """Limite de páginas por PDF: ``EXTRACAO_PDF_MAX_PAGINAS`` (padrão 100; 0 desliga)."""
+    try:
+        return max(0, int(os.environ.get('EXTRACAO_PDF_MAX_PAGINAS') or _MAX_PAGINAS_PADRAO))
+    except ValueError:
+        return _MAX_PAGINAS_PADRAO
+
+
+def classificar_falha(exc) -> str:
+    """``FALHA_*`` de uma exceção da leitura do PDF."""
+    if isinstance(exc, (PdfGrandeDemais, MemoryError)):
+        return FALHA_GRANDE_DEMAIS
+    if isinstance(exc, TimeoutError):
+        return FALHA_TIMEOUT
+    return FALHA_CORROMPIDO
+
+
+class AnalisePdf:
+    """Um PDF analisado abrindo o arquivo no máximo uma vez.
+
+    Antes, uma DANFE nova era aberta três vezes: 1ª página para
+    classificação/bonificação, 1ª página de novo em
+    ``_processar_documentos_pendentes`` e todas as páginas recortadas em
+    ``_processar_pdf``. Aqui o pdfplumber só abre quando alguma região
+    falta no cache por SHA-256, e cada página é parseada uma vez: a
+    1ª página inteira e o recorte dos 75% superiores saem do mesmo layout.
+
+    Classificação, bonificação e cada campo são propriedades calculadas
+    na primeira leitura (``classificacao``, ``bonificacao``, ``cnpj``,
+    ``numero_nf``, ``razao_social``, ``data_vencimento``,
+    ``valor_boleto``...). ``campos`` monta o dict de ``_processar_pdf``.
+    ``tempos`` acumula segundos por etapa (``hash``, ``cache``,
+    ``abrir``, ``primeira_pagina``, ``recortado`` e um por campo).
+
+    ``arquivo`` é um caminho ou um arquivo binário aberto. Use como
+    context manager (ou chame ``fechar()``) para soltar o PDF.
+    """
+
+    def __init__(self, arquivo, tipo=None, nome_arquivo=None):
+        self.arquivo = arquivo
+        self.tipo = tipo
+        if nome_arquivo is None and isinstance(arquivo, (str, os.PathLike)):
+            nome_arquivo = os.path.basename(arquivo)
+        self.nome_arquivo = nome_arquivo
+        self.tempos = {}
+        self._pdf = None
+        self._sha = None
+        self._entrada = None
+        self._textos = {}
+        self._campos_gravados = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+
+    def _medir(self, etapa, calcular):
+        inicio = time.perf_counter()
+        try:
+            return calcular()
+        finally:
+            self.tempos[etapa] = round(self.tempos.get(etapa, 0) + time.perf_counter() - inicio, 4)
+
+    # ── cache por SHA-256 ───────────────────────────────────────────────────
+
+    @property
+    def sha256(self):
+        """SHA-256 do arquivo, ou ``None`` com o cache desligado."""
+        if self._sha is None and diretorio_cache():
+            self._sha = self._medir('hash', lambda: sha256_arquivo(self.arquivo))
+        return self._sha
+
+    def _bloco_cache(self, nome):
+        if not self.sha256:
+            return {}
+        if self._entrada is None:
+            self._entrada = self._medir('cache', lambda: ler_entrada(self.sha256))
+        return self._entrada.get(nome) or {}
+
+    def _gravar_bloco(self, nome, mesclar):
+        # Relê antes de gravar: outro processo pode ter gravado o seu
+        # pedaço desta entrada nesse meio-tempo.
+        bloco = mesclar(ler_entrada(self.sha256).get(nome) or {})
+        atualizar_entrada(self.sha256, **{nome: bloco})
+        self._entrada = dict(self._entrada or {}, **{nome: bloco})
+
+    # ── regiões de página ──────────────────────────────────────────────────
+
+    def _paginas(self):
+        if self._pdf is None:
+            pdf = self._medir('abrir', lambda: pdfplumber.open(self.arquivo))
+            limite = max_paginas_pdf()
+            if limite and len(pdf.pages) > limite:
+                pdf.close()
+                raise PdfGrandeDemais(f'{len(pdf.pages)} páginas (limite {limite})')
+            self._pdf = pdf
+        return self._pdf.pages
+
+    def _ler_primeira_pagina(self):
+        paginas = self._paginas()
+        if not paginas:
+            return ""
+        return (paginas[0].extract_text() or "").strip()
+
+    def _ler_texto_recortado(self):
+        texto_completo = ""
+        for pagina in self._paginas():
+            h = float(pagina.height) or 842
+            w = float(pagina.width) or 595
+            crop_bottom = max(0, h * _FRACAO_RECORTE)
+            if crop_bottom <= 0:
+                cropped = pagina
+            else:
+                cropped = pagina.crop((0, 0, w, crop_bottom))
+            texto_pagina = cropped.extract_text()
+            if texto_pagina:
+                texto_completo += texto_pagina + "\n"
+        return texto_completo
+
+    def _texto(self, etapa, ler):
+        if etapa in self._textos:
+            return self._textos[etapa]
+        textos = self._bloco_cache('textos')
+        if textos.get('versao') == VERSAO_TEXTO and etapa in textos:
+            texto = textos[etapa]
+        else:
+            texto = self._medir(etapa, ler)
+            if self.sha256:
+                def mesclar(bloco):
+                    if bloco.get('versao') != VERSAO_TEXTO:
+                        bloco = {'versao': VERSAO_TEXTO}
+                    bloco[etapa] = texto
+                    return bloco
+                self._gravar_bloco('textos', mesclar)
+        self._textos[etapa] = texto
+        return texto
+
+    @property
+    def texto_primeira_pagina(self):
+        """Texto da 1ª página inteira (classificação e bonificação)."""
+        return self._texto('primeira_pagina', self._ler_primeira_pagina)
+
+    @property
+    def texto_recortado(self):
+        """Todas as páginas, recortadas nos 75% superiores (texto dos campos)."""
+        return self._texto('recortado', self._ler_texto_recortado)
+
+    # ── classificação ───────────────────────────────────────────────────────
+
+    @cached_property
+    def classificacao(self):
+        """'NOTA_FISCAL', 'BOLETO' ou 'NAO_IDENTIFICADO'."""
+        texto = self.texto_primeira_pagina
+        return self._medir('classificacao', lambda: _classificar_pdf(texto))
+
+    @cached_property
+    def bonificacao(self):
+        texto = self.texto_primeira_pagina
+        return self._medir('bonificacao', lambda: _detectar_bonificacao(texto))
+
+    # ── campos ──────────────────────────────────────────────────────────────
+
+    @property
+    def _chave_campos(self):
+        # Os campos dependem do texto, do nome do arquivo (fallback da NF) e do
+        # tipo (nota fiscal não lê a linha digitável).
+        return f'{self.nome_arquivo}|{self.tipo or ""}'
+
+    @cached_property
+    def _campos_em_cache(self):
+        if not self.nome_arquivo:
+            return None
+        bloco = self._bloco_cache('campos')
+        if _versao_campos(bloco) == _versao_campos() and self._chave_campos in bloco:
+            return _campos_de_json(bloco[self._chave_campos])
+        return None
+
+    def _campo(self, nome, calcular):
+        if self._campos_em_cache is not None:
+            return self._campos_em_cache[nome]
+        texto = self.texto_recortado
+        return self._medir(nome, lambda: calcular(texto))
+
+    @cached_property
+    def cnpj(self):
+        return self._campo('cnpj', lambda t: _extrair_cnpj(t, nome_arquivo=self.nome_arquivo))
+
+    @cached_property
+    def numero_nf(self):
+        """NF do texto; senão do nome do arquivo (arquivos CB/BONIF)."""
+        def calcular(texto):
+            numero_nf = _extrair_numero_nf(texto)
+            if not numero_nf and self.nome_arquivo:
+                numero_nf = _extrair_nf_do_nome_arquivo(self.nome_arquivo)
+                if numero_nf:
+                    logger.debug(
+                        f"DEBUG: NF extraída do nome do arquivo: {numero_nf} (arquivo: {self.nome_arquivo})"
+                    )
+            return numero_nf
+        return self._campo('numero_nf', calcular)
+
+    @cached_property
+    def razao_social(self):
+        return self._campo('razao_social', _extrair_razao_social)
+
+    @cached_property
+    def linha_digitavel(self):
+        """``LinhaDigitavel`` válida da 1ª página (``None`` em nota fiscal)."""
+        if self.tipo == 'NOTA_FISCAL':
+            return None
+        texto = self.texto_primeira_pagina
+        return self._medir('linha_digitavel', lambda: localizar_linha_digitavel(texto))
+
+    def _campo_da_linha(self, nome, atributo, calcular):
+        """Campo lido da linha digitável; sem ela, ``calcular`` no texto recortado.
+
+        Com a linha, o recorte de todas as páginas nem é lido para este campo.
+        """
+        if self._campos_em_cache is not None:
+            return self._campos_em_cache[nome]
+        valor = getattr(self.linha_digitavel, atributo, None)
+        if valor is not None:
+            return valor
+        return self._campo(nome, calcular)
+
+    @cached_property
+    def data_vencimento(self):
+        def calcular(texto):
+            # Boleto PATY/Bradesco: liga o log detalhado do vencimento.
+            maiusculo = _maiusculo(texto)
+            eh_paty_bradesco = (
+                'BRADESCO' in maiusculo or
+                'PATY' in maiusculo or
+                'CNPJ_PATY' in maiusculo or
+                not _detectar_empresa_destak(texto)  # Se não é DESTAK, provavelmente é PATY
+            )
+            debug_vencimento = eh_paty_bradesco and self.tipo == 'BOLETO'
+            return _extrair_data_vencimento(texto, debug_paty=debug_vencimento)
+        return self._campo_da_linha('data_vencimento', 'vencimento', calcular)
+
+    @cached_property
+    def empresa_destak(self):
+        return self._campo('empresa_destak', _detectar_empresa_destak)
+
+    @cached_property
+    def valor_boleto(self):
+        """Valor do boleto ou, na DANFE, o Valor Total da Nota."""
+        return self._campo_da_linha('valor_boleto', 'valor', _extrair_valor_boleto)
+
+    @cached_property
+    def apenas_emissor(self):
+        """Todos os CNPJs do texto são dos emissores (Paty/Destak/serviço)."""
+        def calcular(texto):
+            todos_cnpjs = _RE_CNPJ.findall(texto)
+            return len(todos_cnpjs) > 0 and len([c for c in todos_cnpjs if c not in CNPJS_EMISSORES]) == 0
+        return self._campo('apenas_emissor', calcular)
+
+    @property
+    def campos(self):
+        """Dict de ``_processar_pdf`` (cópia nova a cada leitura)."""
+        resultado = {nome: getattr(self, nome) for nome in CAMPOS_PDF}
+        if self._campos_em_cache is None and not self._campos_gravados and self.nome_arquivo and self.sha256:
+            def mesclar(bloco):
+                if _versao_campos(bloco) != _versao_campos():
+                    bloco = {'versao': VERSAO_CAMPOS, 'versao_texto': VERSAO_TEXTO}
+                bloco[self._chave_campos] = _campos_para_json(resultado)
+                return bloco
+            self._gravar_bloco('campos', mesclar)
+            self._campos_gravados = True
+        return resultado
+
+
+def _versao_campos(bloco=None):
+    # Campos saem do texto: nova VERSAO_TEXTO também invalida os campos.
+    if bloco is None:
+        return VERSAO_CAMPOS, VERSAO_TEXTO
+    return bloco.get('versao'), bloco.get('versao_texto')
+
+
+def _campos_para_json(campos):
+    return {k: (v.isoformat() if isinstance(v, date) else v) for k, v in campos.items()}
+
+
+def _campos_de_json(campos):
+    campos = dict(campos)
+    if campos.get('data_vencimento'):
+        campos['data_vencimento'] = date.fromisoformat(campos['data_vencimento'])
+    return campos
+
+
+def texto_recortado_pdf(arquivo):
+    """Texto que ``_processar_pdf`` analisa (caminho ou arquivo binário aberto)."""
+    with AnalisePdf(arquivo) as analise:
+        return analise.texto_recortado
+
+
+def _extrair_texto_primeira_pagina(caminho_arquivo, analise=None):
+    """Extrai o texto apenas da primeira página do PDF. Retorna str (vazia se erro ou sem páginas).
+
+    ``analise``: ``AnalisePdf`` já aberta para o arquivo (reaproveita o PDF).
+    """
+    if not caminho_arquivo or not os.path.isfile(caminho_arquivo):
+        return ""
+    try:
+        if analise is not None:
+            return analise.texto_primeira_pagina
+        with AnalisePdf(caminho_arquivo) as analise:
+            return analise.texto_primeira_pagina
+    except FileNotFoundError:
+        logger.warning(f"PDF não encontrado ao extrair texto: {caminho_arquivo}")
+        return ""
+    except Exception:
+        return ""
+
+
+def _processar_pdf(caminho_arquivo, tipo_documento, analise=None):
+    """Processa um arquivo PDF e extrai informações relevantes.
+    
+    Args:
+        caminho_arquivo: Caminho completo do arquivo PDF
+        tipo_documento: 'BOLETO' ou 'NOTA_FISCAL'
+        analise: ``AnalisePdf`` já aberta para o arquivo (opcional)
+    
+    Returns:
+        dict com campos: cnpj, numero_nf, razao_social, data_vencimento, empresa_destak, apenas_emissor (ou None se erro)
+    """
+    if not caminho_arquivo or not os.path.isfile(caminho_arquivo):
+        logger.warning(f"PDF não encontrado para processamento: {caminho_arquivo}")
+        return None
+    if analise is None:
+        caminho_xml = xml_da_nota(caminho_arquivo, tipo_documento)
+        if caminho_xml:
+            dados = dados_nfe_xml(caminho_xml)
+            if dados is not None or _eh_xml(caminho_arquivo):
+                return dados
+    try:
+        if analise is not None:
+            return analise.campos
+        with AnalisePdf(caminho_arquivo, tipo_documento) as analise:
+            return analise.campos
+    except FileNotFoundError:
+        logger.warning(f"PDF removido durante processamento: {caminho_arquivo}")
+        return None
+    except Exception as e:
+        logger.error(f"Erro ao processar PDF {caminho_arquivo}: {str(e)}")
+        return None
+
+
+def vencimento_e_valor_pdf(caminho_arquivo, tipo_documento='BOLETO'):
+    """Só ``data_vencimento`` e ``valor_boleto`` do PDF (``None`` se erro).
+
+    Para quem não precisa dos outros campos: com linha digitável válida,
+    lê só a 1ª página. Roda no processo atual, sem os limites do
+    ``extrair_lote``.
+    """
+    if not caminho_arquivo or not os.path.isfile(caminho_arquivo):
+        logger.warning(f"PDF não encontrado para processamento: {caminho_arquivo}")
+        return None
+    caminho_xml = xml_da_nota(caminho_arquivo, tipo_documento)
+    dados = dados_nfe_xml(caminho_xml) if caminho_xml else None
+    if dados is not None:
+        return {'data_vencimento': dados['data_vencimento'], 'valor_boleto': dados['valor_boleto']}
+    try:
+        with AnalisePdf(caminho_arquivo, tipo_documento) as analise:
+            return {'data_vencimento': analise.data_vencimento, 'valor_boleto': analise.valor_boleto}
+    except FileNotFoundError:
+        logger.warning(f"PDF removido durante processamento: {caminho_arquivo}")
+        return None
+    except Exception as e:
+        logger.error(f"Erro ao processar PDF {caminho_arquivo}: {str(e)}")
+        return None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# XML da NF-e (services/nfe_xml.py)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _eh_xml(caminho):
+    return isinstance(caminho, (str, os.PathLike)) and os.fspath(caminho).lower().endswith('.xml')
+
+
+def xml_da_nota(caminho_arquivo, tipo_documento=None):
+    """XML da NF-e que responde pelo arquivo: ele mesmo ou o ``.xml`` ao lado do PDF.
+
+    Boleto não usa o XML irmão: vencimento e valor do boleto são os da
+    parcela, não os da nota.
+    """
+    if _eh_xml(caminho_arquivo):
+        return caminho_arquivo if os.path.isfile(caminho_arquivo) else None
+    if tipo_documento == 'BOLETO':
+        return None
+    return xml_irmao(caminho_arquivo)
+
+
+def _bonificacao_nfe(nfe):
+    return _detectar_bonificacao(f"NATUREZA DA OPERACAO: {nfe.natureza_operacao or ''}")
+
+
+def _campos_da_nfe(nfe):
+    """Dict de ``_processar_pdf`` com os campos do XML (destinatário = pagador)."""
+    cnpj = formatar_documento(nfe.destinatario_documento)
+    numero = (nfe.numero or '').strip()
+    vencimentos = sorted(d.vencimento for d in nfe.duplicatas if d.vencimento)
+    emitente = f"{formatar_documento(nfe.emitente_cnpj) or ''} {nfe.emitente_nome or ''}"
+    return {
+        'cnpj': cnpj,
+        'numero_nf': str(int(numero)) if numero.isdigit() else (numero or None),
+        'razao_social': (nfe.destinatario_nome or '').strip() or None,
+        'data_vencimento': vencimentos[0] if vencimentos else None,
+        'empresa_destak': _detectar_empresa_destak(emitente),
+        'valor_boleto': nfe.valor_total,
+        'apenas_emissor': cnpj in CNPJS_EMISSORES,
+    }
+
+
+def dados_nfe_xml(caminho_xml):
+    """``_processar_pdf`` a partir do XML da NF-e (``None`` se não for NF-e)."""
+    try:
+        nfe = ler_nfe_xml(caminho_xml)
+    except OSError as e:
+        logger.warning(f"XML da NF-e ilegível {caminho_xml}: {e}")
+        return None
+    return _campos_da_nfe(nfe) if nfe is not None else None
+
+
+def _extrair_do_xml(tarefa):
+    """``extrair_documento`` pelo XML da NF-e; ``None`` quando o PDF precisa ser lido.
+
+    XML irmão que não é NF-e é ignorado (vale o PDF); arquivo ``.xml``
+    que não é NF-e sai como ``NAO_IDENTIFICADO``.
+    """
+    if tarefa.texto_recortado and not _eh_xml(tarefa.caminho):
+        return None  # o texto pedido é o do PDF
+    caminho_xml = xml_da_nota(tarefa.caminho, tarefa.tipo)
+    if not caminho_xml:
+        return None
+    inicio = time.perf_counter()
+    try:
+        nfe = ler_nfe_xml(caminho_xml)
+    except OSError as e:
+        logger.warning(f"XML da NF-e ilegível {caminho_xml}: {e}")
+        nfe = None
+    if nfe is None and not _eh_xml(tarefa.caminho):
+        return None
+    resultado = {'caminho': tarefa.caminho, 'tipo': tarefa.tipo, 'xml': caminho_xml}
+    if tarefa.primeira_pagina:
+        resultado['texto_primeira_pagina'] = ''
+        resultado['classificacao'] = 'NOTA_FISCAL' if nfe is not None else 'NAO_IDENTIFICADO'
+        resultado['bonificacao'] = nfe is not None and _bonificacao_nfe(nfe)
+    if tarefa.campos:
+        resultado['dados'] = _campos_da_nfe(nfe) if nfe is not None else None
+    segundos = round(time.perf_counter() - inicio, 4)
+    resultado['tempos'] = {'xml': segundos}
+    resultado['segundos'] = segundos
+    return resultado
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Extração em lote (pool de processos)
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TarefaExtracao(NamedTuple):
+    """Um PDF do lote e as etapas pedidas para ele."""
+    caminho: str
+    tipo: str | None = None        # 'BOLETO' / 'NOTA_FISCAL' — repassado a ``_processar_pdf``
+    primeira_pagina: bool = True   # texto da 1ª página + classificação + bonificação
+    campos: bool = True            # ``_processar_pdf`` completo (páginas recortadas a 75%)
+    texto_recortado: bool = False  # texto que ``_processar_pdf`` analisa (raio-x de debug)
+
+
+def _resultado_vazio(tarefa):
+    """Resultado de um PDF que não pôde ser lido (mesmas chaves, sem conteúdo)."""
+    resultado = {'caminho': tarefa.caminho, 'tipo': tarefa.tipo, 'tempos': {}, 'segundos': 0}
+    if tarefa.primeira_pagina:
+        resultado.update(texto_primeira_pagina='', classificacao=_classificar_pdf(''), bonificacao=False)
+    if tarefa.campos:
+        resultado['dados'] = None
+    if tarefa.texto_recortado:
+        resultado['texto_recortado'] = ''
+    return resultado
+
+
+def resultado_com_falha(tarefa, falha, erro, segundos=0) -> dict:
+    """``_resultado_vazio`` com a falha classificada (``FALHA_*``) e a mensagem."""
+    resultado = _resultado_vazio(TarefaExtracao(*tarefa))
+    resultado.update(falha=falha, erro=str(erro)[:500], segundos=round(segundos, 4))
+    return resultado
+
+
+def extrair_documento(tarefa) -> dict:
+    """Executa as etapas de uma ``TarefaExtracao`` e devolve um dict simples.
+
+    Chaves: ``caminho``, ``tipo``, ``segundos``, ``tempos`` (por etapa,
+    de ``AnalisePdf``) e, conforme as etapas,
+    ``texto_primeira_pagina``/``classificacao``/``bonificacao`` e
+    ``dados`` (retorno de ``_processar_pdf``; ``None`` em erro) e
+    ``texto_recortado``. As etapas compartilham a mesma abertura do PDF. Roda tanto no processo
+    atual quanto no processo isolado. Com XML da NF-e (``xml_da_nota``),
+    tudo sai dele e o resultado traz ``xml`` com o caminho lido.
+
+    PDF que não abre ou estoura os limites volta com as mesmas chaves
+    vazias mais ``falha`` (``FALHA_*``) e ``erro``. Arquivo ausente não é
+    falha do PDF: volta vazio, como antes.
+    """
+    tarefa = TarefaExtracao(*tarefa)
+    resultado = _extrair_do_xml(tarefa)
+    if resultado is not None:
+        return resultado
+    inicio = time.perf_counter()
+    resultado = _resultado_vazio(tarefa)
+    with AnalisePdf(tarefa.caminho, tarefa.tipo) as analise:
+        try:
+            if tarefa.primeira_pagina:
+                texto = analise.texto_primeira_pagina
+                resultado['texto_primeira_pagina'] = texto
+                resultado['classificacao'] = _classificar_pdf(texto)
+                resultado['bonificacao'] = _detectar_bonificacao(texto)
+            if tarefa.campos:
+                resultado['dados'] = analise.campos
+            if tarefa.texto_recortado:
+                resultado['texto_recortado'] = analise.texto_recortado
+        except FileNotFoundError:
+            logger.warning(f"PDF não encontrado ao extrair: {tarefa.caminho}")
+        except Exception as exc:
+            resultado['falha'] = classificar_falha(exc)
+            resultado['erro'] = f'{type(exc).__name__}: {exc}'[:500]
+            logger.warning(f"[EXTRACAO-PDF] {tarefa.caminho}: {resultado['falha']} ({resultado['erro']})")
+    resultado['tempos'] = analise.tempos
+    resultado['segundos'] = round(time.perf_counter() - inicio, 4)
+    return resultado
+
+
+def somar_tempos(resultados) -> dict:
+    """Soma os ``tempos`` por etapa de um lote de ``extrair_documento``."""
+    total = {}
+    for r in resultados:
+        for etapa, segundos in (r.get('tempos') or {}).items():
+            total[etapa] = total.get(etapa, 0) + segundos
+    return {etapa: round(segundos, 4) for etapa, segundos in total.items()}
+
+
+def workers_extracao(qtd_tarefas=None) -> int:
+    """Tamanho do pool: ``EXTRACAO_PDF_WORKERS`` ou nº de CPUs, nunca mais que o lote."""
+    try:
+        limite = int(os.environ.get('EXTRACAO_PDF_WORKERS') or 0)
+    except ValueError:
+        limite = 0
+    limite = limite if limite > 0 else (os.cpu_count() or 1)
+    if qtd_tarefas is not None:
+        limite = min(limite, qtd_tarefas)
+    return max(1, limite)
+
+
+def _contexto_mp():
+    # ``fork`` onde existe: ``spawn``/``forkserver`` reimportam o
+    # ``__main__`` em cada worker — com ``python app.py`` isso rodaria o
+    # bootstrap inteiro da aplicação. O filho só executa as funções puras
+    # deste módulo, sem tocar nas conexões herdadas.
+    nome = os.environ.get('EXTRACAO_PDF_MP_CONTEXT') or (
+        'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    )
+    return multiprocessing.get_context(nome)
+
+
+def _extrair_no_servidor(pdfs, workers):
+    """Extração sem isolamento (pool ou série). Devolve ``(resultados, workers)``."""
+    if workers == 1 or len(pdfs) <= 1:
+        return [extrair_documento(t) for t in pdfs], workers
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_contexto_mp()) as pool:
+            return list(pool.map(
+                extrair_documento, pdfs,
+                chunksize=max(1, len(pdfs) // (workers * 4)),
+            )), workers
+    except (OSError, BrokenProcessPool) as exc:
+        logger.warning(f"[EXTRACAO-PDF] pool indisponível ({exc!r}); extraindo em série")
+        return [extrair_documento(t) for t in pdfs], 1
+
+
+def extrair_lote(tarefas, max_workers=None) -> list[dict]:
+    """Extrai um lote de PDFs em paralelo. Resultados na ordem de ``tarefas``.
+
+    ``tarefas`` são ``TarefaExtracao`` (ou tuplas equivalentes). Os PDFs
+    vão para processos isolados (``services/sandbox_extracao.py``), mesmo
+    num lote de um arquivo; PDF problemático volta com ``falha``.
+
+    Com ``EXTRACAO_PDF_SANDBOX=off`` (ou se os processos não puderem ser
+    criados), volta ao modo anterior: lote de um arquivo, ou pool de um
+    worker, no próprio processo; senão ``ProcessPoolExecutor``, com
+    fallback serial.
+    """
+    from services.sandbox_extracao import extrair_isolado, sandbox_ativo
+
+    tarefas = [TarefaExtracao(*t) for t in tarefas]
+    if not tarefas:
+        return []
+    inicio = time.perf_counter()
+    # Notas com XML resolvem aqui mesmo (milissegundos); só os PDFs vão ao pool.
+    resultados = [_extrair_do_xml(t) for t in tarefas]
+    pdfs = [t for t, r in zip(tarefas, resultados) if r is None]
+    workers = max(1, min(max_workers or workers_extracao(), len(pdfs) or 1))
+    if pdfs and sandbox_ativo():
+        try:
+            extraidos = extrair_isolado(pdfs, workers)
+        except OSError as exc:
+            logger.warning(f"[EXTRACAO-PDF] processo isolado indisponível ({exc!r}); extraindo no servidor")
+            extraidos, workers = _extrair_no_servidor(pdfs, workers)
+    else:
+        extraidos, workers = _extrair_no_servidor(pdfs, workers)
+    extraidos = iter(extraidos)
+    resultados = [r if r is not None else next(extraidos) for r in resultados]
+    etapas = ' '.join(f"{etapa}={seg:.2f}" for etapa, seg in somar_tempos(resultados).items())
+    falhas = sum(1 for r in resultados if r.get('falha'))
+    logger.info(
+        f"[EXTRACAO-PDF] lote={len(tarefas)} xml={len(tarefas) - len(pdfs)} workers={workers} "
+        f"falhas={falhas} segundos={time.perf_counter() - inicio:.2f} etapas: {etapas}"
+    )
+    return resultados
+
+
+def _entrada_vigente(entrada):
+    return (entrada.get('textos') or {}).get('versao') == VERSAO_TEXTO
+
+
+def limpar_cache_extracao_pdf(dias=30) -> dict:
+    """Poda o cache: entradas antigas ou com textos de outra ``VERSAO_TEXTO``."""
+    return limpar_cache_extracao(dias=dias, valida=_entrada_vigente)
+
+
+__all__ = [
+    'VERSAO_TEXTO',
+    'VERSAO_CAMPOS',
+    'AnalisePdf',
+    'CAMPOS_PDF',
+    'texto_recortado_pdf',
+    'limpar_cache_extracao_pdf',
+    'TarefaExtracao',
+    'FALHA_TIMEOUT',
+    'FALHA_CORROMPIDO',
+    'FALHA_GRANDE_DEMAIS',
+    'FALHAS_DEFINITIVAS',
+    'DESCRICAO_FALHA',
+    'PdfGrandeDemais',
+    'max_paginas_pdf',
+    'classificar_falha',
+    'resultado_com_falha',
+    'extrair_documento',
+    'extrair_lote',
+    'somar_tempos',
+    'workers_extracao',
+]
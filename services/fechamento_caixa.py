@@ -0,0 +1,305 @@
+"""Fechamento mensal do Livro Caixa (transporte do Fundo de Caixa).
+
+Por que existir:
+    Todo ``GET /caixa`` chamava ``_tentar_fechamento_automatico_mes_anterior``:
+    checava se o mês anterior já tinha "Fundo de Caixa (Saída)", carregava
+    o mês inteiro em Python para somar os saldos por forma e, se houvesse
+    saldo positivo, gravava o transporte — dentro de uma requisição de
+    leitura. No dia 1º, dois usuários abrindo a tela ao mesmo tempo podiam
+    transportar o saldo em dobro.
+
+Como funciona agora:
+    * ``fechar_mes_caixa()`` é o único caminho que grava o transporte. Ele
+      registra um ``FechamentoMensalCaixa`` (UNIQUE empresa/setor/ano/mês)
+      na MESMA transação dos lançamentos de Fundo de Caixa: um segundo
+      fechamento concorrente esbarra na constraint e vira "já fechado".
+    * Os saldos por forma saem de um único ``GROUP BY`` no banco.
+    * ``fechar_meses_anteriores_pendentes()`` roda pelo APScheduler
+      (``app.py``, job ``fechamento_caixa_mensal``) para cada tenant/setor
+      cujo mês anterior ainda tem saldo positivo. ``GET /caixa`` só lê.
+
+Meses fechados antes desta tabela existir continuam reconhecidos pelo
+lançamento "Fundo de Caixa (Saída)". Se o usuário apagar os lançamentos de
+fundo de um mês fechado (para refazer o fechamento), o registro antigo é
+descartado e o mês pode ser fechado de novo.
+"""
+from __future__ import annotations
+
+import calendar
+from datetime import date
+from decimal import Decimal
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.exc import IntegrityError
+
+from models import (
+    db, LancamentoCaixa, SaldoMensalCaixa, FechamentoMensalCaixa,
+    CATEGORIA_FUNDO_SAIDA, CATEGORIA_FUNDO_ENTRADA,
+)
+from services.saldos_caixa import _expr_forma
+
+SETORES_CAIXA = ('GERAL', 'BACALHAU')
+# Formas canônicas usadas no transporte (espelham o select do modal).
+FORMAS_FUNDO_CAIXA = ('Dinheiro', 'Pix', 'Cheque', 'Boleto')
+_FORMA_POR_BUCKET = {f.lower(): f for f in FORMAS_FUNDO_CAIXA}
+_MESES_PT = {
+    1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril', 5: 'Maio', 6: 'Junho',
+    7: 'Julho', 8: 'Agosto', 9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro',
+}
+
+
+def _intervalo_mes(ano, mes):
+    inicio = date(ano, mes, 1)
+    fim = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+    return inicio, fim
+
+
+def _ultimo_dia_mes(ano, mes):
+    return date(ano, mes, calendar.monthrange(ano, mes)[1])
+
+
+def mes_anterior(hoje=None):
+    """``(ano, mes)`` do mês civil anterior a ``hoje``."""
+    hoje = hoje or date.today()
+    if hoje.month == 1:
+        return hoje.year - 1, 12
+    return hoje.year, hoje.month - 1
+
+
+def saldos_por_forma(empresa_id, setor, ano, mes):
+    """Saldo líquido (entradas − saídas) do mês por forma canônica.
+
+    Um ``GROUP BY`` pela forma normalizada; formas fora de
+    ``FORMAS_FUNDO_CAIXA`` não entram.
+    """
+    inicio, fim = _intervalo_mes(int(ano), int(mes))
+    forma = _expr_forma(LancamentoCaixa.forma_pagamento).label('forma')
+    linhas = db.session.execute(
+        select(
+            forma,
+            func.sum(case(
+                (LancamentoCaixa.tipo == 'ENTRADA', LancamentoCaixa.valor),
+                else_=-LancamentoCaixa.valor,
+            )),
+        )
+        .where(
+            LancamentoCaixa.empresa_id == empresa_id,
+            LancamentoCaixa.setor == setor,
+            LancamentoCaixa.data >= inicio,
+            LancamentoCaixa.data < fim,
+        )
+        .group_by(forma)
+    ).all()
+    saldos = {f: Decimal('0.00') for f in FORMAS_FUNDO_CAIXA}
+    for bucket, saldo in linhas:
+        nome = _FORMA_POR_BUCKET.get(bucket)
+        if nome:
+            saldos[nome] = Decimal(str(saldo or 0)).quantize(Decimal('0.01'))
+    return saldos
+
+
+def mes_ja_fechado(empresa_id, setor, ano, mes) -> bool:
+    """True se o mês/setor do tenant já tem "Fundo de Caixa (Saída)"."""
+    inicio, fim = _intervalo_mes(int(ano), int(mes))
+    return db.session.query(
+        LancamentoCaixa.query.filter(
+            LancamentoCaixa.empresa_id == empresa_id,
+            LancamentoCaixa.setor == setor,
+            LancamentoCaixa.data >= inicio,
+            LancamentoCaixa.data < fim,
+            LancamentoCaixa.tipo == 'SAIDA',
+            LancamentoCaixa.categoria == CATEGORIA_FUNDO_SAIDA,
+        ).exists()
+    ).scalar()
+
+
+def fechar_mes_caixa(empresa_id, setor, ano, mes, *, usuario_id=None, origem='MANUAL'):
+    """Transporta o saldo positivo do mês para o 1º dia do mês seguinte, por forma.
+
+    Para cada forma (Dinheiro, Pix, Cheque, Boleto) com saldo > 0:
+      * SAÍDA no último dia do mês — categoria ``Fundo de Caixa (Saída)``
+      * ENTRADA no 1º dia do mês seguinte — ``Fundo de Caixa (Entrada)``
+
+    Idempotente: mês já fechado (ou fechado por outro processo ao mesmo
+    tempo) não é alterado. Faz commit. Retorna dict com ``ok``,
+    ``mensagem``, ``transportado`` (lista de formas/valores) e, quando for
+    o caso, ``ja_fechado``.
+    """
+    mes = int(mes)
+    ano = int(ano)
+    setor = (setor or 'GERAL').strip().upper()
+    if setor not in SETORES_CAIXA:
+        setor = 'GERAL'
+    if mes < 1 or mes > 12:
+        return {'ok': False, 'mensagem': 'Mês inválido.', 'transportado': []}
+    if empresa_id is None:
+        return {'ok': False, 'mensagem': 'Empresa não identificada.', 'transportado': []}
+
+    ja_fechado = {
+        'ok': True,
+        'mensagem': 'Este mês já possui fechamento (Fundo de Caixa).',
+        'transportado': [],
+        'ja_fechado': True,
+    }
+    if mes_ja_fechado(empresa_id, setor, ano, mes):
+        return ja_fechado
+
+    registro_antigo = FechamentoMensalCaixa.query.filter_by(
+        empresa_id=empresa_id, setor=setor, ano=ano, mes=mes,
+    ).first()
+
+    saldos = saldos_por_forma(empresa_id, setor, ano, mes)
+    a_transportar = {forma: valor for forma, valor in saldos.items() if valor > Decimal('0.00')}
+    if not a_transportar:
+        return {
+            'ok': True,
+            'mensagem': 'Nenhum saldo positivo por forma de pagamento para transportar.',
+            'transportado': [],
+        }
+
+    data_saida = _ultimo_dia_mes(ano, mes)
+    data_entrada = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+    rotulo_mes = f"{_MESES_PT[mes]}/{ano}"
+
+    transportado = []
+    try:
+        if registro_antigo is not None:
+            # Fundo de Caixa apagado à mão: o fechamento anterior foi desfeito.
+            db.session.delete(registro_antigo)
+            db.session.flush()
+        db.session.add(FechamentoMensalCaixa(
+            empresa_id=empresa_id,
+            setor=setor,
+            ano=ano,
+            mes=mes,
+            origem=origem,
+            valor_transportado=sum(a_transportar.values(), Decimal('0.00')),
+            usuario_id=usuario_id,
+        ))
+        # A chave de idempotência vai primeiro: se outro processo já
+        # fechou o mês, o INSERT falha aqui, antes de qualquer lançamento.
+        db.session.flush()
+        for forma, valor in a_transportar.items():
+            db.session.add(LancamentoCaixa(
+                data=data_saida,
+                descricao=f'Fechamento mensal — transporte {forma} ({rotulo_mes})',
+                tipo='SAIDA',
+                categoria=CATEGORIA_FUNDO_SAIDA,
+                forma_pagamento=forma,
+                setor=setor,
+                valor=valor,
+                usuario_id=usuario_id,
+                empresa_id=empresa_id,
+            ))
+            db.session.add(LancamentoCaixa(
+                data=data_entrada,
+                descricao=f'Abertura de mês — fundo transportado de {rotulo_mes} ({forma})',
+                tipo='ENTRADA',
+                categoria=CATEGORIA_FUNDO_ENTRADA,
+                forma_pagamento=forma,
+                setor=setor,
+                valor=valor,
+                usuario_id=usuario_id,
+                empresa_id=empresa_id,
+            ))
+            transportado.append({'forma': forma, 'valor': float(valor)})
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return ja_fechado
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error('Falha no fechamento mensal do caixa', exc_info=True)
+        return {
+            'ok': False,
+            'mensagem': f'Erro ao realizar fechamento mensal: {e}',
+            'transportado': [],
+        }
+
+    try:
+        from services.cache_utils import limpar_cache_dashboard
+        limpar_cache_dashboard()
+    except Exception:
+        pass
+    return {
+        'ok': True,
+        'mensagem': (
+            f'Fechamento de {rotulo_mes} concluído. '
+            f'{len(transportado)} forma(s) transportada(s) para {data_entrada.strftime("%d/%m/%Y")}.'
+        ),
+        'transportado': transportado,
+        'data_saida': data_saida.isoformat(),
+        'data_entrada': data_entrada.isoformat(),
+    }
+
+
+def _candidatos_fechamento(ano, mes):
+    """``(empresa_id, setor)`` com saldo positivo em alguma forma e sem fundo.
+
+    Lê o resumo mensal (``saldos_mensais_caixa``): não toca nos lançamentos.
+    """
+    positivo = and_(
+        SaldoMensalCaixa.forma.in_(list(_FORMA_POR_BUCKET)),
+        SaldoMensalCaixa.entradas - SaldoMensalCaixa.saidas > 0,
+    )
+    return db.session.execute(
+        select(SaldoMensalCaixa.empresa_id, SaldoMensalCaixa.setor)
+        .where(SaldoMensalCaixa.ano == ano, SaldoMensalCaixa.mes == mes)
+        .group_by(SaldoMensalCaixa.empresa_id, SaldoMensalCaixa.setor)
+        .having(
+            func.sum(SaldoMensalCaixa.qtd_fundo_saida) == 0,
+            func.sum(case((positivo, 1), else_=0)) > 0,
+        )
+        .order_by(SaldoMensalCaixa.empresa_id, SaldoMensalCaixa.setor)
+    ).all()
+
+
+def fechar_meses_anteriores_pendentes(hoje=None):
+    """Fecha o mês civil anterior de todo tenant/setor que ainda tem saldo.
+
+    Roda diariamente (lançamento retroativo no mês anterior também é
+    transportado no dia seguinte). Retorna resumo com ``fechados``,
+    ``ja_fechados`` e ``falhas``.
+    """
+    ano, mes = mes_anterior(hoje)
+    resumo = {'ano': ano, 'mes': mes, 'fechados': 0, 'ja_fechados': 0, 'falhas': 0}
+    for empresa_id, setor in _candidatos_fechamento(ano, mes):
+        resultado = fechar_mes_caixa(empresa_id, setor, ano, mes, origem='AUTOMATICO')
+        if not resultado.get('ok'):
+            resumo['falhas'] += 1
+        elif resultado.get('ja_fechado'):
+            resumo['ja_fechados'] += 1
+        elif resultado.get('transportado'):
+            resumo['fechados'] += 1
+    return resumo
+
+
+def executar_fechamento_automatico():
+    """Ponto de entrada do job agendado."""
+    if not has_app_context():
+        from app import app as app_obj
+        with app_obj.app_context():
+            return executar_fechamento_automatico()
+    try:
+        resumo = fechar_meses_anteriores_pendentes()
+        current_app.logger.info(f"[FECHAMENTO-CAIXA] {resumo}")
+        return resumo
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.error(f"[FECHAMENTO-CAIXA] falha: {exc}", exc_info=True)
+        return None
+    finally:
+        db.session.remove()
+
+
+__all__ = [
+    'SETORES_CAIXA',
+    'FORMAS_FUNDO_CAIXA',
+    'mes_anterior',
+    'saldos_por_forma',
+    'mes_ja_fechado',
+    'fechar_mes_caixa',
+    'fechar_meses_anteriores_pendentes',
+    'executar_fechamento_automatico',
+]
@@ -0,0 +1,382 @@
+"""Recepção de boletos/NFs em background (RQ com fallback para thread local).
+
+Por que existir:
+    ``/upload``, ``/api/bot/upload``, ``/arquivos/upload_massa`` e
+    ``/api/receber_automatico`` enviavam o arquivo ao Cloudinary, liam o
+    PDF e tentavam o vínculo com a venda dentro do próprio request. Numa
+    rajada de envios do bot, cada arquivo prendia uma thread do Gunicorn
+    por segundos.
+
+Fluxo:
+    1. A rota valida e chama ``receber_documento``: grava o arquivo em
+       ``documentos_entrada/`` (na subpasta do tipo declarado, ou na raiz
+       quando o tipo não veio) e cria/reaproveita o ``Documento`` com
+       ``status_processamento = PROCESSANDO``. Responde na hora.
+    2. ``enfileirar_processamento_documento`` despacha para a fila RQ
+       (``fila_tarefas``) quando há worker escutando; senão, para um
+       ``ThreadPoolExecutor`` do processo web — mesmo critério de
+       ``services/importacao_jobs.py``.
+    3. ``executar_processamento_documento`` classifica o arquivo da raiz
+       (``organizar_arquivos(nomes=...)``) e roda
+       ``_processar_documentos_pendentes(somente=...)`` só para ele:
+       extração e vínculo pela NF; o envio ao Cloudinary vai para o spool
+       de ``services/uploads_nuvem.py``. Imagens só sobem para a nuvem.
+       XML da NF-e é lido como a nota; se o PDF da mesma nota estiver ao
+       lado, o documento do XML é descartado (o do PDF já lê o XML).
+       Fim: ``CONCLUIDO``.
+    4. Falha: ``tentativas_processamento`` +1, erro gravado na linha e
+       nova tentativa após ``_ESPERAS`` (30 s, 2 min, 10 min). Esgotadas
+       — ou arquivo não reconhecido — ``ERRO``. PDF que a extração isolada
+       não leu grava a causa em ``falha_extracao``; corrompido ou grande
+       demais vai direto para ``ERRO``, tempo esgotado tenta de novo.
+    5. ``retomar_documentos_parados`` (scheduler, a cada 10 min) reenfileira
+       ``PROCESSANDO`` sem sinal de vida há ``_PARADO_APOS`` (restart do
+       processo web com a thread ou o timer de retentativa em curso).
+
+Com RQ, as retentativas usam ``enqueue_in``: o worker precisa rodar com
+``rq worker --with-scheduler``.
+
+``status_processamento`` ``NULL`` (documentos anteriores à fila) equivale
+a ``CONCLUIDO``.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import or_
+
+from models import db, Documento, DOC_PROCESSANDO, DOC_CONCLUIDO, DOC_ERRO
+from services.extracao_pdf import DESCRICAO_FALHA, FALHAS_DEFINITIVAS
+from services.importacao_jobs import _rq_disponivel
+from services.uploads_nuvem import DESTINO_DOCUMENTO, disparar_uploads, guardar_para_upload
+
+PASTA_ENTRADA = 'documentos_entrada'
+SUBPASTA_POR_TIPO = {'BOLETO': 'boletos', 'NOTA_FISCAL': 'notas_fiscais'}
+TIPO_POR_SUBPASTA = {v: k for k, v in SUBPASTA_POR_TIPO.items()}
+
+# Espera antes de cada nova tentativa; tentativas = len(_ESPERAS) + 1.
+_ESPERAS = (30, 120, 600)
+_TIMEOUT_JOB_RQ = 10 * 60
+_PARADO_APOS = timedelta(minutes=15)
+_TAMANHO_ERRO = 1000
+
+_executor: ThreadPoolExecutor | None = None
+
+
+class FalhaDefinitiva(Exception):
+    """Falha que não melhora com nova tentativa (vai direto para ``ERRO``)."""
+
+
+def _executor_local() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='documentos')
+    return _executor
+
+
+def tipo_pelo_nome(nome_arquivo: str) -> str:
+    """Palpite de tipo pelo nome (``.xml``/``nfe``/``nota`` → NF); a leitura do PDF confirma."""
+    nome = (nome_arquivo or '').lower()
+    return 'NOTA_FISCAL' if (nome.endswith('.xml') or 'nfe' in nome or 'nota' in nome) else 'BOLETO'
+
+
+def fora_do_processamento():
+    """Filtro: documentos que já saíram da fila (ou nunca passaram por ela)."""
+    return or_(
+        Documento.status_processamento.is_(None),
+        Documento.status_processamento != DOC_PROCESSANDO,
+    )
+
+
+def receber_documento(arquivo, nome_arquivo: str, *, subpasta: str | None = None,
+                      usuario_id: int | None = None, empresa_id: int | None = None,
+                      **campos) -> Documento:
+    """Grava o upload (``FileStorage``) e registra o ``Documento`` como PROCESSANDO.
+
+    ``subpasta``: ``'boletos'``/``'notas_fiscais'`` quando o remetente
+    declarou o tipo; ``None`` deixa o arquivo na raiz para a classificação
+    do worker. ``campos`` (``numero_nf``, ``razao_social``, ``valor``)
+    vão direto para a linha. Reenvio do mesmo arquivo reaproveita o
+    documento existente e recomeça as tentativas.
+    """
+    partes = [PASTA_ENTRADA] + ([subpasta] if subpasta else [])
+    pasta = os.path.join(current_app.root_path, *partes)
+    os.makedirs(pasta, exist_ok=True)
+    try:
+        arquivo.stream.seek(0)
+    except (AttributeError, OSError):
+        pass
+    arquivo.save(os.path.join(pasta, nome_arquivo))
+
+    caminho_relativo = '/'.join(partes + [nome_arquivo])
+    documento = (
+        Documento.query.filter_by(caminho_arquivo=caminho_relativo)
+        .order_by(Documento.id.desc())
+        .first()
+    )
+    if documento is None:
+        documento = Documento(
+            caminho_arquivo=caminho_relativo,
+            usuario_id=usuario_id,
+            empresa_id=empresa_id,
+            venda_id=None,
+        )
+        db.session.add(documento)
+    documento.tipo = TIPO_POR_SUBPASTA.get(subpasta) or tipo_pelo_nome(nome_arquivo)
+    for nome, valor in campos.items():
+        if valor is not None:
+            setattr(documento, nome, valor)
+    documento.data_processamento = date.today()
+    documento.status_processamento = DOC_PROCESSANDO
+    documento.tentativas_processamento = 0
+    documento.erro_processamento = None
+    documento.falha_extracao = None
+    documento.processamento_atualizado_em = datetime.utcnow()
+    db.session.commit()
+    return documento
+
+
+def enfileirar_processamento_documento(documento_id: int, atraso: float = 0) -> str:
+    """Despacha o processamento (após ``atraso`` segundos). Retorna ``'rq'`` ou ``'thread'``."""
+    from app import fila_tarefas
+
+    if _rq_disponivel(fila_tarefas):
+        try:
+            if atraso:
+                fila_tarefas.enqueue_in(
+                    timedelta(seconds=atraso), executar_processamento_documento, documento_id,
+                    job_timeout=_TIMEOUT_JOB_RQ,
+                )
+            else:
+                fila_tarefas.enqueue(
+                    executar_processamento_documento, documento_id, job_timeout=_TIMEOUT_JOB_RQ,
+                )
+            current_app.logger.info(f"[FILA-DOCS] enfileirado rq doc={documento_id} atraso={atraso}s")
+            return 'rq'
+        except Exception as exc:
+            current_app.logger.warning(f"[FILA-DOCS] rq indisponível ({exc}); usando thread local")
+
+    app_obj = current_app._get_current_object()
+
+    def _rodar():
+        with app_obj.app_context():
+            executar_processamento_documento(documento_id)
+
+    if atraso:
+        timer = threading.Timer(atraso, lambda: _executor_local().submit(_rodar))
+        timer.daemon = True
+        timer.start()
+    else:
+        _executor_local().submit(_rodar)
+    current_app.logger.info(f"[FILA-DOCS] enfileirado thread doc={documento_id} atraso={atraso}s")
+    return 'thread'
+
+
+def _localizar_na_entrada(nome_arquivo):
+    """Subpasta de ``documentos_entrada/`` onde o arquivo está (ou ``None``)."""
+    base = os.path.join(current_app.root_path, PASTA_ENTRADA)
+    for subpasta in ('', 'boletos', 'notas_fiscais', 'bonificacoes', 'nao_identificados'):
+        if os.path.isfile(os.path.join(base, subpasta, nome_arquivo)):
+            return subpasta
+    return None
+
+
+def _falha_de_leitura(documento, falha, mensagem):
+    """Grava ``falha_extracao`` e levanta o erro: definitivo, ou nova tentativa no tempo esgotado."""
+    documento.falha_extracao = falha
+    db.session.commit()
+    if falha in FALHAS_DEFINITIVAS:
+        raise FalhaDefinitiva(mensagem)
+    raise TimeoutError(mensagem)
+
+
+def _classificar(documento):
+    """Arquivo ainda na raiz: move para a subpasta do tipo e atualiza a linha.
+
+    Devolve ``False`` quando o documento deixou de existir (bonificação).
+    """
+    from app import organizar_arquivos
+
+    nome = os.path.basename(documento.caminho_arquivo)
+    falha = None
+    if os.path.isfile(os.path.join(current_app.root_path, documento.caminho_arquivo)):
+        falha = organizar_arquivos(nomes=[nome])['falhas_extracao'].get(nome)
+    subpasta = _localizar_na_entrada(nome)
+    if falha:
+        if subpasta:
+            documento.caminho_arquivo = f'{PASTA_ENTRADA}/{subpasta}/{nome}'
+        _falha_de_leitura(documento, falha, f'{nome}: {DESCRICAO_FALHA[falha]}')
+    if subpasta is None or subpasta == '':
+        raise FileNotFoundError(f'Arquivo não encontrado em {PASTA_ENTRADA}/: {nome}')
+    if subpasta == 'bonificacoes':
+        db.session.delete(documento)
+        db.session.commit()
+        current_app.logger.info(f"[FILA-DOCS] {nome}: bonificação, documento descartado")
+        return False
+    documento.caminho_arquivo = f'{PASTA_ENTRADA}/{subpasta}/{nome}'
+    if subpasta == 'nao_identificados':
+        db.session.commit()
+        raise FalhaDefinitiva('Arquivo não reconhecido como boleto nem nota fiscal.')
+    documento.tipo = TIPO_POR_SUBPASTA[subpasta]
+    db.session.commit()
+    return True
+
+
+def _enviar_sem_leitura(documento, caminho_absoluto):
+    """Imagem (sem leitura de texto): só o envio ao Cloudinary, pelo spool."""
+    if documento.url_arquivo or not os.path.isfile(caminho_absoluto):
+        return
+    token = guardar_para_upload(
+        caminho_absoluto, DESTINO_DOCUMENTO, documento.id,
+        resource_type='raw', empresa_id=documento.empresa_id,
+        referencia=documento.caminho_arquivo,
+    )
+    disparar_uploads([token])
+
+
+def _xml_de_um_pdf(caminho_absoluto):
+    """XML da NF-e com o PDF da mesma nota ao lado (``nota.xml`` + ``nota.pdf``)."""
+    if not caminho_absoluto.lower().endswith('.xml'):
+        return False
+    base, _ = os.path.splitext(caminho_absoluto)
+    return os.path.isfile(base + '.pdf') or os.path.isfile(base + '.PDF')
+
+
+def _processar(documento):
+    """Pipeline de um documento. Devolve ``False`` se o documento foi descartado."""
+    from services.documentos_services import _processar_documentos_pendentes
+
+    relativo = documento.caminho_arquivo or ''
+    absoluto = os.path.join(current_app.root_path, relativo)
+    if not relativo.lower().endswith(('.pdf', '.xml')):
+        _enviar_sem_leitura(documento, absoluto)
+        return True
+    if os.path.dirname(relativo) == PASTA_ENTRADA and not _classificar(documento):
+        return False
+    absoluto = os.path.join(current_app.root_path, documento.caminho_arquivo)
+    if _xml_de_um_pdf(absoluto):
+        # O PDF da mesma nota já responde por ela e é lido por este XML.
+        db.session.delete(documento)
+        db.session.commit()
+        current_app.logger.info(f"[FILA-DOCS] {relativo}: XML acompanha o PDF, documento descartado")
+        return False
+    if not os.path.isfile(absoluto):
+        if documento.url_arquivo:
+            return True
+        raise FileNotFoundError(f'Arquivo ausente no servidor: {documento.caminho_arquivo}')
+
+    resultado = _processar_documentos_pendentes(
+        user_id_forcado=documento.usuario_id, somente=[documento.caminho_arquivo],
+    )
+    if resultado['erros']:
+        mensagem = '; '.join(resultado['mensagens'][-3:]) or 'Falha ao processar o documento.'
+        if documento.falha_extracao:
+            _falha_de_leitura(documento, documento.falha_extracao, mensagem)
+        raise RuntimeError(mensagem)
+    return True
+
+
+def _finalizar(documento_id, tentativa, erro=None, definitiva=False):
+    """Grava o desfecho da tentativa; falha com tentativas sobrando reagenda."""
+    documento = db.session.get(Documento, documento_id)
+    if documento is None:
+        return
+    documento.tentativas_processamento = tentativa
+    documento.processamento_atualizado_em = datetime.utcnow()
+    if erro is None:
+        documento.status_processamento = DOC_CONCLUIDO
+        documento.erro_processamento = None
+        db.session.commit()
+        return
+    documento.erro_processamento = str(erro)[:_TAMANHO_ERRO]
+    esgotou = definitiva or tentativa > len(_ESPERAS)
+    if esgotou:
+        documento.status_processamento = DOC_ERRO
+    db.session.commit()
+    if not esgotou:
+        enfileirar_processamento_documento(documento_id, atraso=_ESPERAS[tentativa - 1])
+
+
+def executar_processamento_documento(documento_id: int) -> None:
+    """Ponto de entrada do job (worker RQ ou thread local)."""
+    if not has_app_context():
+        from app import app as app_obj
+        with app_obj.app_context():
+            return executar_processamento_documento(documento_id)
+
+    documento = db.session.get(Documento, documento_id)
+    if documento is None or documento.status_processamento != DOC_PROCESSANDO:
+        return None
+    tentativa = (documento.tentativas_processamento or 0) + 1
+    documento.processamento_atualizado_em = datetime.utcnow()
+    db.session.commit()
+    current_app.logger.info(
+        f"[FILA-DOCS] start doc={documento_id} tentativa={tentativa} arquivo={documento.caminho_arquivo!r}"
+    )
+
+    erro, definitiva = None, False
+    try:
+        existe = _processar(documento)
+    except Exception as exc:
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        erro, definitiva, existe = exc, isinstance(exc, FalhaDefinitiva), True
+        current_app.logger.error(
+            f"[FILA-DOCS] falha doc={documento_id} tentativa={tentativa}: {exc}", exc_info=not definitiva,
+        )
+    if existe:
+        _finalizar(documento_id, tentativa, erro, definitiva)
+    current_app.logger.info(f"[FILA-DOCS] fim doc={documento_id} erro={erro is not None}")
+    try:
+        from services.cache_utils import limpar_cache_dashboard
+        limpar_cache_dashboard()
+    except Exception:
+        pass
+    return None
+
+
+def retomar_documentos_parados() -> int:
+    """Reenfileira documentos PROCESSANDO sem sinal de vida há ``_PARADO_APOS``."""
+    if not has_app_context():
+        from app import app as app_obj
+        with app_obj.app_context():
+            return retomar_documentos_parados()
+
+    limite = datetime.utcnow() - _PARADO_APOS
+    ids = [
+        doc_id for (doc_id,) in db.session.query(Documento.id).filter(
+            Documento.status_processamento == DOC_PROCESSANDO,
+            or_(
+                Documento.processamento_atualizado_em.is_(None),
+                Documento.processamento_atualizado_em < limite,
+            ),
+        ).all()
+    ]
+    if not ids:
+        return 0
+    agora = datetime.utcnow()
+    Documento.query.filter(Documento.id.in_(ids)).update(
+        {Documento.processamento_atualizado_em: agora}, synchronize_session=False,
+    )
+    db.session.commit()
+    for doc_id in ids:
+        enfileirar_processamento_documento(doc_id)
+    current_app.logger.info(f"[FILA-DOCS] retomados {len(ids)} documento(s) parados")
+    return len(ids)
+
+
+__all__ = [
+    'FalhaDefinitiva',
+    'tipo_pelo_nome',
+    'fora_do_processamento',
+    'receber_documento',
+    'enfileirar_processamento_documento',
+    'executar_processamento_documento',
+    'retomar_documentos_parados',
+]
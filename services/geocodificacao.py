@@ -0,0 +1,281 @@
+"""Geocodificação de clientes em background, com cache persistente.
+
+Por que existir:
+    ``/api/logistica/otimizar-rota`` geocodificava no próprio request os
+    clientes sem coordenada: Nominatim com timeout de 2 s por cliente,
+    ``sleep`` de 1,1 s entre chamadas e um commit por cliente. Uma rota
+    com 20 clientes novos travava o worker por ~40 s.
+
+Fluxo:
+    * Salvar/alterar endereço de cliente zera ``latitude``/``longitude``
+      (listener ``before_update`` abaixo) e a rota chama
+      ``agendar_geocodificacao(empresa_id)`` depois do commit.
+    * O job (fila RQ quando há worker; senão uma thread única do processo)
+      percorre os clientes sem coordenada do tenant, resolve cada endereço
+      pelo ``GeocodeCache`` e só consulta o Nominatim nos que faltam —
+      no máximo 1 requisição por ``_INTERVALO_NOMINATIM`` (política de uso
+      do serviço).
+    * A otimização de rota só **lê** coordenadas (cliente ou cache) e
+      nunca faz chamada externa.
+
+Endereços não encontrados também vão para o cache e só são consultados
+de novo depois de ``_RECONSULTAR_NAO_ENCONTRADO_APOS``. Falha de rede não
+é cacheada: o lote para e o próximo agendamento retoma.
+"""
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+import unicodedata
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect as sa_inspect, or_
+
+from models import db, Cliente, GeocodeCache
+
+NOMINATIM_USER_AGENT = 'SistemaMeninoDoAlho/1.0 (logistica-rota; contato@meninodoalho.local)'
+# Política do Nominatim público: no máximo 1 requisição por segundo.
+_INTERVALO_NOMINATIM = 1.1
+_TIMEOUT_NOMINATIM = 5
+_RECONSULTAR_NAO_ENCONTRADO_APOS = timedelta(days=30)
+# Teto de consultas externas por execução do job (o resto fica para a próxima).
+_MAX_CONSULTAS_POR_JOB = 300
+_COMMIT_A_CADA = 20
+_TIMEOUT_JOB_RQ = 60 * 60
+
+# Campos que compõem ``Cliente.endereco_para_mapa``.
+_CAMPOS_ENDERECO = ('endereco', 'cep', 'rua', 'numero', 'bairro', 'cidade', 'estado')
+
+_trava_nominatim = threading.Lock()
+_ultima_consulta = 0.0
+_executor: ThreadPoolExecutor | None = None
+_agendados: set[int] = set()
+_trava_agendados = threading.Lock()
+
+
+def normalizar_endereco(endereco) -> str:
+    """Chave do cache: maiúsculas, sem acento, pontuação/espaços colapsados."""
+    texto = unicodedata.normalize('NFKD', str(endereco or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).upper()
+    texto = re.sub(r'\s*,\s*', ', ', texto)
+    texto = re.sub(r'\s+', ' ', texto).strip(' ,')
+    return texto[:300]
+
+
+def consultar_nominatim(endereco, timeout=_TIMEOUT_NOMINATIM):
+    """Consulta o Nominatim respeitando o intervalo mínimo entre chamadas.
+
+    Returns:
+        ``(lat, lon)`` ou ``None`` se o endereço não foi encontrado.
+
+    Raises:
+        OSError: falha de rede/timeout (``URLError`` é subclasse).
+        ValueError: resposta que não é JSON (ex.: página de bloqueio).
+        Em ambos os casos o resultado não deve ir para o cache.
+    """
+    global _ultima_consulta
+    q = urllib.parse.quote(endereco)
+    url = (
+        'https://nominatim.openstreetmap.org/search'
+        f'?format=json&q={q}&limit=1&countrycodes=br'
+    )
+    req = urllib.request.Request(
+        url,
+        headers={'User-Agent': NOMINATIM_USER_AGENT, 'Accept': 'application/json'},
+    )
+    with _trava_nominatim:
+        espera = _INTERVALO_NOMINATIM - (time.monotonic() - _ultima_consulta)
+        if espera > 0:
+            time.sleep(espera)
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                data = json.loads(resp.read().decode('utf-8'))
+        finally:
+            _ultima_consulta = time.monotonic()
+    try:
+        if not data:
+            return None
+        return float(data[0]['lat']), float(data[0]['lon'])
+    except (ValueError, KeyError, TypeError, IndexError):
+        return None
+
+
+def coords_em_cache(endereco):
+    """``(lat, lon)`` do cache para o endereço, ou ``None``. Só leitura."""
+    chave = normalizar_endereco(endereco)
+    if not chave:
+        return None
+    item = db.session.get(GeocodeCache, chave)
+    if item is None or not item.encontrado:
+        return None
+    return item.latitude, item.longitude
+
+
+def _endereco_cliente(cliente) -> str:
+    return (cliente.endereco_para_mapa or cliente.endereco or '').strip()
+
+
+def _filtro_sem_coordenada():
+    return [
+        or_(Cliente.latitude.is_(None), Cliente.longitude.is_(None)),
+        or_(*[getattr(Cliente, c).isnot(None) & (getattr(Cliente, c) != '') for c in _CAMPOS_ENDERECO]),
+    ]
+
+
+def geocodificar_clientes_pendentes(empresa_id, max_consultas=_MAX_CONSULTAS_POR_JOB):
+    """Preenche lat/lon dos clientes do tenant que ainda não têm.
+
+    Retorna dict com ``atualizados``, ``nao_encontrados``, ``consultas``
+    (chamadas ao Nominatim) e ``pendentes`` (sobraram para a próxima).
+    """
+    clientes = (
+        Cliente.query
+        .filter(Cliente.empresa_id == empresa_id, *_filtro_sem_coordenada())
+        .order_by(Cliente.id)
+        .all()
+    )
+    resumo = {'atualizados': 0, 'nao_encontrados': 0, 'consultas': 0, 'pendentes': 0}
+    alterados = 0
+    for cliente in clientes:
+        chave = normalizar_endereco(_endereco_cliente(cliente))
+        if not chave:
+            continue
+        item = db.session.get(GeocodeCache, chave)
+        reconsultar = (
+            item is None
+            or (not item.encontrado and datetime.utcnow() - item.consultado_em > _RECONSULTAR_NAO_ENCONTRADO_APOS)
+        )
+        if reconsultar:
+            if resumo['consultas'] >= max_consultas:
+                resumo['pendentes'] += 1
+                continue
+            try:
+                coords = consultar_nominatim(chave)
+            except (OSError, ValueError) as exc:
+                current_app.logger.warning(f"[GEOCODE] Nominatim indisponível ({exc}); retomando depois.")
+                resumo['pendentes'] += 1
+                break
+            resumo['consultas'] += 1
+            if item is None:
+                item = GeocodeCache(endereco_normalizado=chave)
+                db.session.add(item)
+            item.latitude, item.longitude = coords if coords else (None, None)
+            item.consultado_em = datetime.utcnow()
+            alterados += 1
+        if item.encontrado:
+            cliente.latitude = item.latitude
+            cliente.longitude = item.longitude
+            resumo['atualizados'] += 1
+            alterados += 1
+        else:
+            resumo['nao_encontrados'] += 1
+        if alterados >= _COMMIT_A_CADA:
+            db.session.commit()
+            alterados = 0
+    db.session.commit()
+    current_app.logger.info(f"[GEOCODE] empresa={empresa_id} {resumo}")
+    return resumo
+
+
+def executar_geocodificacao(empresa_id):
+    """Ponto de entrada do job (worker RQ ou thread local)."""
+    if not has_app_context():
+        from app import app as app_obj
+        with app_obj.app_context():
+            return executar_geocodificacao(empresa_id)
+    # Sai do conjunto de "agendados" já no início: endereço salvo durante
+    # esta execução agenda uma nova passada em vez de ser ignorado.
+    with _trava_agendados:
+        _agendados.discard(empresa_id)
+    try:
+        return geocodificar_clientes_pendentes(empresa_id)
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.error(f"[GEOCODE] falha empresa={empresa_id}: {exc}", exc_info=True)
+        return None
+    finally:
+        db.session.remove()
+
+
+def _executor_local() -> ThreadPoolExecutor:
+    # Uma thread só: o limite de 1 req/s do Nominatim é global do processo.
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='geocode')
+    return _executor
+
+
+def agendar_geocodificacao(empresa_id) -> str | None:
+    """Agenda a geocodificação dos clientes pendentes do tenant.
+
+    Barato quando não há pendência (um ``EXISTS``). Retorna ``'rq'``,
+    ``'thread'`` ou ``None`` (nada a fazer / já agendado). Nunca levanta:
+    é chamado depois do commit de rotas de cadastro.
+    """
+    if empresa_id is None:
+        return None
+    try:
+        pendente = db.session.query(
+            Cliente.query.filter(Cliente.empresa_id == empresa_id, *_filtro_sem_coordenada()).exists()
+        ).scalar()
+        if not pendente:
+            return None
+        with _trava_agendados:
+            if empresa_id in _agendados:
+                return None
+            _agendados.add(empresa_id)
+
+        from app import fila_tarefas
+        from services.importacao_jobs import _rq_disponivel
+        if _rq_disponivel(fila_tarefas):
+            fila_tarefas.enqueue(
+                executar_geocodificacao, empresa_id,
+                job_id=f'geocodificacao-{empresa_id}', job_timeout=_TIMEOUT_JOB_RQ,
+            )
+            with _trava_agendados:
+                _agendados.discard(empresa_id)
+            return 'rq'
+
+        app_obj = current_app._get_current_object()
+
+        def _rodar():
+            with app_obj.app_context():
+                executar_geocodificacao(empresa_id)
+
+        _executor_local().submit(_rodar)
+        return 'thread'
+    except Exception as exc:
+        with _trava_agendados:
+            _agendados.discard(empresa_id)
+        current_app.logger.warning(f"[GEOCODE] não agendado empresa={empresa_id}: {exc}")
+        return None
+
+
+@event.listens_for(Cliente, 'before_update')
+def _cliente_before_update_limpa_coordenadas(mapper, connection, target):
+    """Endereço mudou → coordenadas antigas não valem mais.
+
+    Não vale quando a própria atualização grava lat/lon (geocodificador).
+    """
+    estado = sa_inspect(target)
+    if estado.attrs.latitude.history.has_changes() or estado.attrs.longitude.history.has_changes():
+        return
+    if any(estado.attrs[c].history.has_changes() for c in _CAMPOS_ENDERECO):
+        target.latitude = None
+        target.longitude = None
+
+
+__all__ = [
+    'normalizar_endereco',
+    'consultar_nominatim',
+    'coords_em_cache',
+    'geocodificar_clientes_pendentes',
+    'executar_geocodificacao',
+    'agendar_geocodificacao',
+]
@@ -0,0 +1,295 @@
+"""Importações de planilha em background (RQ com fallback para thread local).
+
+Por que existir:
+    ``importar_vendas``, ``importar_produtos``, ``importar_clientes`` e
+    ``importar_caixa`` processavam o arquivo dentro do próprio POST. Uma
+    planilha grande encostava no ``--timeout 60`` do Gunicorn e o worker
+    era morto no meio da importação — sem resposta para o usuário e com
+    metade das linhas gravadas.
+
+Fluxo:
+    1. A rota salva o upload em ``UPLOAD_FOLDER/importacoes/`` e chama
+       ``criar_job_importacao`` → linha ``JobImportacao`` (PENDENTE).
+    2. ``enfileirar_job_importacao`` manda o job para a fila RQ
+       (``fila_tarefas``) quando há Redis **e** algum worker escutando;
+       senão, para um ``ThreadPoolExecutor`` do próprio processo web.
+       O worker RQ precisa enxergar o mesmo ``UPLOAD_FOLDER`` (disco
+       compartilhado) — caso contrário, rode sem worker e o fallback
+       local assume.
+    3. ``executar_job_importacao`` chama o importador do tipo, que
+       reporta o avanço por ``ProgressoImportacao`` (linhas processadas,
+       erros até agora). A tela ``/importacoes/<id>`` faz polling em
+       ``/api/importacoes/<id>`` e mostra percentual e ETA.
+    4. No fim, ``erros_detalhados`` e as mensagens de sucesso ficam no
+       job; a página de resultado renderiza o mesmo template de antes.
+
+Contrato dos importadores (``processar_importacao_<tipo>`` nos blueprints):
+
+    def processar_importacao_x(caminho, nome_arquivo, *, empresa_id,
+                               usuario_id, progresso=None) -> dict
+
+    devolvendo ``sucesso``, ``erros``, ``ignorados``, ``erros_detalhados``
+    e ``mensagens`` (lista de ``(categoria, texto)`` para ``flash``).
+    Não dependem de ``current_user``: o tenant vem explícito.
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import update
+from werkzeug.utils import secure_filename
+
+from models import (
+    db, JobImportacao, JOB_PENDENTE, JOB_PROCESSANDO, JOB_CONCLUIDO, JOB_ERRO,
+)
+
+TIPOS_IMPORTACAO = ('vendas', 'produtos', 'clientes', 'caixa')
+
+# Intervalo mínimo entre duas gravações de progresso no banco.
+_INTERVALO_PROGRESSO = 1.0
+# Tempo máximo de execução na fila RQ.
+_TIMEOUT_JOB_RQ = 30 * 60
+# Job PENDENTE/PROCESSANDO sem atualização há mais que isso foi perdido
+# (ex.: restart do worker do Gunicorn no meio da thread).
+_JOB_ABANDONADO_APOS = timedelta(minutes=15)
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _executor_local() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='importacao')
+    return _executor
+
+
+def _importador(tipo):
+    """Resolve o importador do tipo (import tardio: os blueprints importam services)."""
+    if tipo == 'vendas':
+        from routes.vendas import processar_importacao_vendas
+        return processar_importacao_vendas
+    if tipo == 'produtos':
+        from routes.produtos import processar_importacao_produtos
+        return processar_importacao_produtos
+    if tipo == 'clientes':
+        from routes.clientes import processar_importacao_clientes
+        return processar_importacao_clientes
+    if tipo == 'caixa':
+        from routes.caixa import processar_importacao_caixa
+        return processar_importacao_caixa
+    raise ValueError(f'Tipo de importação desconhecido: {tipo!r}')
+
+
+def _atualizar_job(job_id: str, **campos) -> None:
+    """UPDATE direto numa conexão própria, fora da sessão do importador.
+
+    O progresso precisa ficar visível para o polling sem commitar o
+    trabalho (ainda não confirmado) que o importador mantém na sessão.
+    Falha aqui nunca derruba a importação: progresso é best-effort.
+    """
+    campos['atualizado_em'] = datetime.utcnow()
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(
+                update(JobImportacao.__table__)
+                .where(JobImportacao.__table__.c.id == job_id)
+                .values(**campos)
+            )
+    except Exception as exc:
+        current_app.logger.warning(f"[IMPORT-JOB] progresso não gravado job={job_id}: {exc}")
+
+
+class ProgressoImportacao:
+    """Callback ``progresso(processadas, total, erros)`` com throttling.
+
+    Os importadores chamam a cada linha; só grava no banco a cada
+    ``_INTERVALO_PROGRESSO`` segundos (ou quando ``total`` muda).
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._total = None
+        self._ultima_gravacao = 0.0
+        self.processadas = 0
+
+    def __call__(self, processadas: int, total: int | None = None, erros: int | None = None) -> None:
+        self.processadas = int(processadas)
+        agora = time.monotonic()
+        mudou_total = total is not None and total != self._total
+        if not mudou_total and agora - self._ultima_gravacao < _INTERVALO_PROGRESSO:
+            return
+        self._ultima_gravacao = agora
+        campos = {'linhas_processadas': int(processadas)}
+        if mudou_total:
+            self._total = total
+            campos['total_linhas'] = int(total)
+        if erros is not None:
+            campos['erros'] = int(erros)
+        _atualizar_job(self.job_id, **campos)
+
+
+def pasta_importacoes() -> str:
+    pasta = os.path.join(current_app.config['UPLOAD_FOLDER'], 'importacoes')
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+def criar_job_importacao(tipo: str, arquivo, *, empresa_id: int, usuario_id: int | None) -> JobImportacao:
+    """Salva o upload (``FileStorage``) e registra o job como PENDENTE.
+
+    O nome em disco leva o id do job: dois uploads simultâneos com o
+    mesmo nome de arquivo não se sobrescrevem.
+    """
+    if tipo not in TIPOS_IMPORTACAO:
+        raise ValueError(f'Tipo de importação desconhecido: {tipo!r}')
+    job = JobImportacao(
+        id=str(uuid.uuid4()), tipo=tipo, empresa_id=empresa_id,
+        usuario_id=usuario_id, status=JOB_PENDENTE,
+    )
+    nome = secure_filename(arquivo.filename or '') or 'arquivo'
+    caminho = os.path.join(pasta_importacoes(), f'{job.id}_{nome}')
+    arquivo.save(caminho)
+    job.nome_arquivo = nome
+    job.caminho_arquivo = caminho
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def _rq_disponivel(fila) -> bool:
+    """Fila existe e há pelo menos um worker RQ escutando nela."""
+    if fila is None:
+        return False
+    try:
+        from rq import Worker
+        return Worker.count(queue=fila) > 0
+    except Exception:
+        return False
+
+
+def enfileirar_job_importacao(job: JobImportacao) -> str:
+    """Despacha o job. Retorna ``'rq'`` ou ``'thread'`` (para log/testes)."""
+    from app import fila_tarefas
+
+    if _rq_disponivel(fila_tarefas):
+        try:
+            fila_tarefas.enqueue(
+                executar_job_importacao, job.id,
+                job_id=f'importacao-{job.id}', job_timeout=_TIMEOUT_JOB_RQ,
+            )
+            current_app.logger.info(f"[IMPORT-JOB] enfileirado rq job={job.id} tipo={job.tipo}")
+            return 'rq'
+        except Exception as exc:
+            current_app.logger.warning(f"[IMPORT-JOB] rq indisponível ({exc}); usando thread local")
+
+    app_obj = current_app._get_current_object()
+    job_id = job.id
+
+    def _rodar():
+        with app_obj.app_context():
+            executar_job_importacao(job_id)
+
+    _executor_local().submit(_rodar)
+    current_app.logger.info(f"[IMPORT-JOB] enfileirado thread job={job.id} tipo={job.tipo}")
+    return 'thread'
+
+
+def executar_job_importacao(job_id: str) -> None:
+    """Ponto de entrada do job (worker RQ ou thread local)."""
+    if not has_app_context():
+        from app import app as app_obj
+        with app_obj.app_context():
+            return executar_job_importacao(job_id)
+
+    job = db.session.get(JobImportacao, job_id)
+    if job is None or job.status != JOB_PENDENTE:
+        return None
+    tipo, caminho, nome = job.tipo, job.caminho_arquivo, job.nome_arquivo
+    empresa_id, usuario_id = job.empresa_id, job.usuario_id
+    inicio = datetime.utcnow()
+    job.status = JOB_PROCESSANDO
+    job.iniciado_em = inicio
+    job.atualizado_em = inicio
+    db.session.commit()
+    current_app.logger.info(f"[IMPORT-JOB] start job={job_id} tipo={tipo} arquivo={nome!r}")
+
+    progresso = ProgressoImportacao(job_id)
+    try:
+        resultado = _importador(tipo)(
+            caminho, nome,
+            empresa_id=empresa_id, usuario_id=usuario_id,
+            progresso=progresso,
+        )
+        campos = {
+            'status': JOB_CONCLUIDO,
+            'linhas_processadas': progresso.processadas,
+            'sucesso': int(resultado.get('sucesso') or 0),
+            'erros': int(resultado.get('erros') or 0),
+            'ignorados': int(resultado.get('ignorados') or 0),
+            'erros_detalhados': json.dumps(list(resultado.get('erros_detalhados') or []), ensure_ascii=False),
+            'mensagens': json.dumps([list(m) for m in resultado.get('mensagens') or []], ensure_ascii=False),
+        }
+        if campos['sucesso']:
+            from services.cache_utils import limpar_cache_dashboard
+            limpar_cache_dashboard()
+    except Exception as exc:
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        current_app.logger.error(f"[IMPORT-JOB] exception job={job_id} tipo={tipo}: {exc}", exc_info=True)
+        campos = {
+            'status': JOB_ERRO,
+            'erros': 1,
+            'erros_detalhados': json.dumps([f'Erro ao processar o arquivo: {exc}'], ensure_ascii=False),
+        }
+    finally:
+        if caminho and os.path.exists(caminho):
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+    campos['concluido_em'] = datetime.utcnow()
+    campos['caminho_arquivo'] = None
+    db.session.remove()
+    _atualizar_job(job_id, **campos)
+    current_app.logger.info(
+        f"[IMPORT-JOB] fim job={job_id} status={campos['status']} "
+        f"sucesso={campos.get('sucesso', 0)} erros={campos.get('erros', 0)}"
+    )
+    return None
+
+
+def marcar_se_abandonado(job: JobImportacao) -> bool:
+    """Fecha como ERRO um job sem sinal de vida há ``_JOB_ABANDONADO_APOS``."""
+    if job.finalizado or not job.atualizado_em:
+        return False
+    if datetime.utcnow() - job.atualizado_em < _JOB_ABANDONADO_APOS:
+        return False
+    job.status = JOB_ERRO
+    job.concluido_em = datetime.utcnow()
+    job.erros = job.erros or 1
+    job.erros_detalhados = json.dumps(
+        ['A importação foi interrompida (o servidor reiniciou durante o processamento). '
+         'Confira o que já foi gravado e importe novamente o arquivo.'],
+        ensure_ascii=False,
+    )
+    db.session.commit()
+    return True
+
+
+__all__ = [
+    'TIPOS_IMPORTACAO',
+    'ProgressoImportacao',
+    'criar_job_importacao',
+    'enfileirar_job_importacao',
+    'executar_job_importacao',
+    'marcar_se_abandonado',
+]
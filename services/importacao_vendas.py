@@ -0,0 +1,344 @@
+"""Motor de importação em massa de vendas (planilha/CSV → ``Venda``).
+
+Por que existir:
+    O ``importar_vendas`` original percorria a planilha linha a linha e,
+    para cada uma, consultava ``Cliente`` por CNPJ, depois por nome,
+    rodava uma query de duplicidade, travava o ``Produto`` com
+    ``FOR UPDATE`` e fazia ``commit`` — 4 a 5 round-trips por linha. Uma
+    planilha de 10 mil linhas passava facilmente do timeout do Gunicorn.
+
+Pipeline:
+    1. **Pré-carga**: clientes do tenant indexados por CNPJ e por nome
+       (``lower`` exato e ``_normalizar_nome_busca``); produtos por nome
+       normalizado (mesma regra de antes).
+    2. **Validação**: cada linha é convertida e validada em memória, com
+       as MESMAS mensagens de erro por linha (``_msg_linha``).
+    3. **Duplicidade**: uma única query traz as vendas do tenant no
+       intervalo de datas da planilha e monta um ``set`` de chaves
+       ``(cliente, produto, data, nf, preço, qtd)``. Linhas aceitas
+       entram no set, então duplicatas dentro do próprio arquivo também
+       são puladas (como acontecia com o commit por linha).
+    4. **Estoque**: todos os produtos envolvidos são travados numa única
+       passada ``SELECT ... FOR UPDATE`` (ordem de ``id`` para evitar
+       deadlock). A baixa é simulada em memória na ordem da planilha,
+       preservando a mensagem de "Estoque insuficiente" da linha que
+       estourou o saldo.
+    5. **Gravação**: ``INSERT`` em lote das vendas + atualização do
+       estoque agregado por produto, tudo numa única transação.
+
+Não depende de ``current_user``: recebe ``empresa_id`` explícito para
+poder rodar também fora de request (ex.: job em background).
+"""
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+from sqlalchemy import insert
+
+from models import db, Cliente, Produto, Venda
+from services.csv_utils import _msg_linha, _normalizar_nome_busca
+from services.diagnostico_vinculo import invalidar_diagnosticos_por_nf
+from services.indice_nf import nf_normalizada_de
+from services.normalizacao_planilha import (
+    coluna, strip_quotes_serie, parse_preco_serie,
+    parse_quantidade_serie, parse_data_serie,
+)
+
+# Valores de NF que o legado trata como "sem nota" na checagem de duplicidade.
+_NF_SEM_NOTA_BANCO = frozenset({'', '0', '0.0', 's/n'})
+# Chave sentinela para NF vazia/S-N dentro do set de duplicidade.
+_NF_VAZIA = ''
+
+
+def _nf_sem_nota(nf_val: str) -> bool:
+    """Mesma regra de ``nf_sn_zero`` do importador original."""
+    return (
+        nf_val.upper() in ('S/N', '0', '0.0') or nf_val == '' or
+        (nf_val.replace('.', '').replace(',', '').strip() == '0')
+    )
+
+
+def _chave_nf_banco(nf) -> str:
+    """Normaliza a NF gravada no banco para a chave de duplicidade."""
+    if nf is None:
+        return _NF_VAZIA
+    if nf in _NF_SEM_NOTA_BANCO or nf.lower() == 's/n':
+        return _NF_VAZIA
+    return nf
+
+
+def _indexar_clientes(empresa_id):
+    """Pré-carrega os clientes do tenant em três dicionários de busca.
+
+    Em caso de homônimos/CNPJ repetido vale o menor ``id`` — o mesmo
+    comportamento prático do ``.first()`` usado antes.
+    """
+    por_cnpj: dict[str, int] = {}
+    por_nome_lower: dict[str, int] = {}
+    por_nome_normalizado: dict[str, int] = {}
+    linhas = (
+        db.session.query(Cliente.id, Cliente.cnpj, Cliente.nome_cliente)
+        .filter(Cliente.empresa_id == empresa_id)
+        .order_by(Cliente.id.asc())
+        .all()
+    )
+    for cid, cnpj, nome in linhas:
+        if cnpj:
+            por_cnpj.setdefault(cnpj, cid)
+        if nome:
+            por_nome_lower.setdefault(nome.lower(), cid)
+            por_nome_normalizado.setdefault(_normalizar_nome_busca(nome), cid)
+    return por_cnpj, por_nome_lower, por_nome_normalizado
+
+
+def _carregar_chaves_duplicidade(empresa_id, data_min, data_max) -> set:
+    """Uma query sobre o intervalo de datas → ``set`` de chaves de venda."""
+    chaves = set()
+    if data_min is None or data_max is None:
+        return chaves
+    linhas = (
+        db.session.query(
+            Venda.cliente_id, Venda.produto_id, Venda.data_venda,
+            Venda.nf, Venda.preco_venda, Venda.quantidade_venda,
+        )
+        .filter(
+            Venda.empresa_id == empresa_id,
+            Venda.data_venda >= data_min,
+            Venda.data_venda <= data_max,
+        )
+        .all()
+    )
+    for cliente_id, produto_id, data_venda, nf, preco, qtd in linhas:
+        chaves.add((
+            cliente_id, produto_id, data_venda, _chave_nf_banco(nf),
+            Decimal(str(preco if preco is not None else 0)), qtd,
+        ))
+    return chaves
+
+
+def _resultado(sucesso, ignorados, erros_linha, erros_extras=()):
+    erros_detalhados = [msg for _, msg in sorted(erros_linha, key=lambda e: e[0])]
+    erros_detalhados.extend(erros_extras)
+    return {
+        'sucesso': sucesso,
+        'erros': len(erros_detalhados),
+        'ignorados': ignorados,
+        'erros_detalhados': erros_detalhados,
+    }
+
+
+def normalizar_planilha_vendas(df: pd.DataFrame, *, is_raw: bool) -> pd.DataFrame:
+    """Converte a planilha de vendas em colunas tipadas + máscaras de erro.
+
+    Uma linha por linha de ``df`` (mesma ordem), com ``linha_num``, os
+    textos já sem aspas, ``quantidade_venda``/``preco_venda``/``data_venda``
+    convertidos e as máscaras ``erro_quantidade``/``erro_preco``/
+    ``erro_data``. Os valores brutos seguem junto para as mensagens.
+    """
+    quantidade_bruta = coluna(df, 'quantidade', 'quantidade_venda', 'qtd', padrao=0)
+    preco_bruto = coluna(df, 'preco_venda', 'preco', padrao=0)
+    datas, data_bruta = parse_data_serie(coluna(df, 'data_venda', 'data', padrao=''))
+    quantidade = parse_quantidade_serie(quantidade_bruta)
+    preco = parse_preco_serie(preco_bruto)
+
+    empresa = strip_quotes_serie(coluna(df, 'empresa', 'empresa_faturadora', padrao='')).str.upper().str.strip()
+    situacao = strip_quotes_serie(
+        coluna(df, 'situacao', 'situação', 'status', padrao='PENDENTE').astype(object).map(str).str.strip().str.upper()
+    )
+    forma = strip_quotes_serie(coluna(df, 'forma_pagamento', 'forma', padrao='')).str.strip()
+
+    quantidade_num = pd.to_numeric(quantidade, errors='coerce')
+    return pd.DataFrame({
+        'linha_num': df.index + (1 if is_raw else 2),
+        'nome_cliente': strip_quotes_serie(coluna(df, 'cliente', 'nome_cliente', padrao='')),
+        'nome_produto': strip_quotes_serie(coluna(df, 'produto', 'nome_produto', padrao='')),
+        'cnpj': strip_quotes_serie(coluna(df, 'cnpj', padrao='')),
+        'quantidade_bruta': quantidade_bruta.astype(object),
+        'quantidade_venda': quantidade,
+        'erro_quantidade': quantidade_num.isna() | (quantidade_num <= 0),
+        'preco_bruto': preco_bruto.astype(object),
+        'preco_venda': preco,
+        'erro_preco': preco.map(lambda v: v is None).astype(bool),
+        'data_venda': datas,
+        'data_bruta': data_bruta,
+        'erro_data': datas.isna() & (data_bruta.str.strip() != ''),
+        'nf': strip_quotes_serie(coluna(df, 'nf', 'nota_fiscal', padrao='')).str.strip(),
+        'empresa_faturadora': empresa.where(empresa.isin(['PATY', 'DESTAK', 'NENHUM']), 'DESTAK'),
+        'situacao': situacao.str.contains('PAGO', regex=False).map({True: 'PAGO', False: 'PENDENTE'}),
+        'forma_pagamento': forma.where(forma != '', None).astype(object),
+    }, index=df.index)
+
+
+def importar_vendas_dataframe(df: pd.DataFrame, *, is_raw: bool, empresa_id: int, progresso=None) -> dict:
+    """Importa as vendas de ``df`` para o tenant ``empresa_id``.
+
+    Args:
+        df: DataFrame já com colunas normalizadas (ou canônicas, em modo raw).
+        is_raw: ``True`` para o formato posicional sem cabeçalho — muda
+            apenas a numeração de linha nas mensagens.
+        empresa_id: tenant dono das vendas.
+        progresso: callback opcional ``progresso(processadas, total, erros)``
+            (ver ``services.importacao_jobs.ProgressoImportacao``).
+
+    Returns:
+        Dict com ``sucesso``, ``erros``, ``ignorados`` e
+        ``erros_detalhados`` (lista de mensagens por linha), no mesmo
+        formato consumido por ``vendas/importar.html``.
+    """
+    # (linha, mensagem): as fases rodam em passadas separadas, então as
+    # mensagens são reordenadas pela linha da planilha no final.
+    erros_linha: list[tuple[int, str]] = []
+    ignorados = 0
+
+    clientes_cnpj, clientes_nome, clientes_nome_norm = _indexar_clientes(empresa_id)
+    produtos_por_nome = {
+        _normalizar_nome_busca(p.nome_produto): p.id
+        for p in Produto.query.filter_by(empresa_id=empresa_id).limit(5000).all()
+    }
+
+    # --- Fase 1: conversão vetorizada + validação (sem tocar no banco) ---
+    planilha = normalizar_planilha_vendas(df, is_raw=is_raw)
+    total_linhas = len(planilha)
+    if progresso:
+        progresso(0, total_linhas, 0)
+    candidatas = []
+    for n, r in enumerate(planilha.itertuples(index=False), start=1):
+        if progresso:
+            progresso(n, total_linhas, len(erros_linha))
+        linha_num = r.linha_num
+        nome_cliente = r.nome_cliente
+        nome_produto = r.nome_produto
+        contexto = f"{nome_cliente or '?'} / {nome_produto or '?'}"[:50]
+        try:
+            cnpj_cliente = r.cnpj or None
+            cliente_id = clientes_cnpj.get(cnpj_cliente) if cnpj_cliente else None
+            if not cliente_id and nome_cliente:
+                cliente_id = (
+                    clientes_nome.get(nome_cliente.lower())
+                    or clientes_nome_norm.get(_normalizar_nome_busca(nome_cliente))
+                )
+            if not cliente_id:
+                erros_linha.append((linha_num, _msg_linha(linha_num, nome_cliente or 'vazio', "O cliente não foi encontrado. Verifique se está cadastrado com esse nome exato (ou use o CNPJ)", True)))
+                continue
+            if not nome_produto:
+                erros_linha.append((linha_num, _msg_linha(linha_num, contexto, "O campo 'produto' (ou 'nome_produto') está vazio", True)))
+                continue
+            produto_id = produtos_por_nome.get(_normalizar_nome_busca(nome_produto))
+            if not produto_id:
+                erros_linha.append((linha_num, _msg_linha(linha_num, nome_produto, "O produto não foi encontrado. Verifique se está cadastrado (o nome é comparado ignorando espaços extras e maiúsculas/minúsculas)", True)))
+                continue
+            if r.erro_quantidade:
+                erros_linha.append((linha_num, _msg_linha(linha_num, contexto, f"A quantidade está vazia ou inválida ({r.quantidade_bruta}). Use um número inteiro (ex: 5)", True)))
+                continue
+            if r.erro_preco:
+                preco_raw = r.preco_bruto
+                txt = f"O preço '{preco_raw}' não pôde ser convertido. Use formato brasileiro (ex: 143,00 ou -120,00 para perdas) ou use ponto como decimal" if preco_raw and str(preco_raw).strip() else "O campo 'preco_venda' (ou 'preco') está vazio"
+                erros_linha.append((linha_num, _msg_linha(linha_num, contexto, txt, True)))
+                continue
+            if r.erro_data:
+                erros_linha.append((linha_num, _msg_linha(linha_num, contexto, f"O formato da data '{r.data_bruta}' é inválido. Use dd/mm/aaaa ou dd/mm/yy (ex: 01/01/2026 ou 01/01/26)", True)))
+                continue
+            preco_venda = r.preco_venda
+            if preco_venda < 0:
+                preco_venda = 0.0
+
+            candidatas.append({
+                'linha_num': linha_num,
+                'contexto': contexto,
+                'nome_produto': nome_produto,
+                'cliente_id': cliente_id,
+                'produto_id': produto_id,
+                'quantidade_venda': r.quantidade_venda,
+                'preco_venda': Decimal(str(preco_venda)),
+                'data_venda': r.data_venda if r.data_venda is not None else date.today(),
+                'nf_val': r.nf,
+                'empresa_faturadora': r.empresa_faturadora,
+                'situacao': r.situacao,
+                'forma_pagamento': r.forma_pagamento,
+            })
+        except Exception as e:
+            erros_linha.append((linha_num, _msg_linha(linha_num, contexto, f"Erro inesperado: {str(e)}", True)))
+
+    if not candidatas:
+        return _resultado(0, 0, erros_linha)
+
+    # --- Fase 2: duplicidade (1 query) + lock de estoque (1 query) ---
+    datas = [c['data_venda'] for c in candidatas]
+    chaves_existentes = _carregar_chaves_duplicidade(empresa_id, min(datas), max(datas))
+
+    ids_produtos = sorted({c['produto_id'] for c in candidatas})
+    produtos_travados = {
+        p.id: p
+        for p in (
+            Produto.query
+            .filter(Produto.empresa_id == empresa_id, Produto.id.in_(ids_produtos))
+            .order_by(Produto.id.asc())
+            .with_for_update()
+            .all()
+        )
+    }
+    saldo = {pid: int(p.estoque_atual or 0) for pid, p in produtos_travados.items()}
+
+    novas_vendas = []
+    for c in candidatas:
+        nf_key = _NF_VAZIA if _nf_sem_nota(c['nf_val']) else c['nf_val']
+        chave = (
+            c['cliente_id'], c['produto_id'], c['data_venda'], nf_key,
+            c['preco_venda'], c['quantidade_venda'],
+        )
+        if chave in chaves_existentes:
+            ignorados += 1
+            continue
+        disponivel = saldo.get(c['produto_id'])
+        if disponivel is None:
+            # Produto removido entre a pré-carga e o lock.
+            erros_linha.append((c['linha_num'], _msg_linha(c['linha_num'], c['nome_produto'], "O produto não foi encontrado. Verifique se está cadastrado (o nome é comparado ignorando espaços extras e maiúsculas/minúsculas)", True)))
+            continue
+        if disponivel < c['quantidade_venda']:
+            erros_linha.append((c['linha_num'], _msg_linha(c['linha_num'], c['nome_produto'], f"Estoque insuficiente. Disponível: {disponivel} unidades, solicitado: {c['quantidade_venda']}. Ajuste a quantidade ou o estoque", True)))
+            continue
+        saldo[c['produto_id']] = disponivel - c['quantidade_venda']
+        # O banco grava NUMERIC(10,2): a chave das linhas novas usa o valor
+        # arredondado, igual ao que a query de duplicidade enxergaria.
+        chaves_existentes.add(chave[:4] + (c['preco_venda'].quantize(Decimal('0.01')), c['quantidade_venda']))
+        novas_vendas.append({
+            'empresa_id': empresa_id,
+            'cliente_id': c['cliente_id'],
+            'produto_id': c['produto_id'],
+            'nf': c['nf_val'] if c['nf_val'] else None,
+            # INSERT em lote não passa pelos listeners de services/indice_nf.py.
+            'nf_normalizada': nf_normalizada_de(c['nf_val']) if c['nf_val'] else None,
+            'preco_venda': c['preco_venda'],
+            'quantidade_venda': c['quantidade_venda'],
+            'data_venda': c['data_venda'],
+            'empresa_faturadora': c['empresa_faturadora'],
+            'situacao': c['situacao'],
+            'forma_pagamento': c['forma_pagamento'],
+        })
+
+    # --- Fase 3: gravação em lote numa única transação ---
+    sucesso = 0
+    erros_extras: list[str] = []
+    if novas_vendas:
+        try:
+            db.session.execute(insert(Venda), novas_vendas)
+            # Idem para o diagnóstico da fila de documentos com as NFs novas.
+            invalidar_diagnosticos_por_nf([v['nf'] for v in novas_vendas if v['nf']])
+            for pid, produto in produtos_travados.items():
+                if saldo[pid] != int(produto.estoque_atual or 0):
+                    produto.estoque_atual = saldo[pid]
+            db.session.commit()
+            sucesso = len(novas_vendas)
+        except Exception as e:
+            db.session.rollback()
+            erros_extras.append(f"Erro ao gravar as vendas no banco (nenhuma venda foi salva): {str(e)}")
+    else:
+        # Libera os locks de estoque mesmo quando nada foi gravado.
+        db.session.rollback()
+
+    return _resultado(sucesso, ignorados, erros_linha, erros_extras)
+
+
+__all__ = ['importar_vendas_dataframe', 'normalizar_planilha_vendas']
@@ -0,0 +1,259 @@
+"""NF normalizada e indexada para o vínculo documento ↔ venda.
+
+Por que existir:
+    ``_processar_documentos_pendentes`` carregava TODAS as vendas com NF
+    (com cliente e produto) para cada PDF e normalizava uma a uma em
+    Python; o diagnóstico da fila e o auto-vínculo por NF carregavam até
+    5000 vendas e rodavam ``_normalizar_nf``/``_nf_match`` contra todas,
+    por documento — O(documentos × vendas), e o que passava de 5000
+    ficava de fora sem aviso.
+
+Como funciona:
+    * ``_normalizar_nf``/``_nf_match`` desceram do ``app.py`` sem mudança
+      (o ``app.py`` reimporta os nomes).
+    * ``Venda.nf_normalizada`` e ``Documento.nf_normalizada`` (indexadas)
+      guardam ``_normalizar_nf`` da NF (no documento, de ``nf_extraida``
+      ou ``numero_nf``). Listeners ``before_insert``/``before_update``
+      mantêm a coluna em qualquer gravação pelo ORM; o ``INSERT`` em lote
+      da importação de vendas preenche no próprio dict. ``NULL`` só
+      quando não há NF; NF sem dígitos vira ``''``.
+    * ``preencher_nf_normalizada()`` faz o backfill (bootstrap do
+      ``app.py``), idempotente.
+    * ``filtro_nf()`` traduz ``_nf_match`` em consultas de índice: igual,
+      faixa de prefixo (venda = NF do documento + sufixo de 2–4 dígitos)
+      e ``IN`` dos prefixos possíveis (documento = NF da venda + sufixo).
+      ``vendas_por_nf()``/``vendas_por_nfs()`` resolvem um documento ou
+      um lote inteiro sem varrer a tabela.
+"""
+from __future__ import annotations
+
+import re
+
+from sqlalchemy import and_, bindparam, event, func, inspect as sa_inspect, or_, select, update
+
+from models import db, Documento, Venda
+
+# Tamanho do sufixo aceito por ``_nf_match`` (ex.: 12263 vs 12263-01).
+_SUFIXO_MIN, _SUFIXO_MAX = 2, 4
+# NFs por consulta em ``vendas_por_nfs`` (cada uma vira um ``OR`` de faixa + ``IN``).
+_LOTE_NFS = 100
+_LOTE_BACKFILL = 1000
+
+
+def _normalizar_nf(s):
+    """Normaliza NF para comparação: remove prefixos (NF-, NF , NF), só dígitos, remove zeros à esquerda.
+    Ex.: '000042234' -> '42234', 'NF-00042234' -> '42234'. Retorna '' se vazio."""
+    if not s:
+        return ''
+    t = str(s).strip()
+    for prefix in ('NF-', 'NF ', 'NF:'):
+        if t.upper().startswith(prefix.upper()):
+            t = t[len(prefix):].strip()
+            break
+    if t.upper().startswith('NF'):
+        t = re.sub(r'^NF\s*', '', t, flags=re.IGNORECASE).strip()
+    digs = re.sub(r'\D', '', t)
+    if not digs:
+        return ''
+    return digs.lstrip('0') or '0'
+
+
+def _nf_match(doc_norm, venda_norm):
+    """True se as NFs normalizadas são iguais ou uma é base + sufixo numérico (ex.: 12263 vs 12263-01 → 1226301).
+    Sufixo permitido: 2–4 dígitos, para evitar falsos positivos (ex.: 1226 vs 12263)."""
+    if doc_norm == venda_norm:
+        return True
+    if not doc_norm or not venda_norm:
+        return False
+
+    def ok_suffix(shorter, longer):
+        if not longer.startswith(shorter) or longer == shorter:
+            return False
+        suf = longer[len(shorter):]
+        return suf.isdigit() and 2 <= len(suf) <= 4
+
+    return ok_suffix(doc_norm, venda_norm) or ok_suffix(venda_norm, doc_norm)
+
+
+def nf_normalizada_de(nf):
+    """Valor da coluna ``nf_normalizada`` para uma NF crua (``None`` sem NF)."""
+    if nf is None or not str(nf).strip():
+        return None
+    return _normalizar_nf(nf)
+
+
+def _nf_do_documento(doc_ou_linha):
+    return (getattr(doc_ou_linha, 'nf_extraida', None) or getattr(doc_ou_linha, 'numero_nf', None) or '').strip()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Consulta indexada
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _teto_prefixo(nf_norm):
+    """Menor sequência de dígitos acima de todas as que começam com ``nf_norm``.
+
+    ``'12263'`` → ``'12264'``; ``'1299'`` → ``'13'``; só noves → ``None``.
+    Só dígitos nas duas pontas: a ordem é a mesma em qualquer collation.
+    """
+    base = nf_norm.rstrip('9')
+    if not base:
+        return None
+    return base[:-1] + str(int(base[-1]) + 1)
+
+
+def filtro_nf(coluna, nf_norm, sufixo=True):
+    """Condição SQL equivalente a ``_nf_match(nf_norm, coluna)``.
+
+    ``sufixo=False`` é só igualdade. Com sufixo: faixa
+    ``[nf_norm, teto)`` limitada ao comprimento exato ou +2..+4, ou
+    ``IN`` dos prefixos de ``nf_norm`` com 2..4 dígitos a menos — todas
+    as partes usam o índice da coluna.
+    """
+    if not sufixo:
+        return coluna == nf_norm
+    n = len(nf_norm)
+    faixa = [coluna >= nf_norm]
+    teto = _teto_prefixo(nf_norm)
+    if teto is not None:
+        faixa.append(coluna < teto)
+    faixa.append(func.length(coluna).in_([n] + list(range(n + _SUFIXO_MIN, n + _SUFIXO_MAX + 1))))
+    prefixos = [nf_norm[:n - k] for k in range(_SUFIXO_MIN, _SUFIXO_MAX + 1) if n - k >= 1]
+    condicao = and_(*faixa)
+    if prefixos:
+        condicao = or_(condicao, coluna.in_(prefixos))
+    return condicao
+
+
+def _consulta_vendas(empresa_id, opcoes):
+    consulta = Venda.query
+    if empresa_id is not None:
+        consulta = consulta.filter(Venda.empresa_id == empresa_id)
+    if opcoes:
+        consulta = consulta.options(*opcoes)
+    return consulta
+
+
+def vendas_por_nf(nf, empresa_id=None, sufixo=True, opcoes=()):
+    """Vendas cuja NF casa com ``nf`` (crua ou normalizada), em ordem de id.
+
+    ``empresa_id=None`` busca em todos os tenants (jobs sem request).
+    ``opcoes``: ``joinedload(...)`` etc. repassados à consulta.
+    """
+    nf_norm = _normalizar_nf(nf)
+    if not nf_norm:
+        return []
+    vendas = (
+        _consulta_vendas(empresa_id, opcoes)
+        .filter(filtro_nf(Venda.nf_normalizada, nf_norm, sufixo))
+        .order_by(Venda.id)
+        .all()
+    )
+    if not sufixo:
+        return vendas
+    return [v for v in vendas if _nf_match(nf_norm, v.nf_normalizada or '')]
+
+
+def vendas_por_nfs(nfs, empresa_id=None, sufixo=True, opcoes=()):
+    """``{nf_normalizada: [Venda, ...]}`` para várias NFs, em poucas consultas.
+
+    Uma consulta a cada ``_LOTE_NFS`` NFs; cada venda é atribuída a todas
+    as NFs com que casa. NFs sem correspondência voltam com lista vazia.
+    """
+    normalizadas = sorted({n for n in (_normalizar_nf(nf) for nf in nfs) if n})
+    resultado = {n: [] for n in normalizadas}
+    for i in range(0, len(normalizadas), _LOTE_NFS):
+        lote = normalizadas[i:i + _LOTE_NFS]
+        vendas = (
+            _consulta_vendas(empresa_id, opcoes)
+            .filter(or_(*[filtro_nf(Venda.nf_normalizada, n, sufixo) for n in lote]))
+            .order_by(Venda.id)
+            .all()
+        )
+        for venda in vendas:
+            nf_venda = venda.nf_normalizada or ''
+            for n in lote:
+                if (nf_venda == n) if not sufixo else _nf_match(n, nf_venda):
+                    resultado[n].append(venda)
+    return resultado
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Manutenção automática
+# ─────────────────────────────────────────────────────────────────────────────
+
+@event.listens_for(Venda, 'before_insert')
+def _venda_before_insert_nf(mapper, connection, target):
+    target.nf_normalizada = nf_normalizada_de(target.nf)
+
+
+@event.listens_for(Venda, 'before_update')
+def _venda_before_update_nf(mapper, connection, target):
+    if sa_inspect(target).attrs.nf.history.has_changes():
+        target.nf_normalizada = nf_normalizada_de(target.nf)
+
+
+@event.listens_for(Documento, 'before_insert')
+def _documento_before_insert_nf(mapper, connection, target):
+    target.nf_normalizada = nf_normalizada_de(_nf_do_documento(target))
+
+
+@event.listens_for(Documento, 'before_update')
+def _documento_before_update_nf(mapper, connection, target):
+    estado = sa_inspect(target)
+    if estado.attrs.nf_extraida.history.has_changes() or estado.attrs.numero_nf.history.has_changes():
+        target.nf_normalizada = nf_normalizada_de(_nf_do_documento(target))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Backfill do histórico
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _gravar_lote(tabela, linhas):
+    for i in range(0, len(linhas), _LOTE_BACKFILL):
+        db.session.execute(
+            update(tabela)
+            .where(tabela.c.id == bindparam('rid'))
+            .values(nf_normalizada=bindparam('nfn')),
+            linhas[i:i + _LOTE_BACKFILL],
+        )
+
+
+def preencher_nf_normalizada() -> dict:
+    """Preenche ``nf_normalizada`` onde há NF e a coluna ainda está ``NULL``.
+
+    Idempotente (NF sem dígitos grava ``''``, não volta a aparecer).
+    NÃO faz commit. Retorna ``{'vendas': int, 'documentos': int}``.
+    """
+    v = Venda.__table__
+    linhas_vendas = [
+        {'rid': rid, 'nfn': _normalizar_nf(nf)}
+        for rid, nf in db.session.execute(
+            select(v.c.id, v.c.nf).where(v.c.nf_normalizada.is_(None), v.c.nf.isnot(None))
+        )
+        if nf_normalizada_de(nf) is not None
+    ]
+    _gravar_lote(v, linhas_vendas)
+
+    d = Documento.__table__
+    linhas_docs = []
+    for rid, nf_extraida, numero_nf in db.session.execute(
+        select(d.c.id, d.c.nf_extraida, d.c.numero_nf).where(
+            d.c.nf_normalizada.is_(None),
+            or_(d.c.nf_extraida.isnot(None), d.c.numero_nf.isnot(None)),
+        )
+    ):
+        nfn = nf_normalizada_de((nf_extraida or numero_nf or '').strip())
+        if nfn is not None:
+            linhas_docs.append({'rid': rid, 'nfn': nfn})
+    _gravar_lote(d, linhas_docs)
+    return {'vendas': len(linhas_vendas), 'documentos': len(linhas_docs)}
+
+
+__all__ = [
+    'nf_normalizada_de',
+    'filtro_nf',
+    'vendas_por_nf',
+    'vendas_por_nfs',
+    'preencher_nf_normalizada',
+]
@@ -0,0 +1,195 @@
+"""Leitura da linha digitável do boleto (vencimento e valor sem heurística).
+
+Por que existir:
+    ``_extrair_data_vencimento`` e ``_extrair_valor_boleto`` caçam o
+    vencimento e o valor com uma cascata de regex sobre o texto recortado
+    de todas as páginas — que é a etapa mais cara da extração. A linha
+    digitável (47 dígitos no boleto bancário, 48 na arrecadação) já traz
+    o fator de vencimento e o valor, com dígitos verificadores.
+
+Como funciona:
+    * ``localizar_linha_digitavel(texto)`` procura, linha a linha, grupos
+      de dígitos consecutivos que somem 47/48 dígitos e devolve o
+      primeiro que passa em todos os DVs. Só se nenhum passar tenta o
+      código de barras de 44 num grupo só: a chave de acesso da NF-e
+      impressa no boleto também tem 44 dígitos.
+    * Boleto bancário: moeda ``9`` (real), DV módulo 10 de cada um dos 3
+      campos e DV geral módulo 11 do código de barras montado. Fator de vencimento: dias
+      desde 07/10/1997; em 22/02/2025 o fator voltou a 1000 (ciclo de
+      9000 dias), então a data escolhida é a do ciclo mais próximo de
+      ``referencia`` (hoje, por padrão). Fator ``0000`` ou valor zero
+      (boleto sem vencimento/valor livre) não preenchem o campo.
+    * Arrecadação (começa com 8): DV de cada bloco e geral em módulo 10
+      ou 11 conforme o identificador de valor; só há valor quando o
+      identificador é de valor efetivo (6 ou 8). Vencimento não tem
+      posição padronizada — fica ``None``.
+
+O módulo é puro (sem Flask, sem banco): roda nos workers da extração.
+"""
+from __future__ import annotations
+
+import re
+from datetime import date, timedelta
+from typing import NamedTuple
+
+TIPO_BANCARIO = 'BANCARIO'
+TIPO_ARRECADACAO = 'ARRECADACAO'
+
+_BASE_FATOR = date(1997, 10, 7)
+_CICLO_FATOR = 9000  # fator 9999 (21/02/2025) volta para 1000 (22/02/2025)
+
+# Grupo de dígitos da linha digitável (o ponto separa os campos: 23790.12345).
+_GRUPO = re.compile(r'\d+(?:\.\d+)*')
+
+
+class LinhaDigitavel(NamedTuple):
+    tipo: str                     # TIPO_BANCARIO / TIPO_ARRECADACAO
+    codigo_barras: str            # 44 dígitos
+    banco: str | None             # código do banco (bancário)
+    fator_vencimento: int | None
+    vencimento: date | None
+    valor: float | None
+
+
+def _mod10(numero):
+    """DV módulo 10 (pesos 2,1 da direita para a esquerda, soma dos algarismos)."""
+    soma = 0
+    for i, d in enumerate(reversed(numero)):
+        produto = int(d) * (2 if i % 2 == 0 else 1)
+        soma += produto // 10 + produto % 10
+    return (10 - soma % 10) % 10
+
+
+def _soma_mod11(numero):
+    return sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(numero)))
+
+
+def _mod11_bancario(numero):
+    """DV geral do código de barras bancário (resto 0, 1 ou 10 → 1)."""
+    dv = 11 - _soma_mod11(numero) % 11
+    return 1 if dv in (0, 10, 11) else dv
+
+
+def _mod11_arrecadacao(numero):
+    resto = _soma_mod11(numero) % 11
+    return 0 if resto in (0, 1) else 11 - resto
+
+
+def data_do_fator(fator, referencia=None):
+    """Data do fator de vencimento no ciclo mais próximo de ``referencia``."""
+    if not fator or fator < 1000:
+        return None
+    referencia = referencia or date.today()
+    data = _BASE_FATOR + timedelta(days=fator)
+    ciclos = max(0, round((referencia - data).days / _CICLO_FATOR))
+    return data + timedelta(days=ciclos * _CICLO_FATOR)
+
+
+def _valor_centavos(digitos):
+    centavos = int(digitos)
+    return round(centavos / 100, 2) if centavos else None
+
+
+def _bancario_do_codigo(codigo, referencia):
+    # Moeda 9 (real): descarta a maior parte dos 44 dígitos que não são
+    # boleto (chave de acesso da NF-e) antes do DV, que passa 1 vez em 11.
+    if codigo[0] == '8' or codigo[3] != '9' or int(codigo[4]) != _mod11_bancario(codigo[:4] + codigo[5:]):
+        return None
+    fator = int(codigo[5:9])
+    return LinhaDigitavel(
+        tipo=TIPO_BANCARIO,
+        codigo_barras=codigo,
+        banco=codigo[:3],
+        fator_vencimento=fator or None,
+        vencimento=data_do_fator(fator, referencia),
+        valor=_valor_centavos(codigo[9:19]),
+    )
+
+
+def _arrecadacao_do_codigo(codigo):
+    if codigo[0] != '8' or codigo[2] not in '6789':
+        return None
+    dv = _mod10 if codigo[2] in '67' else _mod11_arrecadacao
+    if int(codigo[3]) != dv(codigo[:3] + codigo[4:]):
+        return None
+    return LinhaDigitavel(
+        tipo=TIPO_ARRECADACAO,
+        codigo_barras=codigo,
+        banco=None,
+        fator_vencimento=None,
+        vencimento=None,
+        valor=_valor_centavos(codigo[4:15]) if codigo[2] in '68' else None,
+    )
+
+
+def decodificar_linha_digitavel(texto, referencia=None) -> LinhaDigitavel | None:
+    """Valida e decodifica uma linha digitável (47/48) ou código de barras (44).
+
+    ``texto`` pode vir formatado (pontos, espaços). ``None`` se o tamanho
+    não bate ou qualquer dígito verificador falha.
+    """
+    digitos = re.sub(r'\D', '', texto or '')
+    if len(digitos) == 47:
+        campos = ((0, 9), (10, 20), (21, 31))
+        if any(int(digitos[fim]) != _mod10(digitos[ini:fim]) for ini, fim in campos):
+            return None
+        codigo = digitos[:4] + digitos[32] + digitos[33:47] + digitos[4:9] + digitos[10:20] + digitos[21:31]
+        return _bancario_do_codigo(codigo, referencia)
+    if len(digitos) == 48:
+        if digitos[0] != '8' or digitos[2] not in '6789':
+            return None
+        dv = _mod10 if digitos[2] in '67' else _mod11_arrecadacao
+        blocos = [digitos[i:i + 12] for i in range(0, 48, 12)]
+        if any(int(b[11]) != dv(b[:11]) for b in blocos):
+            return None
+        return _arrecadacao_do_codigo(''.join(b[:11] for b in blocos))
+    if len(digitos) == 44:
+        if digitos[0] == '8':
+            return _arrecadacao_do_codigo(digitos)
+        return _bancario_do_codigo(digitos, referencia)
+    return None
+
+
+def localizar_linha_digitavel(texto, referencia=None) -> LinhaDigitavel | None:
+    """Primeira linha digitável (ou código de barras) válida do texto.
+
+    Cada linha do texto vira uma sequência de grupos de dígitos
+    (``23790.12345``, ``6``, ``95670000123456``...); testa-se toda janela
+    de grupos consecutivos com 47 ou 48 dígitos e, se nenhuma valer, os
+    grupos únicos de 44 (código de barras).
+    """
+    if not texto:
+        return None
+    linhas = []
+    for linha in texto.splitlines():
+        grupos = [g.replace('.', '') for g in _GRUPO.findall(linha)]
+        if sum(map(len, grupos)) >= 44:
+            linhas.append(grupos)
+    for grupos in linhas:
+        for i in range(len(grupos)):
+            digitos = ''
+            for seguinte in grupos[i:]:
+                digitos += seguinte
+                if len(digitos) > 48:
+                    break
+                if len(digitos) in (47, 48):
+                    resultado = decodificar_linha_digitavel(digitos, referencia)
+                    if resultado is not None:
+                        return resultado
+    for grupos in linhas:
+        for grupo in grupos:
+            if len(grupo) == 44:
+                resultado = decodificar_linha_digitavel(grupo, referencia)
+                if resultado is not None:
+                    return resultado
+    return None
+
+
+__all__ = [
+    'TIPO_BANCARIO',
+    'TIPO_ARRECADACAO',
+    'LinhaDigitavel',
+    'data_do_fator',
+    'decodificar_linha_digitavel',
+    'localizar_linha_digitavel',
+]
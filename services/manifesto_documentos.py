@@ -0,0 +1,209 @@
+"""Manifesto dos PDFs já vistos em ``documentos_entrada/`` (varredura incremental).
+
+Por que existir:
+    Cada execução de ``_processar_documentos_pendentes`` listava
+    ``boletos/`` e ``notas_fiscais/`` e fazia um
+    ``Documento.query.filter_by(caminho_arquivo=...)`` por arquivo,
+    inclusive para PDFs vinculados há meses.
+
+Como funciona:
+    * Uma entrada por arquivo (caminho relativo): tamanho, ``mtime_ns``,
+      SHA-256, status e quando foi conferida no banco.
+    * ``VINCULADO`` é o único status que dispensa a varredura: arquivo
+      com mesmo tamanho/mtime (ou, se o mtime mudou, mesmo SHA-256) é
+      pulado sem tocar no banco. ``PENDENTE``/``SEM_REGISTRO`` voltam
+      sempre — o vínculo depende de vendas que podem ter chegado.
+    * Entradas conferidas há mais de ``MANIFESTO_DOCUMENTOS_REVALIDAR_HORAS``
+      (padrão 24) voltam para a varredura: pega documento apagado ou
+      desvinculado direto no banco.
+    * ``forcar=True`` (ação "forçar leitura") ignora o manifesto.
+    * JSON único gravado de forma atômica. Duas varreduras simultâneas:
+      vale a última gravação; no pior caso um arquivo é revarrido.
+
+Configuração: ``MANIFESTO_DOCUMENTOS_PATH`` (padrão
+``instance/manifesto_documentos.json``; ``0``/``off`` desliga).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import time
+
+from services.cache_extracao_pdf import sha256_arquivo
+
+logger = logging.getLogger(__name__)
+
+STATUS_VINCULADO = 'VINCULADO'
+STATUS_PENDENTE = 'PENDENTE'          # Documento no banco, sem venda
+STATUS_SEM_REGISTRO = 'SEM_REGISTRO'  # PDF sem Documento (falha de extração/gravação)
+
+_CAMINHO_PADRAO = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'manifesto_documentos.json',
+)
+_VERSAO = 1
+
+
+def caminho_manifesto() -> str | None:
+    """Arquivo do manifesto, ou ``None`` se desligado."""
+    valor = os.environ.get('MANIFESTO_DOCUMENTOS_PATH')
+    if valor is None:
+        return _CAMINHO_PADRAO
+    valor = valor.strip()
+    if valor.lower() in ('', '0', 'off', 'false'):
+        return None
+    return valor
+
+
+def _revalidar_segundos() -> float:
+    try:
+        horas = float(os.environ.get('MANIFESTO_DOCUMENTOS_REVALIDAR_HORAS') or 24)
+    except ValueError:
+        horas = 24
+    return max(0.0, horas) * 3600
+
+
+class ManifestoDocumentos:
+    """Manifesto carregado em memória; ``salvar()`` grava de volta.
+
+        manifesto = ManifestoDocumentos.carregar()
+        alterados, pulados = manifesto.separar(arquivos)   # {relativo: absoluto}
+        ...
+        manifesto.registrar(relativo, absoluto, STATUS_VINCULADO)
+        manifesto.salvar()
+    """
+
+    def __init__(self, caminho, entradas=None):
+        self.caminho = caminho
+        self.entradas = entradas or {}
+        self._alterado = False
+
+    @classmethod
+    def carregar(cls):
+        caminho = caminho_manifesto()
+        if not caminho:
+            return cls(None)
+        try:
+            with open(caminho, encoding='utf-8') as f:
+                dados = json.load(f)
+            if isinstance(dados, dict) and dados.get('versao') == _VERSAO:
+                return cls(caminho, dados.get('arquivos') or {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as exc:
+            logger.warning(f"[MANIFESTO-DOCS] ilegível, recomeçando: {exc!r}")
+        return cls(caminho)
+
+    def _inalterado(self, relativo, absoluto, agora, janela):
+        entrada = self.entradas.get(relativo)
+        if not entrada or entrada.get('status') != STATUS_VINCULADO:
+            return False
+        if agora - entrada.get('conferido_em', 0) > janela:
+            return False
+        try:
+            st = os.stat(absoluto)
+        except OSError:
+            return False
+        if st.st_size != entrada.get('tamanho'):
+            return False
+        if st.st_mtime_ns == entrada.get('mtime_ns'):
+            return True
+        # mtime mudou (cópia, touch): decide pelo conteúdo.
+        try:
+            mesmo = sha256_arquivo(absoluto) == entrada.get('sha256')
+        except OSError:
+            return False
+        if mesmo:
+            entrada['mtime_ns'] = st.st_mtime_ns
+            self._alterado = True
+        return mesmo
+
+    def separar(self, arquivos, forcar=False):
+        """Divide ``{relativo: absoluto}`` em ``(alterados, pulados)``.
+
+        ``alterados`` mantém a ordem de ``arquivos``; ``pulados`` é a lista
+        dos relativos inalterados desde que foram vinculados.
+        """
+        if forcar or not self.caminho:
+            return dict(arquivos), []
+        agora, janela = time.time(), _revalidar_segundos()
+        alterados, pulados = {}, []
+        for relativo, absoluto in arquivos.items():
+            if self._inalterado(relativo, absoluto, agora, janela):
+                pulados.append(relativo)
+            else:
+                alterados[relativo] = absoluto
+        return alterados, pulados
+
+    def registrar(self, relativo, absoluto, status):
+        """Grava o estado atual do arquivo (sem arquivo no disco, esquece)."""
+        if not self.caminho:
+            return
+        try:
+            st = os.stat(absoluto)
+            sha = sha256_arquivo(absoluto)
+        except OSError:
+            self.esquecer(relativo)
+            return
+        self.entradas[relativo] = {
+            'tamanho': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'sha256': sha,
+            'status': status,
+            'conferido_em': int(time.time()),
+        }
+        self._alterado = True
+
+    def esquecer(self, relativo):
+        if self.entradas.pop(relativo, None) is not None:
+            self._alterado = True
+
+    def podar(self, prefixo, presentes):
+        """Remove entradas sob ``prefixo`` cujo arquivo não está em ``presentes``."""
+        presentes = set(presentes)
+        for relativo in [r for r in self.entradas if r.startswith(prefixo) and r not in presentes]:
+            self.esquecer(relativo)
+
+    def salvar(self):
+        if not self.caminho or not self._alterado:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+            fd, temporario = tempfile.mkstemp(dir=os.path.dirname(self.caminho) or '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'versao': _VERSAO, 'arquivos': self.entradas}, f, ensure_ascii=False)
+                os.replace(temporario, self.caminho)
+            except BaseException:
+                try:
+                    os.remove(temporario)
+                except OSError:
+                    pass
+                raise
+            self._alterado = False
+        except OSError as exc:
+            logger.warning(f"[MANIFESTO-DOCS] falha ao gravar: {exc!r}")
+
+
+def limpar_manifesto() -> None:
+    """Descarta o manifesto: a próxima varredura revê todos os arquivos."""
+    caminho = caminho_manifesto()
+    if not caminho:
+        return
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+    except OSError as exc:
+        logger.warning(f"[MANIFESTO-DOCS] falha ao limpar: {exc!r}")
+
+
+__all__ = [
+    'STATUS_VINCULADO',
+    'STATUS_PENDENTE',
+    'STATUS_SEM_REGISTRO',
+    'ManifestoDocumentos',
+    'caminho_manifesto',
+    'limpar_manifesto',
+]
@@ -0,0 +1,489 @@
+"""Manutenção de documentos/vínculos em SQL por conjunto (e em background).
+
+Por que existir:
+    As rotas administrativas de ``routes/documentos.py`` (``raio_x``,
+    ``resgatar_orfaos``, ``limpar_fantasmas``, ``limpar_vinculos_quebrados``
+    e ``admin_reprocessar_vencimentos``) percorriam ``Documento`` e
+    ``Venda`` em Python: um ``os.path.exists`` e uma consulta por linha,
+    um commit por venda. Num tenant grande passavam do timeout do
+    Gunicorn no meio do caminho.
+
+Como funciona:
+    * ``raio_x_documentos`` — contagens num ``SELECT`` só (subqueries
+      escalares) + os últimos documentos.
+    * ``resgatar_orfaos`` — um ``UPDATE``.
+    * ``limpar_fantasmas`` — uma varredura de ``documentos_entrada/``
+      vira um conjunto de caminhos; os ``(id, caminho)`` do banco são
+      comparados com ele e os fantasmas saem em ``DELETE ... IN`` por
+      lote. Caminho fora de ``documentos_entrada/`` é conferido no disco,
+      um a um, como antes. Em background a varredura é feita no nó web
+      e vai como parâmetro; pasta ausente ou vazia não remove nada.
+    * ``limpar_vinculos_quebrados`` — anti-join (``NOT EXISTS``) entre
+      ``vendas.caminho_boleto``/``caminho_nf`` e
+      ``documentos.caminho_arquivo``/``url_arquivo``, e entre
+      ``documentos.venda_id`` e ``vendas.id``; três ``UPDATE``.
+    * ``reprocessar_vencimentos_vendas`` — vendas agrupadas pelo boleto
+      (cada PDF lido uma vez, em lote, nos processos isolados de
+      ``extrair_lote``), existência pela mesma varredura da pasta e
+      gravação em ``UPDATE`` por lote (executemany).
+
+    Toda operação devolve as contagens e ``segundos``. ``empresa_id``
+    restringe ao tenant; ``None`` é global, como as rotas MASTER.
+
+Background:
+    ``agendar_manutencao(operacao, **parametros)`` despacha para a fila
+    RQ (``fila_tarefas``) quando há worker escutando; senão, para um
+    ``ThreadPoolExecutor`` do processo web — mesmo critério de
+    ``services/importacao_jobs.py``. O estado (``JOB_*`` de ``models``)
+    e o resultado ficam no ``cache`` por ``_VALIDADE_ESTADO``;
+    ``estado_manutencao(job_id)`` lê.
+
+    ``reprocessar_vencimentos`` lê os PDFs de ``documentos_entrada/`` no
+    próprio job: com RQ, o worker precisa do mesmo disco do nó web (senão
+    as vendas saem como "Arquivo não encontrado", sem gravar nada).
+"""
+from __future__ import annotations
+
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, bindparam, delete, exists, func, select, update
+
+from extensions import cache
+from models import (
+    db, Documento, Venda, DOC_PROCESSANDO,
+    JOB_PENDENTE, JOB_PROCESSANDO, JOB_CONCLUIDO, JOB_ERRO,
+)
+from services.extracao_pdf import DESCRICAO_FALHA, TarefaExtracao, extrair_lote
+
+PASTA_ENTRADA = 'documentos_entrada'
+# Linhas por DELETE/UPDATE em lote.
+_LOTE = 1000
+_TIMEOUT_JOB_RQ = 60 * 60
+_VALIDADE_ESTADO = 24 * 60 * 60
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _segundos(inicio):
+    return round(time.perf_counter() - inicio, 3)
+
+
+def _lotes(valores):
+    valores = list(valores)
+    for i in range(0, len(valores), _LOTE):
+        yield valores[i:i + _LOTE]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Disco
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _arquivos_em_disco(base_path):
+    """Caminhos relativos (``documentos_entrada/...``, com ``/``) de todos os arquivos da pasta."""
+    raiz = os.path.join(base_path, PASTA_ENTRADA)
+    caminhos = set()
+    for pasta, _, nomes in os.walk(raiz):
+        rel = os.path.relpath(pasta, base_path).replace(os.sep, '/')
+        for nome in nomes:
+            caminhos.add(f'{rel}/{nome}')
+    return caminhos
+
+
+def _na_pasta_entrada(caminho):
+    rel = caminho.strip().replace('\\', '/')
+    return not os.path.isabs(rel) and rel.startswith(PASTA_ENTRADA + '/')
+
+
+def _existe(base_path, caminho, em_disco):
+    if _na_pasta_entrada(caminho):
+        return caminho.strip().replace('\\', '/') in em_disco
+    return os.path.exists(os.path.join(base_path, caminho))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Operações
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _venda_sem_documento(coluna):
+    """Caminho preenchido que nenhum ``Documento`` tem como arquivo ou URL."""
+    d = Documento.__table__
+    caminho = func.trim(coluna)
+    return and_(
+        coluna.isnot(None),
+        caminho != '',
+        ~exists().where(d.c.caminho_arquivo == caminho),
+        ~exists().where(d.c.url_arquivo == caminho),
+    )
+
+
+def _documento_sem_venda():
+    d, v = Documento.__table__, Venda.__table__
+    return and_(d.c.venda_id.isnot(None), ~exists().where(v.c.id == d.c.venda_id))
+
+
+def raio_x_documentos(empresa_id=None, ultimos=5) -> dict:
+    """Contagens de documentos e vínculos + os ``ultimos`` documentos cadastrados."""
+    inicio = time.perf_counter()
+    d, v = Documento.__table__, Venda.__table__
+    escopo_d = [d.c.empresa_id == empresa_id] if empresa_id is not None else []
+    escopo_v = [v.c.empresa_id == empresa_id] if empresa_id is not None else []
+
+    def _conta_docs(*condicoes):
+        return select(func.count()).select_from(d).where(*escopo_d, *condicoes).scalar_subquery()
+
+    def _conta_vendas(*condicoes):
+        return select(func.count()).select_from(v).where(*escopo_v, *condicoes).scalar_subquery()
+
+    contagens = {
+        'documentos': _conta_docs(),
+        'vinculados': _conta_docs(d.c.venda_id.isnot(None)),
+        'sem_vinculo': _conta_docs(d.c.venda_id.is_(None)),
+        'sem_dono': _conta_docs(d.c.usuario_id.is_(None)),
+        'na_nuvem': _conta_docs(d.c.url_arquivo.isnot(None)),
+        'processando': _conta_docs(d.c.status_processamento == DOC_PROCESSANDO),
+        'falha_extracao': _conta_docs(d.c.falha_extracao.isnot(None)),
+        'documentos_venda_inexistente': _conta_docs(_documento_sem_venda()),
+        'vendas_boleto_sem_documento': _conta_vendas(_venda_sem_documento(v.c.caminho_boleto)),
+        'vendas_nf_sem_documento': _conta_vendas(_venda_sem_documento(v.c.caminho_nf)),
+    }
+    linha = db.session.execute(select(*[c.label(nome) for nome, c in contagens.items()])).one()
+    resultado = {nome: int(valor or 0) for nome, valor in linha._mapping.items()}
+
+    consulta = Documento.query
+    if empresa_id is not None:
+        consulta = consulta.filter(Documento.empresa_id == empresa_id)
+    resultado['ultimos'] = [
+        {
+            'id': doc.id,
+            'nome_arquivo': os.path.basename(doc.caminho_arquivo or ''),
+            'usuario_id': doc.usuario_id,
+            'vinculado': doc.venda_id is not None,
+            'data_processamento': doc.data_processamento,
+        }
+        for doc in consulta.order_by(Documento.id.desc()).limit(ultimos).all()
+    ]
+    resultado['segundos'] = _segundos(inicio)
+    return resultado
+
+
+def resgatar_orfaos(usuario_id, empresa_id=None) -> dict:
+    """Atribui a ``usuario_id`` os documentos com ``usuario_id`` NULL. Faz commit."""
+    inicio = time.perf_counter()
+    d = Documento.__table__
+    consulta = update(d).where(d.c.usuario_id.is_(None))
+    if empresa_id is not None:
+        consulta = consulta.where(d.c.empresa_id == empresa_id)
+    recuperados = db.session.execute(consulta.values(usuario_id=usuario_id)).rowcount
+    db.session.commit()
+    return {'recuperados': recuperados, 'segundos': _segundos(inicio)}
+
+
+def limpar_fantasmas(empresa_id=None, em_disco=None) -> dict:
+    """Remove os ``Documento`` só locais (sem ``url_arquivo``) cujo arquivo sumiu. Faz commit.
+
+    ``em_disco``: caminhos de ``documentos_entrada/`` varridos no nó web
+    (``agendar_manutencao`` preenche). O worker RQ pode estar em outra
+    máquina, sem esse disco; com a lista, caminho fora da pasta não é
+    conferido (nem removido). Sem ``em_disco``, varre o disco local.
+
+    Pasta ausente ou vazia: nada é removido (``recusado``). Sem arquivo
+    nenhum, todo documento só local pareceria fantasma — é o caso de um
+    worker sem o disco do nó web ou de um volume não montado.
+    """
+    inicio = time.perf_counter()
+    base_path = current_app.root_path
+    lista_do_no_web = em_disco is not None
+    em_disco = set(em_disco) if lista_do_no_web else _arquivos_em_disco(base_path)
+    if not em_disco:
+        current_app.logger.warning(
+            "[MANUTENCAO-DOCS] limpar_fantasmas recusado: documentos_entrada/ ausente ou vazia"
+        )
+        return {
+            'verificados': 0,
+            'arquivos_em_disco': 0,
+            'removidos': 0,
+            'recusado': 'Pasta documentos_entrada/ ausente ou vazia: nada foi removido.',
+            'segundos': _segundos(inicio),
+        }
+    d = Documento.__table__
+    consulta = select(d.c.id, d.c.caminho_arquivo).where(
+        d.c.url_arquivo.is_(None), d.c.caminho_arquivo.isnot(None), d.c.caminho_arquivo != '',
+    )
+    if empresa_id is not None:
+        consulta = consulta.where(d.c.empresa_id == empresa_id)
+    verificados = 0
+    fantasmas = []
+    for doc_id, caminho in db.session.execute(consulta):
+        if lista_do_no_web and not _na_pasta_entrada(caminho):
+            continue
+        verificados += 1
+        if not _existe(base_path, caminho, em_disco):
+            fantasmas.append(doc_id)
+    for lote in _lotes(fantasmas):
+        db.session.execute(delete(d).where(d.c.id.in_(lote)))
+    db.session.commit()
+    return {
+        'verificados': verificados,
+        'arquivos_em_disco': len(em_disco),
+        'removidos': len(fantasmas),
+        'segundos': _segundos(inicio),
+    }
+
+
+def limpar_vinculos_quebrados(empresa_id=None) -> dict:
+    """Zera caminhos de venda sem documento e ``venda_id`` de venda inexistente. Faz commit."""
+    from services.diagnostico_vinculo import agendar_atualizacao_diagnosticos
+
+    inicio = time.perf_counter()
+    d, v = Documento.__table__, Venda.__table__
+    escopo_v = [v.c.empresa_id == empresa_id] if empresa_id is not None else []
+    escopo_d = [d.c.empresa_id == empresa_id] if empresa_id is not None else []
+    boletos = db.session.execute(
+        update(v).where(_venda_sem_documento(v.c.caminho_boleto), *escopo_v).values(caminho_boleto=None)
+    ).rowcount
+    notas = db.session.execute(
+        update(v).where(_venda_sem_documento(v.c.caminho_nf), *escopo_v).values(caminho_nf=None)
+    ).rowcount
+    # Documento que volta a ser órfão entra na fila com o diagnóstico a recalcular.
+    documentos = db.session.execute(
+        update(d).where(_documento_sem_venda(), *escopo_d)
+        .values(venda_id=None, diagnostico_cenario=None, diagnostico=None)
+    ).rowcount
+    db.session.commit()
+    if documentos:
+        agendar_atualizacao_diagnosticos()
+    return {
+        'boletos': boletos,
+        'notas': notas,
+        'documentos': documentos,
+        'total': boletos + notas + documentos,
+        'segundos': _segundos(inicio),
+    }
+
+
+def _gravar_vencimentos(linhas):
+    """``linhas``: ``(venda_id, data_venda, data_vencimento)``; mesma regra de ``aplicar_vencimento_e_prazo``."""
+    v = Venda.__table__
+    com_prazo, sem_prazo = [], []
+    for venda_id, data_venda, vencimento in linhas:
+        if data_venda and (vencimento - data_venda).days >= 0:
+            com_prazo.append({'vid': venda_id, 'dv': vencimento, 'prazo': (vencimento - data_venda).days})
+        else:
+            sem_prazo.append({'vid': venda_id, 'dv': vencimento})
+    for lote in _lotes(com_prazo):
+        db.session.execute(
+            update(v).where(v.c.id == bindparam('vid'))
+            .values(data_vencimento=bindparam('dv'), prazo_dias=bindparam('prazo')),
+            lote,
+        )
+    for lote in _lotes(sem_prazo):
+        db.session.execute(
+            update(v).where(v.c.id == bindparam('vid')).values(data_vencimento=bindparam('dv')),
+            lote,
+        )
+
+
+def reprocessar_vencimentos_vendas(empresa_id=None) -> dict:
+    """Relê os boletos vinculados às vendas e grava ``data_vencimento``/``prazo_dias``.
+
+    Retorna ``{'total', 'atualizados', 'sem_data', 'erros', 'detalhes', 'segundos'}``
+    (contagens por venda). Vendas ainda sem vencimento cujo ``Documento``
+    do boleto tem a data recebem a do documento. Faz commit.
+    """
+    inicio = time.perf_counter()
+    base_path = current_app.root_path
+    resultado = {'total': 0, 'atualizados': 0, 'sem_data': 0, 'erros': 0, 'detalhes': []}
+    v, d = Venda.__table__, Documento.__table__
+    escopo = [v.c.empresa_id == empresa_id] if empresa_id is not None else []
+
+    # Vendas agrupadas pelo boleto: itens do mesmo pedido dividem o PDF.
+    vendas_por_caminho = {}
+    for venda_id, caminho, data_venda in db.session.execute(
+        select(v.c.id, v.c.caminho_boleto, v.c.data_venda)
+        .where(v.c.caminho_boleto.isnot(None), *escopo).order_by(v.c.id)
+    ):
+        resultado['total'] += 1
+        caminho = (caminho or '').strip()
+        if caminho:
+            vendas_por_caminho.setdefault(caminho, []).append((venda_id, data_venda))
+
+    em_disco = _arquivos_em_disco(base_path)
+    lidos = []
+    for caminho, vendas in vendas_por_caminho.items():
+        if _existe(base_path, caminho, em_disco) and os.path.isfile(os.path.join(base_path, caminho)):
+            lidos.append(caminho)
+            continue
+        resultado['erros'] += len(vendas)
+        resultado['detalhes'].extend(f"Venda {vid}: Arquivo não encontrado: {caminho}" for vid, _ in vendas)
+
+    extraidos = extrair_lote([
+        TarefaExtracao(os.path.join(base_path, caminho), 'BOLETO', False, True) for caminho in lidos
+    ])
+    linhas = []
+    for caminho, extraido in zip(lidos, extraidos):
+        vendas = vendas_por_caminho[caminho]
+        dados = extraido.get('dados')
+        if dados is None:
+            motivo = DESCRICAO_FALHA.get(extraido.get('falha'))
+            sufixo = f' ({motivo})' if motivo else ''
+            resultado['erros'] += len(vendas)
+            resultado['detalhes'].extend(f"Venda {vid}: Erro ao processar PDF{sufixo}" for vid, _ in vendas)
+            continue
+        vencimento = dados.get('data_vencimento')
+        if not vencimento:
+            resultado['sem_data'] += len(vendas)
+            resultado['detalhes'].extend(
+                f"Venda {vid}: Nenhuma data de vencimento encontrada no PDF" for vid, _ in vendas
+            )
+            continue
+        for vid, data_venda in vendas:
+            linhas.append((vid, data_venda, vencimento))
+            resultado['detalhes'].append(f"Venda {vid}: Vencimento atualizado para {vencimento.strftime('%d/%m/%Y')}")
+    _gravar_vencimentos(linhas)
+    resultado['atualizados'] += len(linhas)
+
+    # Também atualizar vendas que têm documento vinculado mas não têm data_vencimento ainda.
+    copiados = {}
+    for venda_id, data_venda, vencimento in db.session.execute(
+        select(v.c.id, v.c.data_venda, d.c.data_vencimento)
+        .join(d, d.c.caminho_arquivo == v.c.caminho_boleto)
+        .where(v.c.data_vencimento.is_(None), d.c.data_vencimento.isnot(None), *escopo)
+        .order_by(v.c.id, d.c.id)
+    ):
+        copiados.setdefault(venda_id, (venda_id, data_venda, vencimento))
+    _gravar_vencimentos(copiados.values())
+    resultado['atualizados'] += len(copiados)
+    resultado['detalhes'].extend(
+        f"Venda {vid}: Vencimento copiado do Documento: {vencimento.strftime('%d/%m/%Y')}"
+        for vid, _, vencimento in copiados.values()
+    )
+    db.session.commit()
+    if resultado['atualizados']:
+        from services.cache_utils import limpar_cache_dashboard
+        limpar_cache_dashboard()
+    resultado['segundos'] = _segundos(inicio)
+    return resultado
+
+
+OPERACOES = {
+    'raio_x': raio_x_documentos,
+    'resgatar_orfaos': resgatar_orfaos,
+    'limpar_fantasmas': limpar_fantasmas,
+    'limpar_vinculos_quebrados': limpar_vinculos_quebrados,
+    'reprocessar_vencimentos': reprocessar_vencimentos_vendas,
+}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Background
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _chave_estado(job_id):
+    return f'manutencao_documentos:{job_id}'
+
+
+def _gravar_estado(job_id, **campos):
+    estado = estado_manutencao(job_id) or {'id': job_id}
+    estado.update(campos)
+    try:
+        cache.set(_chave_estado(job_id), estado, timeout=_VALIDADE_ESTADO)
+    except Exception as exc:
+        current_app.logger.warning(f"[MANUTENCAO-DOCS] estado não gravado job={job_id}: {exc}")
+
+
+def estado_manutencao(job_id) -> dict | None:
+    """Estado do job (``status``, ``operacao``, ``resultado``/``erro``); ``None`` se expirou."""
+    try:
+        return cache.get(_chave_estado(job_id))
+    except Exception:
+        return None
+
+
+def _executor_local() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='manutencao-docs')
+    return _executor
+
+
+def executar_manutencao(job_id, operacao, parametros=None):
+    """Ponto de entrada do job (worker RQ ou thread local)."""
+    if not has_app_context():
+        from app import app as app_obj
+        with app_obj.app_context():
+            return executar_manutencao(job_id, operacao, parametros)
+
+    _gravar_estado(job_id, status=JOB_PROCESSANDO, iniciado_em=datetime.utcnow().isoformat())
+    current_app.logger.info(f"[MANUTENCAO-DOCS] start job={job_id} operacao={operacao}")
+    try:
+        resultado = OPERACOES[operacao](**(parametros or {}))
+        _gravar_estado(
+            job_id, status=JOB_CONCLUIDO, resultado=resultado,
+            concluido_em=datetime.utcnow().isoformat(),
+        )
+        current_app.logger.info(
+            f"[MANUTENCAO-DOCS] fim job={job_id} operacao={operacao} segundos={resultado.get('segundos')}"
+        )
+        return resultado
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.error(f"[MANUTENCAO-DOCS] falha job={job_id} operacao={operacao}: {exc}", exc_info=True)
+        _gravar_estado(job_id, status=JOB_ERRO, erro=str(exc), concluido_em=datetime.utcnow().isoformat())
+        return None
+    finally:
+        db.session.remove()
+
+
+def agendar_manutencao(operacao, **parametros) -> dict:
+    """Registra e despacha a operação em background. Retorna o estado inicial (com ``id``)."""
+    if operacao not in OPERACOES:
+        raise ValueError(f'Operação de manutenção desconhecida: {operacao!r}')
+    from app import fila_tarefas
+    from services.importacao_jobs import _rq_disponivel
+
+    job_id = uuid.uuid4().hex
+    _gravar_estado(
+        job_id, operacao=operacao, parametros=parametros,
+        status=JOB_PENDENTE, criado_em=datetime.utcnow().isoformat(),
+    )
+    if operacao == 'limpar_fantasmas' and 'em_disco' not in parametros:
+        # A varredura é do disco deste nó; o job só compara (ver ``limpar_fantasmas``).
+        parametros = {**parametros, 'em_disco': sorted(_arquivos_em_disco(current_app.root_path))}
+    if _rq_disponivel(fila_tarefas):
+        try:
+            fila_tarefas.enqueue(
+                executar_manutencao, job_id, operacao, parametros,
+                job_id=f'manutencao-{job_id}', job_timeout=_TIMEOUT_JOB_RQ,
+            )
+            current_app.logger.info(f"[MANUTENCAO-DOCS] enfileirado rq job={job_id} operacao={operacao}")
+            return estado_manutencao(job_id) or {'id': job_id, 'status': JOB_PENDENTE}
+        except Exception as exc:
+            current_app.logger.warning(f"[MANUTENCAO-DOCS] rq indisponível ({exc}); usando thread local")
+
+    app_obj = current_app._get_current_object()
+
+    def _rodar():
+        with app_obj.app_context():
+            executar_manutencao(job_id, operacao, parametros)
+
+    _executor_local().submit(_rodar)
+    current_app.logger.info(f"[MANUTENCAO-DOCS] enfileirado thread job={job_id} operacao={operacao}")
+    return estado_manutencao(job_id) or {'id': job_id, 'status': JOB_PENDENTE}
+
+
+__all__ = [
+    'OPERACOES',
+    'raio_x_documentos',
+    'resgatar_orfaos',
+    'limpar_fantasmas',
+    'limpar_vinculos_quebrados',
+    'reprocessar_vencimentos_vendas',
+    'agendar_manutencao',
+    'executar_manutencao',
+    'estado_manutencao',
+]
@@ -0,0 +1,192 @@
+"""Leitura do XML da NF-e (campos exatos, sem pdfplumber).
+
+Por que existir:
+    Número da NF, CNPJ do destinatário, razão social, natureza da
+    operação (bonificação), vencimentos e total saíam do texto da DANFE
+    pelas heurísticas de ``services/extracao_pdf.py`` — a parte cara e
+    a menos confiável da extração. Quando o XML autorizado está junto do
+    PDF (``nota.pdf`` + ``nota.xml``) ou chega sozinho, os mesmos campos
+    estão ali, em tags fixas do leiaute da SEFAZ.
+
+Como funciona:
+    * ``ler_nfe_xml(origem)`` percorre o arquivo com ``iterparse``
+      (eventos ``end``), sem montar a árvore: cada grupo do leiaute
+      (``ide``, ``emit``, ``dest``, ``ICMSTot``, ``dup``, ``infProt``) é
+      lido quando fecha e esvaziado em seguida; cada ``<det>`` (item) é
+      esvaziado sem leitura, então os milhares de itens de uma nota
+      grande não ficam em memória.
+    * As tags são comparadas pelo nome local (sem namespace). Aceita
+      ``nfeProc`` (NF-e + protocolo) ou ``NFe`` solta, leiautes 3.10 e
+      4.00 (``dhEmi``/``dEmi``). Chave: ``Id`` do ``infNFe`` ou, sem ele,
+      ``chNFe`` do protocolo.
+    * XML com ``<!DOCTYPE`` é recusado antes do parse (NF-e não tem DTD;
+      evita expansão de entidades).
+    * Arquivo que não é NF-e (sem ``infNFe``) ou XML malformado devolve
+      ``None``.
+
+O módulo é puro (sem Flask, sem banco): roda nos workers da extração.
+"""
+from __future__ import annotations
+
+import os
+import re
+import xml.etree.ElementTree as ET
+from datetime import date
+from typing import NamedTuple
+
+
+class Duplicata(NamedTuple):
+    numero: str | None
+    vencimento: date | None
+    valor: float | None
+
+
+class NotaFiscalXml(NamedTuple):
+    chave: str | None                 # 44 dígitos (Id do infNFe ou chNFe do protocolo)
+    numero: str | None                # nNF
+    serie: str | None
+    natureza_operacao: str | None     # natOp
+    data_emissao: date | None
+    emitente_cnpj: str | None         # só dígitos
+    emitente_nome: str | None
+    destinatario_documento: str | None  # CNPJ (14) ou CPF (11), só dígitos
+    destinatario_nome: str | None
+    valor_total: float | None         # ICMSTot/vNF
+    duplicatas: tuple = ()
+
+
+# Grupo do leiaute → {tag filha: campo da nota}. O grupo é lido quando
+# fecha (``end``) e esvaziado em seguida.
+_GRUPOS = {
+    'ide': {'nNF': 'numero', 'serie': 'serie', 'natOp': 'natureza_operacao',
+            'dhEmi': 'data_emissao', 'dEmi': 'data_emissao'},
+    'emit': {'CNPJ': 'emitente_cnpj', 'CPF': 'emitente_cnpj', 'xNome': 'emitente_nome'},
+    'dest': {'CNPJ': 'destinatario_documento', 'CPF': 'destinatario_documento',
+             'xNome': 'destinatario_nome'},
+    'ICMSTot': {'vNF': 'valor_total'},
+    'infProt': {'chNFe': 'chave'},
+}
+_TAM_PROLOGO = 4096
+
+
+def _nome_local(tag):
+    return tag.rpartition('}')[2]
+
+
+def _data(texto):
+    try:
+        return date.fromisoformat(texto[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+def _valor(texto):
+    try:
+        return round(float(texto), 2)
+    except (TypeError, ValueError):
+        return None
+
+
+def _abrir(origem):
+    if isinstance(origem, (str, os.PathLike)):
+        return open(origem, 'rb'), True
+    return origem, False
+
+
+def _tem_doctype(arquivo):
+    inicio = arquivo.tell()
+    prologo = arquivo.read(_TAM_PROLOGO)
+    arquivo.seek(inicio)
+    return b'<!DOCTYPE' in prologo.upper()
+
+
+def _filhos(elem):
+    """``{nome local: texto}`` dos filhos diretos de um grupo."""
+    return {_nome_local(f.tag): (f.text or '').strip() for f in elem}
+
+
+def ler_nfe_xml(origem) -> NotaFiscalXml | None:
+    """Campos da NF-e de um caminho ou arquivo binário aberto (``None`` se não for NF-e)."""
+    arquivo, fechar = _abrir(origem)
+    try:
+        if _tem_doctype(arquivo):
+            return None
+        campos = {}
+        duplicatas = []
+        viu_inf_nfe = False
+        for _, elem in ET.iterparse(arquivo, events=('end',)):
+            nome = _nome_local(elem.tag)
+            if nome == 'det':
+                # Itens: a maior parte do arquivo e nada a ler aqui.
+                elem.clear()
+            elif nome in _GRUPOS:
+                filhos = _filhos(elem)
+                for tag, campo in _GRUPOS[nome].items():
+                    if filhos.get(tag) and campo not in campos:
+                        campos[campo] = filhos[tag]
+                elem.clear()
+            elif nome == 'dup':
+                filhos = _filhos(elem)
+                duplicatas.append(Duplicata(
+                    numero=filhos.get('nDup') or None,
+                    vencimento=_data(filhos.get('dVenc')),
+                    valor=_valor(filhos.get('vDup')),
+                ))
+                elem.clear()
+            elif nome == 'infNFe':
+                viu_inf_nfe = True
+                chave = re.sub(r'\D', '', elem.get('Id') or '')
+                if len(chave) == 44:
+                    campos['chave'] = chave
+                elem.clear()
+    except ET.ParseError:
+        return None
+    finally:
+        if fechar:
+            arquivo.close()
+
+    if not viu_inf_nfe:
+        return None
+    return NotaFiscalXml(
+        chave=campos.get('chave'),
+        numero=campos.get('numero'),
+        serie=campos.get('serie'),
+        natureza_operacao=campos.get('natureza_operacao'),
+        data_emissao=_data(campos.get('data_emissao')),
+        emitente_cnpj=campos.get('emitente_cnpj'),
+        emitente_nome=campos.get('emitente_nome'),
+        destinatario_documento=campos.get('destinatario_documento'),
+        destinatario_nome=campos.get('destinatario_nome'),
+        valor_total=_valor(campos.get('valor_total')),
+        duplicatas=tuple(duplicatas),
+    )
+
+
+def formatar_documento(digitos):
+    """CNPJ ``00.000.000/0000-00`` ou CPF ``000.000.000-00`` (outros tamanhos: ``None``)."""
+    digitos = re.sub(r'\D', '', digitos or '')
+    if len(digitos) == 14:
+        return f'{digitos[:2]}.{digitos[2:5]}.{digitos[5:8]}/{digitos[8:12]}-{digitos[12:]}'
+    if len(digitos) == 11:
+        return f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'
+    return None
+
+
+def xml_irmao(caminho_pdf):
+    """``nota.xml`` (ou ``.XML``) ao lado de ``nota.pdf``; ``None`` se não houver."""
+    if not isinstance(caminho_pdf, (str, os.PathLike)):
+        return None
+    base, _ = os.path.splitext(os.fspath(caminho_pdf))
+    for extensao in ('.xml', '.XML'):
+        if os.path.isfile(base + extensao):
+            return base + extensao
+    return None
+
+
+__all__ = [
+    'Duplicata',
+    'NotaFiscalXml',
+    'formatar_documento',
+    'ler_nfe_xml',
+    'xml_irmao',
+]
@@ -0,0 +1,319 @@
+"""Normalização vetorizada das planilhas de importação (pandas → colunas tipadas).
+
+Por que existir:
+    Os importadores de produtos, vendas, clientes e caixa convertiam cada
+    célula dentro de ``df.iterrows()`` chamando ``_parse_preco``,
+    ``_parse_quantidade``, ``_parse_data_flex`` e ``_strip_quotes`` —
+    ``iterrows`` cria uma ``Series`` por linha e é o padrão de acesso
+    mais lento do pandas. Em planilhas de milhares de linhas a conversão
+    sozinha já pesava mais que a validação.
+
+Estratégia:
+    Cada coluna é convertida uma vez, antes do laço de validação, que
+    passa a ler colunas prontas (``itertuples``/``zip``) em vez de
+    ``iterrows``. Texto, preço e quantidade seguem pelos helpers
+    escalares, célula a célula: um pré-passe com regex do pandas saía
+    mais lento que eles. Só as datas têm *caminho rápido* vetorizado
+    (``dd/mm/aaaa``, ``dd/mm/yy``, montadas com o calendário do numpy);
+    qualquer célula fora dele cai em ``_parse_data_flex``, então a
+    semântica é a mesma de antes (anos de 2 dígitos viram 20XX, datas
+    fora do padrão passam por ``pd.to_datetime(dayfirst=True)``).
+
+    As colunas são montadas com ``dtype=object`` para que o laço de
+    validação receba os mesmos tipos Python (``str``, ``float``, ``int``,
+    ``date``, ``None``) que os helpers escalares devolvem.
+
+Resolução de colunas (mesma precedência dos importadores):
+    * ``coluna(df, 'a', 'b', padrao=x)`` ≡ ``row.get('a', row.get('b', x))``
+      — vale a primeira coluna *existente*, mesmo que a célula esteja vazia;
+    * ``coluna_primeiro_valor(df, 'a', 'b')`` — vale a primeira célula
+      não-vazia entre as colunas (regra do antigo ``_row_get`` do
+      importador de produtos).
+
+Única divergência conhecida: ``_parse_quantidade`` estoura
+``OverflowError`` para ``inf``; aqui a célula vira ``None`` (quantidade
+inválida) em vez de derrubar a linha com "Erro inesperado".
+"""
+from __future__ import annotations
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from services.csv_utils import (
+    _strip_quotes, _parse_preco, _parse_quantidade, _parse_data_flex,
+)
+
+# Número já "limpo" (sem R$, sinal, milhar BR): só dígitos e um ponto decimal.
+_RE_NUMERO_LIMPO = r'(?:\d+(?:\.\d*)?|\.\d+)'
+# Mesmo padrão de ``_parse_data_flex``.
+_RE_DATA_BR = r'^(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{2,4})$'
+
+_FORMATOS_DATA_CAIXA = ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y')
+
+
+# ---------------------------------------------------------------------------
+# Utilitários internos
+# ---------------------------------------------------------------------------
+
+def _serie_objeto(valores, index) -> pd.Series:
+    return pd.Series(valores, index=index, dtype=object)
+
+
+def _como_texto(serie: pd.Series) -> pd.Series:
+    """``str(v)`` célula a célula, em dtype ``object`` (métodos ``.str`` do Python)."""
+    return serie.astype(object).map(str)
+
+
+def _tira_aspas(texto: pd.Series) -> pd.Series:
+    """Equivalente vetorizado de ``.strip().strip('"').strip("'").strip()``."""
+    return texto.str.strip().str.strip('"').str.strip("'").str.strip()
+
+
+def _numerica(serie: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype)
+
+
+def _mapear(serie: pd.Series, funcao) -> pd.Series:
+    """``funcao`` em cada célula, em dtype ``object``.
+
+    ``Series.map`` converteria ``None`` em ``NaN`` nas colunas numéricas;
+    aqui cada célula fica com o tipo Python que o helper devolve.
+    """
+    return _serie_objeto([funcao(v) for v in serie], serie.index)
+
+
+# ---------------------------------------------------------------------------
+# Resolução de colunas
+# ---------------------------------------------------------------------------
+
+def coluna(df: pd.DataFrame, *nomes: str, padrao=None) -> pd.Series:
+    """Primeira coluna existente entre ``nomes`` (≡ ``row.get`` aninhado)."""
+    for nome in nomes:
+        if nome in df.columns:
+            return df[nome]
+    return _serie_objeto([padrao] * len(df), df.index)
+
+
+def coluna_primeiro_valor(df: pd.DataFrame, *nomes: str) -> pd.Series:
+    """Primeira célula não-vazia entre ``nomes`` por linha.
+
+    Célula vazia = NA ou texto só com espaços. Linhas sem nenhum valor
+    ficam ``None``.
+    """
+    resultado = _serie_objeto([None] * len(df), df.index)
+    pendente = pd.Series(True, index=df.index)
+    for nome in nomes:
+        if nome not in df.columns or not pendente.any():
+            continue
+        serie = df[nome]
+        preenchida = serie.notna()
+        if not _numerica(serie):
+            preenchida &= _como_texto(serie.where(preenchida, '')).str.strip() != ''
+        usar = pendente & preenchida
+        resultado[usar] = serie[usar].astype(object)
+        pendente &= ~usar
+    return resultado
+
+
+def texto_primeiro_valor(df: pd.DataFrame, *nomes: str) -> pd.Series:
+    """``_strip_quotes(valor or '')`` sobre ``coluna_primeiro_valor``."""
+    valores = coluna_primeiro_valor(df, *nomes)
+    return strip_quotes_serie(valores.where(valores.astype(bool), ''))
+
+
+# ---------------------------------------------------------------------------
+# Conversões de coluna (paridade com os helpers escalares)
+# ---------------------------------------------------------------------------
+
+def strip_quotes_serie(serie: pd.Series) -> pd.Series:
+    """``_strip_quotes`` célula a célula (sempre devolve ``str``)."""
+    return _mapear(serie, _strip_quotes)
+
+
+def parse_preco_serie(serie: pd.Series) -> pd.Series:
+    """``_parse_preco`` célula a célula (``float`` ou ``None``)."""
+    return _mapear(serie, _parse_preco)
+
+
+def _quantidade_segura(valor):
+    try:
+        return _parse_quantidade(valor)
+    except OverflowError:
+        return None
+
+
+def parse_quantidade_serie(serie: pd.Series) -> pd.Series:
+    """``_parse_quantidade`` célula a célula (``int`` ou ``None``)."""
+    return _mapear(serie, _quantidade_segura)
+
+
+def _montar_datas(anos, meses, dias) -> np.ndarray:
+    """``datetime64[D]`` a partir de componentes; combinações inválidas → ``NaT``.
+
+    Aritmética de calendário do numpy (sem laço Python): soma meses e dias
+    ao início do ano e descarta o que "transbordou" (ex.: 31/02).
+    """
+    validos = (meses >= 1) & (meses <= 12) & (dias >= 1) & (dias <= 31)
+    m = np.where(validos, meses, 1)
+    d = np.where(validos, dias, 1)
+    inicio_mes = (anos - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (m - 1).astype('timedelta64[M]')
+    datas = inicio_mes.astype('datetime64[D]') + (d - 1).astype('timedelta64[D]')
+    validos &= datas.astype('datetime64[M]') == inicio_mes
+    return np.where(validos, datas, np.datetime64('NaT'))
+
+
+def parse_data_serie(serie: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """Versão vetorizada de ``_parse_data_flex``.
+
+    Returns:
+        ``(datas, brutos)`` — ``date``/``None`` e o texto bruto usado nas
+        mensagens de erro, exatamente como a tupla do helper escalar.
+    """
+    datas = _serie_objeto([None] * len(serie), serie.index)
+    brutos = _serie_objeto([''] * len(serie), serie.index)
+    ok = serie.notna()
+    escalar = ~ok
+
+    # Colunas datetime64 (Excel) e numéricas vão inteiras para o helper
+    # escalar: ele converte ``str(Timestamp)`` com ``dayfirst=True``, o que
+    # pode inverter dia/mês em datas ISO — comportamento preservado.
+    if ok.any() and not _numerica(serie) and not pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        texto = _tira_aspas(_como_texto(serie[ok]))
+        partes = texto.str.extract(_RE_DATA_BR)
+        ano = partes[2].where(partes[2].str.len() != 2, '20' + partes[2])
+        # Anos fora de 1900–2200 (ex.: ``0999``) ficam com o helper escalar;
+        # o ``to_datetime`` por componentes não cobre esse intervalo igual.
+        ano_num = pd.to_numeric(ano, errors='coerce')
+        rapido = partes[0].notna() & ano.str.len().eq(4) & ano_num.between(1900, 2200)
+        if rapido.any():
+            anos = ano_num[rapido].to_numpy(dtype='int64')
+            meses = pd.to_numeric(partes.loc[rapido, 1]).to_numpy(dtype='int64')
+            dias = pd.to_numeric(partes.loc[rapido, 0]).to_numpy(dtype='int64')
+            montadas = _montar_datas(anos, meses, dias)
+            convertidas = pd.Series(~np.isnat(montadas), index=ano_num.index[rapido])
+            idx = convertidas.index[convertidas]
+            datas[idx] = montadas[convertidas.to_numpy()].astype(object)
+            brutos[idx] = texto[idx]
+            rapido[rapido] = convertidas
+        escalar = ok.copy()
+        escalar[ok] = ~rapido
+        escalar |= ~ok
+    else:
+        escalar = pd.Series(True, index=serie.index)
+
+    if escalar.any():
+        alvo = serie[escalar]
+        tuplas = [_parse_data_flex(v) for v in alvo]
+        datas[escalar] = _serie_objeto([t[0] for t in tuplas], alvo.index)
+        brutos[escalar] = _serie_objeto([t[1] for t in tuplas], alvo.index)
+    return datas, brutos
+
+
+# ---------------------------------------------------------------------------
+# Caixa (CSV posicional, regras próprias de ``importar_caixa``)
+# ---------------------------------------------------------------------------
+
+def _valor_caixa_escalar(valor_raw: str) -> float:
+    v_str = valor_raw.replace('R$', '').replace('-', '').replace(' ', '').strip()
+    if ',' in v_str:
+        v_str = v_str.replace('.', '').replace(',', '.')
+    else:
+        if '.' in v_str and len(v_str.split('.')[-1]) == 3:
+            v_str = v_str.replace('.', '')
+    return float(v_str) if v_str else 0.0
+
+
+def _data_caixa_escalar(data_str: str):
+    s = data_str.split()[0]
+    for fmt in _FORMATOS_DATA_CAIXA:
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def normalizar_caixa(linhas: list[list[str]]) -> pd.DataFrame:
+    """Converte as 5 colunas posicionais do CSV de caixa em colunas tipadas.
+
+    ``linhas`` já vem filtrada (sem cabeçalho, sem linhas vazias, com ao
+    menos 5 colunas). O DataFrame devolvido tem ``descricao``,
+    ``categoria``, ``forma_pagamento``, ``tipo``, ``valor``, ``data`` e
+    ``data_bruta``, além da máscara de erro ``erro`` (texto da exceção
+    que o laço original reportaria como "Erro nos dados", ou ``None``).
+    ``data`` ``None`` sem ``erro`` = data fora dos formatos aceitos.
+    """
+    df = pd.DataFrame([l[:5] for l in linhas], columns=['descricao', 'valor_bruto', 'data_bruta', 'categoria', 'forma_pagamento'], dtype=object)
+    if df.empty:
+        for nome in ('tipo', 'valor', 'data', 'erro'):
+            df[nome] = pd.Series(dtype=object)
+        return df
+
+    for nome in df.columns:
+        df[nome] = _como_texto(df[nome]).str.strip()
+    df['categoria'] = df['categoria'].where(df['categoria'] != '', 'Outros')
+    df['forma_pagamento'] = df['forma_pagamento'].where(df['forma_pagamento'] != '', 'Dinheiro')
+
+    categoria_lower = df['categoria'].str.lower()
+    saida = (
+        df['valor_bruto'].str.contains('-', regex=False)
+        | categoria_lower.str.contains('saída', regex=False)
+        | categoria_lower.str.contains('saida', regex=False)
+    )
+    df['tipo'] = saida.map({True: 'SAIDA', False: 'ENTRADA'})
+
+    erro = _serie_objeto([None] * len(df), df.index)
+
+    # --- data: dd/mm/aaaa e aaaa-mm-dd no caminho rápido ---
+    datas = _serie_objeto([None] * len(df), df.index)
+    primeira = df['data_bruta'].str.split().str[0]
+    for padrao, fmt in ((r'\d{2}/\d{2}/\d{4}', '%d/%m/%Y'), (r'\d{4}-\d{2}-\d{2}', '%Y-%m-%d')):
+        candidatas = primeira.str.fullmatch(padrao).fillna(False).astype(bool) & datas.isna()
+        if candidatas.any():
+            convertidas = pd.to_datetime(primeira[candidatas], format=fmt, errors='coerce')
+            convertidas = convertidas[convertidas.notna()]
+            datas[convertidas.index] = convertidas.dt.date
+    for i in df.index[datas.isna()]:
+        try:
+            datas[i] = _data_caixa_escalar(df.at[i, 'data_bruta'])
+        except Exception as e:
+            erro[i] = str(e)
+    df['data'] = datas
+
+    # --- valor ---
+    v = (
+        df['valor_bruto'].str.replace('R$', '', regex=False)
+        .str.replace('-', '', regex=False).str.replace(' ', '', regex=False).str.strip()
+    )
+    com_virgula = v.str.contains(',', regex=False)
+    milhar = ~com_virgula & v.str.contains('.', regex=False) & (v.str.split('.').str[-1].str.len() == 3)
+    v = v.where(~com_virgula, v.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    v = v.where(~milhar, v.str.replace('.', '', regex=False))
+    valores = _serie_objeto([0.0] * len(df), df.index)
+    rapido = v.str.fullmatch(_RE_NUMERO_LIMPO).astype(bool)
+    if rapido.any():
+        valores[rapido] = v[rapido].astype(float).astype(object)
+    for i in df.index[~rapido & (v != '')]:
+        try:
+            valores[i] = _valor_caixa_escalar(df.at[i, 'valor_bruto'])
+        except Exception as e:
+            # No laço original a data é validada antes do valor.
+            if erro[i] is None and datas[i] is not None:
+                erro[i] = str(e)
+    df['valor'] = valores
+    df['erro'] = erro
+    return df
+
+
+__all__ = [
+    'coluna',
+    'coluna_primeiro_valor',
+    'texto_primeiro_valor',
+    'strip_quotes_serie',
+    'parse_preco_serie',
+    'parse_quantidade_serie',
+    'parse_data_serie',
+    'normalizar_caixa',
+]
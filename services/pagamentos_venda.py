@@ -0,0 +1,248 @@
+"""Vínculo caixa ↔ venda por ``LancamentoCaixa.venda_id`` e ressync em lote.
+
+Por que existir:
+    O pagamento de uma venda era calculado somando os lançamentos cuja
+    ``descricao`` casava ``LIKE 'Venda #<id> -%'`` — uma query por venda,
+    e ``_apagar_lancamentos_caixa_por_vendas`` montava um ``OR`` com um
+    ``LIKE`` por venda. A coluna ``venda_id`` (FK indexada) já existia,
+    mas quase nenhum ponto de criação de lançamento a preenchia.
+
+Peças:
+    * Listeners ``before_insert``/``before_update`` em ``LancamentoCaixa``
+      preenchem ``venda_id`` a partir do marcador ``Venda #N -`` da
+      descrição, validando que a venda existe no mesmo tenant. Assim
+      todo lançamento criado por qualquer rota fica vinculado sem que
+      cada rota precise lembrar do campo.
+    * ``vincular_lancamentos_por_descricao()`` faz o mesmo para o
+      histórico (backfill set-based: uma leitura, uma validação, um
+      ``UPDATE`` em lote). Roda no bootstrap do ``app.py``.
+    * ``resincronizar_vendas(ids)`` recalcula ``valor_pago``/``situacao``
+      de qualquer quantidade de vendas com um ``GROUP BY`` e um único
+      ``UPDATE`` (executemany) — mesmas regras de
+      ``_resincronizar_pagamento_venda``.
+
+O marcador reconhecido é exatamente o prefixo que o ``LIKE`` antigo
+casava (``Venda #N -``, no início da descrição).
+"""
+from __future__ import annotations
+
+import re
+from decimal import Decimal
+
+from sqlalchemy import and_, bindparam, event, func, inspect as sa_inspect, or_, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, LancamentoCaixa, Venda
+
+_RE_PREFIXO_VENDA = re.compile(r'^Venda #(\d+) -')
+# Limite de parâmetros por ``IN (...)``.
+_LOTE_IDS = 1000
+_TOLERANCIA = Decimal('0.01')
+
+
+def venda_id_do_marcador(descricao) -> int | None:
+    """ID da venda no prefixo ``Venda #N -`` da descrição, ou ``None``."""
+    m = _RE_PREFIXO_VENDA.match(descricao or '')
+    return int(m.group(1)) if m else None
+
+
+def _em_lotes(ids):
+    ids = sorted(ids)
+    for i in range(0, len(ids), _LOTE_IDS):
+        yield ids[i:i + _LOTE_IDS]
+
+
+def _mesmo_tenant(empresa_venda, empresa_lanc) -> bool:
+    # Mesma regra do backfill original: NULL em qualquer lado é legado.
+    return empresa_venda is None or empresa_lanc is None or empresa_venda == empresa_lanc
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Vínculo automático (lançamentos novos/editados)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _vincular_pelo_marcador(connection, target):
+    vid = venda_id_do_marcador(target.descricao)
+    if vid is None:
+        target.venda_id = None
+        return
+    empresa_venda = connection.execute(
+        select(Venda.__table__.c.empresa_id).where(Venda.__table__.c.id == vid)
+    ).first()
+    if empresa_venda is None or not _mesmo_tenant(empresa_venda[0], target.empresa_id):
+        target.venda_id = None
+        return
+    target.venda_id = vid
+
+
+@event.listens_for(LancamentoCaixa, 'before_insert')
+def _lancamento_caixa_before_insert_venda_id(mapper, connection, target):
+    """Lançamento sem ``venda_id`` explícito herda o da descrição."""
+    if target.venda_id is None:
+        _vincular_pelo_marcador(connection, target)
+
+
+@event.listens_for(LancamentoCaixa, 'before_update')
+def _lancamento_caixa_before_update_venda_id(mapper, connection, target):
+    """Descrição editada → o vínculo acompanha o novo marcador.
+
+    Se a própria atualização grava ``venda_id``, ela prevalece.
+    """
+    estado = sa_inspect(target)
+    if estado.attrs.venda_id.history.has_changes():
+        return
+    if estado.attrs.descricao.history.has_changes():
+        _vincular_pelo_marcador(connection, target)
+
+
+def vendas_vinculaveis(venda_ids, empresa_id) -> set:
+    """Subconjunto de ``venda_ids`` que existe e pode ser vinculado ao tenant.
+
+    Para caminhos em lote (INSERT sem ORM) que não passam pelos
+    listeners acima: uma consulta por lote de IDs.
+    """
+    vendas = Venda.__table__
+    validas = set()
+    for lote in _em_lotes({int(v) for v in venda_ids if v is not None}):
+        for vid, empresa_venda in db.session.execute(
+            select(vendas.c.id, vendas.c.empresa_id).where(vendas.c.id.in_(lote))
+        ):
+            if _mesmo_tenant(empresa_venda, empresa_id):
+                validas.add(vid)
+    return validas
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Backfill do histórico
+# ─────────────────────────────────────────────────────────────────────────────
+
+def vincular_lancamentos_por_descricao(empresa_id=None) -> int:
+    """Preenche ``venda_id`` dos lançamentos antigos pelo marcador da descrição.
+
+    Só toca lançamentos com ``venda_id`` NULL e cuja venda existe no
+    mesmo tenant. Idempotente. NÃO faz commit. Retorna quantos vinculou.
+    """
+    lanc = LancamentoCaixa.__table__
+    consulta = select(lanc.c.id, lanc.c.descricao, lanc.c.empresa_id).where(
+        lanc.c.venda_id.is_(None),
+        lanc.c.descricao.like('Venda #%'),
+    )
+    if empresa_id is not None:
+        consulta = consulta.where(lanc.c.empresa_id == empresa_id)
+
+    candidatos = []
+    for lanc_id, descricao, emp_lanc in db.session.execute(consulta):
+        vid = venda_id_do_marcador(descricao)
+        if vid is not None:
+            candidatos.append((lanc_id, vid, emp_lanc))
+    if not candidatos:
+        return 0
+
+    empresa_da_venda = {}
+    vendas = Venda.__table__
+    for lote in _em_lotes({vid for _, vid, _ in candidatos}):
+        empresa_da_venda.update(db.session.execute(
+            select(vendas.c.id, vendas.c.empresa_id).where(vendas.c.id.in_(lote))
+        ).all())
+
+    linhas = [
+        {'lid': lanc_id, 'vid': vid}
+        for lanc_id, vid, emp_lanc in candidatos
+        if vid in empresa_da_venda and _mesmo_tenant(empresa_da_venda[vid], emp_lanc)
+    ]
+    if linhas:
+        db.session.execute(
+            update(lanc)
+            .where(lanc.c.id == bindparam('lid'))
+            .values(venda_id=bindparam('vid')),
+            linhas,
+        )
+    return len(linhas)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Ressync de pagamento em lote
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _situacao_por_pagamento(total_pago: Decimal, valor_total: Decimal):
+    """``(valor_pago, situacao)`` — mesmas faixas de ``_resincronizar_pagamento_venda``."""
+    if total_pago < Decimal('0.00'):
+        total_pago = Decimal('0.00')
+    if total_pago <= _TOLERANCIA:
+        return Decimal('0.00'), 'PENDENTE'
+    if total_pago < (valor_total - _TOLERANCIA):
+        return total_pago, 'PARCIAL'
+    return total_pago, 'PAGO'
+
+
+def resincronizar_vendas(venda_ids, empresa_id=None) -> int:
+    """Recalcula ``valor_pago`` e ``situacao`` de várias vendas de uma vez.
+
+    Equivale a chamar ``_resincronizar_pagamento_venda`` em cada venda:
+    soma as ENTRADAs vinculadas por ``venda_id`` (mesmo tenant da venda),
+    ignora vendas PERDA e reclassifica PENDENTE/PARCIAL/PAGO com
+    tolerância de 1 centavo. Só as vendas cujo estado mudou entram no
+    ``UPDATE``; objetos ``Venda`` já carregados na sessão recebem os
+    novos valores sem nova leitura.
+
+    Faz ``flush`` antes (lançamentos pendentes precisam entrar na soma).
+    NÃO faz commit. Retorna quantas vendas foram ressincronizadas.
+    """
+    ids = {int(v) for v in (venda_ids or []) if v is not None}
+    if not ids:
+        return 0
+    db.session.flush()
+
+    v = Venda.__table__
+    lanc = LancamentoCaixa.__table__
+    juncao = v.outerjoin(lanc, and_(
+        lanc.c.venda_id == v.c.id,
+        lanc.c.tipo == 'ENTRADA',
+        or_(v.c.empresa_id.is_(None), lanc.c.empresa_id == v.c.empresa_id),
+    ))
+    nao_perda = func.upper(func.trim(func.coalesce(v.c.tipo_operacao, ''))) != 'PERDA'
+
+    processadas = 0
+    mudancas = []
+    for lote in _em_lotes(ids):
+        consulta = (
+            select(
+                v.c.id, v.c.preco_venda, v.c.quantidade_venda,
+                v.c.valor_pago, v.c.situacao,
+                func.coalesce(func.sum(lanc.c.valor), 0),
+            )
+            .select_from(juncao)
+            .where(v.c.id.in_(lote), nao_perda)
+            .group_by(v.c.id, v.c.preco_venda, v.c.quantidade_venda, v.c.valor_pago, v.c.situacao)
+        )
+        if empresa_id is not None:
+            consulta = consulta.where(v.c.empresa_id == empresa_id)
+        for vid, preco, quantidade, pago_atual, situacao_atual, soma in db.session.execute(consulta):
+            processadas += 1
+            valor_total = Decimal(str(preco or 0)) * Decimal(str(quantidade or 0))
+            novo_pago, nova_situacao = _situacao_por_pagamento(Decimal(str(soma or 0)), valor_total)
+            if pago_atual is None or Decimal(str(pago_atual)) != novo_pago or situacao_atual != nova_situacao:
+                mudancas.append({'vid': vid, 'valor_pago': novo_pago, 'situacao': nova_situacao})
+
+    if mudancas:
+        db.session.execute(
+            update(v)
+            .where(v.c.id == bindparam('vid'))
+            .values(valor_pago=bindparam('valor_pago'), situacao=bindparam('situacao')),
+            mudancas,
+        )
+        mapper = sa_inspect(Venda)
+        for m in mudancas:
+            obj = db.session.identity_map.get(mapper.identity_key_from_primary_key((m['vid'],)))
+            if obj is not None:
+                set_committed_value(obj, 'valor_pago', m['valor_pago'])
+                set_committed_value(obj, 'situacao', m['situacao'])
+    return processadas
+
+
+__all__ = [
+    'venda_id_do_marcador',
+    'vendas_vinculaveis',
+    'vincular_lancamentos_por_descricao',
+    'resincronizar_vendas',
+]
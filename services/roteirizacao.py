@@ -0,0 +1,195 @@
+"""Roteirização local das entregas (sem depender de serviço externo).
+
+Por que existir:
+    ``/api/logistica/otimizar-rota`` chamava o OSRM público
+    (``router.project-osrm.org``) a cada clique, com timeout de 10 s. Com
+    o serviço lento ou fora do ar o botão simplesmente falhava.
+
+    Aqui a ordem das paradas é calculada no próprio processo, a partir
+    das coordenadas já cacheadas dos clientes:
+
+    1. matriz de distâncias haversine (NumPy, ``O(n²)`` vetorizado);
+    2. construção por vizinho mais próximo a partir do galpão;
+    3. melhoria local com 2-opt (inversão de trechos) e Or-opt (realoca
+       blocos de 1 a 3 paradas, nos dois sentidos) até não haver ganho.
+
+    A rota é aberta (``roundtrip=false`` no OSRM): começa no galpão e
+    termina na última entrega. Distância em linha reta é corrigida por
+    ``FATOR_ESTRADA`` para estimar km rodados e tempo de viagem.
+
+Uso:
+
+    from services.roteirizacao import otimizar_rota
+
+    rota = otimizar_rota([(lat_galpao, lon_galpao), (lat1, lon1), ...])
+    rota['ordem']        # índices das paradas (1..n), na ordem de visita
+    rota['distancia_m']  # estimativa rodoviária
+    rota['duracao_s']
+
+Benchmark: ``python scripts_dev/benchmark_roteirizacao.py``.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+RAIO_TERRA_KM = 6371.0088
+# Razão típica distância rodoviária / linha reta em malha urbana+rodovia.
+FATOR_ESTRADA = 1.3
+VELOCIDADE_MEDIA_KMH = 40.0
+# Ganho mínimo (km) para aceitar um movimento — evita laço por ruído numérico.
+_EPS = 1e-9
+_OR_OPT_MAX_BLOCO = 3
+
+
+def matriz_haversine(coords) -> np.ndarray:
+    """Matriz ``n x n`` de distâncias em km entre pares ``(lat, lon)``."""
+    pts = np.radians(np.asarray(coords, dtype=float).reshape(-1, 2))
+    lat = pts[:, 0][:, None]
+    lon = pts[:, 1][:, None]
+    dlat = lat - lat.T
+    dlon = lon - lon.T
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlon / 2.0) ** 2
+    return 2.0 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def custo_rota(dist: np.ndarray, rota) -> float:
+    """Soma das pernas de uma rota aberta (lista de índices da matriz)."""
+    r = np.asarray(rota, dtype=int)
+    if len(r) < 2:
+        return 0.0
+    return float(dist[r[:-1], r[1:]].sum())
+
+
+def vizinho_mais_proximo(dist: np.ndarray, inicio: int = 0) -> list[int]:
+    """Rota gulosa: a partir de ``inicio``, sempre a parada mais perto."""
+    n = dist.shape[0]
+    visitado = np.zeros(n, dtype=bool)
+    visitado[inicio] = True
+    rota = [inicio]
+    atual = inicio
+    for _ in range(n - 1):
+        candidatos = np.where(visitado, np.inf, dist[atual])
+        atual = int(np.argmin(candidatos))
+        visitado[atual] = True
+        rota.append(atual)
+    return rota
+
+
+def _dois_opt(dist: np.ndarray, rota: np.ndarray) -> bool:
+    """Uma passada de 2-opt (ponto inicial fixo, fim livre).
+
+    Para cada ``i`` avalia de uma vez todas as inversões ``rota[i..j]`` e
+    aplica a de maior ganho. Retorna True se alguma melhoria foi feita.
+    """
+    n = len(rota)
+    melhorou = False
+    for i in range(1, n - 1):
+        js = np.arange(i + 1, n)
+        a, b = rota[i - 1], rota[i]
+        c = rota[js]
+        # Trecho após o fim do bloco invertido (inexistente quando j = n-1).
+        prox = np.append(rota[js[:-1] + 1], -1)
+        tem_prox = prox >= 0
+        prox_idx = np.where(tem_prox, prox, 0)
+        delta = dist[a, c] - dist[a, b]
+        delta = delta + np.where(tem_prox, dist[b, prox_idx] - dist[c, prox_idx], 0.0)
+        k = int(np.argmin(delta))
+        if delta[k] < -_EPS:
+            j = int(js[k])
+            rota[i:j + 1] = rota[i:j + 1][::-1]
+            melhorou = True
+    return melhorou
+
+
+def _or_opt(dist: np.ndarray, rota: np.ndarray) -> tuple[np.ndarray, bool]:
+    """Uma passada de Or-opt: realoca blocos de 1..3 paradas.
+
+    Para cada bloco, remove-o da rota e avalia vetorialmente a inserção
+    após cada posição restante (também invertido). Aplica o melhor
+    movimento com ganho e segue.
+    """
+    melhorou = False
+    for tam in range(1, _OR_OPT_MAX_BLOCO + 1):
+        i = 1
+        while i + tam <= len(rota):
+            bloco = rota[i:i + tam]
+            s0, s1 = bloco[0], bloco[-1]
+            ant = rota[i - 1]
+            tem_prox = i + tam < len(rota)
+            prox = rota[i + tam] if tem_prox else None
+            ganho_remocao = dist[ant, s0]
+            if tem_prox:
+                ganho_remocao += dist[s1, prox] - dist[ant, prox]
+
+            resto = np.concatenate([rota[:i], rota[i + tam:]])
+            a = resto
+            b = np.append(resto[1:], -1)
+            tem_b = b >= 0
+            b_idx = np.where(tem_b, b, 0)
+            base = np.where(tem_b, dist[a, b_idx], 0.0)
+            custo_direto = dist[a, s0] + np.where(tem_b, dist[s1, b_idx], 0.0) - base
+            custo_invertido = dist[a, s1] + np.where(tem_b, dist[s0, b_idx], 0.0) - base
+            # Reinserir no mesmo lugar não é movimento.
+            custo_direto[i - 1] = np.inf
+            custo_invertido[i - 1] = np.inf
+
+            kd = int(np.argmin(custo_direto))
+            ki = int(np.argmin(custo_invertido))
+            if custo_invertido[ki] < custo_direto[kd]:
+                p, custo, novo_bloco = ki, custo_invertido[ki], bloco[::-1]
+            else:
+                p, custo, novo_bloco = kd, custo_direto[kd], bloco
+            if custo - ganho_remocao < -_EPS:
+                rota = np.concatenate([resto[:p + 1], novo_bloco, resto[p + 1:]])
+                melhorou = True
+            else:
+                i += 1
+    return rota, melhorou
+
+
+def melhorar_rota(dist: np.ndarray, rota, max_passadas: int = 50) -> list[int]:
+    """Aplica 2-opt + Or-opt alternadamente até estabilizar."""
+    r = np.asarray(rota, dtype=int).copy()
+    if len(r) < 3:
+        return r.tolist()
+    for _ in range(max_passadas):
+        melhorou = _dois_opt(dist, r)
+        r, melhorou_or = _or_opt(dist, r)
+        if not (melhorou or melhorou_or):
+            break
+    return r.tolist()
+
+
+def otimizar_rota(coords, *, max_passadas: int = 50) -> dict:
+    """Ordem de visita para ``coords[1:]`` partindo de ``coords[0]``.
+
+    Args:
+        coords: lista de ``(lat, lon)``; o primeiro ponto é a origem fixa.
+
+    Returns:
+        dict com ``ordem`` (índices 1..n na ordem de visita),
+        ``distancia_m`` e ``duracao_s`` estimados pela malha viária
+        (``FATOR_ESTRADA`` / ``VELOCIDADE_MEDIA_KMH``) e
+        ``distancia_reta_m`` (soma haversine pura).
+    """
+    dist = matriz_haversine(coords)
+    rota = melhorar_rota(dist, vizinho_mais_proximo(dist, 0), max_passadas=max_passadas)
+    reta_km = custo_rota(dist, rota)
+    estrada_km = reta_km * FATOR_ESTRADA
+    return {
+        'ordem': rota[1:],
+        'distancia_reta_m': reta_km * 1000.0,
+        'distancia_m': estrada_km * 1000.0,
+        'duracao_s': estrada_km / VELOCIDADE_MEDIA_KMH * 3600.0,
+    }
+
+
+__all__ = [
+    'FATOR_ESTRADA',
+    'VELOCIDADE_MEDIA_KMH',
+    'matriz_haversine',
+    'custo_rota',
+    'vizinho_mais_proximo',
+    'melhorar_rota',
+    'otimizar_rota',
+]
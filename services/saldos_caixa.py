@@ -0,0 +1,268 @@
+"""Saldos mensais do Livro Caixa, mantidos junto com os lançamentos.
+
+Por que existir:
+    ``GET /caixa`` carregava todos os ``LancamentoCaixa`` do ano/setor como
+    objetos ORM e reagrupava em Python por mês e por forma de pagamento só
+    para montar os cabeçalhos dos meses e o ``saldo_anterior``. Em
+    dezembro isso é o ano inteiro a cada abertura da tela.
+
+Como funciona:
+    * ``SaldoMensalCaixa`` guarda, por (empresa, setor, ano, mês, forma),
+      as somas de entradas/saídas, saídas por categoria e contagens.
+    * Listeners ``after_insert``/``after_update``/``after_delete`` em
+      ``LancamentoCaixa`` anotam na sessão os meses tocados (inclusive o
+      mês/setor ANTIGO numa edição que muda data ou setor). No
+      ``after_flush`` cada mês anotado é recalculado a partir dos próprios
+      lançamentos (um ``GROUP BY`` por mês) e gravado com upsert — na
+      mesma transação, então o resumo nunca diverge do que foi commitado.
+    * ``reconstruir_saldos_mensais()`` refaz tudo de uma vez (bootstrap,
+      quando a tabela ainda está vazia).
+    * Gravações set-based (``INSERT``/``DELETE`` em lote, sem ORM) não
+      disparam os listeners: chamam ``recalcular_saldos_meses()``.
+
+Recalcular o mês inteiro (em vez de aplicar deltas) deixa o resumo
+correto mesmo que algum lançamento tenha sido gravado por fora (SQL
+manual): a próxima alteração daquele mês realinha.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, case, delete, event, extract, func, inspect as sa_inspect, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import (
+    db, LancamentoCaixa, SaldoMensalCaixa, CATEGORIA_FUNDO_SAIDA, FORMAS_SALDO_CAIXA,
+)
+
+_CHAVE_SESSAO = 'saldos_caixa_meses_pendentes'
+_CAMPOS_VALOR = (
+    'entradas', 'saidas', 'saidas_fornecedor', 'saidas_pessoal',
+    'qtd_lancamentos', 'qtd_fundo_saida',
+)
+_CHAVE_UNICA = ('empresa_id', 'setor', 'ano', 'mes', 'forma')
+# Colunas de ``LancamentoCaixa`` que entram no resumo.
+_CAMPOS_RELEVANTES = ('empresa_id', 'setor', 'data', 'tipo', 'categoria', 'forma_pagamento', 'valor')
+
+
+def _expr_forma(coluna):
+    """Bucket da forma de pagamento — mesma regra de ``_normalizar_bucket_forma``."""
+    f = func.lower(func.coalesce(coluna, ''))
+    return case(
+        (f.like('%dinheiro%'), 'dinheiro'),
+        (f.like('%cheque%'), 'cheque'),
+        (or_(f.like('%pix%'), f.like('%transfer%')), 'pix'),
+        (f.like('%boleto%'), 'boleto'),
+        else_='outros',
+    )
+
+
+def _colunas_agregadas(sub):
+    entrada = sub.c.tipo == 'ENTRADA'
+    fornecedor = sub.c.categoria.like('%Fornecedor%')
+    pessoal = sub.c.categoria.like('%Pessoal%')
+    return [
+        func.sum(case((entrada, sub.c.valor), else_=0)).label('entradas'),
+        func.sum(case((entrada, 0), else_=sub.c.valor)).label('saidas'),
+        func.sum(case((entrada, 0), (fornecedor, sub.c.valor), else_=0)).label('saidas_fornecedor'),
+        func.sum(case((entrada, 0), (fornecedor, 0), (pessoal, sub.c.valor), else_=0)).label('saidas_pessoal'),
+        func.count().label('qtd_lancamentos'),
+        func.sum(case(
+            (and_(sub.c.tipo == 'SAIDA', sub.c.categoria == CATEGORIA_FUNDO_SAIDA), 1), else_=0,
+        )).label('qtd_fundo_saida'),
+    ]
+
+
+def _linha(empresa_id, setor, ano, mes, forma, valores=None, agora=None):
+    linha = {
+        'empresa_id': empresa_id, 'setor': setor, 'ano': int(ano), 'mes': int(mes),
+        'forma': forma, 'atualizado_em': agora or datetime.utcnow(),
+    }
+    for campo in _CAMPOS_VALOR:
+        v = valores.get(campo) if valores else None
+        if campo.startswith('qtd_'):
+            linha[campo] = int(v or 0)
+        else:
+            linha[campo] = Decimal(str(v or 0)).quantize(Decimal('0.01'))
+    return linha
+
+
+def _gravar(conn, linhas):
+    """Upsert pela chave (empresa, setor, ano, mês, forma)."""
+    if not linhas:
+        return
+    tabela = SaldoMensalCaixa.__table__
+    dialeto = {'postgresql': postgresql, 'sqlite': sqlite}.get(conn.dialect.name)
+    if dialeto is None:
+        for linha in linhas:
+            conn.execute(delete(tabela).where(*[tabela.c[k] == linha[k] for k in _CHAVE_UNICA]))
+        conn.execute(tabela.insert(), linhas)
+        return
+    stmt = dialeto.insert(tabela)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(_CHAVE_UNICA),
+        set_={c: stmt.excluded[c] for c in _CAMPOS_VALOR + ('atualizado_em',)},
+    )
+    conn.execute(stmt, linhas)
+
+
+def recalcular_saldos_mes(conn, empresa_id, setor, ano, mes) -> None:
+    """Recalcula o resumo de um mês/setor do tenant a partir dos lançamentos."""
+    lanc = LancamentoCaixa.__table__
+    ano, mes = int(ano), int(mes)
+    inicio = date(ano, mes, 1)
+    fim = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+    sub = (
+        select(
+            _expr_forma(lanc.c.forma_pagamento).label('forma'),
+            lanc.c.tipo, lanc.c.categoria, lanc.c.valor,
+        )
+        .where(
+            lanc.c.empresa_id == empresa_id,
+            lanc.c.setor == setor,
+            lanc.c.data >= inicio,
+            lanc.c.data < fim,
+        )
+        .subquery()
+    )
+    por_forma = {
+        r.forma: r._mapping
+        for r in conn.execute(select(sub.c.forma, *_colunas_agregadas(sub)).group_by(sub.c.forma))
+    }
+    agora = datetime.utcnow()
+    _gravar(conn, [
+        _linha(empresa_id, setor, ano, mes, forma, por_forma.get(forma), agora)
+        for forma in FORMAS_SALDO_CAIXA
+    ])
+
+
+def recalcular_saldos_meses(empresa_id, meses, conn=None) -> None:
+    """Recalcula vários ``(setor, ano, mes)`` do tenant.
+
+    Para gravações em lote (``INSERT``/``DELETE`` set-based) que não
+    disparam os listeners de mapper abaixo. NÃO faz commit.
+    """
+    conn = conn if conn is not None else db.session.connection()
+    for setor, ano, mes in sorted(set(meses)):
+        recalcular_saldos_mes(conn, empresa_id, setor or 'GERAL', ano, mes)
+
+
+def reconstruir_saldos_mensais(empresa_id=None, conn=None) -> int:
+    """Refaz todos os resumos (de um tenant ou de todos). Retorna nº de linhas.
+
+    NÃO faz commit quando usa a sessão (``conn=None``).
+    """
+    conn = conn if conn is not None else db.session.connection()
+    lanc = LancamentoCaixa.__table__
+    tabela = SaldoMensalCaixa.__table__
+    filtro = [lanc.c.empresa_id.isnot(None)]
+    if empresa_id is not None:
+        filtro.append(lanc.c.empresa_id == empresa_id)
+        conn.execute(delete(tabela).where(tabela.c.empresa_id == empresa_id))
+    else:
+        conn.execute(delete(tabela))
+    sub = (
+        select(
+            lanc.c.empresa_id,
+            func.coalesce(lanc.c.setor, 'GERAL').label('setor'),
+            extract('year', lanc.c.data).label('ano'),
+            extract('month', lanc.c.data).label('mes'),
+            _expr_forma(lanc.c.forma_pagamento).label('forma'),
+            lanc.c.tipo, lanc.c.categoria, lanc.c.valor,
+        )
+        .where(*filtro)
+        .subquery()
+    )
+    chaves = (sub.c.empresa_id, sub.c.setor, sub.c.ano, sub.c.mes, sub.c.forma)
+    agora = datetime.utcnow()
+    linhas = [
+        _linha(r.empresa_id, r.setor, r.ano, r.mes, r.forma, r._mapping, agora)
+        for r in conn.execute(select(*chaves, *_colunas_agregadas(sub)).group_by(*chaves))
+    ]
+    if linhas:
+        conn.execute(tabela.insert(), linhas)
+    return len(linhas)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Manutenção automática
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _anotar(target, valores):
+    empresa_id, setor, data_lanc = valores
+    if empresa_id is None or data_lanc is None:
+        return
+    sessao = sa_inspect(target).session
+    if sessao is None:
+        return
+    sessao.info.setdefault(_CHAVE_SESSAO, set()).add(
+        (empresa_id, setor or 'GERAL', data_lanc.year, data_lanc.month)
+    )
+
+
+def _valores_antigos(target):
+    estado = sa_inspect(target)
+    antigos = []
+    for attr in ('empresa_id', 'setor', 'data'):
+        hist = estado.attrs[attr].history
+        antigos.append(hist.deleted[0] if hist.deleted else getattr(target, attr))
+    return antigos
+
+
+@event.listens_for(LancamentoCaixa, 'after_insert')
+def _lancamento_after_insert_saldos(mapper, connection, target):
+    _anotar(target, (target.empresa_id, target.setor, target.data))
+
+
+@event.listens_for(LancamentoCaixa, 'after_update')
+def _lancamento_after_update_saldos(mapper, connection, target):
+    estado = sa_inspect(target)
+    if not any(estado.attrs[c].history.has_changes() for c in _CAMPOS_RELEVANTES):
+        return
+    _anotar(target, _valores_antigos(target))
+    _anotar(target, (target.empresa_id, target.setor, target.data))
+
+
+@event.listens_for(LancamentoCaixa, 'after_delete')
+def _lancamento_after_delete_saldos(mapper, connection, target):
+    _anotar(target, _valores_antigos(target))
+
+
+@event.listens_for(Session, 'after_flush')
+def _recalcular_meses_anotados(session, flush_context):
+    meses = session.info.pop(_CHAVE_SESSAO, None)
+    if not meses:
+        return
+    conn = session.connection()
+    for empresa_id, setor, ano, mes in sorted(meses):
+        recalcular_saldos_mes(conn, empresa_id, setor, ano, mes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_meses_anotados(session):
+    session.info.pop(_CHAVE_SESSAO, None)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Leitura
+# ─────────────────────────────────────────────────────────────────────────────
+
+def saldos_mensais_do_ano(empresa_id, setor, ano):
+    """``{mes: {forma: SaldoMensalCaixa}}`` do tenant/setor/ano."""
+    resultado = {}
+    linhas = SaldoMensalCaixa.query.filter_by(
+        empresa_id=empresa_id, setor=setor, ano=int(ano),
+    ).all()
+    for linha in linhas:
+        resultado.setdefault(linha.mes, {})[linha.forma] = linha
+    return resultado
+
+
+__all__ = [
+    'recalcular_saldos_mes',
+    'recalcular_saldos_meses',
+    'reconstruir_saldos_mensais',
+    'saldos_mensais_do_ano',
+]
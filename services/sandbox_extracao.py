@@ -0,0 +1,308 @@
+"""Extração de PDFs em processo isolado, com limites de CPU, memória e tempo.
+
+Por que existir:
+    O pdfplumber rodava dentro do processo web (lote de um arquivo) ou
+    num ``ProcessPoolExecutor``. Um PDF malformado ou enorme prendia a
+    thread do Gunicorn por minutos ou inflava a memória até o processo
+    cair — e, no pool, um worker morto derrubava o lote inteiro
+    (``BrokenProcessPool``), que então era refeito em série no processo
+    pai. O único freio era o ``MAX_CONTENT_LENGTH`` de 16 MB do upload.
+
+Como funciona:
+    * ``extrair_isolado(tarefas, workers)`` sobe ``workers`` processos
+      ``python -m services.sandbox_extracao``; cada um recebe uma
+      ``TarefaExtracao`` por linha (JSON no stdin), roda
+      ``extrair_documento`` e devolve o resultado numa linha JSON no
+      stdout, assim que termina. O processo é reaproveitado para as
+      próximas tarefas (a importação do pdfplumber custa ~0,5 s) e
+      trocado a cada ``_TAREFAS_POR_PROCESSO``.
+    * Limites (Linux/macOS, via ``resource``): memória virtual
+      (``RLIMIT_AS``) e tempo de CPU por tarefa (``RLIMIT_CPU``). Em
+      qualquer sistema, o pai mata o processo que passar do tempo limite
+      de parede. Páginas: ``EXTRACAO_PDF_MAX_PAGINAS`` (em ``AnalisePdf``).
+    * Falha de uma tarefa não afeta as outras: o processo morto é
+      substituído e o resultado volta com ``falha``:
+      ``TIMEOUT`` (tempo de parede ou de CPU), ``GRANDE_DEMAIS`` (páginas,
+      ``MemoryError`` ou processo morto pelo sistema por memória) ou
+      ``CORROMPIDO`` (o PDF não abre, ou o processo caiu lendo-o).
+
+Configuração (variáveis de ambiente):
+    ``EXTRACAO_PDF_SANDBOX`` (``0``/``off`` volta ao pool no próprio
+    servidor), ``EXTRACAO_PDF_TIMEOUT`` (s de parede por PDF, padrão 60),
+    ``EXTRACAO_PDF_CPU`` (s de CPU por PDF, padrão 45),
+    ``EXTRACAO_PDF_MEMORIA_MB`` (padrão 1024).
+
+O módulo é puro (sem Flask, sem banco).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import NamedTuple
+
+from services.extracao_pdf import (
+    FALHA_CORROMPIDO, FALHA_GRANDE_DEMAIS, FALHA_TIMEOUT, TarefaExtracao,
+    extrair_documento, resultado_com_falha,
+)
+
+try:
+    import resource
+except ImportError:  # Windows: só o tempo limite de parede vale
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_RAIZ_PROJETO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_TAREFAS_POR_PROCESSO = 25
+# Folga do pai sobre o tempo limite, para a primeira tarefa de um processo
+# novo (importação do pdfplumber/pandas).
+_FOLGA_INICIO = 15
+
+
+class LimitesSandbox(NamedTuple):
+    timeout: float       # segundos de parede por PDF
+    cpu: int             # segundos de CPU por PDF
+    memoria_mb: int      # memória virtual do processo
+
+
+def _numero_env(nome, padrao):
+    try:
+        valor = float(os.environ.get(nome) or padrao)
+    except ValueError:
+        return padrao
+    return valor if valor > 0 else padrao
+
+
+def limites_sandbox() -> LimitesSandbox:
+    """Limites configurados (``EXTRACAO_PDF_TIMEOUT``/``_CPU``/``_MEMORIA_MB``)."""
+    return LimitesSandbox(
+        timeout=_numero_env('EXTRACAO_PDF_TIMEOUT', 60),
+        cpu=int(_numero_env('EXTRACAO_PDF_CPU', 45)),
+        memoria_mb=int(_numero_env('EXTRACAO_PDF_MEMORIA_MB', 1024)),
+    )
+
+
+def sandbox_ativo() -> bool:
+    """``False`` com ``EXTRACAO_PDF_SANDBOX`` = ``0``/``off``/``false``."""
+    valor = (os.environ.get('EXTRACAO_PDF_SANDBOX') or '').strip().lower()
+    return valor not in ('0', 'off', 'false', 'nao', 'não')
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Processo filho
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _para_json(valor):
+    if isinstance(valor, date):
+        return valor.isoformat()
+    raise TypeError(f'{type(valor).__name__} não serializável')
+
+
+def _de_json(resultado):
+    dados = resultado.get('dados')
+    if dados and dados.get('data_vencimento'):
+        dados['data_vencimento'] = date.fromisoformat(dados['data_vencimento'])
+    return resultado
+
+
+def _limitar_cpu(segundos):
+    # Limite acumulado do processo: o que já usou + o desta tarefa.
+    # Estourou: SIGXCPU, que encerra o filho (o pai classifica TIMEOUT).
+    if resource is None:
+        return
+    uso = resource.getrusage(resource.RUSAGE_SELF)
+    gasto = int(uso.ru_utime + uso.ru_stime) + 1
+    _, maximo = resource.getrlimit(resource.RLIMIT_CPU)
+    limite = gasto + segundos
+    if maximo != resource.RLIM_INFINITY:
+        limite = min(limite, maximo)
+    resource.setrlimit(resource.RLIMIT_CPU, (limite, maximo))
+
+
+def _servir():
+    """Laço do filho: uma tarefa por linha no stdin, um resultado por linha no stdout."""
+    # O stdout real fica só para o protocolo; prints de bibliotecas vão ao stderr.
+    saida = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    if resource is not None:
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        memoria = int(os.environ.get('EXTRACAO_PDF_MEMORIA_MB') or 0)
+        if memoria > 0:
+            resource.setrlimit(resource.RLIMIT_AS, (memoria * 1024 * 1024, resource.RLIM_INFINITY))
+    for linha in sys.stdin:
+        pedido = json.loads(linha)
+        tarefa = TarefaExtracao(*pedido['tarefa'])
+        _limitar_cpu(pedido['cpu'])
+        inicio = time.perf_counter()
+        try:
+            resultado = extrair_documento(tarefa)
+            texto = json.dumps(resultado, default=_para_json, ensure_ascii=False)
+        except MemoryError as exc:
+            texto = json.dumps(resultado_com_falha(
+                tarefa, FALHA_GRANDE_DEMAIS, f'MemoryError: {exc}', time.perf_counter() - inicio,
+            ))
+        saida.write(texto + '\n')
+        saida.flush()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Processo pai
+# ─────────────────────────────────────────────────────────────────────────────
+
+class _ProcessoIsolado:
+    """Um filho ``services.sandbox_extracao`` e o leitor das respostas dele."""
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.atendidas = 0
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [_RAIZ_PROJETO, env.get('PYTHONPATH')]))
+        env['EXTRACAO_PDF_MEMORIA_MB'] = str(limites.memoria_mb)
+        # Sem pools de threads do BLAS (numpy/pandas): cada thread reserva
+        # memória virtual e estouraria o RLIMIT_AS à toa.
+        for nome in ('OPENBLAS_NUM_THREADS', 'OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+            env.setdefault(nome, '1')
+        self.processo = subprocess.Popen(
+            [sys.executable, '-m', 'services.sandbox_extracao'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env,
+            text=True, encoding='utf-8', bufsize=1,
+        )
+        self._respostas = queue.Queue()
+        threading.Thread(target=self._ler, daemon=True, name='sandbox-extracao').start()
+
+    def _ler(self):
+        for linha in self.processo.stdout:
+            self._respostas.put(linha)
+        self._respostas.put(None)  # EOF: o filho terminou
+
+    def extrair(self, tarefa):
+        """Resultado de ``extrair_documento``; em falha do filho, ``None`` (ver ``falha``)."""
+        limite = self.limites.timeout + (_FOLGA_INICIO if self.atendidas == 0 else 0)
+        self.atendidas += 1
+        self.falha, self.erro = None, None
+        inicio = time.monotonic()
+        try:
+            pedido = {'tarefa': list(tarefa), 'cpu': self.limites.cpu}
+            self.processo.stdin.write(json.dumps(pedido) + '\n')
+            self.processo.stdin.flush()
+            linha = self._respostas.get(timeout=limite)
+        except queue.Empty:
+            self.encerrar()
+            self.falha, self.erro = FALHA_TIMEOUT, f'sem resposta em {limite:.0f} s'
+            return None
+        except OSError as exc:  # filho já morto (pipe fechado)
+            linha, self.erro = None, repr(exc)
+        if linha is not None:
+            return _de_json(json.loads(linha))
+        try:
+            codigo = self.processo.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.encerrar()
+            codigo = None
+        self.falha = _falha_pelo_codigo(codigo)
+        self.erro = f'processo de extração terminou (código {codigo}) após {time.monotonic() - inicio:.1f} s'
+        return None
+
+    def vivo(self):
+        return self.processo.poll() is None
+
+    def encerrar(self):
+        if self.processo.poll() is None:
+            self.processo.kill()
+        try:
+            self.processo.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        for canal in (self.processo.stdin, self.processo.stdout):
+            try:
+                canal.close()
+            except OSError:
+                pass
+
+
+def _falha_pelo_codigo(codigo):
+    sigxcpu = getattr(signal, 'SIGXCPU', None)
+    sigkill = getattr(signal, 'SIGKILL', None)
+    if codigo is None or (sigxcpu is not None and codigo == -sigxcpu):
+        return FALHA_TIMEOUT
+    if sigkill is not None and codigo == -sigkill:
+        # SIGKILL que não foi do pai: o sistema matou o processo por memória.
+        return FALHA_GRANDE_DEMAIS
+    return FALHA_CORROMPIDO
+
+
+def _atender(fila, resultados, limites):
+    """Worker do pai: consome tarefas da fila com um filho próprio, trocado após falha."""
+    processo = None
+    try:
+        while True:
+            try:
+                indice, tarefa = fila.get_nowait()
+            except queue.Empty:
+                return
+            if processo is None or not processo.vivo() or processo.atendidas >= _TAREFAS_POR_PROCESSO:
+                if processo is not None:
+                    processo.encerrar()
+                processo = _ProcessoIsolado(limites)
+            inicio = time.perf_counter()
+            resultado = processo.extrair(tarefa)
+            if resultado is None:
+                logger.warning(
+                    f"[SANDBOX-PDF] {tarefa.caminho}: {processo.falha} ({processo.erro})"
+                )
+                resultado = resultado_com_falha(
+                    tarefa, processo.falha, processo.erro, time.perf_counter() - inicio,
+                )
+                processo.encerrar()
+                processo = None
+            elif resultado.get('falha') == FALHA_GRANDE_DEMAIS:
+                # Depois de um MemoryError o heap do filho não é confiável.
+                processo.encerrar()
+                processo = None
+            resultados[indice] = resultado
+    finally:
+        if processo is not None:
+            processo.encerrar()
+
+
+def extrair_isolado(tarefas, workers=1, limites=None) -> list[dict]:
+    """``extrair_documento`` de cada tarefa em processos isolados, na ordem de ``tarefas``.
+
+    ``workers`` processos em paralelo; ``limites`` (``LimitesSandbox``)
+    padrão de ``limites_sandbox()``. Nunca levanta por causa de um PDF:
+    a falha vem classificada no resultado.
+    """
+    tarefas = [TarefaExtracao(*t) for t in tarefas]
+    if not tarefas:
+        return []
+    limites = limites or limites_sandbox()
+    fila = queue.Queue()
+    for item in enumerate(tarefas):
+        fila.put(item)
+    resultados = [None] * len(tarefas)
+    workers = max(1, min(workers, len(tarefas)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sandbox-pdf') as executor:
+        for futuro in [executor.submit(_atender, fila, resultados, limites) for _ in range(workers)]:
+            futuro.result()
+    return resultados
+
+
+__all__ = [
+    'LimitesSandbox',
+    'limites_sandbox',
+    'sandbox_ativo',
+    'extrair_isolado',
+]
+
+
+if __name__ == '__main__':
+    _servir()
@@ -0,0 +1,533 @@
+"""Envio de arquivos ao Cloudinary em background, com spool local e retentativa.
+
+Por que existir:
+    ``_upload_cloudinary_documento_local``, as fotos de produto e
+    ``/upload_imagem_cheque`` chamavam ``cloudinary.uploader.upload`` dentro
+    do request, um arquivo por vez e sem nova tentativa: cinco fotos
+    prendiam a thread do Gunicorn pelo tempo de cinco envios, e uma falha
+    da nuvem deixava o documento sem ``url_arquivo`` para sempre.
+
+Fluxo:
+    1. O request chama ``guardar_para_upload``: copia o arquivo para o
+       spool (``<token><ext>`` + ``<token>.json`` com destino, pasta e
+       estado) e devolve o token. Só disco local.
+    2. Depois do commit, ``disparar_uploads(tokens)`` entrega os tokens a um
+       ``ThreadPoolExecutor`` limitado (``UPLOADS_NUVEM_WORKERS``, padrão 4).
+    3. ``processar_upload`` envia, grava ``url``/``public_id`` no JSON
+       (sobrevive a queda entre o envio e o banco) e aplica no destino:
+         * ``documento``    → ``Documento.url_arquivo``/``public_id`` (se
+           ainda vazios) e remove a cópia em ``documentos_entrada/``, como
+           o envio síncrono fazia;
+         * ``produto_foto`` → ``ProdutoFoto.arquivo``/``public_id``;
+         * ``cheque``       → troca a URL provisória nas
+           ``ContagemGaveta.estado_json`` da empresa.
+       Destino apagado (ou reaproveitado) antes do envio: entrada descartada.
+    4. Falha: ``tentativas`` +1 e próxima tentativa em
+       ``min(1 h, 30 s × 2^(n-1))``; após ``_MAX_TENTATIVAS``, ``ERRO``.
+    5. ``reconciliar_uploads`` (scheduler, a cada 5 min) redespacha o que
+       venceu a espera e poda o spool.
+
+Enquanto a foto não sobe, ``url_provisoria(token)`` aponta para
+``/uploads/pendentes/<token>`` (``routes/uploads.py``), que serve o arquivo
+do spool ou redireciona para a nuvem depois do envio. Cheques mantêm o
+JSON (``ENVIADO``) por ``_GUARDAR_ENVIADOS`` para o redirect continuar
+valendo em contagens salvas pelo navegador com a URL antiga.
+
+O spool é disco do próprio servidor: os envios rodam em threads do
+processo web, não no worker RQ (que pode estar em outra máquina).
+
+Configuração:
+    * ``UPLOADS_NUVEM_SPOOL`` — pasta (padrão ``instance/uploads_nuvem``);
+    * ``UPLOADS_NUVEM_WORKERS`` — threads de envio (padrão 4);
+    * ``UPLOADS_NUVEM_ENVIADOR=local`` — dublê offline (``EnviadorLocal``):
+      copia para ``UPLOADS_NUVEM_LOCAL_DIR`` (padrão
+      ``instance/nuvem_local``) e devolve URI ``file://``.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from flask import current_app, has_app_context
+
+from models import db, ContagemGaveta, Documento, ProdutoFoto
+
+logger = logging.getLogger(__name__)
+
+DESTINO_DOCUMENTO = 'documento'
+DESTINO_PRODUTO_FOTO = 'produto_foto'
+DESTINO_CHEQUE = 'cheque'
+
+STATUS_PENDENTE = 'PENDENTE'
+STATUS_ENVIADO = 'ENVIADO'
+STATUS_ERRO = 'ERRO'
+
+PREFIXO_URL_PROVISORIA = '/uploads/pendentes/'
+
+_RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SPOOL_PADRAO = os.path.join(_RAIZ, 'instance', 'uploads_nuvem')
+_NUVEM_LOCAL_PADRAO = os.path.join(_RAIZ, 'instance', 'nuvem_local')
+
+_MAX_TENTATIVAS = 12
+_ESPERA_BASE, _ESPERA_MAX = 30, 3600
+# Envio em background: folga maior que o ``_EXTERNAL_TIMEOUT`` dos requests.
+_TIMEOUT_ENVIO = 60
+_TRAVA_EXPIRA = 15 * 60
+_GUARDAR_ENVIADOS = 30 * 86400
+_ORFAO_APOS = 86400
+_TAMANHO_ERRO = 500
+_TOKEN_VALIDO = re.compile(r'^[A-Za-z0-9_-]{1,80}$')
+_TOKEN_NA_URL = re.compile(re.escape(PREFIXO_URL_PROVISORIA) + r'([A-Za-z0-9_-]{1,80})')
+
+_executor: ThreadPoolExecutor | None = None
+_enviador = None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Enviadores
+# ─────────────────────────────────────────────────────────────────────────────
+
+class EnviadorCloudinary:
+    """Envio real: ``cloudinary.uploader.upload``."""
+
+    def enviar(self, caminho, pasta=None, resource_type='image'):
+        import cloudinary.uploader
+
+        opcoes = {'resource_type': resource_type, 'timeout': _TIMEOUT_ENVIO}
+        if pasta:
+            opcoes['folder'] = pasta
+        resultado = cloudinary.uploader.upload(caminho, **opcoes)
+        url = resultado.get('secure_url')
+        if not url:
+            raise RuntimeError('Cloudinary não devolveu secure_url.')
+        return url, resultado.get('public_id')
+
+
+class EnviadorLocal:
+    """Dublê offline: copia para uma pasta local e devolve URI ``file://``."""
+
+    def __init__(self, pasta_destino=None):
+        self.pasta_destino = (
+            pasta_destino or os.environ.get('UPLOADS_NUVEM_LOCAL_DIR') or _NUVEM_LOCAL_PADRAO
+        )
+
+    def enviar(self, caminho, pasta=None, resource_type='image'):
+        destino = os.path.join(self.pasta_destino, pasta or '')
+        os.makedirs(destino, exist_ok=True)
+        nome = uuid.uuid4().hex + os.path.splitext(caminho)[1].lower()
+        shutil.copyfile(caminho, os.path.join(destino, nome))
+        public_id = '/'.join(p for p in (pasta, nome) if p)
+        return Path(destino, nome).resolve().as_uri(), public_id
+
+
+def _enviador_local_por_env() -> bool:
+    return (os.environ.get('UPLOADS_NUVEM_ENVIADOR') or '').strip().lower() == 'local'
+
+
+def enviador_atual():
+    global _enviador
+    if _enviador is None:
+        _enviador = EnviadorLocal() if _enviador_local_por_env() else EnviadorCloudinary()
+    return _enviador
+
+
+def definir_enviador(enviador) -> None:
+    """Troca o enviador (scripts/benchmark). ``None`` volta ao padrão do ambiente."""
+    global _enviador
+    _enviador = enviador
+
+
+def nuvem_configurada() -> bool:
+    """Há para onde enviar (Cloudinary configurado ou dublê local ativo)?"""
+    if _enviador is not None or _enviador_local_por_env():
+        return True
+    if os.environ.get('CLOUDINARY_URL'):
+        return True
+    if not has_app_context():
+        return False
+    config = current_app.config
+    return bool(
+        config.get('CLOUDINARY_URL')
+        or (config.get('CLOUDINARY_CLOUD_NAME') and config.get('CLOUDINARY_API_KEY'))
+    )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Spool
+# ─────────────────────────────────────────────────────────────────────────────
+
+def pasta_spool() -> str:
+    return os.environ.get('UPLOADS_NUVEM_SPOOL') or _SPOOL_PADRAO
+
+
+def _caminho_meta(token):
+    return os.path.join(pasta_spool(), f'{token}.json')
+
+
+def caminho_arquivo_spool(meta) -> str:
+    return os.path.join(pasta_spool(), meta['token'] + (meta.get('extensao') or ''))
+
+
+def url_provisoria(token: str) -> str:
+    """URL servida por ``routes/uploads.py`` até o envio terminar."""
+    return PREFIXO_URL_PROVISORIA + token
+
+
+def ler_upload(token: str) -> dict | None:
+    """JSON do token no spool (``None`` se inválido ou inexistente)."""
+    if not token or not _TOKEN_VALIDO.match(token):
+        return None
+    try:
+        with open(_caminho_meta(token), encoding='utf-8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        logger.warning(f"[UPLOADS-NUVEM] {token}: JSON ilegível: {exc!r}")
+        return None
+    return meta if isinstance(meta, dict) else None
+
+
+def _gravar_atomico(caminho, escrever):
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            escrever(f)
+        os.replace(temporario, caminho)
+    except BaseException:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        raise
+
+
+def _gravar_meta(meta):
+    dados = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+    _gravar_atomico(_caminho_meta(meta['token']), lambda f: f.write(dados))
+
+
+def _remover(*caminhos):
+    for caminho in caminhos:
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            logger.warning(f"[UPLOADS-NUVEM] falha ao remover {caminho}: {exc!r}")
+
+
+def _descartar(meta, motivo):
+    _remover(caminho_arquivo_spool(meta), _caminho_meta(meta['token']))
+    logger.info(f"[UPLOADS-NUVEM] {meta['token']}: descartado ({motivo})")
+
+
+def guardar_para_upload(origem, destino: str, destino_id: int | None = None, *,
+                        pasta: str | None = None, resource_type: str = 'image',
+                        empresa_id: int | None = None, referencia: str | None = None,
+                        nome_arquivo: str | None = None) -> str | None:
+    """Copia ``origem`` (caminho ou ``FileStorage``) para o spool. Retorna o token.
+
+    ``None`` quando a nuvem não está configurada (o chamador segue sem
+    URL, como antes). Documentos usam o token ``documento-<id>``: o mesmo
+    arquivo (``referencia`` = ``caminho_arquivo``) ainda pendente não é
+    copiado de novo a cada varredura. Chamar ``disparar_uploads`` só
+    depois do commit da linha de destino.
+    """
+    if not nuvem_configurada():
+        return None
+    pasta_local = pasta_spool()
+    os.makedirs(pasta_local, exist_ok=True)
+
+    if destino == DESTINO_DOCUMENTO:
+        token = f'{DESTINO_DOCUMENTO}-{destino_id}'
+        atual = ler_upload(token)
+        if (atual and atual.get('status') == STATUS_PENDENTE
+                and atual.get('referencia') == referencia
+                and os.path.isfile(caminho_arquivo_spool(atual))):
+            return token
+    else:
+        token = uuid.uuid4().hex
+
+    nome = nome_arquivo or (origem if isinstance(origem, str) else getattr(origem, 'filename', '')) or ''
+    meta = {
+        'token': token,
+        'destino': destino,
+        'destino_id': destino_id,
+        'referencia': referencia,
+        'empresa_id': empresa_id,
+        'pasta': pasta,
+        'resource_type': resource_type,
+        'extensao': os.path.splitext(nome)[1].lower()[:10],
+        'status': STATUS_PENDENTE,
+        'tentativas': 0,
+        'proxima_em': 0,
+        'erro': None,
+        'url': None,
+        'public_id': None,
+        'criado_em': int(time.time()),
+    }
+    if isinstance(origem, str):
+        def escrever(f):
+            with open(origem, 'rb') as src:
+                shutil.copyfileobj(src, f)
+    else:
+        def escrever(f):
+            try:
+                origem.stream.seek(0)
+            except (AttributeError, OSError):
+                pass
+            shutil.copyfileobj(getattr(origem, 'stream', origem), f)
+    _gravar_atomico(caminho_arquivo_spool(meta), escrever)
+    _gravar_meta(meta)
+    return token
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Envio
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _executor_local() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        try:
+            workers = int(os.environ.get('UPLOADS_NUVEM_WORKERS') or 4)
+        except ValueError:
+            workers = 4
+        _executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='uploads-nuvem')
+    return _executor
+
+
+def disparar_uploads(tokens) -> int:
+    """Entrega os tokens às threads de envio. Retorna quantos foram despachados."""
+    tokens = [t for t in (tokens or []) if t]
+    if not tokens:
+        return 0
+    app_obj = current_app._get_current_object()
+
+    def _rodar(token):
+        with app_obj.app_context():
+            try:
+                processar_upload(token)
+            except Exception:
+                app_obj.logger.error(f"[UPLOADS-NUVEM] {token}: falha inesperada", exc_info=True)
+
+    for token in tokens:
+        _executor_local().submit(_rodar, token)
+    return len(tokens)
+
+
+def _travar(token):
+    """Trava por arquivo (``O_EXCL``): vale entre threads e processos do servidor."""
+    caminho = os.path.join(pasta_spool(), f'{token}.lock')
+    for _ in range(2):
+        try:
+            os.close(os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return caminho
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(caminho) < _TRAVA_EXPIRA:
+                    return None
+            except OSError:
+                pass
+            _remover(caminho)  # processo morreu no meio do envio
+    return None
+
+
+def _destino_vigente(meta):
+    """Linha de destino ainda existe e ainda espera ESTE arquivo?"""
+    destino, destino_id = meta.get('destino'), meta.get('destino_id')
+    if destino == DESTINO_DOCUMENTO:
+        documento = db.session.get(Documento, destino_id)
+        if documento is None or documento.caminho_arquivo != meta.get('referencia'):
+            return None
+        return documento
+    if destino == DESTINO_PRODUTO_FOTO:
+        foto = db.session.get(ProdutoFoto, destino_id)
+        if foto is None or foto.arquivo != url_provisoria(meta['token']):
+            return None
+        return foto
+    if destino == DESTINO_CHEQUE:
+        return True
+    return None
+
+
+def _aplicar(meta):
+    """Grava o resultado no banco. ``False`` se o destino não existe mais."""
+    alvo = _destino_vigente(meta)
+    if alvo is None:
+        return False
+    url, public_id = meta['url'], meta.get('public_id')
+    destino = meta['destino']
+    if destino == DESTINO_DOCUMENTO:
+        if not alvo.url_arquivo:
+            alvo.url_arquivo, alvo.public_id = url, public_id
+        db.session.commit()
+        local = os.path.join(current_app.root_path, alvo.caminho_arquivo or '')
+        if alvo.url_arquivo and alvo.caminho_arquivo and os.path.isfile(local):
+            _remover(local)
+    elif destino == DESTINO_PRODUTO_FOTO:
+        alvo.arquivo, alvo.public_id = url, public_id
+        db.session.commit()
+    else:
+        provisoria = url_provisoria(meta['token'])
+        consulta = ContagemGaveta.query.filter(ContagemGaveta.estado_json.contains(provisoria))
+        if meta.get('empresa_id') is not None:
+            consulta = consulta.filter(ContagemGaveta.empresa_id == meta['empresa_id'])
+        for registro in consulta.all():
+            registro.estado_json = registro.estado_json.replace(provisoria, url)
+        db.session.commit()
+    return True
+
+
+def _espera(tentativas):
+    return min(_ESPERA_MAX, _ESPERA_BASE * 2 ** (tentativas - 1))
+
+
+def processar_upload(token: str, forcar: bool = False) -> str | None:
+    """Envia e aplica um item do spool. Retorna o status final (ou ``None``).
+
+    Item travado por outra thread/processo, ou ainda dentro da espera da
+    retentativa (sem ``forcar``), é deixado como está.
+    """
+    if not has_app_context():
+        from app import app as app_obj
+        with app_obj.app_context():
+            return processar_upload(token, forcar)
+
+    meta = ler_upload(token)
+    if meta is None or meta.get('status') != STATUS_PENDENTE:
+        return meta and meta.get('status')
+    trava = _travar(token)
+    if trava is None:
+        return STATUS_PENDENTE
+    try:
+        meta = ler_upload(token)  # pode ter mudado antes da trava
+        if meta is None or meta.get('status') != STATUS_PENDENTE:
+            return meta and meta.get('status')
+        if not forcar and meta.get('proxima_em', 0) > time.time():
+            return STATUS_PENDENTE
+        try:
+            if not meta.get('url'):
+                if _destino_vigente(meta) is None:
+                    _descartar(meta, 'destino removido')
+                    return None
+                meta['url'], meta['public_id'] = enviador_atual().enviar(
+                    caminho_arquivo_spool(meta), meta.get('pasta'), meta.get('resource_type') or 'image',
+                )
+                _gravar_meta(meta)
+            if not _aplicar(meta):
+                _descartar(meta, 'destino removido após o envio')
+                return None
+        except Exception as exc:
+            try:
+                db.session.rollback()
+            except Exception:
+                pass
+            meta['tentativas'] = meta.get('tentativas', 0) + 1
+            meta['erro'] = str(exc)[:_TAMANHO_ERRO] or exc.__class__.__name__
+            if meta['tentativas'] >= _MAX_TENTATIVAS:
+                meta['status'] = STATUS_ERRO
+            else:
+                meta['proxima_em'] = int(time.time() + _espera(meta['tentativas']))
+            _gravar_meta(meta)
+            logger.warning(
+                f"[UPLOADS-NUVEM] {token}: falha tentativa={meta['tentativas']} "
+                f"status={meta['status']}: {meta['erro']}"
+            )
+            return meta['status']
+
+        if meta['destino'] == DESTINO_CHEQUE:
+            meta.update(status=STATUS_ENVIADO, erro=None, enviado_em=int(time.time()))
+            _gravar_meta(meta)
+            _remover(caminho_arquivo_spool(meta))
+        else:
+            _remover(caminho_arquivo_spool(meta), _caminho_meta(token))
+        logger.info(f"[UPLOADS-NUVEM] {token}: enviado ({meta['destino']} {meta.get('destino_id')})")
+        return STATUS_ENVIADO
+    finally:
+        _remover(trava)
+
+
+def resolver_urls_provisorias(texto: str) -> str:
+    """Troca URLs provisórias já enviadas pela URL definitiva (contagem salva depois do envio)."""
+    if not texto or PREFIXO_URL_PROVISORIA not in texto:
+        return texto
+    for token in set(_TOKEN_NA_URL.findall(texto)):
+        meta = ler_upload(token)
+        if meta and meta.get('status') == STATUS_ENVIADO and meta.get('url'):
+            texto = texto.replace(url_provisoria(token), meta['url'])
+    return texto
+
+
+def reconciliar_uploads() -> dict:
+    """Job do scheduler: redespacha pendentes vencidos e poda o spool."""
+    if not has_app_context():
+        from app import app as app_obj
+        with app_obj.app_context():
+            return reconciliar_uploads()
+
+    resumo = {'despachados': 0, 'erros': 0, 'podados': 0}
+    pasta = pasta_spool()
+    if not os.path.isdir(pasta):
+        return resumo
+    agora = time.time()
+    vencidos, conhecidos = [], set()
+    for nome in os.listdir(pasta):
+        if not nome.endswith('.json'):
+            continue
+        meta = ler_upload(nome[:-5])
+        if meta is None:
+            continue
+        conhecidos.add(meta['token'])
+        status = meta.get('status')
+        if status == STATUS_PENDENTE and meta.get('proxima_em', 0) <= agora:
+            vencidos.append(meta['token'])
+        elif status == STATUS_ERRO:
+            resumo['erros'] += 1
+        elif status == STATUS_ENVIADO and agora - meta.get('enviado_em', 0) > _GUARDAR_ENVIADOS:
+            _descartar(meta, 'envio antigo')
+            resumo['podados'] += 1
+    for nome in os.listdir(pasta):
+        caminho = os.path.join(pasta, nome)
+        token = os.path.splitext(nome)[0]
+        if nome.endswith(('.json', '.lock')) or token in conhecidos:
+            continue
+        try:
+            if agora - os.path.getmtime(caminho) > _ORFAO_APOS:
+                _remover(caminho)
+                resumo['podados'] += 1
+        except OSError:
+            pass
+    resumo['despachados'] = disparar_uploads(vencidos)
+    if any(resumo.values()):
+        current_app.logger.info(f"[UPLOADS-NUVEM] reconciliação: {resumo}")
+    return resumo
+
+
+__all__ = [
+    'DESTINO_DOCUMENTO',
+    'DESTINO_PRODUTO_FOTO',
+    'DESTINO_CHEQUE',
+    'PREFIXO_URL_PROVISORIA',
+    'EnviadorCloudinary',
+    'EnviadorLocal',
+    'definir_enviador',
+    'nuvem_configurada',
+    'guardar_para_upload',
+    'disparar_uploads',
+    'processar_upload',
+    'reconciliar_uploads',
+    'resolver_urls_provisorias',
+    'url_provisoria',
+    'ler_upload',
+    'caminho_arquivo_spool',
+]
@@ -8,10 +8,9 @@ Estas funções são **inerentemente cross-blueprint** — usadas por
   identificado por (cliente, NF, data) ou (cliente, data) para
   consumidor final. Usado para aplicar uma operação em massa em todos
   os itens do mesmo pedido (excluir, estornar, reabrir).
-* ``_apagar_lancamentos_caixa_por_vendas(vendas)`` — varre o livro
-  caixa e remove os lançamentos de ENTRADA cuja descrição contém o
-  marcador ``Venda #<id>`` para qualquer ``venda`` da lista. Mantém
-  multi-tenant filtrando por ``empresa_id``.
+* ``_apagar_lancamentos_caixa_por_vendas(vendas)`` — remove do livro
+  caixa os lançamentos com ``venda_id`` de qualquer ``venda`` da lista.
+  Mantém multi-tenant filtrando por ``empresa_id``.
 * ``_produto_com_lock(produto_id)`` — carrega um Produto com
   ``SELECT ... FOR UPDATE`` para serializar atualizações de estoque
   concorrentes (importante em finalização de carrinho e edição de
@@ -22,6 +21,8 @@ Estas funções são **inerentemente cross-blueprint** — usadas por
   PARCIAL/PAGO. **Use sempre** após criar/editar/deletar lançamentos
   de caixa que afetam vendas — substitui a lógica frágil de
   delta-a-delta. Não faz commit; o chamador agrupa a transação.
+  Para várias vendas, ``services.pagamentos_venda.resincronizar_vendas``
+  faz o mesmo em um ``GROUP BY`` + um ``UPDATE``.
 * ``_resincronizar_pagamento_venda_seguro(venda)`` — variante MÃO
   ÚNICA do anterior: só promove (PENDENTE → PARCIAL → PAGO), nunca
   rebaixa. Use em rotas administrativas de recuperação de saldos